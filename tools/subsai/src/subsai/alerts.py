@@ -0,0 +1,393 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Watch-list alerts on the live subtitles
+
+The watch-list terms (names, phrases) are compiled into a word-level Aho–Corasick automaton, so each committed
+subtitle is checked in one pass over its words whatever the number of terms. The words are normalized (case,
+accents, possessives, plurals) and, with `fuzzy`, words one edit away from a watch-list word (typical Whisper
+misspellings of names) are mapped to it before entering the automaton.
+
+The matches go to pluggable notifiers, set with `SUBSAI_ALERT_NOTIFIERS` in the live pipeline, e.g.
+`log,webhook:http://newsroom:8080/alerts`. The watch list is read from the file `SUBSAI_WATCHLIST`, one term per
+line, optionally followed by a tab and a label.
+
+Example usage:
+```python
+stage = AlertStage(KeywordMatcher(['Volodymyr Zelensky', ('European Central Bank', 'ECB')]), [LogNotifier()])
+stage.process({'text': "Zelenskyy's visit...", 'channel': 'cnn', 'start': '2026-10-19T20:00:00+00:00'})
+```
+"""
+
+import collections
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+import unicodedata
+import urllib.request
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+WATCHLIST_PATH = os.environ.get('SUBSAI_WATCHLIST')
+NOTIFIERS_SPEC = os.environ.get('SUBSAI_ALERT_NOTIFIERS', 'log')
+
+_WORD = re.compile(r"\w+(?:['’]\w+)*")
+
+
+def _strip_accents(word: str) -> str:
+    if word.isascii():
+        return word
+    return ''.join(c for c in unicodedata.normalize('NFKD', word) if not unicodedata.combining(c))
+
+
+def stem(word: str) -> str:
+    """
+    Light English stemming of a lower-cased word: possessives and plurals only, so names are not mangled
+
+    :param word: lower-cased word
+    :return: stem
+    """
+    if word.endswith("'s") or word.endswith("’s"):
+        word = word[:-2]
+    if len(word) <= 4:
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('sses', 'xes', 'zes', 'ches', 'shes')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def _deletes(word: str):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class Match(NamedTuple):
+    term: str
+    label: str
+    # character span of the match in the text
+    start: int
+    end: int
+    text: str
+
+
+class Alert(NamedTuple):
+    channel: Optional[str]
+    term: str
+    label: str
+    text: str
+    matched: str
+    air_start: Optional[str]
+    air_end: Optional[str]
+    detected_at: float
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+
+class KeywordMatcher:
+    """
+    Word-level Aho–Corasick automaton of a watch list
+    """
+
+    def __init__(self, terms: Iterable[Union[str, Tuple[str, str]]], stemming: bool = True, fuzzy: bool = True,
+                 min_fuzzy_length: int = 5):
+        """
+        :param terms: terms, or (term, label) tuples; the label defaults to the term
+        :param stemming: match the plural and possessive forms
+        :param fuzzy: match the words one edit (insertion, deletion, substitution) away from the watch-list
+                      words of at least `min_fuzzy_length` characters
+        :param min_fuzzy_length: shorter words are matched exactly
+        """
+        self.stemming = stemming
+        self.fuzzy = fuzzy
+        self.min_fuzzy_length = min_fuzzy_length
+        self.patterns = []  # (term, label, number of words)
+        # automaton: goto[state] maps a word to the next state
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        self._vocabulary = set()
+        for term in terms:
+            term, label = (term, term) if isinstance(term, str) else term
+            self._add(term, label)
+        self._build()
+        self._fuzzy_index = self._build_fuzzy_index() if fuzzy else {}
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def normalize(self, word: str) -> str:
+        word = _strip_accents(word.lower())
+        return stem(word) if self.stemming else word
+
+    def _add(self, term: str, label: str) -> None:
+        words = [self.normalize(w) for w in _WORD.findall(term)]
+        if not words:
+            return
+        state = 0
+        for word in words:
+            self._vocabulary.add(word)
+            next_state = self._goto[state].get(word)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][word] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append(len(self.patterns))
+        self.patterns.append((term, label, len(words)))
+
+    def _build(self) -> None:
+        # breadth-first, the failure link of a state is the longest proper suffix of its path that is a prefix
+        todo = collections.deque(self._goto[0].values())
+        while todo:
+            state = todo.popleft()
+            for word, child in self._goto[state].items():
+                todo.append(child)
+                fail = self._fail[state]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(word, 0)
+                # the children of the root fail to the root
+                self._fail[child] = fail if fail != child else 0
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+
+    def _build_fuzzy_index(self) -> Dict[str, str]:
+        # symmetric deletions: a word and a watch-list word one edit apart share a deletion or are one
+        index = {}
+        for word in self._vocabulary:
+            if len(word) >= self.min_fuzzy_length:
+                for deletion in _deletes(word):
+                    index.setdefault(deletion, word)
+        return index
+
+    def _canonical(self, word: str) -> str:
+        """
+        The watch-list word `word` is a variant of, or `word`
+        """
+        canonical = self._cache.get(word)
+        if canonical is not None:
+            return canonical
+        canonical = self.normalize(word)
+        if self.fuzzy and canonical not in self._vocabulary and len(canonical) >= self.min_fuzzy_length - 1:
+            index = self._fuzzy_index
+            # deletion in the text, then insertion or substitution
+            match = index.get(canonical)
+            if match is None and len(canonical) >= self.min_fuzzy_length:
+                for deletion in _deletes(canonical):
+                    if deletion in self._vocabulary and len(deletion) >= self.min_fuzzy_length:
+                        match = deletion
+                    else:
+                        match = index.get(deletion)
+                    if match is not None:
+                        break
+            if match is not None:
+                canonical = match
+        if len(self._cache) < 100000:
+            self._cache[word] = canonical
+        return canonical
+
+    def match(self, text: str) -> List[Match]:
+        """
+        Finds the watch-list terms in `text`, overlapping matches included
+
+        :param text: subtitle text
+        :return: matches in the order of their end
+        """
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        spans = []
+        matches = []
+        state = 0
+        for m in _WORD.finditer(text):
+            word = self._canonical(m.group())
+            spans.append(m.span())
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            for pattern in outputs[state]:
+                term, label, n_words = self.patterns[pattern]
+                start = spans[-n_words][0]
+                end = spans[-1][1]
+                matches.append(Match(term, label, start, end, text[start:end]))
+        return matches
+
+
+def load_watchlist(path: str) -> List[Tuple[str, str]]:
+    """
+    Reads a watch list: one term per line, optionally followed by a tab and a label; # starts a comment
+
+    :param path: text file
+    :return: (term, label) tuples
+    """
+    terms = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            term, _, label = line.partition('\t')
+            terms.append((term.strip(), label.strip() or term.strip()))
+    return terms
+
+
+class Notifier:
+    """
+    Receives the alerts of an :class:`AlertStage`
+    """
+
+    def notify(self, alert: Alert) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class LogNotifier(Notifier):
+
+    def __init__(self, log: logging.Logger = logger):
+        self.log = log
+
+    def notify(self, alert: Alert) -> None:
+        self.log.warning("ALERT [%s] %s: %s", alert.channel, alert.label, alert.text)
+
+
+class CallbackNotifier(Notifier):
+
+    def __init__(self, callback: Callable[[Alert], None]):
+        self.callback = callback
+
+    def notify(self, alert: Alert) -> None:
+        self.callback(alert)
+
+
+class WebhookNotifier(Notifier):
+    """
+    POSTs the alerts as JSON from a background thread, so a slow endpoint doesn't delay the ASR loop
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0, max_pending: int = 1000):
+        self.url = url
+        self.timeout = timeout
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def notify(self, alert: Alert) -> None:
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            logger.error("Webhook %s is not keeping up, alert dropped: %s", self.url, alert.label)
+
+    def _run(self):
+        while True:
+            alert = self._queue.get()
+            if alert is None:
+                break
+            request = urllib.request.Request(self.url, data=json.dumps(alert.to_dict()).encode('utf-8'),
+                                             headers={'Content-Type': 'application/json'}, method='POST')
+            try:
+                urllib.request.urlopen(request, timeout=self.timeout).close()
+            except Exception as e:
+                logger.error("Webhook %s failed: %s", self.url, e)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join(self.timeout)
+
+
+NOTIFIERS = {
+    'log': lambda arg: LogNotifier(),
+    'webhook': lambda arg: WebhookNotifier(arg),
+}
+
+
+def create_notifiers(spec: str = NOTIFIERS_SPEC) -> List[Notifier]:
+    """
+    Creates the notifiers of a comma separated spec, e.g. `log,webhook:http://host/alerts`
+
+    :param spec: `name[:argument]` list, the names are the keys of :data:`NOTIFIERS`
+    :return: notifiers
+    """
+    notifiers = []
+    for item in filter(None, (s.strip() for s in spec.split(','))):
+        name, _, arg = item.partition(':')
+        if name not in NOTIFIERS:
+            raise ValueError(f'Unknown notifier `{name}`, it should be one of the following: {list(NOTIFIERS)}')
+        notifiers.append(NOTIFIERS[name](arg))
+    return notifiers
+
+
+class AlertStage:
+    """
+    Matches the committed subtitles of the live pipeline against the watch list and notifies the matches
+    """
+
+    def __init__(self, matcher: KeywordMatcher, notifiers: List[Notifier], cooldown: float = 60.0):
+        """
+        :param matcher: compiled watch list
+        :param notifiers: receivers of the alerts
+        :param cooldown: seconds during which the same label on the same channel is not notified again
+        """
+        self.matcher = matcher
+        self.notifiers = notifiers
+        self.cooldown = cooldown
+        self._last = {}
+
+    def process(self, subtitle: Union[str, dict], channel: Optional[str] = None) -> List[Alert]:
+        """
+        :param subtitle: subtitle entry, a dict or the JSON string of `generate_subtitle`
+        :param channel: channel, the one of the subtitle by default
+        :return: notified alerts
+        """
+        if isinstance(subtitle, str):
+            subtitle = json.loads(subtitle)
+        channel = subtitle.get('channel') if channel is None else channel
+        text = subtitle.get('text', '')
+        now = time.time()
+        alerts = []
+        for match in self.matcher.match(text):
+            key = (channel, match.label)
+            if now - self._last.get(key, float('-inf')) < self.cooldown:
+                continue
+            self._last[key] = now
+            alert = Alert(channel, match.term, match.label, text, match.text, subtitle.get('start'),
+                          subtitle.get('end'), now)
+            for notifier in self.notifiers:
+                try:
+                    notifier.notify(alert)
+                except Exception as e:
+                    logger.error("Notifier %s failed: %s", type(notifier).__name__, e)
+            alerts.append(alert)
+        return alerts
+
+    def close(self) -> None:
+        for notifier in self.notifiers:
+            notifier.close()
+
+
+def alert_stage_from_env(log: logging.Logger = logger) -> Optional[AlertStage]:
+    """
+    Returns the alert stage of the watch list `SUBSAI_WATCHLIST` and the notifiers `SUBSAI_ALERT_NOTIFIERS`, or
+    None without watch list
+    """
+    if not WATCHLIST_PATH:
+        return None
+    terms = load_watchlist(WATCHLIST_PATH)
+    t = time.perf_counter()
+    matcher = KeywordMatcher(terms)
+    log.info("Watch list of %d terms compiled in %.2f s", len(matcher), time.perf_counter() - t)
+    notifiers = [LogNotifier(log) if isinstance(n, LogNotifier) else n for n in create_notifiers()]
+    return AlertStage(matcher, notifiers)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Raw audio archive of the channels
+
+The live ingest writes the 16 kHz mono audio of each channel to chunks of `chunk_seconds` (FLAC, or Opus for a
+smaller archive) and appends a 13 bytes record per chunk to an index: its air time, its number of samples and its
+format. A seek is a binary search of the index followed by a sample-accurate seek inside the chunk, so any air time
+range is read back without scanning the archive: for the webui player, or a re-transcription with
+`SubsAI.transcribe`. The chunks older than the retention are pruned as new ones are written.
+
+Set `SUBSAI_ARCHIVE` to the archive directory to make the live pipeline archive the audio of its channels.
+
+Example usage:
+```python
+# ingest process
+archive = AudioArchive('/home/nexanews/archive', 'cnn')
+archive.write(audio_chunk)
+archive.gap(12.0)
+# any other process
+archive = AudioArchive('/home/nexanews/archive', 'cnn')
+path = archive.extract('2026-10-19T20:00:00+00:00', '2026-10-19T20:05:00+00:00')
+subs = SubsAI.transcribe(path, 'guillaumekln/faster-whisper')
+```
+"""
+
+import bisect
+import datetime
+import io
+import logging
+import os
+import struct
+import tempfile
+import time
+from typing import Optional, Tuple, Union
+
+import numpy as np
+import soundfile
+
+from subsai.local_index import _timestamp
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PATH = os.environ.get('SUBSAI_ARCHIVE')
+ARCHIVE_RETENTION_HOURS = float(os.environ.get('SUBSAI_ARCHIVE_RETENTION_HOURS', 72))
+SAMPLING_RATE = 16000
+INDEX_FILE = 'index.bin'
+# name: (soundfile format, subtype, extension), the position is the format code of the index records
+FORMATS = {
+    'flac': ('FLAC', 'PCM_16', '.flac'),
+    'opus': ('OGG', 'OPUS', '.opus'),
+}
+_FORMAT_NAMES = list(FORMATS)
+# chunk start (milliseconds since the epoch), samples, format code
+_RECORD = struct.Struct('<qIB')
+
+AirTime = Union[str, float, datetime.datetime]
+
+
+class AudioArchive:
+    """
+    Segmented audio archive of a channel: one writer (the ingest process), any number of readers
+    """
+
+    def __init__(self,
+                 root: str,
+                 channel: str,
+                 chunk_seconds: float = 60.0,
+                 retention: float = ARCHIVE_RETENTION_HOURS * 3600,
+                 format: str = 'flac'):
+        """
+        :param root: archive directory, the channel is archived in its `channel` subdirectory
+        :param channel: channel name
+        :param chunk_seconds: audio of each chunk, the chunk being written is readable once complete
+        :param retention: seconds of audio kept, 0 keeps everything
+        :param format: 'flac' (lossless) or 'opus'
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unknown archive format {format}, expected one of {_FORMAT_NAMES}")
+        self.channel = channel
+        self.directory = os.path.join(root, channel)
+        os.makedirs(self.directory, exist_ok=True)
+        self.index_path = os.path.join(self.directory, INDEX_FILE)
+        self.chunk_samples = int(chunk_seconds * SAMPLING_RATE)
+        self.retention = retention
+        self.format = format
+
+        # the index, sorted by air time
+        self._starts = []
+        self._samples = []
+        self._formats = []
+        self._index_inode = None
+        self._index_size = 0
+        # the chunk being written
+        self._writer = None
+        self._writer_start = None
+        self._writer_samples = 0
+        # air time of the next written sample, seconds since the epoch
+        self._next_time = None
+        self._load()
+
+    def __len__(self) -> int:
+        self._load()
+        return len(self._starts)
+
+    def _chunk_path(self, start_ms: int, format_code: int) -> str:
+        return os.path.join(self.directory, f'{start_ms}{FORMATS[_FORMAT_NAMES[format_code]][2]}')
+
+    def _load(self) -> None:
+        # reads the records appended since the last call, or the whole index after it was rewritten
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            stat = None
+        if stat is None or stat.st_ino != self._index_inode or stat.st_size < self._index_size:
+            self._starts, self._samples, self._formats = [], [], []
+            self._index_inode = stat.st_ino if stat is not None else None
+            self._index_size = 0
+        if stat is None or stat.st_size - self._index_size < _RECORD.size:
+            return
+        with open(self.index_path, 'rb') as f:
+            f.seek(self._index_size)
+            data = f.read((stat.st_size - self._index_size) // _RECORD.size * _RECORD.size)
+        for start_ms, samples, format_code in _RECORD.iter_unpack(data):
+            self._starts.append(start_ms)
+            self._samples.append(samples)
+            self._formats.append(format_code)
+        self._index_size += len(data)
+
+    # writer
+
+    def write(self, audio: np.ndarray, air_time: Optional[AirTime] = None) -> None:
+        """
+        Appends audio after the previous one
+
+        :param audio: 16 kHz float32 PCM
+        :param air_time: air time of its first sample, only read by the first write: the audio that just arrived by
+                         default
+        """
+        if self._next_time is None:
+            self._next_time = (_timestamp(air_time) if air_time is not None
+                               else time.time() - len(audio) / SAMPLING_RATE)
+        while len(audio):
+            if self._writer is None:
+                self._open_chunk()
+            n = min(len(audio), self.chunk_samples - self._writer_samples)
+            self._writer.write(audio[:n])
+            self._writer_samples += n
+            self._next_time += n / SAMPLING_RATE
+            audio = audio[n:]
+            if self._writer_samples >= self.chunk_samples:
+                self._close_chunk()
+
+    def gap(self, seconds: float) -> None:
+        """the next audio airs `seconds` after the end of the previous one"""
+        self._close_chunk()
+        if self._next_time is not None:
+            self._next_time += seconds
+
+    def close(self) -> None:
+        """writes the chunk being written, the next write opens a new one"""
+        self._close_chunk()
+
+    def _open_chunk(self) -> None:
+        self._writer_start = int(round(self._next_time * 1000))
+        if self._starts and self._writer_start <= self._starts[-1]:
+            # a clock set back, the index stays sorted
+            self._writer_start = self._starts[-1] + 1
+        file_format, subtype, _ = FORMATS[self.format]
+        self._writer = soundfile.SoundFile(self._chunk_path(self._writer_start, _FORMAT_NAMES.index(self.format)),
+                                           'w', SAMPLING_RATE, 1, subtype, format=file_format)
+        self._writer_samples = 0
+
+    def _close_chunk(self) -> None:
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._writer = None
+        if self._writer_samples:
+            with open(self.index_path, 'ab') as f:
+                f.write(_RECORD.pack(self._writer_start, self._writer_samples, _FORMAT_NAMES.index(self.format)))
+            self._load()
+        else:
+            os.remove(self._chunk_path(self._writer_start, _FORMAT_NAMES.index(self.format)))
+        if self.retention:
+            self.prune()
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """
+        Deletes the chunks ended `retention` seconds or more before `now`
+
+        :return: the number of deleted chunks
+        """
+        self._load()
+        cutoff_ms = ((now if now is not None else time.time()) - self.retention) * 1000
+        n = 0
+        while n < len(self._starts) and self._starts[n] + self._samples[n] * 1000 / SAMPLING_RATE <= cutoff_ms:
+            n += 1
+        if not n:
+            return 0
+        # the index is replaced first: the readers never see a record of a deleted chunk
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            for record in zip(self._starts[n:], self._samples[n:], self._formats[n:]):
+                f.write(_RECORD.pack(*record))
+        os.replace(tmp, self.index_path)
+        for start_ms, format_code in zip(self._starts[:n], self._formats[:n]):
+            try:
+                os.remove(self._chunk_path(start_ms, format_code))
+            except FileNotFoundError:
+                pass
+        self._load()
+        logger.debug("%s: %d archive chunks pruned", self.channel, n)
+        return n
+
+    # readers
+
+    def time_range(self) -> Optional[Tuple[float, float]]:
+        """:return: (start, end) air times of the archived audio, in seconds since the epoch"""
+        self._load()
+        if not self._starts:
+            return None
+        return self._starts[0] / 1000, self._starts[-1] / 1000 + self._samples[-1] / SAMPLING_RATE
+
+    def seek(self, air_time: AirTime) -> Optional[Tuple[str, int]]:
+        """
+        :return: (chunk path, sample offset in it) of the sample aired at `air_time`, None if it's not archived
+        """
+        self._load()
+        t_ms = _timestamp(air_time) * 1000
+        i = bisect.bisect_right(self._starts, t_ms) - 1
+        if i < 0:
+            return None
+        offset = int((t_ms - self._starts[i]) * SAMPLING_RATE / 1000)
+        if offset >= self._samples[i]:
+            return None
+        return self._chunk_path(self._starts[i], self._formats[i]), offset
+
+    def read(self, start: AirTime, end: AirTime) -> np.ndarray:
+        """
+        :return: the 16 kHz float32 audio aired from `start` to `end`, silence where nothing is archived
+        """
+        self._load()
+        start, end = _timestamp(start), _timestamp(end)
+        out = np.zeros(max(0, int(round((end - start) * SAMPLING_RATE))), dtype=np.float32)
+        i = max(0, bisect.bisect_right(self._starts, start * 1000) - 1)
+        while i < len(self._starts) and self._starts[i] < end * 1000:
+            chunk_start = self._starts[i] / 1000
+            a = max(start, chunk_start)
+            b = min(end, chunk_start + self._samples[i] / SAMPLING_RATE)
+            if b > a:
+                position = int(round((a - start) * SAMPLING_RATE))
+                with soundfile.SoundFile(self._chunk_path(self._starts[i], self._formats[i])) as f:
+                    f.seek(int(round((a - chunk_start) * SAMPLING_RATE)))
+                    data = f.read(int(round((b - a) * SAMPLING_RATE)), dtype='float32')
+                data = data[:len(out) - position]
+                out[position:position + len(data)] = data
+            i += 1
+        return out
+
+    def read_wav(self, start: AirTime, end: AirTime) -> bytes:
+        """:return: the WAV file of the audio aired from `start` to `end`, for `st.audio`"""
+        buffer = io.BytesIO()
+        soundfile.write(buffer, self.read(start, end), SAMPLING_RATE, format='WAV', subtype='PCM_16')
+        return buffer.getvalue()
+
+    def extract(self, start: AirTime, end: AirTime, path: Optional[str] = None) -> str:
+        """
+        Writes the audio aired from `start` to `end` to a file, for `SubsAI.transcribe`
+
+        :param path: output file, its extension sets the format; a temporary WAV file by default
+        :return: the path of the file
+        """
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.wav', prefix=f'{self.channel}-')
+            os.close(fd)
+        soundfile.write(path, self.read(start, end), SAMPLING_RATE)
+        return path
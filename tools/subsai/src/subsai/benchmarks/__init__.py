@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks
+
+Each module is a command line tool that prints (or saves) its results as JSON, e.g.
+
+    python -m subsai.benchmarks.streaming_latency ./corpus --model tiny.en --device cpu --output results.json
+"""
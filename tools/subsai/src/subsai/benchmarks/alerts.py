@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Watch-list matcher benchmark
+
+Compiles watch lists of increasing sizes (1 to 3 word terms drawn from the archived subtitles vocabulary plus
+synthetic names) into :class:`subsai.alerts.KeywordMatcher` and measures the compile time, the subtitles, words
+and matches per second on the archived subtitles, with and without fuzzy matching. Small watch lists are also
+matched with a regex alternation, the usual alternative.
+
+Example:
+
+    python -m subsai.benchmarks.alerts --sizes 1000 10000 100000
+"""
+
+import argparse
+import glob
+import random
+import re
+import time
+
+from subsai.alerts import KeywordMatcher
+from subsai.benchmarks.common import environment, dump_results
+from subsai.local_index import split_sentences
+
+# larger watch lists make the regex alternation too slow to measure
+REGEX_MAX_SIZE = 10000
+
+
+def _watchlist(words, size, rng):
+    terms = set()
+    syllables = ['ka', 'lo', 'mi', 'zen', 'sky', 'ro', 'va', 'del', 'tor', 'ne', 'shi', 'ba', 'dor']
+    while len(terms) < size:
+        kind = rng.random()
+        if kind < 0.4:
+            # synthetic first and last names, rarely spoken
+            terms.add(' '.join(''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize()
+                               for _ in range(2)))
+        else:
+            i = rng.randrange(len(words) - 3)
+            terms.add(' '.join(words[i:i + rng.randint(1, 3)]))
+    return sorted(terms)
+
+
+def _measure(match, segments, repeat):
+    n_words = sum(len(s.split()) for s in segments)
+    matches = 0
+    t = time.perf_counter()
+    for _ in range(repeat):
+        for segment in segments:
+            matches += len(match(segment))
+    elapsed = time.perf_counter() - t
+    return {
+        'segments_per_second': len(segments) * repeat / elapsed,
+        'words_per_second': n_words * repeat / elapsed,
+        'matches_per_second': matches / elapsed,
+        'matches': matches // repeat,
+    }
+
+
+def run(text_glob: str, sizes, repeat: int, seed: int) -> dict:
+    paths = sorted(glob.glob(text_glob))
+    if not paths:
+        raise FileNotFoundError(f'No files match {text_glob}')
+    text = ' '.join(open(p, encoding='utf-8').read() for p in paths)
+    segments = split_sentences(text)
+    words = re.findall(r"[A-Za-z']+", text)
+    rng = random.Random(seed)
+
+    results = []
+    for size in sizes:
+        terms = _watchlist(words, size, rng)
+        for fuzzy in (False, True):
+            t = time.perf_counter()
+            matcher = KeywordMatcher(terms, fuzzy=fuzzy)
+            compile_seconds = time.perf_counter() - t
+            result = {'size': size, 'matcher': 'aho-corasick', 'fuzzy': fuzzy, 'compile_seconds': compile_seconds}
+            result.update(_measure(matcher.match, segments, repeat))
+            results.append(result)
+        if size <= REGEX_MAX_SIZE:
+            t = time.perf_counter()
+            pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\b', re.IGNORECASE)
+            compile_seconds = time.perf_counter() - t
+            result = {'size': size, 'matcher': 'regex', 'fuzzy': False, 'compile_seconds': compile_seconds}
+            result.update(_measure(pattern.findall, segments, repeat))
+            results.append(result)
+    return {
+        'benchmark': 'alerts',
+        'config': {'segments': len(segments), 'words': sum(len(s.split()) for s in segments), 'repeat': repeat},
+        'environment': environment(),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the watch-list matcher")
+    parser.add_argument('--text', default='volumes/nexanews_container/mysubs*.txt',
+                        help="Glob of the archived subtitles text files")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="Watch list sizes")
+    parser.add_argument('--repeat', type=int, default=5, help="Number of passes over the subtitles")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--output', default=None, help="Output JSON file, stdout by default")
+    args = parser.parse_args()
+    dump_results(run(args.text, args.sizes, args.repeat, args.seed), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Helpers shared by the benchmarks
+"""
+
+import json
+import platform
+import re
+import sys
+from typing import List, Sequence
+
+import numpy as np
+
+_PUNCTUATION = re.compile(r"[^\w' ]+")
+
+
+def percentiles(values: Sequence[float], qs: Sequence[int] = (50, 90, 95, 99)) -> dict:
+    """
+    Summary statistics of `values`
+
+    :param values: list of numbers
+    :param qs: percentiles to report
+    :return: dict with count, mean, max and the pXX percentiles (None values if `values` is empty)
+    """
+    if len(values) == 0:
+        return {'count': 0, 'mean': None, 'max': None, **{f'p{q}': None for q in qs}}
+    a = np.asarray(values, dtype=np.float64)
+    return {'count': int(a.size), 'mean': float(a.mean()), 'max': float(a.max()),
+            **{f'p{q}': float(np.percentile(a, q)) for q in qs}}
+
+
+def normalize_words(text: str) -> List[str]:
+    """
+    Lower-cased words without punctuation
+    """
+    return _PUNCTUATION.sub(' ', text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """
+    Word error rate: word-level Levenshtein distance divided by the number of reference words
+
+    :param reference: reference transcript
+    :param hypothesis: transcript to evaluate
+    :return: WER (can be above 1 with many insertions)
+    """
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return float(len(hyp) > 0)
+    previous = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def environment() -> dict:
+    """
+    Description of the machine the benchmark runs on, stored with the results
+    """
+    return {'python': sys.version.split()[0], 'platform': platform.platform(), 'processor': platform.processor()}
+
+
+def dump_results(results: dict, output: str = None) -> None:
+    """
+    Writes the results as JSON to `output`, or to stdout
+
+    :param results: JSON serializable results
+    :param output: path of the output file, or None for stdout
+    """
+    if output is None:
+        json.dump(results, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    else:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Subtitles search load test
+
+Loads synthetic subtitles (sentences of the archived subtitles text, spread over channels and days) into the
+time-based subtitles indices of a local Elasticsearch standing in for the production cluster (e.g. the
+`elasticsearch` service of docker-compose.yml), then measures the latency of a mix of
+:func:`subsai.elasticsearch_class.SubtitleDatabase.search` queries.
+
+Example (10M documents, then only the queries on the loaded indices):
+
+    python -m subsai.benchmarks.es_search --host localhost --docs 10000000 --output es_search.json
+    python -m subsai.benchmarks.es_search --host localhost --docs 10000000 --skip-load
+"""
+
+import argparse
+import datetime
+import glob
+import random
+import re
+import time
+
+from elasticsearch import helpers
+
+from subsai.benchmarks.common import percentiles, environment, dump_results
+from subsai.elasticsearch_class import SubtitleDatabase, setup_subtitles_index
+
+# not matched by the `subtitles-*` pattern of the production template
+ALIAS = 'loadtest-subtitles'
+QUERY_KINDS = ['term', 'phrase', 'channel', 'time_range', 'channel_time_range', 'latest', 'paginate']
+
+
+def _sentences(text_glob: str):
+    sentences = []
+    for file in sorted(glob.glob(text_glob)):
+        with open(file, encoding='utf-8') as f:
+            sentences.extend(s.strip() for s in re.split(r'(?<=[.!?])\s+', f.read()) if len(s.split()) >= 3)
+    if not sentences:
+        raise FileNotFoundError(f'No text in {text_glob}')
+    return sentences
+
+
+def _documents(sentences, n_docs, channels, days, seed):
+    rng = random.Random(seed)
+    end = datetime.datetime.now(datetime.timezone.utc)
+    span = days * 86400
+    for _ in range(n_docs):
+        start = end - datetime.timedelta(seconds=rng.random() * span)
+        stop = start + datetime.timedelta(seconds=rng.uniform(2, 30))
+        yield {
+            '_index': ALIAS,
+            '_source': {
+                'start': start.isoformat(),
+                'end': stop.isoformat(),
+                'start_time': start.strftime('%H:%M:%S'),
+                'end_time': stop.strftime('%H:%M:%S'),
+                'text': rng.choice(sentences),
+                'channel': rng.choice(channels),
+            },
+        }
+
+
+def load(db: SubtitleDatabase, sentences, n_docs, channels, days, batch_size, threads, seed) -> dict:
+    setup_subtitles_index(db.es, ALIAS, max_age='30d', max_primary_shard_size='50gb')
+    # bulk load settings, restored after
+    db.es.indices.put_settings(index=ALIAS, settings={'refresh_interval': '-1'})
+    t = time.perf_counter()
+    indexed = 0
+    for ok, _ in helpers.parallel_bulk(db.es, _documents(sentences, n_docs, channels, days, seed),
+                                       thread_count=threads, chunk_size=batch_size, raise_on_error=False):
+        indexed += ok
+    load_seconds = time.perf_counter() - t
+    db.es.indices.put_settings(index=ALIAS, settings={'refresh_interval': '5s'})
+    db.es.indices.refresh(index=ALIAS)
+    return {'documents': indexed, 'seconds': load_seconds, 'documents_per_second': indexed / load_seconds}
+
+
+def _query(db, kind, rng, sentences, channels, days):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    words = rng.choice(sentences).split()
+    i = rng.randrange(max(1, len(words) - 2))
+    if kind == 'term':
+        return db.search(words[i], index_name=ALIAS)
+    if kind == 'phrase':
+        return db.search(' '.join(words[i:i + 3]), index_name=ALIAS)
+    if kind == 'channel':
+        return db.search(words[i], index_name=ALIAS, channels=[rng.choice(channels)])
+    if kind == 'time_range':
+        start = now - datetime.timedelta(days=rng.uniform(0, days))
+        return db.search(words[i], index_name=ALIAS, start=start, end=start + datetime.timedelta(hours=1))
+    if kind == 'channel_time_range':
+        start = now - datetime.timedelta(days=rng.uniform(0, days))
+        return db.search(words[i], index_name=ALIAS, channels=[rng.choice(channels)], start=start,
+                         end=start + datetime.timedelta(days=1))
+    if kind == 'latest':
+        return db.search(index_name=ALIAS, channels=[rng.choice(channels)])
+    if kind == 'paginate':
+        # 5 pages of a point in time
+        pit_id = db.open_point_in_time(ALIAS)
+        try:
+            result = None
+            search_after = None
+            for _ in range(5):
+                result = db.search(words[i], pit_id=pit_id, search_after=search_after)
+                pit_id = result['pit_id']
+                search_after = result['search_after']
+                if search_after is None:
+                    break
+            return result
+        finally:
+            db.close_point_in_time(pit_id)
+    raise ValueError(f'Unknown query kind `{kind}`, it should be one of the following: {QUERY_KINDS}')
+
+
+def run(host, port, text_glob, n_docs, channels, days, queries, batch_size, threads, skip_load, seed) -> dict:
+    db = SubtitleDatabase(host=host, port=port)
+    sentences = _sentences(text_glob)
+    channel_names = [f'channel-{i}' for i in range(channels)]
+    load_results = None if skip_load else load(db, sentences, n_docs, channel_names, days, batch_size, threads,
+                                                seed)
+    count = db.es.count(index=ALIAS)['count']
+
+    rng = random.Random(seed + 1)
+    # warm up the caches of the node
+    for kind in QUERY_KINDS:
+        _query(db, kind, rng, sentences, channel_names, days)
+    results = {}
+    for kind in QUERY_KINDS:
+        latencies = []
+        for _ in range(queries):
+            t = time.perf_counter()
+            _query(db, kind, rng, sentences, channel_names, days)
+            latencies.append(time.perf_counter() - t)
+        results[kind] = {'latency': percentiles(latencies)}
+    return {
+        'benchmark': 'es_search',
+        'config': {'host': host, 'documents': count, 'channels': channels, 'days': days, 'queries': queries},
+        'environment': environment(),
+        'cluster': db.es.info().body['version'],
+        'load': load_results,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the subtitles search")
+    parser.add_argument('--host', default='localhost', help="Elasticsearch host")
+    parser.add_argument('--port', type=int, default=9200, help="Elasticsearch port")
+    parser.add_argument('--text', default='volumes/nexanews_container/mysubs*.txt',
+                        help="Glob of the text files the subtitles are sampled from")
+    parser.add_argument('--docs', type=int, default=10_000_000, help="Number of documents to load")
+    parser.add_argument('--channels', type=int, default=50, help="Number of channels")
+    parser.add_argument('--days', type=int, default=30, help="Air time span of the documents")
+    parser.add_argument('--queries', type=int, default=200, help="Number of queries of each kind")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Bulk request size")
+    parser.add_argument('--threads', type=int, default=4, help="Bulk indexing threads")
+    parser.add_argument('--skip-load', action='store_true', help="Only run the queries on the loaded documents")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--output', default=None, help="Output JSON file, stdout by default")
+    args = parser.parse_args()
+
+    dump_results(run(args.host, args.port, args.text, args.docs, args.channels, args.days, args.queries,
+                     args.batch_size, args.threads, args.skip_load, args.seed), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Repeated audio cache benchmark
+
+Simulates a channel airing unique programs with ad breaks drawn from a small pool of commercials, each airing
+with its own gain, noise and sample offset, and streams it through :class:`subsai.fingerprint.RepeatSkipper` in
+1 second chunks, as the live pipeline does. The ASR is replaced by a processor committing one word per second of
+audio it receives, naming the audio it heard, so the cached transcripts can be checked.
+
+Reports the fingerprinting cost (seconds per audio second), the fraction of the audio not transcribed against the
+fraction of repeated audio, the unique audio wrongly skipped, and the accuracy of the cached words.
+The programs and commercials are cut from the WAV files of `--corpus`, or synthesized (tones with decays and
+noise) without it.
+
+Example:
+
+    python -m subsai.benchmarks.fingerprint --hours 2 --corpus ./corpus
+"""
+
+import argparse
+import pathlib
+import random
+import time
+
+import numpy as np
+
+from subsai.benchmarks.common import environment, dump_results
+from subsai.fingerprint import SAMPLING_RATE, RepeatSkipper
+
+
+class _Asr:
+    sep = ' '
+
+
+class _LabelingProcessor:
+    """
+    Stands in for OnlineASRProcessor: commits a word per second of received audio, the label of that second
+    """
+
+    def __init__(self, labels):
+        self.asr = _Asr()
+        self.labels = labels
+        self.skipper = None
+        self.commited = []
+        self.buffer_time_offset = 0.0
+        self.received = 0
+
+    def insert_audio_chunk(self, audio):
+        start = self.received / SAMPLING_RATE
+        self.received += len(audio)
+        for second in range(int(np.ceil(start)), int(self.received / SAMPLING_RATE)):
+            label = self.labels[int(self.skipper._stream_time(second))]
+            self.commited.append((second, second + 1, label))
+        self.buffer_time_offset = self.received / SAMPLING_RATE
+        return True
+
+
+def _synthetic_clip(seconds, rng):
+    n = int(seconds * SAMPLING_RATE)
+    clip = np.zeros(n, dtype=np.float32)
+    pos = 0
+    while pos < n:
+        # notes and syllables: a few partials decaying from an onset
+        d = min(int(rng.uniform(0.1, 0.4) * SAMPLING_RATE), n - pos)
+        t = np.arange(d) / SAMPLING_RATE
+        for _ in range(3):
+            clip[pos:pos + d] += (rng.uniform(0.05, 0.3) * np.sin(2 * np.pi * rng.uniform(100, 4000) * t)
+                                  * np.exp(-t / rng.uniform(0.05, 0.2)))
+        pos += d
+    return clip + 0.003 * rng.standard_normal(n).astype(np.float32)
+
+
+def _corpus_clips(corpus):
+    from subsai.models.whisper_online import load_audio
+    clips = [load_audio(str(p)) for p in sorted(pathlib.Path(corpus).glob('*.wav'))]
+    if not clips:
+        raise FileNotFoundError(f'No WAV file in {corpus}')
+    return np.concatenate(clips)
+
+
+def _channel(hours, n_ads, break_minutes, ads_per_break, snr_db, corpus, seed):
+    """
+    :return: (audio, label of each second, repeated seconds)
+    """
+    rng = np.random.default_rng(seed)
+    pick = random.Random(seed)
+    ad_seconds = [pick.choice([10, 15, 20, 30]) for _ in range(n_ads)]
+    source = _corpus_clips(corpus) if corpus else None
+    if source is not None:
+        need = int((sum(ad_seconds) + hours * 3600) * SAMPLING_RATE)
+        source = np.resize(source, need)
+    cursor = 0
+
+    def clip(seconds):
+        nonlocal cursor
+        if source is None:
+            return _synthetic_clip(seconds, rng)
+        n = int(seconds * SAMPLING_RATE)
+        cursor += n
+        return source[cursor - n:cursor]
+
+    ads = [clip(s) for s in ad_seconds]
+    parts, labels = [], []
+    aired = set()
+    repeated = 0
+    total = 0
+    while total < hours * 3600:
+        program = pick.randint(break_minutes * 30, break_minutes * 90)
+        parts.append(clip(program))
+        labels.extend(f'program:{total + s}' for s in range(program))
+        total += program
+        for _ in range(ads_per_break):
+            ad = pick.randrange(n_ads)
+            audio = ads[ad] * 10 ** (pick.uniform(-2, 2) / 20)
+            noise = np.sqrt(np.mean(audio ** 2)) * 10 ** (-snr_db / 20)
+            # another encoding of the same audio, shifted by a fraction of the fingerprint frames
+            offset = pick.randrange(256)
+            audio = np.concatenate([np.zeros(offset, dtype=np.float32), audio])[:len(audio)]
+            parts.append((audio + noise * rng.standard_normal(len(audio))).astype(np.float32))
+            labels.extend(f'ad{ad}:{s}' for s in range(ad_seconds[ad]))
+            repeated += ad_seconds[ad] if ad in aired else 0
+            aired.add(ad)
+            total += ad_seconds[ad]
+    return np.concatenate(parts), labels, repeated
+
+
+def run(hours, n_ads, break_minutes, ads_per_break, snr_db, block_seconds, corpus, seed) -> dict:
+    audio, labels, repeated = _channel(hours, n_ads, break_minutes, ads_per_break, snr_db, corpus, seed)
+    online = _LabelingProcessor(labels)
+    skipper = RepeatSkipper(online, block_seconds=block_seconds)
+    online.skipper = skipper
+
+    skipped_blocks = []
+    t = time.perf_counter()
+    for start in range(0, len(audio), SAMPLING_RATE):
+        skipped = skipper.skipped_seconds
+        skipper.insert_audio_chunk(audio[start:start + SAMPLING_RATE])
+        if skipper.skipped_seconds > skipped:
+            skipped_blocks.append((skipper.stream_seconds - block_seconds, skipper.stream_seconds))
+    elapsed = time.perf_counter() - t
+
+    # the blocks of the programs are unique, skipping them is a false match
+    skipped_unique = sum(end - start for start, end in skipped_blocks if labels[int(start)].startswith('program'))
+    # the cached words name the second of the ad they were transcribed from
+    cached = correct = 0
+    for start, end in skipped_blocks:
+        for word_start, _, word in skipper._words_between(start, end):
+            cached += 1
+            correct += word == labels[min(int(round(word_start)), len(labels) - 1)]
+    duration = len(audio) / SAMPLING_RATE
+    return {
+        'benchmark': 'fingerprint',
+        'config': {'hours': hours, 'ads': n_ads, 'break_minutes': break_minutes, 'ads_per_break': ads_per_break,
+                   'snr_db': snr_db, 'block_seconds': block_seconds, 'corpus': corpus},
+        'environment': environment(),
+        'results': {
+            'audio_seconds': duration,
+            'seconds_per_audio_second': elapsed / duration,
+            'repeated_fraction': repeated / duration,
+            'saved_fraction': skipper.saved_fraction,
+            'unique_skipped_seconds': skipped_unique,
+            'cached_words': cached,
+            'cached_words_accuracy': correct / cached if cached else None,
+            'index_hashes': skipper.index.size,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the repeated audio cache")
+    parser.add_argument('--hours', type=float, default=1, help="Simulated air time")
+    parser.add_argument('--ads', type=int, default=20, help="Number of distinct commercials")
+    parser.add_argument('--break-minutes', type=int, default=10, help="Average minutes between the ad breaks")
+    parser.add_argument('--ads-per-break', type=int, default=4, help="Commercials of an ad break")
+    parser.add_argument('--snr', type=float, default=30, help="Signal to noise ratio of the airings, in dB")
+    parser.add_argument('--block-seconds', type=float, default=4.0, help="Fingerprinted block")
+    parser.add_argument('--corpus', default=None, help="Directory of WAV files, synthesized audio by default")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--output', default=None, help="Output JSON file, stdout by default")
+    args = parser.parse_args()
+
+    dump_results(run(args.hours, args.ads, args.break_minutes, args.ads_per_break, args.snr, args.block_seconds,
+                     args.corpus, args.seed), args.output)
+
+
+if __name__ == '__main__':
+    main()
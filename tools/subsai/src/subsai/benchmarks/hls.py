@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HLS ingest benchmark: native client against ffmpeg
+
+Serves `--channels` copies of an HLS stream of AAC segments from a local server (in another process, so its CPU is
+not counted), and ingests all of them as fast as the client can, with:
+
+* `native`: one :class:`subsai.hls.HLSClient` event loop for all the channels
+* `ffmpeg`: one ffmpeg process per channel, with the command of :func:`subsai.ingest.ffmpeg_command` (skipped when
+  ffmpeg is not installed)
+
+Reports the CPU seconds per audio second, and the channels one core can ingest in real time (audio seconds per CPU
+second), with the time to the first audio chunk of each channel.
+
+Example:
+
+    python -m subsai.benchmarks.hls --channels 32 --minutes 10
+"""
+
+import argparse
+import functools
+import http.server
+import io
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from subsai.benchmarks.common import environment, dump_results, percentiles
+from subsai.hls import HLSClient
+from subsai.ingest import SAMPLING_RATE, ffmpeg_command
+
+
+def _write_stream(directory, segments, segment_seconds, rate=48000, seed=0):
+    # a VOD playlist of distinct AAC segments of noise bursts and tones, stereo like the broadcast renditions
+    import av
+    rng = np.random.default_rng(seed)
+    lines = ['#EXTM3U', f'#EXT-X-TARGETDURATION:{int(np.ceil(segment_seconds))}', '#EXT-X-MEDIA-SEQUENCE:0']
+    for i in range(segments):
+        n = int(segment_seconds * rate)
+        t = np.arange(n) / rate
+        samples = 0.2 * np.sin(2 * np.pi * rng.uniform(100, 2000) * t) + 0.05 * rng.standard_normal(n)
+        out = io.BytesIO()
+        with av.open(out, 'w', format='mpegts') as container:
+            stream = container.add_stream('aac', rate=rate, layout='stereo')
+            frame = av.AudioFrame.from_ndarray(np.tile(samples.astype(np.float32), (2, 1)), format='fltp',
+                                               layout='stereo')
+            frame.sample_rate = rate
+            for packet in stream.encode(frame):
+                container.mux(packet)
+            for packet in stream.encode(None):
+                container.mux(packet)
+        with open(os.path.join(directory, f'seg{i}.ts'), 'wb') as f:
+            f.write(out.getvalue())
+        lines += [f'#EXTINF:{segment_seconds:.3f},', f'seg{i}.ts']
+    lines.append('#EXT-X-ENDLIST')
+    with open(os.path.join(directory, 'audio.m3u8'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(directory, port):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=directory))
+    port.value = server.server_port
+    server.serve_forever()
+
+
+def _cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _summary(audio_seconds, cpu_seconds, wall_seconds, first_audio):
+    return {
+        'audio_seconds': audio_seconds,
+        'cpu_seconds': cpu_seconds,
+        'wall_seconds': wall_seconds,
+        'cpu_per_audio_second': cpu_seconds / audio_seconds if audio_seconds else None,
+        'channels_per_core': audio_seconds / cpu_seconds if cpu_seconds else None,
+        'first_audio_seconds': percentiles(first_audio),
+    }
+
+
+def run_native(url, channels, prefetch, decoders) -> dict:
+    client = HLSClient(prefetch=prefetch, decoders=decoders)
+    received = [0] * channels
+    first_audio = [None] * channels
+    start = time.perf_counter()
+
+    def sink(i, chunk):
+        if first_audio[i] is None:
+            first_audio[i] = time.perf_counter() - start
+        received[i] += len(chunk)
+
+    for i in range(channels):
+        client.add_channel(f'channel{i}', url, functools.partial(sink, i))
+    cpu = _cpu_seconds()
+    client.run()
+    return _summary(sum(received) / SAMPLING_RATE, _cpu_seconds() - cpu, time.perf_counter() - start,
+                    [t for t in first_audio if t is not None])
+
+
+def run_ffmpeg(url, channels) -> dict:
+    received = [0] * channels
+    first_audio = [None] * channels
+    start = time.perf_counter()
+    cpu = _cpu_seconds()
+
+    def read(i):
+        process = subprocess.Popen(ffmpeg_command(url), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        while True:
+            data = process.stdout.read(2 * SAMPLING_RATE)
+            if not data:
+                break
+            if first_audio[i] is None:
+                first_audio[i] = time.perf_counter() - start
+            received[i] += len(data) // 2
+        process.wait()
+
+    threads = [threading.Thread(target=read, args=(i,)) for i in range(channels)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _summary(sum(received) / SAMPLING_RATE, _cpu_seconds() - cpu, time.perf_counter() - start,
+                    [t for t in first_audio if t is not None])
+
+
+def run(channels, minutes, segment_seconds, prefetch, decoders) -> dict:
+    directory = tempfile.mkdtemp()
+    port = multiprocessing.Value('i', 0)
+    server = multiprocessing.Process(target=_serve, args=(directory, port), daemon=True)
+    try:
+        _write_stream(directory, int(np.ceil(minutes * 60 / segment_seconds)), segment_seconds)
+        server.start()
+        while not port.value:
+            time.sleep(0.01)
+        url = f'http://127.0.0.1:{port.value}/audio.m3u8'
+        results = {'native': run_native(url, channels, prefetch, decoders)}
+        results['ffmpeg'] = run_ffmpeg(url, channels) if shutil.which('ffmpeg') else None
+    finally:
+        server.terminate()
+        shutil.rmtree(directory)
+    return {
+        'benchmark': 'hls',
+        'config': {'channels': channels, 'minutes': minutes, 'segment_seconds': segment_seconds,
+                   'prefetch': prefetch, 'decoders': decoders},
+        'environment': {**environment(), 'cpus': os.cpu_count()},
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the native HLS client against ffmpeg")
+    parser.add_argument('--channels', type=int, default=16, help="Channels ingested at once")
+    parser.add_argument('--minutes', type=float, default=5, help="Audio of each channel")
+    parser.add_argument('--segment-seconds', type=float, default=6.0, help="Duration of the HLS segments")
+    parser.add_argument('--prefetch', type=int, default=3, help="Segments downloaded ahead per channel")
+    parser.add_argument('--decoders', type=int, default=None, help="Decoder threads, the number of CPUs by default")
+    parser.add_argument('--output', default=None, help="Output JSON file, stdout by default")
+    args = parser.parse_args()
+
+    dump_results(run(args.channels, args.minutes, args.segment_seconds, args.prefetch, args.decoders), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Channel ingest cost benchmark
+
+Runs ffmpeg on each channel for a while with the command of the live pipeline before the rendition selection (the
+configured URL, every stream demuxed) and after it (:func:`subsai.ingest.select_rendition` and
+:func:`subsai.ingest.ffmpeg_command`), and reports the ingress bandwidth (bytes read by ffmpeg) and the ffmpeg CPU
+time per second of audio of both. Reads /proc, so it only runs on Linux.
+
+Example:
+
+    python -m subsai.benchmarks.ingest --channels cnn.us CBS.us --seconds 60
+"""
+
+import argparse
+import subprocess
+import time
+
+from subsai.benchmarks.common import environment, dump_results
+from subsai.configs import AVAILABLE_CHANNELS
+from subsai.ingest import SAMPLING_RATE, ffmpeg_command, process_stats, select_rendition
+
+
+def _measure(cmd, seconds) -> dict:
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    audio_bytes = 0
+    stats = None
+    t = time.monotonic()
+    try:
+        while time.monotonic() - t < seconds:
+            data = process.stdout.read(SAMPLING_RATE * 2)
+            if not data:
+                break
+            audio_bytes += len(data)
+            stats = process_stats(process.pid) or stats
+    finally:
+        process.terminate()
+        process.wait()
+    elapsed = time.monotonic() - t
+    if stats is None:
+        raise RuntimeError(f'No statistics of `{" ".join(cmd)}`: ffmpeg failed or /proc is not available')
+    cpu_seconds, read_bytes = stats
+    audio_seconds = audio_bytes / 2 / SAMPLING_RATE
+    return {
+        'seconds': elapsed,
+        'audio_seconds': audio_seconds,
+        'ingress_kbps': read_bytes * 8 / 1000 / elapsed,
+        'read_bytes_per_audio_second': read_bytes / audio_seconds if audio_seconds else None,
+        'cpu_seconds_per_audio_second': cpu_seconds / audio_seconds if audio_seconds else None,
+    }
+
+
+def run(channels, seconds) -> dict:
+    results = {}
+    for channel in channels:
+        url = AVAILABLE_CHANNELS[channel]['url']
+        rendition = select_rendition(url)
+        before = _measure(ffmpeg_command(url, audio_only=False), seconds)
+        after = _measure(ffmpeg_command(rendition.url), seconds)
+        results[channel] = {
+            'url': url,
+            'rendition': rendition._asdict(),
+            'before': before,
+            'after': after,
+            'ingress_reduction': 1 - after['ingress_kbps'] / before['ingress_kbps'] if before['ingress_kbps'] else None,
+        }
+    return {
+        'benchmark': 'ingest',
+        'config': {'channels': channels, 'seconds': seconds},
+        'environment': environment(),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingress bandwidth and CPU of the channel ingest")
+    parser.add_argument('--channels', nargs='+', default=list(AVAILABLE_CHANNELS.keys()), help="Channels")
+    parser.add_argument('--seconds', type=float, default=60, help="Measurement duration of each command")
+    parser.add_argument('--output', default=None, help="Output JSON file, stdout by default")
+    args = parser.parse_args()
+
+    dump_results(run(args.channels, args.seconds), args.output)
+
+
+if __name__ == '__main__':
+    main()
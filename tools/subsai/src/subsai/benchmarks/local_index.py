@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Embedded full-text index benchmark
+
+Indexes the archived subtitles text files in :class:`subsai.local_index.LocalSubtitleDatabase` and compares the
+latency of term, phrase and time-range queries with scanning the text files, which is how the archive is
+searched without an index. `--scale` replicates the corpus to measure larger archives.
+
+Example:
+
+    python -m subsai.benchmarks.local_index --text 'volumes/nexanews_container/mysubs*.txt' --scale 100
+"""
+
+import argparse
+import glob
+import os
+import random
+import re
+import tempfile
+import time
+
+from subsai.benchmarks.common import percentiles, environment, dump_results
+from subsai.local_index import LocalSubtitleDatabase, split_sentences
+
+
+def _scan(paths, query: str, phrase: bool) -> int:
+    # what grepping the archive does: read every file and match case-insensitively
+    if phrase:
+        pattern = re.compile(r'\b' + r'\s+'.join(map(re.escape, query.split())) + r'\b', re.IGNORECASE)
+    else:
+        pattern = re.compile(r'\b(?:' + '|'.join(map(re.escape, query.split())) + r')\b', re.IGNORECASE)
+    matches = 0
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            for sentence in split_sentences(f.read()):
+                if pattern.search(sentence):
+                    matches += 1
+    return matches
+
+
+def run(text_glob: str, scale: int, queries: int, seed: int) -> dict:
+    paths = sorted(glob.glob(text_glob))
+    if not paths:
+        raise FileNotFoundError(f'No files match {text_glob}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # replicated archive, the scan reads the same amount of text as the index holds
+        scan_paths = []
+        for i in range(scale):
+            for path in paths:
+                copy = os.path.join(tmp_dir, f'{i}_{os.path.basename(path)}')
+                with open(path, 'rb') as src, open(copy, 'wb') as dst:
+                    dst.write(src.read())
+                scan_paths.append(copy)
+        archive_bytes = sum(os.path.getsize(p) for p in scan_paths)
+
+        db = LocalSubtitleDatabase(os.path.join(tmp_dir, 'subtitles.db'))
+        t = time.perf_counter()
+        documents = 0
+        for i in range(scale):
+            documents += db.ingest_archive(paths, channel=f'channel-{i}')
+        ingest_seconds = time.perf_counter() - t
+        index_bytes = sum(os.path.getsize(p) for p in glob.glob(os.path.join(tmp_dir, 'subtitles.db*')))
+
+        rng = random.Random(seed)
+        words = [w for w in re.findall(r"[A-Za-z']{4,}", ' '.join(open(p, encoding='utf-8').read() for p in paths))]
+        sentences = [s.split() for p in paths for s in split_sentences(open(p, encoding='utf-8').read())
+                     if len(s.split()) >= 4]
+        results = {}
+        for kind in ('term', 'phrase', 'time_range'):
+            index_latencies = []
+            scan_latencies = []
+            for _ in range(queries):
+                if kind == 'phrase':
+                    sentence = rng.choice(sentences)
+                    i = rng.randrange(len(sentence) - 2)
+                    query = ' '.join(re.sub(r'[^\w\s]', '', w) for w in sentence[i:i + 3])
+                    index_query = f'"{query}"'
+                else:
+                    query = index_query = rng.choice(words)
+                kwargs = {}
+                if kind == 'time_range':
+                    # a random channel and 10 minutes window of its archive
+                    kwargs['channels'] = [f'channel-{rng.randrange(scale)}']
+                    hit = db.search(index_query, channels=kwargs['channels'], size=1, highlight=False)['hits']
+                    if hit:
+                        kwargs['start'] = hit[0]['source']['start']
+                        kwargs['end'] = hit[0]['source']['end']
+                t = time.perf_counter()
+                db.search(index_query, size=20, **kwargs)
+                index_latencies.append(time.perf_counter() - t)
+                t = time.perf_counter()
+                _scan(scan_paths, query, kind == 'phrase')
+                scan_latencies.append(time.perf_counter() - t)
+            index_summary = percentiles(index_latencies)
+            scan_summary = percentiles(scan_latencies)
+            results[kind] = {
+                'index_latency': index_summary,
+                'scan_latency': scan_summary,
+                'p50_speedup': scan_summary['p50'] / index_summary['p50'],
+            }
+        db.close()
+    return {
+        'benchmark': 'local_index',
+        'config': {'files': len(paths), 'scale': scale, 'queries': queries},
+        'environment': environment(),
+        'documents': documents,
+        'archive_bytes': archive_bytes,
+        'index_bytes': index_bytes,
+        'ingest_seconds': ingest_seconds,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedded full-text index against scanning the archive files")
+    parser.add_argument('--text', default='volumes/nexanews_container/mysubs*.txt',
+                        help="Glob of the archived subtitles text files")
+    parser.add_argument('--scale', type=int, default=10, help="Number of copies of the archive")
+    parser.add_argument('--queries', type=int, default=50, help="Number of queries of each kind")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--output', default=None, help="Output JSON file, stdout by default")
+    args = parser.parse_args()
+    dump_results(run(args.text, args.scale, args.queries, args.seed), args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Cross-channel story detection benchmark
+
+Cuts the archived subtitles into stories (runs of consecutive sentences), then simulates channels airing random
+stories in random order, each with its own subtitle boundaries and ASR-like errors (dropped and substituted
+words), and feeds the subtitles of all the channels to :class:`subsai.stories.StoryClusterer` in air time order.
+Measures the assignment latency, the throughput, the memory of the sketches, the precision of the story IDs (the
+window that created the ID is from the same story) and their recall (the windows with an overlapping window of
+the same story on another channel within the horizon got an existing ID).
+
+Example:
+
+    python -m subsai.benchmarks.stories --channels 20 --hours 24
+"""
+
+import argparse
+import collections
+import glob
+import random
+import time
+import tracemalloc
+
+from subsai.benchmarks.common import percentiles, environment, dump_results
+from subsai.local_index import split_sentences
+from subsai.stories import StoryClusterer
+
+
+def _stories(text_glob, story_words):
+    stories, current = [], []
+    for file in sorted(glob.glob(text_glob)):
+        with open(file, encoding='utf-8', errors='replace') as f:
+            for sentence in split_sentences(f.read()):
+                current.extend(sentence.split())
+                if len(current) >= story_words:
+                    stories.append(current)
+                    current = []
+    if not stories:
+        raise FileNotFoundError(f'No text in {text_glob}')
+    return stories
+
+
+def _air(story, rng, error_rate, vocabulary):
+    """
+    :return: aired words and their position in the story
+    """
+    words, positions = [], []
+    for position, word in enumerate(story):
+        r = rng.random()
+        if r < error_rate / 2:
+            continue
+        words.append(rng.choice(vocabulary) if r < error_rate else word)
+        positions.append(position)
+    return words, positions
+
+
+def _subtitles(stories, channels, hours, error_rate, seed):
+    """
+    :return: (air time, channel, text, story index, story positions of the words) sorted by air time
+    """
+    rng = random.Random(seed)
+    vocabulary = [w for story in stories for w in story]
+    subtitles = []
+    for c in range(channels):
+        channel = f'channel-{c}'
+        t = rng.uniform(0, 600)
+        while t < hours * 3600:
+            story = rng.randrange(len(stories))
+            words, positions = _air(stories[story], rng, error_rate, vocabulary)
+            i = 0
+            while i < len(words):
+                # subtitles of 2 to 8 seconds at 2.5 words per second
+                n = rng.randint(5, 20)
+                subtitles.append((t, channel, ' '.join(words[i:i + n]), story, positions[i:i + n]))
+                t += n / 2.5
+                i += n
+            # commercials
+            t += rng.uniform(0, 120)
+    subtitles.sort(key=lambda s: s[0])
+    return subtitles
+
+
+def _source(window):
+    """
+    :param window: (story, position) of the words of a window
+    :return: (story, first position, last position) of the words of its main story
+    """
+    story = collections.Counter(s for s, _ in window).most_common(1)[0][0]
+    positions = [p for s, p in window if s == story]
+    return story, min(positions), max(positions)
+
+
+def _overlaps(a, b):
+    # the main stories are the same and their spans overlap by more than half
+    if a[0] != b[0]:
+        return False
+    overlap = min(a[2], b[2]) - max(a[1], b[1])
+    return overlap > (a[2] - a[1]) / 2
+
+
+def run(text_glob, channels, hours, story_words, error_rate, threshold, num_perm, bands, window_words, horizon,
+        seed) -> dict:
+    stories = _stories(text_glob, story_words)
+    subtitles = _subtitles(stories, channels, hours, error_rate, seed)
+    clusterer = StoryClusterer(threshold=threshold, num_perm=num_perm, bands=bands, window_words=window_words,
+                               horizon=horizon)
+
+    tracemalloc.start()
+    latencies = []
+    assigned = []
+    max_entries = 0
+    t = time.perf_counter()
+    for air_time, channel, text, _, _ in subtitles:
+        start = time.perf_counter()
+        story_id = clusterer.assign(channel, text, air_time)
+        latencies.append(time.perf_counter() - start)
+        assigned.append(story_id)
+        max_entries = max(max_entries, len(clusterer._entries))
+    elapsed = time.perf_counter() - t
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # a window is a duplicate if another channel aired an overlapping window of the same story within the horizon,
+    # a match is correct if the window that created the story ID has the same main story
+    windows = {}
+    origins = {}
+    earlier = collections.defaultdict(collections.deque)
+    duplicates = matches = correct = found = 0
+    for (air_time, channel, _, story, positions), story_id in zip(subtitles, assigned):
+        window = windows.setdefault(channel, collections.deque(maxlen=window_words))
+        window.extend((story, p) for p in positions)
+        if story_id is None:
+            continue
+        source = _source(window)
+        candidates = earlier[source[0]]
+        while candidates and air_time - candidates[0][0] > horizon:
+            candidates.popleft()
+        duplicate = any(c != channel and _overlaps(source, s) for _, c, s in candidates)
+        candidates.append((air_time, channel, source))
+        if story_id not in origins:
+            origins[story_id] = source
+        else:
+            matches += 1
+            correct += origins[story_id][0] == source[0]
+        duplicates += duplicate
+        found += duplicate and origins[story_id] is not source
+
+    return {
+        'benchmark': 'stories',
+        'config': {'text': text_glob, 'stories': len(stories), 'channels': channels, 'hours': hours,
+                   'story_words': story_words, 'error_rate': error_rate, 'threshold': threshold,
+                   'num_perm': num_perm, 'bands': bands, 'window_words': window_words, 'horizon': horizon},
+        'environment': environment(),
+        'results': {
+            'subtitles': len(subtitles),
+            'subtitles_per_second': len(subtitles) / elapsed,
+            'latency': percentiles(latencies),
+            # measured with tracemalloc, which slows the run down
+            'peak_memory_mb': peak / 2 ** 20,
+            'max_entries': max_entries,
+            'story_ids': len(origins),
+            'duplicates': duplicates,
+            'matches': matches,
+            'precision': correct / matches if matches else None,
+            'recall': found / duplicates if duplicates else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the cross-channel story detection")
+    parser.add_argument('--text', default='volumes/nexanews_container/mysubs*.txt',
+                        help="Glob of the text files the stories are cut from")
+    parser.add_argument('--channels', type=int, default=20, help="Number of simulated channels")
+    parser.add_argument('--hours', type=float, default=24, help="Simulated air time")
+    parser.add_argument('--story-words', type=int, default=150, help="Words of a story")
+    parser.add_argument('--error-rate', type=float, default=0.1, help="Dropped or substituted words rate")
+    parser.add_argument('--threshold', type=float, default=0.3, help="Jaccard similarity threshold")
+    parser.add_argument('--num-perm', type=int, default=96, help="MinHash signature size")
+    parser.add_argument('--bands', type=int, default=32, help="LSH bands")
+    parser.add_argument('--window-words', type=int, default=60, help="Words of the sketched windows")
+    parser.add_argument('--horizon', type=float, default=6 * 3600, help="Seconds the sketches are kept")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed")
+    parser.add_argument('--output', default=None, help="Output JSON file, stdout by default")
+    args = parser.parse_args()
+
+    dump_results(run(args.text, args.channels, args.hours, args.story_words, args.error_rate, args.threshold,
+                     args.num_perm, args.bands, args.window_words, args.horizon, args.seed), args.output)
+
+
+if __name__ == '__main__':
+    main()
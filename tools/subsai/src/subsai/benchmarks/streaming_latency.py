@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Streaming latency benchmark
+
+Replays a corpus of WAV files through :class:`subsai.models.whisper_online.OnlineASRProcessor` in the same modes as
+`whisper_online.py` (offline, computationally unaware and simultaneous) and reports, per file and per mode:
+
+* emission latency: time between the end of an emitted text in the audio and its emission
+* commit delay: processed audio between the first iteration that could hear a word and the iteration committing it
+  (independent of the compute speed, it measures how long the LocalAgreement policy waits)
+* real-time factor: processing time / audio duration
+* re-decoded audio ratio: audio seconds passed to Whisper / audio duration
+* WER against the reference transcripts, when a `<name>.txt` file is next to `<name>.wav`
+
+Example:
+
+    python -m subsai.benchmarks.streaming_latency ./corpus --model tiny.en --device cpu --compute-type int8 \
+        --modes offline comp_unaware --output results.json
+"""
+
+import argparse
+import bisect
+import pathlib
+import time
+
+from subsai.benchmarks.common import percentiles, word_error_rate, environment, dump_results
+from subsai.models.whisper_online import (
+    FasterWhisperASR,
+    OnlineASRProcessor,
+    create_tokenizer,
+    load_audio,
+    load_audio_chunk,
+    audio_duration,
+)
+
+MODES = ['offline', 'comp_unaware', 'simultaneous']
+SAMPLING_RATE = OnlineASRProcessor.SAMPLING_RATE
+
+
+class _Recorder:
+    """
+    Runs the `process_iter` iterations and records what each of them decoded and committed
+    """
+
+    def __init__(self, online: OnlineASRProcessor):
+        self.online = online
+        self.decoded_seconds = 0.0
+        self.processing_seconds = 0.0
+        self.iteration_ends = []  # end of the processed audio at each iteration
+        self.emission_latencies = []
+        self.commit_delays = []
+        self.texts = []
+        self.clock = None  # emission clock of the modes measured in wall clock time
+
+    def iterate(self, processed_end: float, now: float = None) -> None:
+        """
+        :param processed_end: end of the audio received so far, in seconds
+        :param now: emission time; the wall clock time after processing if None
+        """
+        self.decoded_seconds += len(self.online.audio_buffer) / SAMPLING_RATE
+        self.iteration_ends.append(processed_end)
+        n_commited = len(self.online.commited)
+        t = time.perf_counter()
+        try:
+            o = self.online.process_iter()
+        except AssertionError:
+            o = (None, None, "")
+        elapsed = time.perf_counter() - t
+        self.processing_seconds += elapsed
+        if now is None:
+            now = self.clock()
+        self._record(o, self.online.commited[n_commited:], now, processed_end)
+
+    def finish(self, now: float) -> None:
+        o = self.online.finish()
+        if o[0] is not None:
+            self.emission_latencies.append(now - o[1])
+            self.texts.append(o[2])
+
+    def _record(self, o, words, now, processed_end):
+        if o[0] is None:
+            return
+        self.emission_latencies.append(now - o[1])
+        self.texts.append(o[2])
+        for _, end, _ in words:
+            first = bisect.bisect_left(self.iteration_ends, end)
+            if first < len(self.iteration_ends):
+                self.commit_delays.append(processed_end - self.iteration_ends[first])
+
+
+def replay(online: OnlineASRProcessor, audio_path: str, mode: str, min_chunk: float) -> _Recorder:
+    """
+    Replays `audio_path` through `online`, the same way as the modes of `whisper_online.py`
+
+    :param online: initialized processor
+    :param audio_path: 16 kHz mono WAV
+    :param mode: one of :attr:`MODES`
+    :param min_chunk: minimum audio chunk size in seconds
+    :return: the recorder holding the measurements
+    """
+    recorder = _Recorder(online)
+    duration = audio_duration(audio_path)
+
+    if mode == 'offline':
+        start = time.perf_counter()
+        recorder.clock = lambda: time.perf_counter() - start
+        online.insert_audio_chunk(load_audio(audio_path))
+        # everything is available at once: latency is measured from the end of the file
+        recorder.iterate(duration, now=duration + recorder.clock())
+        recorder.finish(duration + recorder.clock())
+    elif mode == 'comp_unaware':
+        # the emission time is the end of the received audio, as if the computation was instantaneous
+        beg, end = 0.0, min(min_chunk, duration)
+        while True:
+            online.insert_audio_chunk(load_audio_chunk(audio_path, beg, end))
+            recorder.iterate(end, now=end)
+            if end >= duration:
+                break
+            beg = end
+            end = min(end + min_chunk, duration)
+        recorder.finish(duration)
+    elif mode == 'simultaneous':
+        start = time.perf_counter()
+        recorder.clock = lambda: time.perf_counter() - start
+        beg = end = 0.0
+        while True:
+            now = recorder.clock()
+            if now < end + min_chunk:
+                time.sleep(min_chunk + end - now)
+            end = min(recorder.clock(), duration)
+            online.insert_audio_chunk(load_audio_chunk(audio_path, beg, end))
+            beg = end
+            recorder.iterate(end)
+            if end >= duration:
+                break
+        recorder.finish(recorder.clock())
+    else:
+        raise ValueError(f'Unknown mode `{mode}`, it should be one of the following: {MODES}')
+    return recorder
+
+
+def run(corpus, model, language, modes, min_chunk, device, compute_type, model_cache_dir=None) -> dict:
+    """
+    Runs the benchmark over all the WAV files of `corpus`
+
+    :return: JSON serializable results
+    """
+    files = sorted(pathlib.Path(corpus).glob('*.wav'))
+    if not files:
+        raise FileNotFoundError(f'No .wav files in {corpus}')
+
+    t = time.perf_counter()
+    asr = FasterWhisperASR(lan=language, modelsize=model, cache_dir=model_cache_dir,
+                           device=device, compute_type=compute_type)
+    load_seconds = time.perf_counter() - t
+    tokenizer = create_tokenizer(language)
+    # warm up, the first transcribe is much slower than the others
+    asr.transcribe(load_audio_chunk(str(files[0]), 0, 1))
+
+    results = []
+    pooled = {mode: {'emission_latency': [], 'commit_delay': []} for mode in modes}
+    for mode in modes:
+        for file in files:
+            online = OnlineASRProcessor(asr, tokenizer)
+            recorder = replay(online, str(file), mode, min_chunk)
+            duration = audio_duration(str(file))
+            pooled[mode]['emission_latency'].extend(recorder.emission_latencies)
+            pooled[mode]['commit_delay'].extend(recorder.commit_delays)
+            result = {
+                'file': file.name,
+                'mode': mode,
+                'audio_seconds': duration,
+                'iterations': len(recorder.iteration_ends),
+                'rtf': recorder.processing_seconds / duration,
+                'redecoded_audio_ratio': recorder.decoded_seconds / duration,
+                'emission_latency': percentiles(recorder.emission_latencies),
+                'commit_delay': percentiles(recorder.commit_delays),
+                'wer': None,
+            }
+            reference = file.with_suffix('.txt')
+            if reference.exists():
+                result['wer'] = word_error_rate(reference.read_text(), ' '.join(recorder.texts))
+            results.append(result)
+
+    summary = {}
+    for mode in modes:
+        mode_results = [r for r in results if r['mode'] == mode]
+        audio_seconds = sum(r['audio_seconds'] for r in mode_results)
+        wers = [r['wer'] for r in mode_results if r['wer'] is not None]
+        summary[mode] = {
+            'audio_seconds': audio_seconds,
+            'rtf': sum(r['rtf'] * r['audio_seconds'] for r in mode_results) / audio_seconds,
+            'redecoded_audio_ratio': sum(r['redecoded_audio_ratio'] * r['audio_seconds']
+                                         for r in mode_results) / audio_seconds,
+            'emission_latency': percentiles(pooled[mode]['emission_latency']),
+            'commit_delay': percentiles(pooled[mode]['commit_delay']),
+            'wer': sum(wers) / len(wers) if wers else None,
+        }
+
+    return {
+        'benchmark': 'streaming_latency',
+        'config': {'model': model, 'language': language, 'min_chunk_size': min_chunk, 'device': device,
+                   'compute_type': compute_type, 'backend': 'faster-whisper'},
+        'environment': environment(),
+        'model_load_seconds': load_seconds,
+        'results': results,
+        'summary': summary,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming latency benchmark of OnlineASRProcessor")
+    parser.add_argument('corpus', type=str, help="Directory of 16 kHz mono WAV files, with optional reference "
+                                                 "transcripts in .txt files of the same name")
+    parser.add_argument('--model', type=str, default='tiny.en', help="Whisper model size")
+    parser.add_argument('--lan', '--language', type=str, default='en', help="Language code")
+    parser.add_argument('--modes', nargs='+', default=['offline', 'comp_unaware'], choices=MODES,
+                        help="Replay modes, simultaneous runs in real time")
+    parser.add_argument('--min-chunk-size', type=float, default=1.0, help="Minimum audio chunk size in seconds")
+    parser.add_argument('--device', type=str, default='cpu', help="Device, cpu or cuda")
+    parser.add_argument('--compute-type', type=str, default='int8', help="CTranslate2 compute type")
+    parser.add_argument('--model-cache-dir', type=str, default=None, help="Model download directory")
+    parser.add_argument('--output', type=str, default=None, help="Output JSON file, stdout by default")
+    args = parser.parse_args()
+
+    results = run(args.corpus, args.model, args.lan, args.modes, args.min_chunk_size, args.device,
+                  args.compute_type, args.model_cache_dir)
+    dump_results(results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Sentence tokenizers benchmark
+
+Measures the load time and the split throughput (characters and sentences per second) of each backend of
+:func:`subsai.models.whisper_online.create_tokenizer` on the archived subtitles text.
+
+Example:
+
+    python -m subsai.benchmarks.tokenizers --text 'volumes/nexanews_container/mysubs*.txt' --backends regex moses wtp
+"""
+
+import argparse
+import glob
+import time
+
+from subsai.benchmarks.common import percentiles, environment, dump_results
+from subsai.models.whisper_online import TOKENIZER_BACKENDS, create_tokenizer
+
+# size of the texts passed to split(), similar to the committed text of a few seconds of live audio
+WINDOW_CHARS = 400
+
+
+def _windows(text: str, size: int):
+    words = text.split()
+    window = []
+    length = 0
+    for word in words:
+        window.append(word)
+        length += len(word) + 1
+        if length >= size:
+            yield ' '.join(window)
+            window = []
+            length = 0
+    if window:
+        yield ' '.join(window)
+
+
+def run(text: str, backends, language: str, repeat: int) -> dict:
+    windows = list(_windows(text, WINDOW_CHARS))
+    chars = sum(len(w) for w in windows)
+    results = {}
+    for backend in backends:
+        t = time.perf_counter()
+        tokenizer = create_tokenizer(language, backend=backend)
+        load_seconds = time.perf_counter() - t
+
+        t = time.perf_counter()
+        create_tokenizer(language, backend=backend)
+        cached_seconds = time.perf_counter() - t
+
+        latencies = []
+        sentences = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for window in windows:
+                t = time.perf_counter()
+                sentences += len(tokenizer.split(window))
+                latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+        results[backend] = {
+            'load_seconds': load_seconds,
+            'cached_create_seconds': cached_seconds,
+            'chars_per_second': chars * repeat / elapsed,
+            'sentences_per_second': sentences / elapsed,
+            'split_latency': percentiles(latencies),
+        }
+    return {
+        'benchmark': 'tokenizers',
+        'config': {'language': language, 'window_chars': WINDOW_CHARS, 'windows': len(windows), 'repeat': repeat},
+        'environment': environment(),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Split throughput of the sentence tokenizers")
+    parser.add_argument('--text', default='volumes/nexanews_container/mysubs*.txt',
+                        help="Glob of the text files used as input")
+    parser.add_argument('--backends', nargs='+', default=['regex'], choices=list(TOKENIZER_BACKENDS.keys()),
+                        help="Tokenizer backends to measure")
+    parser.add_argument('--lan', '--language', default='en', help="Language code")
+    parser.add_argument('--repeat', type=int, default=10, help="Number of passes over the text")
+    parser.add_argument('--output', default=None, help="Output JSON file, stdout by default")
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(args.text))
+    if not files:
+        raise FileNotFoundError(f'No files match {args.text}')
+    text = ' '.join(open(f, encoding='utf-8').read() for f in files)
+    dump_results(run(text, args.backends, args.lan, args.repeat), args.output)
+
+
+if __name__ == '__main__':
+    main()
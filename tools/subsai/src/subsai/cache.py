@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Persistent, content-addressed cache of transcription results
+
+Results are keyed by the hash of the media content, the model name and the normalized model configs, so a renamed
+or copied file still hits the cache, while an edited file at the same path does not.
+
+:class:`ModelCache` keeps the loaded models themselves, in memory and bounded to a few configurations.
+"""
+
+import collections
+import gc
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import threading
+from typing import Callable, Union
+
+from pysubs2 import SSAFile
+
+DEFAULT_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+                                 'subsai', 'transcriptions')
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024  # 512 MB
+# loaded models kept by ModelCache, each one holds its weights on the GPU
+DEFAULT_MAX_MODELS = int(os.environ.get('SUBSAI_MAX_MODELS', 1))
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class TranscriptionCache:
+    """
+    Size-bounded on-disk cache of `SSAFile` transcription results.
+
+    Entries are stored as gzip-compressed pysubs2 JSON, one file per key. When the total size exceeds `max_size`,
+    the least recently used entries are evicted.
+
+    Example usage:
+    ```python
+    cache = TranscriptionCache()
+    subs = SubsAI.transcribe('./assets/test1.mp4', 'openai/whisper', cache=cache)
+    ```
+    """
+
+    suffix = '.subs.json.gz'
+
+    def __init__(self, cache_dir: Union[str, pathlib.Path] = None, max_size: int = DEFAULT_MAX_SIZE):
+        """
+        :param cache_dir: directory where the entries are stored, defaults to :attr:`DEFAULT_CACHE_DIR`
+        :param max_size: maximum total size of the cache in bytes
+        """
+        self.cache_dir = pathlib.Path(cache_dir if cache_dir is not None else DEFAULT_CACHE_DIR)
+        self.max_size = max_size
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        # (path, size, mtime) -> content hash, so unchanged files are hashed only once per process
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def media_hash(self, media_file: Union[str, pathlib.Path]) -> str:
+        """
+        Returns the sha256 of the media file content
+
+        :param media_file: path of the media file
+        :return: hex digest
+        """
+        path = str(pathlib.Path(media_file).resolve())
+        stat = os.stat(path)
+        stat_key = (path, stat.st_size, stat.st_mtime_ns)
+        digest = self._hashes.get(stat_key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b''):
+                    h.update(block)
+            digest = h.hexdigest()
+            self._hashes[stat_key] = digest
+        return digest
+
+    @staticmethod
+    def normalize_config(model_name: str, model_config: dict) -> dict:
+        """
+        Fills the missing configs with the defaults of the model schema, so that `{}` and an explicit
+        default configuration map to the same key
+
+        :param model_name: name of the model
+        :param model_config: configs dict
+        :return: normalized configs dict
+        """
+        from subsai.configs import AVAILABLE_MODELS
+        from subsai.utils import _load_config
+
+        config_schema = AVAILABLE_MODELS.get(model_name, {}).get('config_schema', {})
+        normalized = {config: _load_config(config, model_config, config_schema) for config in config_schema}
+        # keep unknown configs as well, they may still change the output
+        for config in model_config:
+            normalized.setdefault(config, model_config[config])
+        return normalized
+
+    def key(self, media_file: Union[str, pathlib.Path], model_name: str, model_config: dict) -> str:
+        """
+        Returns the cache key of a transcription
+
+        :param media_file: path of the media file
+        :param model_name: name of the model
+        :param model_config: configs dict
+        :return: hex key
+        """
+        config = json.dumps(self.normalize_config(model_name, model_config), sort_keys=True, default=str)
+        h = hashlib.sha256()
+        for part in (self.media_hash(media_file), model_name, config):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def _entry_path(self, key: str) -> pathlib.Path:
+        return self.cache_dir / (key + self.suffix)
+
+    def get(self, key: str) -> Union[SSAFile, None]:
+        """
+        Returns the cached subtitles or None
+
+        :param key: cache key, see :func:`key`
+        :return: `SSAFile` or None
+        """
+        path = self._entry_path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                subs = SSAFile.from_string(f.read(), format_='json')
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, EOFError):
+            # corrupted entry, drop it
+            path.unlink(missing_ok=True)
+            return None
+        # bump the mtime, it is used as the LRU clock
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return subs
+
+    def put(self, key: str, subs: SSAFile) -> None:
+        """
+        Stores the subtitles under `key` and evicts old entries if needed
+
+        :param key: cache key, see :func:`key`
+        :param subs: `SSAFile` subtitles
+        """
+        data = gzip.compress(subs.to_string('json').encode('utf-8'))
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._entry_path(key))
+        except BaseException:
+            pathlib.Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache fits into `max_size`
+        """
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if not entry.name.endswith(self.suffix):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                    total += stat.st_size
+            if total <= self.max_size:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_size:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def clear(self) -> None:
+        """
+        Removes all the entries
+        """
+        for path in self.cache_dir.glob('*' + self.suffix):
+            path.unlink(missing_ok=True)
+        self._hashes.clear()
+
+
+class ModelCache:
+    """
+    In-memory LRU of the loaded transcription models, one per model name and configs.
+
+    Beyond `max_entries` models, the least recently used one is released before the next one is loaded: its resident
+    models are dropped (see `WhisperXModel.release_models`) and the GPU memory it held is returned.
+
+    Example usage:
+    ```python
+    models = ModelCache(SubsAI.create_model, max_entries=2)
+    model = models.get('openai/whisper', {'model_type': 'base'})
+    ```
+    """
+
+    def __init__(self, factory: Callable, max_entries: int = DEFAULT_MAX_MODELS):
+        """
+        :param factory: (model name, configs dict) -> model, e.g. :func:`subsai.main.SubsAI.create_model`
+        :param max_entries: maximum number of models kept loaded
+        """
+        self.factory = factory
+        self.max_entries = max(max_entries, 1)
+        self._models = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str, model_config: dict):
+        """
+        Returns the model of `model_name` with `model_config`, loading it if needed
+
+        :param model_name: name of the model
+        :param model_config: configs dict
+        :return: model instance
+        """
+        key = json.dumps([model_name, model_config], sort_keys=True, default=str)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+            while len(self._models) >= self.max_entries:
+                _, model = self._models.popitem(last=False)
+                self._release(model)
+                del model
+                self._free()
+            model = self.factory(model_name, model_config)
+            self._models[key] = model
+            return model
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+    def clear(self) -> None:
+        """
+        Releases all the models
+        """
+        with self._lock:
+            for model in self._models.values():
+                self._release(model)
+            self._models.clear()
+            self._free()
+
+    @staticmethod
+    def _release(model) -> None:
+        release_models = getattr(model, 'release_models', None)
+        if release_models is not None:
+            release_models()
+
+    @staticmethod
+    def _free() -> None:
+        gc.collect()
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Checkpoints of the online ASR processing of the channels
+
+A restarted ASR process starts from an empty audio buffer: it commits nothing until two iterations agree, and its
+first prompt is empty. :class:`ProcessorCheckpoint` writes the state of the
+:class:`subsai.models.whisper_online.OnlineASRProcessor` of a channel every `interval` seconds (the audio buffer as
+16-bit PCM, the hypothesis buffer, the commited words still in the audio and the offsets, ~1 MB for a 30 s buffer)
+and restores it when the process starts again: the first iteration commits the restored words it confirms.
+
+A checkpoint older than `max_age` is not restored. The audio of the stream from the checkpoint to the restart is
+missing: after more than `max_splice` seconds (`restored_age`), the caller transcribes the restored buffer once more
+when the live audio arrives, which commits its words waiting for confirmation, then ends it like a stream gap
+(`OnlineASRProcessor.insert_gap`, its text is published, the stream times stay right and its words stay the prompt)
+instead of splicing the live audio right after it. Set `SUBSAI_CHECKPOINT_DIR` to the checkpoints directory to
+checkpoint the live channels.
+
+Example usage:
+```python
+checkpoint = ProcessorCheckpoint('/home/nexanews/checkpoints', 'cnn')
+resume_gap = checkpoint.restore(online) and checkpoint.restored_age > checkpoint.max_splice
+chunk = data_queue.get()
+if resume_gap:
+    online.transcriptioChuncker()
+    online.insert_gap(checkpoint.age())
+while True:
+    online.insert_audio_chunk(chunk)
+    online.transcriptioChuncker()
+    checkpoint.maybe_save(online)
+    chunk = data_queue.get()
+```
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+import numpy as np
+
+from subsai.ingest import PCM_SCALE
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.environ.get('SUBSAI_CHECKPOINT_DIR')
+CHECKPOINT_VERSION = 2
+
+
+class ProcessorCheckpoint:
+    """
+    On-disk snapshot of the OnlineASRProcessor of one channel
+    """
+
+    def __init__(self,
+                 directory: str,
+                 channel: str,
+                 interval: float = 5.0,
+                 max_age: float = 60.0,
+                 max_splice: float = 1.0,
+                 logger: logging.Logger = logger):
+        """
+        :param directory: checkpoints directory, one file per channel
+        :param channel: channel name
+        :param interval: seconds between two checkpoints
+        :param max_age: seconds after which a checkpoint is not restored
+        :param max_splice: seconds of missing audio the live audio can be spliced over to the restored buffer
+        :param logger: logger of the channel
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{channel.replace(os.sep, '_')}.npz")
+        self.interval = interval
+        self.max_age = max_age
+        self.max_splice = max_splice
+        self.logger = logger
+        # seconds from the restored checkpoint to its restore, and the time of the checkpoint
+        self.restored_age = None
+        self._restored_time = None
+        self._saved_at = None
+
+    def save(self, online, now: Optional[float] = None) -> None:
+        """writes the state of `online`, replacing the previous checkpoint at once"""
+        now = time.time() if now is None else now
+        state, audio = online.checkpoint_state()
+        state = {'version': CHECKPOINT_VERSION, 'time': now, **state}
+        pcm = np.clip(np.round(audio * PCM_SCALE), -PCM_SCALE, PCM_SCALE - 1).astype(np.int16)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f, audio=pcm, state=np.frombuffer(json.dumps(state, default=float).encode(), np.uint8))
+        os.replace(tmp, self.path)
+        self._saved_at = now
+
+    def maybe_save(self, online, now: Optional[float] = None) -> bool:
+        """save() if the last checkpoint is `interval` seconds old, :return: True if saved"""
+        now = time.time() if now is None else now
+        if self._saved_at is not None and now - self._saved_at < self.interval:
+            return False
+        try:
+            self.save(online, now)
+        except OSError as e:
+            # the channel keeps running without checkpoints
+            self.logger.error("Checkpoint not written: %s", e)
+            return False
+        return True
+
+    def restore(self, online, now: Optional[float] = None) -> bool:
+        """
+        Restores the last checkpoint in `online`
+
+        :return: True if restored, False if there is no recent checkpoint of the same language
+        """
+        now = time.time() if now is None else now
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                state = json.loads(data['state'].tobytes())
+                audio = data['audio'].astype(np.float32) / PCM_SCALE
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.error("Checkpoint %s not restored: %s", self.path, e)
+            return False
+        age = now - state['time']
+        if state.get('version') != CHECKPOINT_VERSION or age > self.max_age:
+            self.logger.info("Checkpoint of %.0f s ago not restored", age)
+            return False
+        if state['language'] != online.asr.original_language:
+            self.logger.info("Checkpoint of the %s model not restored", state['language'])
+            return False
+        online.restore_state(state, audio)
+        self._saved_at = now
+        self.restored_age = age
+        self._restored_time = state['time']
+        self.logger.info("Restored the checkpoint of %.1f s ago: %.1f s of audio, %d words waiting for confirmation",
+                         age, len(audio) / online.SAMPLING_RATE, len(state['hypothesis']))
+        return True
+
+    def age(self, now: Optional[float] = None) -> Optional[float]:
+        """:return: seconds of stream from the restored checkpoint to `now`, None if nothing was restored"""
+        if self._restored_time is None:
+            return None
+        return (time.time() if now is None else now) - self._restored_time
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Long media chunked transcription
+
+Splits long media at silence points into overlapping chunks, transcribes the chunks in parallel with any
+:class:`subsai.models.abstract_model.AbstractModel` backend, and stitches the results back into one `SSAFile`.
+"""
+
+import os
+import re
+import tempfile
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Tuple, Union
+
+import ffmpeg
+import numpy as np
+from pysubs2 import SSAFile, SSAEvent
+
+from subsai.models.abstract_model import AbstractModel
+from subsai.scheduler import current_priority, priority
+
+SAMPLING_RATE = 16000
+# energy frames used to find the silence points
+FRAME_LENGTH = 480  # 30 ms
+# maximum n-gram size matched when deduplicating the overlaps, and the maximum time between the two sides of the
+# split point, same as `HypothesisBuffer.insert`
+MAX_NGRAM = 5
+MAX_OVERLAP_GAP = 1.0
+
+_PUNCTUATION = re.compile(r"[^\w']+")
+
+
+def load_audio(media_file: str) -> np.ndarray:
+    """
+    Decodes the media file to 16 kHz mono int16 PCM
+
+    :param media_file: path of the media file
+    :return: int16 samples
+    """
+    out, _ = (
+        ffmpeg.input(media_file, threads=0)
+        .output('-', format='s16le', acodec='pcm_s16le', ac=1, ar=SAMPLING_RATE)
+        .run(cmd=['ffmpeg', '-nostdin'], capture_stdout=True, capture_stderr=True)
+    )
+    return np.frombuffer(out, np.int16)
+
+
+def check_chunking(chunk_length: float, overlap: float = 0.0) -> None:
+    """
+    Raises `ValueError` if the chunking arguments can't split the media
+
+    :param chunk_length: target chunk length in seconds
+    :param overlap: audio added on both sides of each chunk, in seconds
+    """
+    if not chunk_length > 0:
+        raise ValueError(f"The chunk length should be positive, not {chunk_length}")
+    if not overlap >= 0:
+        raise ValueError(f"The chunk overlap should not be negative, not {overlap}")
+
+
+def find_split_points(audio: np.ndarray,
+                      chunk_length: float,
+                      search_window: float = 30.0) -> List[float]:
+    """
+    Returns the split points (in seconds) of the audio, one every `chunk_length` seconds or slightly before,
+    at the quietest point of the `search_window` seconds that precede it.
+
+    :param audio: 16 kHz samples
+    :param chunk_length: target chunk length in seconds
+    :param search_window: how far before the target point to look for silence, in seconds
+    :return: list of split points, including 0 and the duration
+    """
+    check_chunking(chunk_length)
+    duration = len(audio) / SAMPLING_RATE
+    if duration <= chunk_length:
+        return [0.0, duration]
+
+    n_frames = len(audio) // FRAME_LENGTH
+    frames = audio[:n_frames * FRAME_LENGTH].reshape(n_frames, FRAME_LENGTH).astype(np.float32)
+    energy = np.sqrt(np.mean(frames ** 2, axis=1))
+    # smooth over ~300 ms so a single quiet frame between two words is not taken as a pause
+    kernel = np.ones(10, dtype=np.float32) / 10
+    energy = np.convolve(energy, kernel, mode='same')
+
+    frame_duration = FRAME_LENGTH / SAMPLING_RATE
+    search_window = min(search_window, chunk_length / 2)
+    points = [0.0]
+    while duration - points[-1] > chunk_length:
+        target = points[-1] + chunk_length
+        lo = int((target - search_window) / frame_duration)
+        hi = min(int(target / frame_duration), n_frames)
+        if hi <= lo:
+            points.append(target)
+            continue
+        points.append((lo + int(np.argmin(energy[lo:hi]))) * frame_duration)
+    points.append(duration)
+    return points
+
+
+def _words(text: str) -> List[str]:
+    return text.split()
+
+
+def _timed_words(event: SSAEvent) -> List[Tuple[str, float, float]]:
+    # (word, start, end) in seconds, the words share the duration of the event evenly
+    words = _words(event.plaintext)
+    duration = (event.end - event.start) / 1000 / max(1, len(words))
+    start = event.start / 1000
+    return [(w, start + i * duration, start + (i + 1) * duration) for i, w in enumerate(words)]
+
+
+def _normalize(word: str) -> str:
+    return _PUNCTUATION.sub('', word.lower())
+
+
+def _drop_overlap_words(prev_events: List[SSAEvent], next_events: List[SSAEvent]) -> None:
+    """
+    Compares the last words of `prev_events` with the first words of `next_events` and drops, from `next_events`,
+    the longest n-gram (up to :attr:`MAX_NGRAM` words) that appears on both sides of the split point, if the first
+    words of `next_events` start within :attr:`MAX_OVERLAP_GAP` seconds of the end of the last ones of `prev_events`
+    (the words of the events are timed evenly over their duration).
+    """
+    tail = []
+    for event in reversed(prev_events):
+        tail = _timed_words(event) + tail
+        if len(tail) >= MAX_NGRAM:
+            break
+    head = []  # (event index, word)
+    for i, event in enumerate(next_events):
+        head.extend((i, w) for w in _timed_words(event))
+        if len(head) >= MAX_NGRAM:
+            break
+    if not tail or not head or abs(head[0][1][1] - tail[-1][2]) >= MAX_OVERLAP_GAP:
+        # the same words far apart are not the overlap transcribed twice
+        return
+
+    tail = [_normalize(w) for w, _, _ in tail]
+    for n in range(min(len(tail), len(head), MAX_NGRAM), 0, -1):
+        if tail[-n:] == [_normalize(w) for _, (w, _, _) in head[:n]]:
+            drop = {}
+            for i, _ in head[:n]:
+                drop[i] = drop.get(i, 0) + 1
+            for i, count in drop.items():
+                next_events[i].plaintext = ' '.join(_words(next_events[i].plaintext)[count:])
+            next_events[:] = [e for e in next_events if e.plaintext.strip()]
+            return
+
+
+def stitch(chunks: List[Tuple[float, SSAFile]], split_points: List[float]) -> SSAFile:
+    """
+    Stitches the subtitles of overlapping chunks into one `SSAFile`.
+    Each chunk keeps the events centred in its own part (between its split points), and the words repeated on both
+    sides of a split point are removed.
+
+    :param chunks: list of (chunk start time in seconds, chunk subtitles), in order
+    :param split_points: split points returned by :func:`find_split_points`
+    :return: `SSAFile`
+    """
+    stitched = []
+    for i, (offset, subs) in enumerate(chunks):
+        lo = split_points[i] * 1000
+        hi = split_points[i + 1] * 1000
+        events = []
+        for event in subs:
+            event = event.copy()
+            event.shift(s=offset)
+            middle = (event.start + event.end) / 2
+            if lo <= middle < hi or (i == len(chunks) - 1 and middle >= hi):
+                events.append(event)
+        if stitched and events:
+            _drop_overlap_words(stitched, events)
+        stitched.extend(events)
+
+    subs = SSAFile()
+    subs.events = stitched
+    return subs
+
+
+def _write_wav(path: str, audio: np.ndarray) -> None:
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLING_RATE)
+        f.writeframes(audio.tobytes())
+
+
+def transcribe_chunked(media_file: str,
+                       model: Union[AbstractModel, Callable[[], AbstractModel]],
+                       chunk_length: float = 600.0,
+                       overlap: float = 5.0,
+                       workers: int = 2) -> SSAFile:
+    """
+    Transcribes long media in overlapping chunks, in parallel.
+
+    :param media_file: path of the media file
+    :param model: a model instance shared by all the workers, or a callable that creates one model per worker
+                  (use the latter if the backend is not thread-safe, or to spread the workers across devices)
+    :param chunk_length: target chunk length in seconds; the chunks are split at the quietest nearby point
+    :param overlap: audio added on both sides of each chunk, in seconds
+    :param workers: number of chunks transcribed in parallel, at most the slots of the device (see
+                    :mod:`subsai.scheduler`); don't call it from a task holding a slot of that device
+    :return: `SSAFile`
+    """
+    check_chunking(chunk_length, overlap)
+    audio = load_audio(media_file)
+    split_points = find_split_points(audio, chunk_length)
+
+    local = threading.local()
+    # each chunk asks the scheduler for a slot with the priority of the caller: a chunk boundary is a preemption point
+    chunk_priority = current_priority()
+
+    def _model() -> AbstractModel:
+        if isinstance(model, AbstractModel):
+            return model
+        if not hasattr(local, 'model'):
+            local.model = model()
+        return local.model
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def _transcribe_chunk(i: int) -> Tuple[float, SSAFile]:
+            start = max(0.0, split_points[i] - overlap)
+            end = split_points[i + 1] + overlap
+            chunk_file = os.path.join(tmp_dir, f'chunk-{i}.wav')
+            _write_wav(chunk_file, audio[int(start * SAMPLING_RATE):int(end * SAMPLING_RATE)])
+            try:
+                with priority(chunk_priority):
+                    return start, _model().transcribe(chunk_file)
+            finally:
+                os.unlink(chunk_file)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(_transcribe_chunk, range(len(split_points) - 1)))
+
+    return stitch(chunks, split_points)
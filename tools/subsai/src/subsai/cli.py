@@ -32,6 +32,9 @@ import os
 import pathlib
 
 from subsai import SubsAI, Tools
+from subsai.cache import TranscriptionCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE
+from subsai.chunking import check_chunking
+from subsai.streaming import STREAMING_FORMATS, write_events
 from subsai.utils import available_translation_models, available_subs_formats
 
 subs_ai = SubsAI()
@@ -61,6 +64,16 @@ def _handle_configs(model_configs_arg: str):
     return json.loads(model_configs_arg)
 
 
+def _check_stream_args(subs_format, chunk_length, translation_model):
+    # the streamed events are written as they are decoded: no chunking, translation nor cache
+    if subs_format not in STREAMING_FORMATS:
+        raise ValueError(f"--stream writes the formats {STREAMING_FORMATS}, not `{subs_format}`")
+    if chunk_length is not None:
+        raise ValueError("--stream does not support --chunk-length")
+    if translation_model is not None:
+        raise ValueError("--stream does not support --translation-model")
+
+
 def run(media_file_arg: List[str],
         model_name,
         model_configs,
@@ -70,22 +83,37 @@ def run(media_file_arg: List[str],
         translation_configs,
         translation_source_lang,
         translation_target_lang,
-        output_suffix
+        output_suffix,
+        cache_dir=DEFAULT_CACHE_DIR,
+        cache_max_size=DEFAULT_MAX_SIZE,
+        chunk_length=None,
+        workers=2,
+        stream=False
         ):
+    if stream:
+        # before any output file is opened
+        _check_stream_args(subs_format, chunk_length, translation_model)
+        cache_dir = None
+    if chunk_length is not None:
+        check_chunking(chunk_length)
     files = _handle_media_file(media_file_arg)
     model_configs = _handle_configs(model_configs)
     print(f"[-] Model name: {model_name}")
     print(f"[-] Model configs: {'defaults' if model_configs == {} else model_configs}")
+    cache = None
+    if cache_dir is not None:
+        print(f"[-] Cache: {cache_dir}")
+        cache = TranscriptionCache(cache_dir, max_size=cache_max_size)
+    if chunk_length is not None:
+        print(f"[-] Chunked transcription: {chunk_length}s chunks, {workers} worker(s)")
     print(f"---")
-    print(f"[+] Initializing the model")
-    model = subs_ai.create_model(model_name, model_configs)
+    model = None
     tr_model = None
     for file in files:
         print(f"[+] Processing file: {file}")
         if not file.exists():
             print(f"[*] Error: {file} does not exist -> continue")
             continue
-        subs = subs_ai.transcribe(file, model)
         if destination_folder is not None:
             folder = pathlib.Path(destination_folder).absolute()
             if not folder.exists():
@@ -98,6 +126,39 @@ def run(media_file_arg: List[str],
         else:
             file_name = folder / (file.stem + '.' + subs_format)
 
+        if stream:
+            if model is None:
+                print(f"[+] Initializing the model")
+                model = subs_ai.create_model(model_name, model_configs)
+            print(f"[+] Streaming subtitles to: {file_name}")
+            with open(file_name, 'w', encoding='utf-8') as f:
+                write_events(subs_ai.transcribe_iter(file, model), f, subs_format)
+            continue
+
+        key = None
+        subs = None
+        if cache is not None:
+            key_configs = model_configs
+            if chunk_length is not None:
+                # chunked results are stitched, they do not share the entries of whole file transcriptions
+                key_configs = {**model_configs, '_chunk_length': chunk_length}
+            key = cache.key(file, model_name, key_configs)
+            subs = cache.get(key)
+            if subs is not None:
+                print(f"[+] Loaded subtitles from the cache")
+        if subs is None:
+            if chunk_length is not None:
+                # one model per worker
+                subs = subs_ai.transcribe_chunked(file, model_name, model_configs,
+                                                  chunk_length=chunk_length, workers=workers)
+            else:
+                if model is None:
+                    print(f"[+] Initializing the model")
+                    model = subs_ai.create_model(model_name, model_configs)
+                subs = subs_ai.transcribe(file, model)
+            if cache is not None:
+                cache.put(key, subs)
+
         if translation_model is not None:
             if tr_model is None:
                 print(f"[+] Creating translation model: {translation_model}")
@@ -143,8 +204,28 @@ def main():
                         help="JSON configuration (path to a json file or a direct "
                              "string)")
     parser.add_argument('-os', '--output-suffix', default=None, help="Name of the subtitles output file, (In batch processing, this will be used as a suffix to the media filename)")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help="The directory of the transcription results cache, shared with the web UI")
+    parser.add_argument('--cache-max-size', type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024),
+                        help="Maximum size of the transcription results cache in MB")
+    parser.add_argument('--no-cache', action='store_true', help="Do not use the transcription results cache")
+    parser.add_argument('--chunk-length', type=float, default=None,
+                        help="Split long media files into chunks of about this many seconds (cut at silence points) "
+                             "and transcribe them in parallel")
+    parser.add_argument('--workers', type=int, default=2,
+                        help="Number of chunks transcribed in parallel when --chunk-length is set")
+    parser.add_argument('--stream', action='store_true',
+                        help=f"Write the subtitles incrementally while they are decoded, available formats "
+                             f"{STREAMING_FORMATS} (the cache is not used, no chunking nor translation)")
 
     args = parser.parse_args()
+    try:
+        if args.stream:
+            _check_stream_args(args.format, args.chunk_length, args.translation_model)
+        if args.chunk_length is not None:
+            check_chunking(args.chunk_length)
+    except ValueError as e:
+        parser.error(str(e))
 
     run(media_file_arg=args.media_file,
         model_name=args.model,
@@ -155,7 +236,12 @@ def main():
         translation_configs=args.translation_configs,
         translation_source_lang=args.translation_source_lang,
         translation_target_lang=args.translation_target_lang,
-        output_suffix=args.output_suffix)
+        output_suffix=args.output_suffix,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        cache_max_size=args.cache_max_size * 1024 * 1024,
+        chunk_length=args.chunk_length,
+        workers=args.workers,
+        stream=args.stream)
 
 
 if __name__ == '__main__':
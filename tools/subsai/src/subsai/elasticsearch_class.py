@@ -1,6 +1,11 @@
 from elasticsearch import Elasticsearch, helpers
+import datetime
 import json
 import logging
+import uuid
+from typing import List, Optional, Union
+
+from subsai import metrics
 
 logging.basicConfig(
     level=logging.INFO, 
@@ -12,16 +17,144 @@ logging.basicConfig(
 )
 
 
+# write alias of the time-based subtitles indices (<alias>-<date>-000001, ...)
+SUBTITLES_ALIAS = 'subtitles'
+
+SUBTITLES_SETTINGS = {
+    'refresh_interval': '5s',
+    'analysis': {
+        'filter': {
+            'subtitle_shingle': {
+                'type': 'shingle',
+                'min_shingle_size': 2,
+                'max_shingle_size': 3,
+                'output_unigrams': False,
+            },
+        },
+        'analyzer': {
+            'subtitle_shingle': {
+                'type': 'custom',
+                'tokenizer': 'standard',
+                'filter': ['lowercase', 'asciifolding', 'subtitle_shingle'],
+            },
+        },
+    },
+}
+
+SUBTITLES_MAPPINGS = {
+    'dynamic': False,
+    'properties': {
+        'channel': {'type': 'keyword'},
+        # near-duplicate segments of all the channels (see subsai.stories)
+        'story_id': {'type': 'keyword'},
+        # 'repass' for the subtitles re-transcribed by the larger model (see subsai.repass), absent for the live ones
+        'tier': {'type': 'keyword'},
+        # document id of the live subtitles (see subsai.utils.generate_subtitle) and their rank in the ASR stream
+        'segment_id': {'type': 'keyword'},
+        'seq': {'type': 'long'},
+        # unique id of every document, the segment_id when there is one: the tiebreaker of the paginated searches
+        'doc_id': {'type': 'keyword'},
+        # air time of the subtitle
+        'start': {'type': 'date'},
+        'end': {'type': 'date'},
+        # HH:MM:SS, only displayed
+        'start_time': {'type': 'keyword', 'index': False},
+        'end_time': {'type': 'keyword', 'index': False},
+        'text': {
+            'type': 'text',
+            # word n-grams, they rank the documents containing the words of the query next to each other first
+            'fields': {'shingles': {'type': 'text', 'analyzer': 'subtitle_shingle'}},
+        },
+    },
+}
+
+
+def setup_subtitles_index(es: Elasticsearch,
+                          alias: str = SUBTITLES_ALIAS,
+                          shards: int = 1,
+                          replicas: int = 0,
+                          max_age: str = '1d',
+                          max_primary_shard_size: str = '10gb') -> bool:
+    """
+    Creates the lifecycle policy and the index template of the subtitles indices, and the first index behind the
+    write alias `alias` if it doesn't exist. The indices are rolled over daily or when their shard reaches
+    `max_primary_shard_size`.
+
+    :param es: Elasticsearch client
+    :param alias: write alias, e.g. `subtitles`
+    :param shards: number of primary shards per index
+    :param replicas: number of replicas, 0 on a single node
+    :param max_age: rollover age
+    :param max_primary_shard_size: rollover size
+    :return: False if `alias` is the name of an existing (mapping-less) index, which has to be reindexed first
+    """
+    policy = f'{alias}-policy'
+    es.ilm.put_lifecycle(name=policy, policy={
+        'phases': {
+            'hot': {'actions': {'rollover': {'max_age': max_age,
+                                             'max_primary_shard_size': max_primary_shard_size}}},
+        },
+    })
+    es.indices.put_index_template(
+        name=f'{alias}-template',
+        index_patterns=[f'{alias}-*'],
+        priority=200,
+        template={
+            'settings': {
+                'number_of_shards': shards,
+                'number_of_replicas': replicas,
+                'index.lifecycle.name': policy,
+                'index.lifecycle.rollover_alias': alias,
+                **SUBTITLES_SETTINGS,
+            },
+            'mappings': SUBTITLES_MAPPINGS,
+        },
+    )
+    if es.indices.exists_alias(name=alias):
+        return True
+    if es.indices.exists(index=alias):
+        logging.warning(f"`{alias}` is an index, not an alias: reindex it into the `{alias}-*` indices to use "
+                        f"the subtitles template")
+        return False
+    # the date is resolved by Elasticsearch, the rollovers keep this pattern with the date of the rollover
+    es.indices.create(index=f'<{alias}-{{now/d}}-000001>', aliases={alias: {'is_write_index': True}})
+    return True
+
+
+def _with_doc_id(subtitle_doc: dict) -> dict:
+    if subtitle_doc.get('doc_id'):
+        return subtitle_doc
+    return {**subtitle_doc, 'doc_id': subtitle_doc.get('segment_id') or uuid.uuid4().hex}
+
+
+def _es_date(value: Union[str, datetime.datetime, None]) -> Optional[str]:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
 class SubtitleDatabase:
-    def __init__(self, host='elasticsearch', port=9200):
-        self.es = Elasticsearch([{'host': host, 'port': port}])
+    def __init__(self, host='elasticsearch', port=9200, scheme='http'):
+        self.es = Elasticsearch([{'host': host, 'port': port, 'scheme': scheme}])
         # Check if Elasticsearch is running
         if not self.es.ping():
             raise ValueError("Connection failed")
         
     def create_index(self, index_name):
-        """Create a new index in Elasticsearch."""
-        self.es.indices.create(index = index_name, ignore=400)
+        """Create a new index in Elasticsearch, with the subtitles settings and mappings."""
+        self.es.options(ignore_status=400).indices.create(
+            index=index_name, settings=SUBTITLES_SETTINGS, mappings=SUBTITLES_MAPPINGS)
+
+    def setup(self, alias=SUBTITLES_ALIAS, **kwargs):
+        """Create the subtitles template and the time-based indices behind `alias`, see `setup_subtitles_index`."""
+        return setup_subtitles_index(self.es, alias, **kwargs)
+
+    def rollover(self, alias=SUBTITLES_ALIAS, **conditions):
+        """
+        Roll over the write index of `alias`, now or when one of the `conditions` (e.g. max_age='1d',
+        max_docs=1000000) is met. The lifecycle policy rolls over automatically, this forces it.
+        """
+        return self.es.indices.rollover(alias=alias, conditions=conditions or None)
     
     def insert_subtitle(self, index_name, subtitle_doc):
         """
@@ -33,22 +166,158 @@ class SubtitleDatabase:
             'subtitle_text': 'Example subtitle text',
             'video_id': 'example_video_id'
         }
+
+        A document with a `segment_id` is indexed under this id: inserting it again overwrites it, in the same
+        index only (a write through the alias after a rollover creates a second document). The documents get a
+        unique `doc_id`, their `segment_id` or a random one.
         """
-        self.es.index(index=index_name, body=subtitle_doc)
+        if isinstance(subtitle_doc, str):
+            subtitle_doc = json.loads(subtitle_doc)
+        subtitle_doc = _with_doc_id(subtitle_doc)
+        with metrics.es_write(index_name, 'index'):
+            self.es.index(index=index_name, id=subtitle_doc.get('segment_id'), body=subtitle_doc)
     
     def bulk_insert(self, index_name, subtitle_docs):
         """
         Perform a bulk insert into Elasticsearch.
         
-        subtitle_docs should be a list of subtitle_doc dicts.
+        subtitle_docs should be a list of subtitle_doc dicts. The documents with a `segment_id` are
+        indexed under this id, so the retried actions don't duplicate them.
         """
         actions = [
             {
                 "_index": index_name,
-                "_source": subtitle_doc
+                "_source": subtitle_doc,
+                **({"_id": subtitle_doc["segment_id"]} if subtitle_doc.get("segment_id") else {})
+            }
+            for subtitle_doc in map(_with_doc_id, subtitle_docs)
+        ]
+        with metrics.es_write(index_name, 'bulk', len(actions)):
+            helpers.bulk(self.es, actions, max_retries=3)
+
+    def replace_subtitles(self, index_name, channel, start, end, subtitle_docs):
+        """
+        Replace the subtitles of `channel` aired from `start` to `end` by `subtitle_docs`, in two requests: the new
+        subtitles are indexed first (one bulk request), then the others of the window are deleted by a
+        delete-by-query, so the window is never empty for the readers (it shows both versions in between).
+
+        The documents with a `segment_id` are indexed under this id: replacing a window again overwrites them.
+
+        :return: number of replaced subtitles
+        """
+        actions = [
+            {
+                '_index': index_name,
+                '_source': subtitle_doc,
+                **({'_id': subtitle_doc['segment_id']} if subtitle_doc.get('segment_id') else {})
             }
-            for subtitle_doc in subtitle_docs
+            for subtitle_doc in map(_with_doc_id, subtitle_docs)
         ]
-        helpers.bulk(self.es, actions)
+        with metrics.es_write(index_name, 'bulk', len(actions)):
+            helpers.bulk(self.es, actions, max_retries=3, refresh='wait_for')
+        ids = [action['_id'] for action in actions if '_id' in action]
+        query = {'bool': {'filter': [{'term': {'channel': channel}},
+                                     {'range': {'start': {'gte': _es_date(start), 'lt': _es_date(end)}}}]}}
+        if ids:
+            query['bool']['must_not'] = [{'ids': {'values': ids}}]
+        with metrics.es_write(index_name, 'delete_by_query', 0):
+            response = self.es.delete_by_query(index=index_name, query=query, conflicts='proceed', refresh=True)
+        return response['deleted']
     
-    # Additional methods (like search) can be added as needed
+    def search(self,
+               query: Optional[str] = None,
+               index_name: str = SUBTITLES_ALIAS,
+               channels: Optional[List[str]] = None,
+               start: Union[str, datetime.datetime, None] = None,
+               end: Union[str, datetime.datetime, None] = None,
+               size: int = 20,
+               search_after: Optional[list] = None,
+               pit_id: Optional[str] = None,
+               keep_alive: str = '1m',
+               highlight: bool = True) -> dict:
+        """
+        Search the subtitles.
+
+        Without `query` the subtitles are sorted by air time (newest first), otherwise by relevance then air time,
+        the ties by `doc_id` (by the point in time order with `pit_id`).
+        To get the next page, pass the `search_after` of the previous result. For a consistent pagination while
+        documents are indexed, pass a point in time from `open_point_in_time` as `pit_id`.
+
+        :param query: full-text query
+        :param index_name: index, alias or pattern
+        :param channels: only the subtitles of these channels
+        :param start: only the subtitles aired from this time (datetime or ISO 8601 string)
+        :param end: only the subtitles aired before this time
+        :param size: page size
+        :param search_after: sort values of the last hit of the previous page
+        :param pit_id: point in time id
+        :param keep_alive: extension of the point in time
+        :param highlight: return the highlighted fragments of `text`
+        :return: dict with `total`, `hits` (id, score, source, highlight), `search_after` of the next page and
+                 `pit_id`
+        """
+        filters = []
+        if channels:
+            filters.append({'terms': {'channel': list(channels)}})
+        if start is not None or end is not None:
+            time_range = {}
+            if start is not None:
+                time_range['gte'] = _es_date(start)
+            if end is not None:
+                time_range['lt'] = _es_date(end)
+            filters.append({'range': {'start': time_range}})
+
+        if query:
+            must = [{'multi_match': {'query': query, 'fields': ['text', 'text.shingles'], 'type': 'most_fields'}}]
+            sort = ['_score', {'start': 'desc'}]
+        else:
+            must = [{'match_all': {}}]
+            sort = [{'start': 'desc'}]
+
+        kwargs = {
+            'query': {'bool': {'must': must, 'filter': filters}},
+            'sort': sort,
+            'size': size,
+            'track_total_hits': True,
+        }
+        if pit_id is not None:
+            # the point in time adds the _shard_doc tiebreaker to the sort
+            kwargs['pit'] = {'id': pit_id, 'keep_alive': keep_alive}
+        else:
+            kwargs['index'] = index_name
+            # a unique tiebreaker, so `search_after` neither skips nor repeats the hits tied on the other values (the
+            # documents indexed before the doc_id field tie with each other)
+            sort.append({'doc_id': {'order': 'asc', 'unmapped_type': 'keyword'}})
+        if search_after is not None:
+            kwargs['search_after'] = search_after
+        if highlight and query:
+            kwargs['highlight'] = {
+                'fields': {'text': {'fragment_size': 150, 'number_of_fragments': 3}},
+                'pre_tags': ['<em>'],
+                'post_tags': ['</em>'],
+            }
+
+        response = self.es.search(**kwargs)
+        hits = response['hits']['hits']
+        return {
+            'total': response['hits']['total']['value'],
+            'hits': [
+                {
+                    'id': hit['_id'],
+                    'index': hit.get('_index'),
+                    'score': hit.get('_score'),
+                    'source': hit['_source'],
+                    'highlight': hit.get('highlight', {}).get('text', []),
+                }
+                for hit in hits
+            ],
+            'search_after': hits[-1]['sort'] if hits else None,
+            'pit_id': response.get('pit_id', pit_id),
+        }
+
+    def open_point_in_time(self, index_name=SUBTITLES_ALIAS, keep_alive='1m'):
+        """Open a point in time for a consistent `search` pagination, returns its id."""
+        return self.es.open_point_in_time(index=index_name, keep_alive=keep_alive)['id']
+
+    def close_point_in_time(self, pit_id):
+        self.es.close_point_in_time(id=pit_id)
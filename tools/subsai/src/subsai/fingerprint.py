@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Acoustic fingerprint cache of the repeated segments of a channel
+
+The channels loop the same commercials, promos and station IDs many times a day. A :class:`RepeatSkipper` sits
+between the audio queue and the :class:`subsai.models.whisper_online.OnlineASRProcessor` of a channel: it cuts
+the 16 kHz PCM into blocks of a few seconds and fingerprints each block (pairs of spectral peaks hashed with their
+frequencies and time difference). A block matching audio already heard and transcribed on the channel gets the
+cached transcript of that audio and is not passed to Whisper, the others are passed on and indexed.
+
+The blocks are passed to the processor once complete, which delays the transcription by up to `block_seconds`.
+The stage of the live pipeline is enabled by setting `SUBSAI_REPEAT_CACHE=1`: it changes the subtitles of the repeated
+audio and their latency, so it is opt-in.
+
+Example usage:
+```python
+skipper = RepeatSkipper(online, channel='cnn')
+for chunk in chunks:
+    if skipper.insert_audio_chunk(chunk):
+        output = online.transcriptioChuncker()
+    for output in skipper.pop_cached():
+        ...  # (start, end, text, seq) like the outputs of transcriptioChuncker
+print(skipper.saved_fraction)
+```
+"""
+
+import bisect
+import collections
+import datetime
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+REPEAT_CACHE_ENABLED = os.environ.get('SUBSAI_REPEAT_CACHE', '0') not in ('', '0')
+
+N_FFT = 1024
+HOP = 256
+HALF_HOP = HOP // 2
+FRAMES_PER_SECOND = SAMPLING_RATE / HOP
+_WINDOW = np.hanning(N_FFT).astype(np.float32)
+# magnitude floor of the peaks, about -70 dBFS: silence has no peaks, so no hashes
+_FLOOR_DB = -20.0
+
+
+def spectral_peaks(audio: np.ndarray,
+                   freq_neighborhood: int = 20,
+                   time_neighborhood: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Local maxima of the log magnitude spectrogram
+
+    The neighborhoods bound the number of peaks, rather than keeping the strongest ones: the peaks of a block
+    then do not depend on the rest of the block, nor on where the block starts.
+
+    :param audio: 16 kHz float32 PCM
+    :param freq_neighborhood: a peak is the maximum of the +/- this many frequency bins...
+    :param time_neighborhood: ... and +/- this many frames
+    :return: (frames, bins) of the peaks, sorted by frame
+    """
+    if len(audio) < N_FFT:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    frames = np.lib.stride_tricks.sliding_window_view(audio, N_FFT)[::HOP] * _WINDOW
+    spectrogram = 20 * np.log10(np.abs(np.fft.rfft(frames, axis=1)) + 1e-10)
+    padded = np.pad(spectrogram, ((time_neighborhood, time_neighborhood), (freq_neighborhood, freq_neighborhood)),
+                    constant_values=-np.inf)
+    # the 2D maximum filter is separable
+    local_max = np.lib.stride_tricks.sliding_window_view(padded, 2 * time_neighborhood + 1, axis=0).max(axis=-1)
+    local_max = np.lib.stride_tricks.sliding_window_view(local_max, 2 * freq_neighborhood + 1, axis=1).max(axis=-1)
+    # sorted by frame
+    return np.nonzero((spectrogram == local_max) & (spectrogram > _FLOOR_DB))
+
+
+def peak_hashes(audio: np.ndarray, fan_out: int = 5, max_dt: int = 63) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hashes of the pairs of peaks: each peak is paired with the `fan_out` next ones within `max_dt` frames
+
+    :param audio: 16 kHz float32 PCM
+    :return: (hashes, frames of the first peaks)
+    """
+    t, f = spectral_peaks(audio)
+    hashes, anchors = [], []
+    for i in range(len(t)):
+        for j in range(i + 1, min(i + 1 + fan_out, len(t))):
+            dt = t[j] - t[i]
+            if dt > max_dt:
+                break
+            if dt == 0:
+                continue
+            # 10 bits per frequency bin (N_FFT / 2 + 1 bins), 6 bits of time difference
+            hashes.append((int(f[i]) << 16) | (int(f[j]) << 6) | int(dt))
+            anchors.append(t[i])
+    return np.array(hashes, dtype=np.uint32), np.array(anchors, dtype=np.int64)
+
+
+class FingerprintIndex:
+    """
+    Inverted index from the hashes to the frames of a channel stream where they were heard
+    """
+
+    def __init__(self):
+        self._postings = {}
+        # (last frame, hashes) of the added blocks, for the eviction
+        self._blocks = collections.deque()
+        self.size = 0
+
+    def add(self, hashes: np.ndarray, frames: np.ndarray) -> None:
+        """
+        :param hashes: hashes of a block
+        :param frames: stream frames of the hashes, increasing from block to block
+        """
+        postings = self._postings
+        for h, frame in zip(hashes.tolist(), frames.tolist()):
+            postings.setdefault(h, []).append(frame)
+        self._blocks.append((int(frames.max()) if len(frames) else -1, hashes))
+        self.size += len(hashes)
+
+    def evict_before(self, frame: int) -> None:
+        """
+        Removes the blocks ending before `frame`
+        """
+        postings = self._postings
+        while self._blocks and self._blocks[0][0] < frame:
+            last, hashes = self._blocks.popleft()
+            self.size -= len(hashes)
+            for h in set(hashes.tolist()):
+                kept = [f for f in postings[h] if f > last]
+                if kept:
+                    postings[h] = kept
+                else:
+                    del postings[h]
+
+    def query(self, hashes: np.ndarray, frames: np.ndarray) -> Tuple[Optional[int], int]:
+        """
+        :param hashes: hashes of the queried audio
+        :param frames: their frames, relative to the start of the queried audio
+        :return: (stream frame the queried audio starts at in the best match, number of aligned hashes)
+        """
+        votes = collections.Counter()
+        postings = self._postings
+        for h, frame in zip(hashes.tolist(), frames.tolist()):
+            for indexed in postings.get(h, ()):
+                votes[indexed - frame] += 1
+        if not votes:
+            return None, 0
+        # a frame of misalignment between the two airings splits the votes
+        best = max(votes, key=lambda offset: votes[offset] + votes.get(offset - 1, 0) + votes.get(offset + 1, 0))
+        return best, votes[best] + votes.get(best - 1, 0) + votes.get(best + 1, 0)
+
+
+class RepeatSkipper:
+    """
+    Skips the transcription of the audio blocks already heard on a channel
+    """
+
+    def __init__(self,
+                 online,
+                 block_seconds: float = 4.0,
+                 horizon: float = 3 * 3600,
+                 min_matches: int = 15,
+                 min_ratio: float = 0.05,
+                 max_cached_seconds: float = 30.0,
+                 channel: Optional[str] = None):
+        """
+        :param online: OnlineASRProcessor of the channel
+        :param block_seconds: fingerprinted audio block, and delay of the transcription
+        :param horizon: seconds of audio a repeat is searched in
+        :param min_matches: minimum number of aligned hashes of a repeated block...
+        :param min_ratio: ... and minimum fraction of the hashes of the block
+        :param max_cached_seconds: consecutive repeated blocks are emitted as one output up to this duration
+        :param channel: channel name, the skipped audio is recorded in the subsai.metrics registry when set
+        """
+        self.online = online
+        self.block_samples = int(block_seconds * SAMPLING_RATE)
+        self.horizon = horizon
+        self.min_matches = min_matches
+        self.min_ratio = min_ratio
+        self.max_cached_seconds = max_cached_seconds
+        self.channel = channel
+        self.metrics = None
+        if channel is not None:
+            from subsai import metrics
+            self.metrics = metrics
+
+        self.index = FingerprintIndex()
+        self._tail = np.zeros(HALF_HOP, dtype=np.float32)
+        self._pending = []
+        self._pending_samples = 0
+        # audio seconds of the channel, received and passed to the processor
+        self.stream_seconds = 0.0
+        self.processed_seconds = 0.0
+        self.skipped_seconds = 0.0
+        # stream seconds missing from the audio, see insert_gap
+        self.gap_seconds = 0.0
+        # processor times where audio was skipped, and the skipped seconds before them
+        self._splice_times = []
+        self._splice_skipped = []
+        self._seen_commited = 0
+        # (start, end, word) in stream seconds, of the transcribed and the cached audio
+        self._words = collections.deque()
+        self._word_starts = collections.deque()
+        self._transcribed_until = 0.0
+        self._cached = []
+        self._run = None
+
+    @property
+    def saved_fraction(self) -> float:
+        """fraction of the audio seconds of the channel not passed to Whisper"""
+        audio_seconds = self.stream_seconds - self.gap_seconds
+        return self.skipped_seconds / audio_seconds if audio_seconds else 0.0
+
+    def _stream_time(self, processor_time: float) -> float:
+        i = bisect.bisect_right(self._splice_times, processor_time)
+        return processor_time + (self._splice_skipped[i - 1] if i else 0.0)
+
+    def _collect_words(self) -> None:
+        # words committed by the processor since the last block, in stream time
+        commited = self.online.commited
+        for start, end, word in commited[self._seen_commited:]:
+            self._add_word(self._stream_time(start), self._stream_time(end), word)
+        self._seen_commited = len(commited)
+        transcribed = self._stream_time(self.online.buffer_time_offset)
+        if self._words:
+            transcribed = max(transcribed, self._words[-1][1])
+        self._transcribed_until = max(self._transcribed_until, transcribed)
+
+    def _add_word(self, start, end, word) -> None:
+        # the words committed after a skip can be older than the cached ones
+        i = bisect.bisect_right(self._word_starts, start)
+        self._words.insert(i, (start, end, word))
+        self._word_starts.insert(i, start)
+
+    def _evict(self) -> None:
+        oldest = self.stream_seconds - self.horizon
+        while self._words and self._words[0][1] < oldest:
+            self._words.popleft()
+            self._word_starts.popleft()
+        self.index.evict_before(int(oldest * FRAMES_PER_SECOND))
+
+    def _words_between(self, start: float, end: float) -> List[Tuple[float, float, str]]:
+        i = bisect.bisect_left(self._word_starts, start)
+        out = []
+        while i < len(self._words) and self._word_starts[i] < end:
+            out.append(self._words[i])
+            i += 1
+        return out
+
+    def insert_audio_chunk(self, audio: np.ndarray) -> bool:
+        """
+        Buffers `audio`, and passes the complete blocks that are not repeats to the processor
+
+        :param audio: 16 kHz float32 PCM
+        :return: True if the processor received new audio, so it should run an iteration
+        """
+        self._pending.append(audio)
+        self._pending_samples += len(audio)
+        fed = False
+        while self._pending_samples >= self.block_samples:
+            pending = np.concatenate(self._pending)
+            block, rest = pending[:self.block_samples], pending[self.block_samples:]
+            self._pending = [rest] if len(rest) else []
+            self._pending_samples = len(rest)
+            fed |= self._process_block(block)
+        return fed
+
+    def insert_gap(self, seconds: float) -> Tuple[Optional[float], Optional[float], str]:
+        """
+        Ends the audio before an interruption of the stream of `seconds`: the incomplete block is passed to the
+        processor without fingerprinting, and the processor restarts after the gap (`OnlineASRProcessor.insert_gap`)
+
+        :return: the incomplete text of the processor before the gap
+        """
+        self._collect_words()
+        self._flush_run()
+        if self._pending_samples:
+            block = np.concatenate(self._pending)
+            self._pending, self._pending_samples = [], 0
+            self.online.insert_audio_chunk(block)
+            self.stream_seconds += len(block) / SAMPLING_RATE
+            self.processed_seconds += len(block) / SAMPLING_RATE
+        output = self.online.insert_gap(seconds)
+        # the processor times run on through the gap, its restarted commited list is read from the start
+        self.processed_seconds += seconds
+        self.stream_seconds += seconds
+        self.gap_seconds += seconds
+        self._seen_commited = 0
+        self._tail = np.zeros(HALF_HOP, dtype=np.float32)
+        return output
+
+    def _process_block(self, block: np.ndarray) -> bool:
+        self._collect_words()
+        block_start = self.stream_seconds
+        duration = len(block) / SAMPLING_RATE
+        self.stream_seconds += duration
+        hashes, frames = peak_hashes(block)
+
+        source, votes = None, 0
+        if len(hashes):
+            match, votes = self.index.query(hashes, frames)
+            source = match / FRAMES_PER_SECOND if match is not None else None
+            # the frames of another airing start anywhere in between the frames of this one, the peaks move when
+            # the phase is off by half a frame: the block is also queried half a frame earlier
+            shifted = np.concatenate([self._tail, block[:-HALF_HOP]])
+            shifted_match, shifted_votes = self.index.query(*peak_hashes(shifted))
+            if shifted_votes > votes:
+                source, votes = (shifted_match + 0.5) / FRAMES_PER_SECOND, shifted_votes
+        self._tail = block[-HALF_HOP:]
+        repeat = (source is not None and votes >= max(self.min_matches, self.min_ratio * len(hashes))
+                  # the transcript of the matched audio is known
+                  and source + duration <= self._transcribed_until)
+
+        self.index.add(hashes, frames + int(round(block_start * FRAMES_PER_SECOND)))
+        if repeat:
+            self._skip(block_start, duration, source)
+        else:
+            self._flush_run()
+            self.online.insert_audio_chunk(block)
+            self.processed_seconds += duration
+        if self.metrics is not None:
+            self.metrics.REPEAT_SAVED_FRACTION.set(self.saved_fraction, channel=self.channel)
+        self._evict()
+        return not repeat
+
+    def _skip(self, block_start: float, duration: float, source: float) -> None:
+        # the processor continues after the skipped audio: its times are shifted from there
+        processor_time = self.processed_seconds
+        if self._splice_times and self._splice_times[-1] == processor_time:
+            self._splice_skipped[-1] += duration
+        else:
+            self._splice_times.append(processor_time)
+            self._splice_skipped.append((self._splice_skipped[-1] if self._splice_skipped else 0.0) + duration)
+        self.skipped_seconds += duration
+        if self.metrics is not None:
+            self.metrics.REPEAT_SKIPPED_SECONDS.inc(duration, channel=self.channel)
+
+        words = [(start - source + block_start, end - source + block_start, word)
+                 for start, end, word in self._words_between(source, source + duration)]
+        for word in words:
+            # the cached words are the transcript of this audio too, for its next airings
+            self._add_word(*word)
+        self._transcribed_until = max(self._transcribed_until, block_start + duration)
+
+        if self._run is None:
+            self._run = [block_start, 0.0, []]
+        self._run[1] += duration
+        self._run[2].extend(w for _, _, w in words)
+        if self._run[1] >= self.max_cached_seconds:
+            self._flush_run()
+
+    def _flush_run(self) -> None:
+        if self._run is None:
+            return
+        _, duration, words = self._run
+        self._run = None
+        if not words:
+            # a jingle or music, nothing to emit
+            return
+        # wall clock times, like the outputs of transcriptioChuncker; the words are numbered in the stream with the
+        # words emitted by the processor, the number is the identity of the segment (see subsai.utils.subtitle_id)
+        end = datetime.datetime.now()
+        seq = self.online.seq
+        self.online.seq += len(words)
+        self._cached.append((end - datetime.timedelta(seconds=duration), end, self.online.asr.sep.join(words), seq))
+
+    def pop_cached(self) -> List[Tuple[datetime.datetime, datetime.datetime, str, int]]:
+        """
+        :return: the (start, end, text, seq) transcripts of the skipped audio since the last call
+        """
+        cached, self._cached = self._cached, []
+        return cached
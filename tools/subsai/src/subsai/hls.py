@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Native HLS client
+
+An alternative to one ffmpeg process per channel (:class:`subsai.ingest.IngestManager`): one asyncio event loop
+polls the media playlists of many channels, prefetches their new segments concurrently over a pool of HTTP
+connections, and decodes only their audio track to 16 kHz mono PCM in a pool of decoder threads. The audio of each
+channel is delivered in order, in chunks like the ffmpeg ingest, and the segments missed (fallen off the playlist
+before they were fetched, or failed) are delivered as a :class:`subsai.ingest.Gap`.
+
+aiohttp and PyAV are optional dependencies of this module: `pip install aiohttp av`. The live pipeline uses it
+instead of ffmpeg when `SUBSAI_NATIVE_HLS=1`.
+
+Example usage:
+```python
+client = HLSClient()
+client.add_channel('cnn', 'https://example.com/cnn/master.m3u8', cnn_queue.put)
+client.add_channel('bbc', 'https://example.com/bbc/master.m3u8', bbc_queue.put)
+client.run()
+
+# one channel, with the interface of IngestManager
+for chunk in HLSIngest('https://example.com/cnn/master.m3u8', channel='cnn').chunks():
+    data_queue.put(chunk)
+```
+"""
+
+import asyncio
+import concurrent.futures
+import io
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.parse
+from typing import Callable, Iterator, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from subsai import metrics
+from subsai.ingest import PCM_SCALE, SAMPLING_RATE, Gap, _attributes, select_rendition
+
+logger = logging.getLogger(__name__)
+
+NATIVE_HLS_ENABLED = os.environ.get('SUBSAI_NATIVE_HLS', '0') not in ('', '0')
+
+
+class Segment(NamedTuple):
+    sequence: int
+    url: str
+    duration: float
+    # the encoding changes from the previous segment
+    discontinuity: bool = False
+    # initialization section of fragmented MP4 segments
+    map_url: Optional[str] = None
+
+
+class MediaPlaylist(NamedTuple):
+    target_duration: float
+    segments: List[Segment]
+    ended: bool
+
+
+def parse_media_playlist(text: str, base_url: str = '') -> MediaPlaylist:
+    """
+    :param text: HLS media playlist
+    :param base_url: URL of the playlist, the relative URIs are resolved against it
+    :return: the playlist, without segments for a master playlist
+    """
+    target_duration, first_sequence, ended = 0.0, 0, False
+    segments = []
+    duration, discontinuity, map_url = None, False, None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-TARGETDURATION:'):
+            target_duration = float(line.split(':', 1)[1])
+        elif line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+            first_sequence = int(line.split(':', 1)[1])
+        elif line.startswith('#EXTINF:'):
+            duration = float(line.split(':', 1)[1].split(',')[0])
+        elif line == '#EXT-X-DISCONTINUITY':
+            discontinuity = True
+        elif line.startswith('#EXT-X-MAP:'):
+            uri = _attributes(line).get('URI')
+            map_url = urllib.parse.urljoin(base_url, uri) if uri else None
+        elif line == '#EXT-X-ENDLIST':
+            ended = True
+        elif line and not line.startswith('#') and duration is not None:
+            segments.append(Segment(first_sequence + len(segments), urllib.parse.urljoin(base_url, line), duration,
+                                    discontinuity, map_url))
+            duration, discontinuity = None, False
+    if not target_duration and segments:
+        target_duration = max(s.duration for s in segments)
+    return MediaPlaylist(target_duration, segments, ended)
+
+
+class AudioDecoder:
+    """
+    Decodes the audio track of the consecutive segments of a stream to 16 kHz mono float32
+
+    The codec context and the resampler are kept from a segment to the next, so the segment boundaries are decoded
+    like a continuous stream. Call reset() at a discontinuity.
+    """
+
+    def __init__(self):
+        self._codec = None
+        self._resampler = None
+
+    def reset(self) -> None:
+        self._codec = None
+        self._resampler = None
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """
+        :param data: a segment (MPEG-TS, fragmented MP4 with its initialization section, ADTS...)
+        :return: its audio, the other streams are only demuxed
+        """
+        import av
+        out = []
+        with av.open(io.BytesIO(data)) as container:
+            if not container.streams.audio:
+                raise ValueError("No audio stream in the segment")
+            stream = container.streams.audio[0]
+            if self._codec is None:
+                self._codec = av.CodecContext.create(stream.codec_context.name, 'r')
+                if stream.codec_context.extradata:
+                    self._codec.extradata = stream.codec_context.extradata
+                self._resampler = av.AudioResampler(format='s16', layout='mono', rate=SAMPLING_RATE)
+            for packet in container.demux(stream):
+                if packet.size == 0:
+                    continue
+                for frame in self._codec.decode(packet):
+                    for resampled in self._resampler.resample(frame):
+                        out.append(resampled.to_ndarray().reshape(-1))
+        if not out:
+            return np.zeros(0, dtype=np.float32)
+        audio = np.concatenate(out).astype(np.float32)
+        audio /= PCM_SCALE
+        return audio
+
+
+class _Channel:
+
+    def __init__(self, name: str, url: str, sink: Callable[[Union[np.ndarray, Gap]], None]):
+        self.name = name
+        self.url = url
+        self.sink = sink
+        self.decoder = AudioDecoder()
+        self.maps = {}
+        self.pending = []
+        self.pending_samples = 0
+        # stream seconds of the delivered audio and gaps
+        self.stream_seconds = 0.0
+
+
+class HLSClient:
+    """
+    Ingests the audio of many HLS channels from one event loop
+    """
+
+    def __init__(self,
+                 max_connections: int = 64,
+                 prefetch: int = 3,
+                 decoders: Optional[int] = None,
+                 chunk_seconds: float = 1.0,
+                 live_edge_segments: int = 1,
+                 timeout: float = 10.0,
+                 retries: int = 2,
+                 max_backoff: float = 60.0,
+                 language: Optional[str] = 'en',
+                 logger: logging.Logger = logger):
+        """
+        :param max_connections: HTTP connections shared by the channels
+        :param prefetch: segments of a channel downloaded ahead of the one being decoded
+        :param decoders: decoder threads shared by the channels, the number of CPUs by default
+        :param chunk_seconds: audio of each delivered chunk
+        :param live_edge_segments: segments of a live playlist ingested at the start, the older ones are skipped
+        :param timeout: seconds of each download
+        :param retries: retries of a failed segment download, before it is delivered as a gap
+        :param max_backoff: longest wait between the polls of a playlist that can't be read
+        :param language: preferred language of the audio renditions
+        :param logger: logger of the client
+        """
+        self.max_connections = max_connections
+        self.prefetch = prefetch
+        self.decoders = decoders or os.cpu_count() or 1
+        self.chunk_samples = int(chunk_seconds * SAMPLING_RATE)
+        self.live_edge_segments = live_edge_segments
+        self.timeout = timeout
+        self.retries = retries
+        self.max_backoff = max_backoff
+        self.language = language
+        self.logger = logger
+        self.channels = []
+        self._session = None
+        self._pool = None
+        self._loop = None
+        self._stop_event = None
+        self._stopped = False
+
+    def add_channel(self, name: str, url: str, sink: Callable[[Union[np.ndarray, Gap]], None]) -> None:
+        """
+        Adds a channel, before serve()
+
+        :param name: channel name, for the logs and metrics
+        :param url: master or media playlist
+        :param sink: called from the event loop with each float32 audio chunk and Gap, it should not block
+        """
+        self.channels.append(_Channel(name, url, sink))
+
+    def run(self) -> None:
+        """serves the channels until stop(), or the end of all their playlists"""
+        asyncio.run(self.serve())
+
+    def stop(self) -> None:
+        """ends serve(), from any thread"""
+        self._stopped = True
+        loop = self._loop
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._stop_event.set)
+            except RuntimeError:
+                # serve() returned meanwhile
+                pass
+
+    async def serve(self) -> None:
+        import aiohttp
+        self._stop_event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        if self._stopped:
+            self._loop = None
+            return
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        async with aiohttp.ClientSession(connector=connector,
+                                         timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
+            self._session = session
+            with concurrent.futures.ThreadPoolExecutor(self.decoders, thread_name_prefix='hls-decoder') as pool:
+                self._pool = pool
+                channels = asyncio.ensure_future(asyncio.gather(*(self._run_channel(c) for c in self.channels)))
+                stop = asyncio.ensure_future(self._stop_event.wait())
+                await asyncio.wait([channels, stop], return_when=asyncio.FIRST_COMPLETED)
+                for task in (channels, stop):
+                    task.cancel()
+                await asyncio.gather(channels, stop, return_exceptions=True)
+        self._session = self._pool = self._loop = None
+
+    async def _get(self, url: str) -> bytes:
+        import aiohttp
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._session.get(url) as response:
+                    response.raise_for_status()
+                    return await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def _run_channel(self, channel: _Channel) -> None:
+        loop = asyncio.get_running_loop()
+        rendition = await loop.run_in_executor(None, select_rendition, channel.url, self.language, self.timeout)
+        self.logger.info("%s: ingesting the %s rendition %s", channel.name, rendition.kind, rendition.url)
+        segments = asyncio.Queue(self.prefetch)
+        consumer = asyncio.ensure_future(self._consume(channel, segments))
+        try:
+            await self._poll(channel, rendition.url, segments)
+            await segments.put(None)
+            await consumer
+        finally:
+            consumer.cancel()
+
+    async def _poll(self, channel: _Channel, url: str, segments: asyncio.Queue) -> None:
+        import aiohttp
+        next_sequence = None
+        failures = 0
+        while True:
+            try:
+                playlist = parse_media_playlist((await self._get(url)).decode('utf-8', errors='replace'), url)
+                if not playlist.segments:
+                    raise ValueError("no segment")
+                failures = 0
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                failures += 1
+                delay = min(self.max_backoff, 2 ** failures)
+                self.logger.warning("%s: playlist %s not read (%s), retrying in %.0f s", channel.name, url, e, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            if next_sequence is not None and playlist.segments[-1].sequence + 1 < next_sequence:
+                # the media sequence restarted with the stream
+                self.logger.warning("%s: media sequence restarted at %d", channel.name, playlist.segments[0].sequence)
+                next_sequence = None
+            if next_sequence is None:
+                new = playlist.segments if playlist.ended else playlist.segments[-self.live_edge_segments:]
+            else:
+                new = [s for s in playlist.segments if s.sequence >= next_sequence]
+                if new and new[0].sequence > next_sequence:
+                    # fallen off the playlist before this poll
+                    await segments.put((new[0].sequence - next_sequence) * playlist.target_duration)
+            for segment in new:
+                # the download starts now, the queue bounds the downloads ahead of the decoder
+                await segments.put((segment, asyncio.ensure_future(self._fetch(channel, segment))))
+            if new:
+                next_sequence = new[-1].sequence + 1
+            if playlist.ended:
+                return
+            # RFC 8216 6.3.4: the target duration after a change, half of it otherwise
+            await asyncio.sleep(playlist.target_duration if new else playlist.target_duration / 2)
+
+    async def _fetch(self, channel: _Channel, segment: Segment) -> bytes:
+        data = await self._get(segment.url)
+        if segment.map_url is not None:
+            if segment.map_url not in channel.maps:
+                channel.maps = {segment.map_url: await self._get(segment.map_url)}
+            data = channel.maps[segment.map_url] + data
+        return data
+
+    async def _consume(self, channel: _Channel, segments: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await segments.get()
+            if item is None:
+                break
+            if isinstance(item, float):
+                self._gap(channel, item)
+                continue
+            segment, download = item
+            t = time.perf_counter()
+            try:
+                data = await download
+                if segment.discontinuity:
+                    channel.decoder.reset()
+                audio = await loop.run_in_executor(self._pool, channel.decoder.decode, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error("%s: segment %d not ingested: %s", channel.name, segment.sequence, e)
+                channel.decoder.reset()
+                self._gap(channel, segment.duration)
+                continue
+            metrics.HLS_SEGMENT_SECONDS.observe(time.perf_counter() - t, channel=channel.name)
+            self._deliver(channel, audio)
+        self._flush(channel)
+
+    def _deliver(self, channel: _Channel, audio: np.ndarray) -> None:
+        channel.pending.append(audio)
+        channel.pending_samples += len(audio)
+        if channel.pending_samples < self.chunk_samples:
+            return
+        pending = np.concatenate(channel.pending)
+        n = len(pending) // self.chunk_samples * self.chunk_samples
+        for start in range(0, n, self.chunk_samples):
+            channel.sink(pending[start:start + self.chunk_samples])
+        channel.stream_seconds += n / SAMPLING_RATE
+        channel.pending = [pending[n:]] if n < len(pending) else []
+        channel.pending_samples = len(pending) - n
+
+    def _flush(self, channel: _Channel) -> None:
+        if channel.pending_samples:
+            channel.sink(np.concatenate(channel.pending))
+            channel.stream_seconds += channel.pending_samples / SAMPLING_RATE
+        channel.pending, channel.pending_samples = [], 0
+
+    def _gap(self, channel: _Channel, seconds: float) -> None:
+        self._flush(channel)
+        self.logger.warning("%s: %.1f s of stream missed at %.1f s", channel.name, seconds, channel.stream_seconds)
+        channel.sink(Gap(channel.stream_seconds, seconds))
+        channel.stream_seconds += seconds
+        metrics.STREAM_GAP_SECONDS.inc(seconds, channel=channel.name)
+
+
+class HLSIngest:
+    """
+    One channel of :class:`HLSClient` with the interface of :class:`subsai.ingest.IngestManager`: the event loop
+    runs in a thread
+    """
+
+    def __init__(self, url: str, channel: Optional[str] = None, **kwargs):
+        """
+        :param url: master or media playlist
+        :param channel: channel name, the URL by default
+        :param kwargs: arguments of HLSClient
+        """
+        self.url = url
+        self.channel = channel or url
+        self.client = HLSClient(**kwargs)
+
+    def stop(self) -> None:
+        self.client.stop()
+
+    def chunks(self) -> Iterator[Union[np.ndarray, Gap]]:
+        """
+        :return: the float32 audio chunks of the stream, and the gaps between them, until stop()
+        """
+        out = queue.Queue()
+        self.client.add_channel(self.channel, self.url, out.put)
+
+        def run():
+            try:
+                self.client.run()
+            except Exception as e:
+                self.client.logger.error("%s: HLS client failed: %s", self.channel, e, exc_info=True)
+            finally:
+                out.put(None)
+
+        thread = threading.Thread(target=run, name=f'hls-{self.channel}', daemon=True)
+        thread.start()
+        try:
+            while True:
+                chunk = out.get()
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            self.client.stop()
+            thread.join(self.client.timeout)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Live model hot-swap
+
+Changes the Whisper model (size or language) of a running channel without stopping its processes: the new
+`ASRBase` backend is loaded by a thread of the ASR process while the current one keeps transcribing, then it takes
+over the :class:`subsai.models.whisper_online.OnlineASRProcessor` at a commit boundary (an iteration that committed
+words), with its audio buffer and its committed words. The old backend is freed once it's no longer used.
+
+The webui sends a :class:`ModelSwap` on the audio queue of the channel, the ASR process passes it to
+:meth:`HotSwapper.request` and calls :meth:`HotSwapper.maybe_swap` after each iteration. The swap latency (from the
+request to the handover) and the subtitle gap (stream seconds between the last word of the old model and the first
+word of the new one) are logged and recorded in the channel metrics.
+
+Example usage:
+```python
+swapper = HotSwapper(online, lambda size, lan: FasterWhisperASR(lan=lan, modelsize=size), channel='cnn')
+swapper.request(ModelSwap('small.en', 'en'))
+while True:
+    online.insert_audio_chunk(data_queue.get())
+    online.transcriptioChuncker()
+    swapper.maybe_swap()
+```
+"""
+
+import gc
+import logging
+import sys
+import threading
+import time
+from typing import Callable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# model sizes offered for the live channels
+LIVE_MODEL_SIZES = ['tiny.en', 'tiny', 'base.en', 'base', 'small.en', 'small', 'medium.en', 'medium', 'large-v3']
+
+
+class ModelSwap(NamedTuple):
+    """Request to replace the model of a running channel, sent on its audio queue"""
+    modelsize: str
+    language: str
+
+
+class HotSwapper:
+    """
+    Loads the requested backends in the background and hands them the OnlineASRProcessor of the channel
+    """
+
+    def __init__(self,
+                 online,
+                 factory: Callable[[str, str], object],
+                 tokenizer_factory: Optional[Callable[[str], object]] = None,
+                 channel: Optional[str] = None,
+                 max_wait: float = 10.0,
+                 logger: logging.Logger = logger):
+        """
+        :param online: OnlineASRProcessor of the channel
+        :param factory: (modelsize, language) -> the loaded ASRBase backend, called in a thread
+        :param tokenizer_factory: language -> the sentence tokenizer, for the swaps that change the language
+        :param channel: channel name, the swaps are recorded in the subsai.metrics registry under this label when set
+        :param max_wait: seconds a loaded backend waits for a commit boundary, after which it takes over anyway (a
+                         channel without speech commits nothing)
+        :param logger: logger of the channel
+        """
+        self.online = online
+        self.factory = factory
+        self.tokenizer_factory = tokenizer_factory
+        self.channel = channel
+        self.max_wait = max_wait
+        self.logger = logger
+        self.metrics = None
+        if channel is not None:
+            from subsai import metrics
+            self.metrics = metrics
+        self._lock = threading.Lock()
+        self._request = None
+        self._requested_at = None
+        self._loaded = None
+        self._loaded_at = None
+        self._error = None
+        self._commited = self._commited_count()
+        # stream time of the last word of the old model and rank in the stream of the first word of the new one,
+        # until it commits
+        self._gap_from = None
+        self._swap_index = None
+
+    @property
+    def pending(self) -> bool:
+        """True from a request to its handover"""
+        with self._lock:
+            return self._request is not None
+
+    def request(self, swap: ModelSwap) -> None:
+        """Starts loading the backend of `swap`, a later request replaces a pending one"""
+        with self._lock:
+            self._request = swap
+            self._requested_at = time.monotonic()
+            self._loaded = None
+            self._error = None
+        self.logger.info("Loading the %s model (%s) in the background", swap.modelsize, swap.language)
+        threading.Thread(target=self._load, args=(swap,), name=f'hotswap-{swap.modelsize}', daemon=True).start()
+
+    def _load(self, swap: ModelSwap) -> None:
+        try:
+            asr = self.factory(swap.modelsize, swap.language)
+            tokenizer = self.tokenizer_factory(swap.language) if self.tokenizer_factory is not None else None
+        except Exception as e:
+            with self._lock:
+                if self._request is swap:
+                    self._error = e
+            return
+        with self._lock:
+            if self._request is swap:
+                self._loaded = (asr, tokenizer)
+                self._loaded_at = time.monotonic()
+
+    def _commited_count(self) -> int:
+        # words committed since the start of the stream: online.commited is emptied at the stream gaps
+        online = self.online
+        return online.seq + len(online.commited) - online.emitted_index
+
+    def maybe_swap(self) -> bool:
+        """
+        Hands the processor over to the loaded backend if the last iteration committed words (or after `max_wait`)
+
+        :return: True if the backend was swapped
+        """
+        commited = self._commited_count()
+        boundary = commited > self._commited
+        self._commited = commited
+        if boundary and self._gap_from is not None:
+            self._record_gap()
+        with self._lock:
+            if self._error is not None:
+                self.logger.error("Model %s not loaded, the channel keeps its model: %s", self._request.modelsize,
+                                  self._error)
+                self._request, self._error = None, None
+                return False
+            if self._loaded is None:
+                return False
+            if not boundary and time.monotonic() - self._loaded_at < self.max_wait:
+                return False
+            swap, requested_at = self._request, self._requested_at
+            (asr, tokenizer), self._loaded, self._request = self._loaded, None, None
+
+        old = self.online.swap_asr(asr, tokenizer)
+        latency = time.monotonic() - requested_at
+        self._gap_from = self.online.transcript_buffer.last_commited_time
+        self._swap_index = self._commited_count()
+        self.logger.info("Swapped to the %s model (%s) in %.1f s", swap.modelsize, swap.language, latency)
+        if self.metrics is not None:
+            self.metrics.MODEL_SWAPS.inc(channel=self.channel)
+            self.metrics.MODEL_SWAP_SECONDS.observe(latency, channel=self.channel)
+        # the processor was the last user of the old backend, its weights go with it
+        del old
+        self._free()
+        return True
+
+    def _record_gap(self) -> None:
+        # the first words of the new model
+        first = self._swap_index - (self._commited_count() - len(self.online.commited))
+        if first < 0:
+            # a stream gap came first, the subtitle gap of the swap is not measured
+            self._gap_from = None
+            return
+        gap = max(0.0, self.online.commited[first][0] - self._gap_from)
+        self.logger.info("First words of the new model %.1f s of stream after the last ones of the old model", gap)
+        if self.metrics is not None:
+            self.metrics.MODEL_SWAP_GAP_SECONDS.set(gap, channel=self.channel)
+        self._gap_from = None
+
+    @staticmethod
+    def _free() -> None:
+        gc.collect()
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Channel stream ingest
+
+The channels are HLS streams: their master playlist lists renditions from audio-only to full HD video, and the
+live pipeline only keeps mono 16 kHz audio. :func:`select_rendition` picks an audio-only rendition, or the lowest
+bandwidth variant, and :func:`ffmpeg_command` builds the ffmpeg command decoding only its audio.
+
+:class:`IngestManager` keeps ffmpeg running on a live stream: it restarts it when it exits or stalls, and marks the
+missed stream time with a :class:`Gap` between the audio chunks.
+
+Example usage:
+```python
+rendition = select_rendition('https://example.com/live/master.m3u8')
+cmd = ffmpeg_command(rendition.url)
+
+manager = IngestManager('https://example.com/live/master.m3u8', channel='cnn')
+for chunk in manager.chunks():
+    # 1 s of float32 audio, or a Gap
+    data_queue.put(chunk)
+```
+"""
+
+import collections
+import logging
+import os
+import re
+import select
+import subprocess
+import threading
+import time
+import urllib.parse
+import urllib.request
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+# mono 16 bits PCM
+BYTES_PER_SECOND = 2 * SAMPLING_RATE
+# float audio = PCM / PCM_SCALE, in [-1, 1) like the conversion of whisper's load_audio
+PCM_SCALE = 32768.0
+_ATTRIBUTE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+_AUDIO_CODECS = ('mp4a', 'ac-3', 'ec-3', 'opus', 'mp3', 'flac')
+
+
+class Variant(NamedTuple):
+    url: str
+    bandwidth: int
+    codecs: Optional[str]
+    resolution: Optional[str]
+    audio_group: Optional[str]
+
+    @property
+    def audio_only(self) -> bool:
+        if self.resolution:
+            return False
+        if self.codecs:
+            codecs = [c.strip().lower() for c in self.codecs.split(',')]
+            return all(c.startswith(_AUDIO_CODECS) for c in codecs)
+        return False
+
+
+class AudioRendition(NamedTuple):
+    url: str
+    group: Optional[str]
+    language: Optional[str]
+    name: Optional[str]
+    default: bool
+
+
+class Rendition(NamedTuple):
+    url: str
+    # 'audio' (an audio-only media playlist), 'audio_variant', 'lowest_variant' or 'original'
+    kind: str
+    bandwidth: Optional[int] = None
+
+    @property
+    def audio_only(self) -> bool:
+        return self.kind in ('audio', 'audio_variant')
+
+
+def _attributes(line: str) -> dict:
+    attributes = {}
+    for key, value in _ATTRIBUTE.findall(line.split(':', 1)[1]):
+        attributes[key] = value[1:-1] if value.startswith('"') else value
+    return attributes
+
+
+def parse_master_playlist(text: str, base_url: str = '') -> Tuple[List[Variant], List[AudioRendition]]:
+    """
+    :param text: HLS playlist
+    :param base_url: URL of the playlist, the relative URIs are resolved against it
+    :return: (variants, audio renditions with a URI); both empty for a media playlist
+    """
+    variants, audio = [], []
+    pending = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#EXT-X-STREAM-INF:'):
+            pending = _attributes(line)
+        elif line.startswith('#EXT-X-MEDIA:'):
+            attributes = _attributes(line)
+            if attributes.get('TYPE') == 'AUDIO' and attributes.get('URI'):
+                audio.append(AudioRendition(urllib.parse.urljoin(base_url, attributes['URI']),
+                                            attributes.get('GROUP-ID'), attributes.get('LANGUAGE'),
+                                            attributes.get('NAME'), attributes.get('DEFAULT') == 'YES'))
+        elif line and not line.startswith('#') and pending is not None:
+            variants.append(Variant(urllib.parse.urljoin(base_url, line), int(pending.get('BANDWIDTH', 0)),
+                                    pending.get('CODECS'), pending.get('RESOLUTION'), pending.get('AUDIO')))
+            pending = None
+    return variants, audio
+
+
+def _fetch(url: str, timeout: float) -> str:
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read().decode('utf-8', errors='replace')
+
+
+def choose_rendition(variants: List[Variant], audio: List[AudioRendition],
+                     language: Optional[str] = 'en') -> Optional[Rendition]:
+    """
+    Picks, in this order: an audio-only rendition (of `language`, then the default one), an audio-only variant,
+    the lowest bandwidth variant
+
+    :return: the rendition, None without variants
+    """
+    if audio:
+        # the renditions of the audio group of the lowest variant are the cheapest encodings
+        lowest = min(variants, key=lambda v: v.bandwidth) if variants else None
+        ranked = sorted(audio, key=lambda a: (lowest is not None and a.group != lowest.audio_group,
+                                              language is not None and a.language != language,
+                                              not a.default))
+        return Rendition(ranked[0].url, 'audio')
+    audio_variants = [v for v in variants if v.audio_only]
+    if audio_variants:
+        best = min(audio_variants, key=lambda v: v.bandwidth)
+        return Rendition(best.url, 'audio_variant', best.bandwidth)
+    if variants:
+        best = min(variants, key=lambda v: v.bandwidth)
+        return Rendition(best.url, 'lowest_variant', best.bandwidth)
+    return None
+
+
+def select_rendition(url: str, language: Optional[str] = 'en', timeout: float = 10.0,
+                     try_master: bool = True) -> Rendition:
+    """
+    Picks the cheapest rendition of a stream carrying its audio
+
+    :param url: master playlist, or a media playlist: then the `master.m3u8` next to it is tried if `try_master`
+    :param language: preferred language of the audio renditions
+    :param timeout: seconds of each playlist download
+    :param try_master: look for the master playlist of a media playlist
+    :return: the rendition, the original URL if there is no choice or the playlists can't be read
+    """
+    try:
+        rendition = choose_rendition(*parse_master_playlist(_fetch(url, timeout), url), language=language)
+        if rendition is None and try_master and url.split('?')[0].endswith('.m3u8'):
+            master = urllib.parse.urljoin(url, 'master.m3u8')
+            if master != url:
+                try:
+                    rendition = choose_rendition(*parse_master_playlist(_fetch(master, timeout), master),
+                                                 language=language)
+                except OSError:
+                    rendition = None
+    except (OSError, ValueError) as e:
+        logger.warning("Playlist %s not read, ingesting it as is: %s", url, e)
+        return Rendition(url, 'original')
+    if rendition is None:
+        return Rendition(url, 'original')
+    logger.debug("Rendition %s (%s) of %s", rendition.url, rendition.kind, url)
+    return rendition
+
+
+def ffmpeg_command(url: str, audio_only: bool = True, reconnect: bool = True) -> List[str]:
+    """
+    ffmpeg command writing the raw mono 16 kHz 16 bits PCM of `url` to stdout
+
+    :param url: stream URL
+    :param audio_only: only demux the first audio stream: the video, subtitles and data streams are not decoded
+    :param reconnect: retry the failed HTTP downloads, and fail the reads stuck for 15 s
+    :return: arguments
+    """
+    cmd = ["ffmpeg", "-loglevel", "quiet"]
+    if reconnect:
+        cmd += ["-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "30",
+                "-rw_timeout", "15000000"]
+    cmd += ["-i", url]
+    if audio_only:
+        cmd += ["-map", "0:a:0", "-vn", "-sn", "-dn"]
+    # raw samples: no header is written again when ffmpeg is restarted
+    cmd += ["-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(SAMPLING_RATE), "-ac", "1", "-"]
+    return cmd
+
+
+def process_stats(pid: int) -> Optional[Tuple[float, int]]:
+    """
+    CPU seconds and bytes read (files and sockets) of a running process, from /proc
+
+    :return: (cpu_seconds, read_bytes), None where /proc is not available
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # the fields after the command name, which can contain spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/io') as f:
+            io = dict(line.split(': ') for line in f.read().splitlines())
+    except (OSError, ValueError):
+        return None
+    ticks = os.sysconf('SC_CLK_TCK')
+    # utime and stime are the 14th and 15th fields of the stat line
+    return (int(fields[11]) + int(fields[12])) / ticks, int(io['rchar'])
+
+
+class Gap(NamedTuple):
+    """Marker between the audio chunks of a stream where audio is missing"""
+    # stream seconds of the audio before the gap
+    stream_time: float
+    # missing stream seconds
+    seconds: float
+
+
+class IngestManager:
+    """
+    Runs ffmpeg on a live stream, and restarts it when it exits or stalls
+
+    A watchdog restarts ffmpeg when no audio arrives for `stall_seconds`, or when less than `min_rate` times the
+    real-time byte rate arrived over the last `rate_window` seconds: a live stream is read at least in real time.
+    The restarts wait an exponential backoff, from `backoff` to `max_backoff` seconds, reset after `healthy_seconds`
+    of audio.
+
+    The stream goes on while ffmpeg is down: the wall clock seconds without audio are yielded as a :class:`Gap` before
+    the audio of the restarted ffmpeg, so the times of the audio after it stay in stream time.
+    """
+
+    def __init__(self,
+                 url: str,
+                 channel: Optional[str] = None,
+                 language: Optional[str] = 'en',
+                 chunk_seconds: float = 1.0,
+                 stall_seconds: float = 20.0,
+                 rate_window: float = 60.0,
+                 min_rate: float = 0.5,
+                 backoff: float = 1.0,
+                 max_backoff: float = 60.0,
+                 healthy_seconds: float = 60.0,
+                 min_gap: float = 2.0,
+                 command: Optional[Callable[[str], List[str]]] = None,
+                 logger: logging.Logger = logger):
+        """
+        :param url: stream URL, its rendition is selected again at each start
+        :param channel: channel name, the restarts and gaps are recorded in the subsai.metrics registry when set
+        :param language: preferred language of the audio renditions
+        :param chunk_seconds: audio of each yielded chunk
+        :param stall_seconds: seconds without audio before ffmpeg is restarted...
+        :param rate_window: ... or seconds the byte rate is measured on...
+        :param min_rate: ... and minimum fraction of the real-time byte rate over them
+        :param backoff: first wait before a restart, doubled at each failed run
+        :param max_backoff: longest wait before a restart
+        :param healthy_seconds: audio seconds of a run resetting the backoff
+        :param min_gap: shorter interruptions are jitter of the stream, no gap is yielded
+        :param command: url -> ffmpeg arguments, the command of the selected rendition by default
+        :param logger: logger of the channel
+        """
+        self.url = url
+        self.channel = channel
+        self.language = language
+        self.chunk_bytes = int(chunk_seconds * SAMPLING_RATE) * 2
+        self.stall_seconds = stall_seconds
+        self.rate_window = rate_window
+        self.min_rate = min_rate
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.healthy_seconds = healthy_seconds
+        self.min_gap = min_gap
+        self.command = command
+        self.logger = logger
+        self.metrics = None
+        if channel is not None:
+            from subsai import metrics
+            self.metrics = metrics
+
+        self.process = None
+        self.restarts = 0
+        # stream seconds of the yielded audio and gaps
+        self.stream_seconds = 0.0
+        self.gap_seconds = 0.0
+        self._failures = 0
+        self._stopped = threading.Event()
+
+    def _command(self) -> List[str]:
+        if self.command is not None:
+            return self.command(self.url)
+        rendition = select_rendition(self.url, self.language)
+        self.logger.info("Ingesting the %s rendition %s", rendition.kind, rendition.url)
+        return ffmpeg_command(rendition.url)
+
+    def next_backoff(self) -> float:
+        """seconds to wait before the next restart, they double with each run ending without `healthy_seconds`"""
+        delay = min(self.max_backoff, self.backoff * 2 ** self._failures)
+        self._failures += 1
+        return delay
+
+    def stop(self) -> None:
+        """ends chunks(), from another thread"""
+        self._stopped.set()
+        process = self.process
+        if process is not None:
+            process.terminate()
+
+    def chunks(self) -> Iterator[Union[np.ndarray, Gap]]:
+        """
+        :return: the float32 audio chunks of the stream, and the gaps between them, until stop()
+        """
+        last_audio = None
+        while not self._stopped.is_set():
+            run_seconds = 0.0
+            reason = 'exit'
+            try:
+                self.process = subprocess.Popen(self._command(), stdout=subprocess.PIPE,
+                                                stderr=subprocess.DEVNULL, bufsize=0)
+                for chunk in self._read(self.process):
+                    if isinstance(chunk, str):
+                        reason = chunk
+                        break
+                    now = time.monotonic()
+                    if run_seconds == 0 and last_audio is not None and now - last_audio >= self.min_gap:
+                        yield self._gap(now - last_audio)
+                    last_audio = now
+                    run_seconds += len(chunk) / SAMPLING_RATE
+                    self.stream_seconds += len(chunk) / SAMPLING_RATE
+                    yield chunk
+            except OSError as e:
+                self.logger.error("ffmpeg not started: %s", e)
+            finally:
+                self._end_process()
+            if self._stopped.is_set():
+                break
+
+            if run_seconds >= self.healthy_seconds:
+                self._failures = 0
+            delay = self.next_backoff()
+            self.restarts += 1
+            self.logger.warning("ffmpeg %s after %.1f s of audio, restarting in %.1f s",
+                                'stalled' if reason == 'stall' else 'exited', run_seconds, delay)
+            if self.metrics is not None:
+                self.metrics.FFMPEG_RESTARTS.inc(channel=self.channel, reason=reason)
+            self._stopped.wait(delay)
+
+    def _gap(self, seconds: float) -> Gap:
+        gap = Gap(self.stream_seconds, seconds)
+        self.logger.warning("No audio for %.1f s, gap at %.1f s of stream", seconds, self.stream_seconds)
+        self.stream_seconds += seconds
+        self.gap_seconds += seconds
+        if self.metrics is not None:
+            self.metrics.STREAM_GAP_SECONDS.inc(seconds, channel=self.channel)
+        return gap
+
+    def _end_process(self) -> None:
+        process, self.process = self.process, None
+        if process is None:
+            return
+        process.terminate()
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        if self.metrics is not None:
+            self.metrics.FFMPEG_EXITS.inc(channel=self.channel)
+
+    def _read(self, process: subprocess.Popen) -> Iterator[Union[np.ndarray, str]]:
+        # the audio chunks of a run of ffmpeg, then 'stall' if the watchdog stopped it
+        fd = process.stdout.fileno()
+        pending = bytearray()
+        started = last_data = time.monotonic()
+        received = collections.deque()
+        window_bytes = 0
+        chunks = 0
+        while not self._stopped.is_set():
+            ready, _, _ = select.select([fd], [], [], min(1.0, self.stall_seconds))
+            now = time.monotonic()
+            if ready:
+                data = os.read(fd, 65536)
+                if not data:
+                    break
+                last_data = now
+                pending += data
+                received.append((now, len(data)))
+                window_bytes += len(data)
+            while received and received[0][0] < now - self.rate_window:
+                window_bytes -= received.popleft()[1]
+            if now - last_data >= self.stall_seconds or (
+                    now - started >= self.rate_window
+                    and window_bytes < self.min_rate * BYTES_PER_SECOND * self.rate_window):
+                yield 'stall'
+                return
+            while len(pending) >= self.chunk_bytes:
+                yield self._to_float(pending[:self.chunk_bytes])
+                del pending[:self.chunk_bytes]
+                chunks += 1
+                if self.metrics is not None and chunks % 10 == 0:
+                    self._record_stats(process)
+        if len(pending) >= 2:
+            yield self._to_float(pending[:len(pending) // 2 * 2])
+
+    @staticmethod
+    def _to_float(raw: bytes) -> np.ndarray:
+        audio = np.frombuffer(bytes(raw), dtype=np.int16).astype(np.float32)
+        audio /= PCM_SCALE
+        return audio
+
+    def _record_stats(self, process: subprocess.Popen) -> None:
+        stats = process_stats(process.pid)
+        if stats is not None:
+            self.metrics.FFMPEG_CPU_SECONDS.set(stats[0], channel=self.channel)
+            self.metrics.FFMPEG_READ_BYTES.set(stats[1], channel=self.channel)
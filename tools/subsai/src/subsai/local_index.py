@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Embedded subtitles full-text index
+
+A SQLite FTS5 index with the same interface as :class:`subsai.elasticsearch_class.SubtitleDatabase`, for the
+deployments and tests without Elasticsearch. Set `SUBSAI_LOCAL_INDEX` to the database path to make the live
+pipeline write its subtitles there instead of Elasticsearch.
+
+Query syntax: the words are matched with OR and ranked with BM25, `"quoted words"` are phrases.
+
+Example usage:
+```python
+db = LocalSubtitleDatabase('/home/nexanews/subtitles.db')
+db.insert_subtitle('subtitles', {'start': '2026-10-19T20:00:00+00:00', 'end': '2026-10-19T20:00:04+00:00',
+                                 'text': 'Breaking news tonight', 'channel': 'cnn'})
+db.search('"breaking news"', channels=['cnn'], start='2026-10-19T00:00:00+00:00')
+```
+"""
+
+import datetime
+import glob
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Union
+
+LOCAL_INDEX_PATH = os.environ.get('SUBSAI_LOCAL_INDEX')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subtitles (
+    id INTEGER PRIMARY KEY,
+    idx TEXT NOT NULL,
+    channel TEXT,
+    start REAL,
+    "end" REAL,
+    text TEXT NOT NULL,
+    source TEXT NOT NULL,
+    segment_id TEXT
+);
+CREATE INDEX IF NOT EXISTS subtitles_start ON subtitles (idx, start);
+CREATE INDEX IF NOT EXISTS subtitles_channel_start ON subtitles (idx, channel, start);
+CREATE VIRTUAL TABLE IF NOT EXISTS subtitles_fts USING fts5(
+    text, content='subtitles', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS subtitles_ai AFTER INSERT ON subtitles BEGIN
+    INSERT INTO subtitles_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS subtitles_ad AFTER DELETE ON subtitles BEGIN
+    INSERT INTO subtitles_fts (subtitles_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+_QUERY_TOKENS = re.compile(r'"([^"]*)"|(\S+)')
+_SENTENCES = re.compile(r'(?<=[.!?])\s*(?=[A-Z"])')
+# mysubs_<n>.txt: the subtitles of the 10 minutes starting at n * 600 (see webui.saveSubsToFile)
+_ARCHIVE_FILE = re.compile(r'mysubs_(\d+)\.txt$')
+ARCHIVE_INTERVAL_SECONDS = 600
+
+
+def _timestamp(value: Union[str, float, datetime.datetime, None]) -> Optional[float]:
+    """
+    Epoch seconds of an ISO 8601 string or a datetime (naive ones are local times)
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return value.timestamp()
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Splits the archived text, whose subtitles are written without separators, into sentences
+    """
+    return [s.strip() for s in _SENTENCES.split(text) if s.strip()]
+
+
+def fts_query(query: str) -> str:
+    """
+    Converts a user query to an FTS5 query: quoted parts are phrases, the other words are OR-ed terms
+
+    :param query: e.g. `"breaking news" tonight`
+    :return: e.g. `"breaking news" OR "tonight"`
+    """
+    parts = []
+    for phrase, word in _QUERY_TOKENS.findall(query):
+        text = phrase if phrase else word
+        # the FTS5 syntax characters are dropped, the tokenizer would ignore them anyway
+        text = re.sub(r'[^\w\s]', ' ', text).strip()
+        if text:
+            parts.append(f'"{text}"')
+    return ' OR '.join(parts)
+
+
+class LocalSubtitleDatabase:
+    """
+    SQLite FTS5 subtitles index, with the interface of `SubtitleDatabase`
+    """
+
+    def __init__(self, path: str = ':memory:'):
+        """
+        :param path: database file, created if needed
+        """
+        self.path = path
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            # the channel processes write concurrently, the readers don't block them
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(_SCHEMA)
+        columns = [row['name'] for row in self.db.execute('PRAGMA table_info(subtitles)')]
+        if 'segment_id' not in columns:
+            # databases created before the segment ids
+            self.db.execute('ALTER TABLE subtitles ADD COLUMN segment_id TEXT')
+        self.db.execute('CREATE UNIQUE INDEX IF NOT EXISTS subtitles_segment ON subtitles (idx, segment_id)')
+
+    def create_index(self, index_name):
+        """Indices are only a column of the documents, nothing to create."""
+
+    def setup(self, alias=None, **kwargs):
+        return True
+
+    def rollover(self, alias=None, **conditions):
+        """Nothing to roll over: old documents can be removed with `delete_before`."""
+
+    def _row(self, index_name: str, doc: Union[str, dict]):
+        if isinstance(doc, str):
+            doc = json.loads(doc)
+        source = dict(doc)
+        text = source.pop('text', '')
+        return (index_name, doc.get('channel'), _timestamp(doc.get('start')), _timestamp(doc.get('end')), text,
+                json.dumps(source), doc.get('segment_id'))
+
+    def _insert(self, rows) -> None:
+        # a subtitle sent again replaces itself; DELETE then INSERT, as REPLACE doesn't fire the FTS delete trigger
+        self.db.executemany('DELETE FROM subtitles WHERE idx = ? AND segment_id = ?',
+                            [(row[0], row[-1]) for row in rows if row[-1] is not None])
+        self.db.executemany('INSERT INTO subtitles (idx, channel, start, "end", text, source, segment_id) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def insert_subtitle(self, index_name, subtitle_doc):
+        """
+        Insert a subtitle, a dict or the JSON string of `generate_subtitle`.
+        """
+        self.bulk_insert(index_name, [subtitle_doc])
+
+    def bulk_insert(self, index_name, subtitle_docs: Iterable[Union[str, dict]]) -> int:
+        """
+        Insert subtitles in one transaction, a subtitle with the `segment_id` of an indexed one replaces it.
+
+        :return: number of inserted subtitles
+        """
+        rows = [self._row(index_name, doc) for doc in subtitle_docs]
+        with self._lock, self.db:
+            self._insert(rows)
+        return len(rows)
+
+    def replace_subtitles(self, index_name, channel, start, end, subtitle_docs: Iterable[Union[str, dict]]) -> int:
+        """
+        Replace the subtitles of `channel` aired from `start` to `end` by `subtitle_docs`, in one transaction.
+
+        :return: number of replaced subtitles
+        """
+        rows = [self._row(index_name, doc) for doc in subtitle_docs]
+        with self._lock, self.db:
+            replaced = self.db.execute(
+                'DELETE FROM subtitles WHERE idx = ? AND channel = ? AND start >= ? AND start < ?',
+                (index_name, channel, _timestamp(start), _timestamp(end))).rowcount
+            self._insert(rows)
+        return replaced
+
+    def delete_before(self, end: Union[str, float, datetime.datetime], index_name: Optional[str] = None) -> int:
+        """
+        Delete the subtitles aired before `end`.
+
+        :return: number of deleted subtitles
+        """
+        sql = 'DELETE FROM subtitles WHERE start < ?'
+        params = [_timestamp(end)]
+        if index_name is not None:
+            sql += ' AND idx = ?'
+            params.append(index_name)
+        with self._lock, self.db:
+            return self.db.execute(sql, params).rowcount
+
+    def count(self, index_name: Optional[str] = None) -> int:
+        if index_name is None:
+            return self.db.execute('SELECT count(*) FROM subtitles').fetchone()[0]
+        return self.db.execute('SELECT count(*) FROM subtitles WHERE idx = ?', (index_name,)).fetchone()[0]
+
+    def search(self,
+               query: Optional[str] = None,
+               index_name: Optional[str] = None,
+               channels: Optional[List[str]] = None,
+               start: Union[str, datetime.datetime, None] = None,
+               end: Union[str, datetime.datetime, None] = None,
+               size: int = 20,
+               search_after: Optional[list] = None,
+               pit_id: Optional[str] = None,
+               keep_alive: str = '1m',
+               highlight: bool = True) -> dict:
+        """
+        Search the subtitles, same parameters and result as `SubtitleDatabase.search`.
+
+        Without `query` the subtitles are sorted by air time (newest first), otherwise by BM25 relevance then air
+        time. `index_name` None searches all the indices. Points in time are not needed: pass `search_after` only.
+        """
+        filters = []
+        params = []
+        if index_name is not None:
+            filters.append('s.idx = ?')
+            params.append(index_name)
+        if channels:
+            filters.append(f's.channel IN ({",".join("?" * len(channels))})')
+            params.extend(channels)
+        if start is not None:
+            filters.append('s.start >= ?')
+            params.append(_timestamp(start))
+        if end is not None:
+            filters.append('s.start < ?')
+            params.append(_timestamp(end))
+
+        match = fts_query(query) if query else ''
+        if match:
+            fragment = "highlight(subtitles_fts, 0, '<em>', '</em>')" if highlight else "NULL"
+            inner = (f'SELECT s.id, s.idx, s.start, s.text, s.source, bm25(subtitles_fts) AS rank, '
+                     f'{fragment} AS fragment '
+                     f'FROM subtitles_fts JOIN subtitles s ON s.id = subtitles_fts.rowid '
+                     f'WHERE subtitles_fts MATCH ?')
+            params.insert(0, match)
+            # bm25() is lower for better matches
+            order = 'rank ASC, start DESC, id DESC'
+            after = '(rank > ? OR (rank = ? AND (start < ? OR (start = ? AND id < ?))))'
+        else:
+            inner = ('SELECT s.id, s.idx, s.start, s.text, s.source, 0.0 AS rank, NULL AS fragment '
+                     'FROM subtitles s WHERE 1')
+            order = 'start DESC, id DESC'
+            after = '(start < ? OR (start = ? AND id < ?))'
+        for f in filters:
+            inner += f' AND {f}'
+
+        # the total ignores the pagination
+        total_params = list(params)
+        sql = f'SELECT * FROM ({inner})'
+        if search_after is not None:
+            sql += f' WHERE {after}'
+            if match:
+                rank, start_after, id_after = search_after
+                params.extend([rank, rank, start_after, start_after, id_after])
+            else:
+                start_after, id_after = search_after
+                params.extend([start_after, start_after, id_after])
+        sql += f' ORDER BY {order} LIMIT ?'
+        params.append(size)
+
+        with self._lock:
+            rows = self.db.execute(sql, params).fetchall()
+            total = self._total(match, filters, total_params)
+        hits = []
+        for row in rows:
+            source = json.loads(row['source'])
+            source['text'] = row['text']
+            hits.append({
+                'id': str(row['id']),
+                'index': row['idx'],
+                'score': -row['rank'] if match else None,
+                'source': source,
+                'highlight': [row['fragment']] if row['fragment'] else [],
+                'sort': [row['rank'], row['start'], row['id']] if match else [row['start'], row['id']],
+            })
+        return {
+            'total': total,
+            'hits': [{k: v for k, v in hit.items() if k != 'sort'} for hit in hits],
+            'search_after': hits[-1]['sort'] if hits else None,
+            'pit_id': None,
+        }
+
+    def _total(self, match, filters, params) -> int:
+        if match:
+            sql = ('SELECT count(*) FROM subtitles_fts JOIN subtitles s ON s.id = subtitles_fts.rowid '
+                   'WHERE subtitles_fts MATCH ?')
+        else:
+            sql = 'SELECT count(*) FROM subtitles s WHERE 1'
+        for f in filters:
+            sql += f' AND {f}'
+        return self.db.execute(sql, params).fetchone()[0]
+
+    def open_point_in_time(self, index_name=None, keep_alive='1m'):
+        return None
+
+    def close_point_in_time(self, pit_id):
+        pass
+
+    def ingest_archive(self, paths: Union[str, List[str]], index_name: str = 'subtitles',
+                       channel: Optional[str] = None) -> int:
+        """
+        Index the text archive files written by the live pipeline (`mysubs_<n>.txt`), one document per sentence.
+        The sentences get the 10 minutes window of their file as air time, or the file modification time for the
+        other files.
+
+        :param paths: files or a glob
+        :param index_name: index of the documents
+        :param channel: channel of the documents, the files don't record it
+        :return: number of inserted documents
+        """
+        if isinstance(paths, str):
+            paths = sorted(glob.glob(paths))
+        inserted = 0
+        for path in paths:
+            m = _ARCHIVE_FILE.search(os.path.basename(path))
+            if m:
+                window_start = int(m.group(1)) * ARCHIVE_INTERVAL_SECONDS
+                window_end = window_start + ARCHIVE_INTERVAL_SECONDS
+            else:
+                window_end = os.path.getmtime(path)
+                window_start = window_end - ARCHIVE_INTERVAL_SECONDS
+            with open(path, encoding='utf-8', errors='replace') as f:
+                sentences = split_sentences(f.read())
+            docs = [{
+                'start': datetime.datetime.fromtimestamp(window_start, datetime.timezone.utc).isoformat(),
+                'end': datetime.datetime.fromtimestamp(window_end, datetime.timezone.utc).isoformat(),
+                'text': sentence,
+                'channel': channel,
+                'file': os.path.basename(path),
+            } for sentence in sentences]
+            inserted += self.bulk_insert(index_name, docs)
+        return inserted
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Logging of the live pipeline
+
+The channel processes log through a non-blocking queue handler to a listener thread of the main process. Records
+are only created for enabled levels (use `logger.debug("x=%s", x)`, not f-strings), so disabled debug logging in
+the ASR loop costs a level check. An enabled record is formatted in the channel process by `QueueHandler.prepare`
+before it is queued, the listener only writes it. Debug logging can be switched on and off per
+channel at runtime with :class:`DebugSwitch`.
+"""
+
+import logging
+import logging.handlers
+import multiprocessing
+import queue
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks the caller: records are dropped (and counted) when the queue is full
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DebugSwitch:
+    """
+    Debug logging toggle of one channel, shared with its processes (create it before starting them).
+
+    The processes call :func:`apply` once per loop iteration, it only reads a shared byte.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self._enabled = multiprocessing.Value('b', int(enabled), lock=False)
+        self._applied = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._enabled.value)
+
+    def set(self, enabled: bool) -> None:
+        """
+        Switches debug logging on or off
+
+        :param enabled: True for DEBUG, False for INFO
+        """
+        self._enabled.value = int(enabled)
+
+    def apply(self, *loggers: logging.Logger) -> None:
+        """
+        Sets the level of `loggers` if the switch changed since the last call
+
+        :param loggers: loggers of the channel
+        """
+        enabled = self._enabled.value
+        if enabled != self._applied:
+            self._applied = enabled
+            for logger in loggers:
+                logger.setLevel(logging.DEBUG if enabled else logging.INFO)
+
+
+def channel_logger(component: str, channel: str) -> logging.Logger:
+    """
+    Returns the logger of a component of a channel, e.g. `subsai.asr.cnn.us`
+
+    :param component: e.g. asr, ffmpeg
+    :param channel: channel name
+    :return: logger
+    """
+    return logging.getLogger(f'subsai.{component}.{channel}')
+
+
+def worker_logger(log_queue, component: str, channel: str) -> logging.Logger:
+    """
+    Returns the logger of a channel process, sending its records to `log_queue`
+
+    :param log_queue: queue read by :func:`start_listener`
+    :param component: e.g. asr, ffmpeg
+    :param channel: channel name
+    :return: logger
+    """
+    logger = channel_logger(component, channel)
+    if not any(isinstance(h, NonBlockingQueueHandler) for h in logger.handlers):
+        logger.addHandler(NonBlockingQueueHandler(log_queue))
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def start_listener(log_queue, *handlers: logging.Handler) -> logging.handlers.QueueListener:
+    """
+    Starts a thread writing the records of `log_queue` to `handlers` (stderr by default)
+
+    :param log_queue: queue filled by the :func:`worker_logger` loggers
+    :param handlers: logging handlers
+    :return: the started listener, call `stop()` to stop it
+    """
+    if not handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers = (handler,)
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
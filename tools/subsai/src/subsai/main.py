@@ -19,14 +19,17 @@ this program. If not, see <https://www.gnu.org/licenses/>.
 import os
 import pathlib
 import tempfile
-from typing import Union, Dict
+from typing import Union, Dict, Iterator
 
 import ffmpeg
 import pysubs2
 from dl_translate import TranslationModel
-from pysubs2 import SSAFile
+from pysubs2 import SSAFile, SSAEvent
+from subsai.cache import TranscriptionCache
+from subsai.chunking import transcribe_chunked
 from subsai.configs import AVAILABLE_MODELS , AVAILABLE_CHANNELS 
 from subsai.models.abstract_model import AbstractModel
+from subsai.scheduler import compute, device_of
 from ffsubsync.ffsubsync import run, make_parser
 from subsai.utils import available_translation_models
 
@@ -115,7 +118,10 @@ class SubsAI:
         return AVAILABLE_MODELS[model_name]['class'](model_config)
 
     @staticmethod
-    def transcribe(media_file: str, model: Union[AbstractModel, str], model_config: dict = {}) -> SSAFile:
+    def transcribe(media_file: str,
+                   model: Union[AbstractModel, str],
+                   model_config: dict = {},
+                   cache: Union[TranscriptionCache, bool, None] = None) -> SSAFile:
         """
         Takes the model instance (created by :func:`create_model`) or the model name.
         Returns a :class:`pysubs2.SSAFile` <https://pysubs2.readthedocs.io/en/latest/api-reference.html#ssafile-a-subtitle-file>`_
@@ -123,16 +129,95 @@ class SubsAI:
         :param media_file: path of the media file (video/audio)
         :param model: model instance or model name
         :param model_config: model configs' dict
+        :param cache: a :class:`subsai.cache.TranscriptionCache` instance, `True` to use the default cache,
+                      or None to disable caching
 
         :return: SSAFile: list of subtitles
         """
+        media_file = str(pathlib.Path(media_file).resolve())
+        if cache is True:
+            cache = TranscriptionCache()
+        key = None
+        if cache:
+            if type(model) == str:
+                key = cache.key(media_file, model, model_config)
+            else:
+                key = cache.key(media_file, model.model_name, model.model_config)
+            subs = cache.get(key)
+            if subs is not None:
+                return subs
+
+        if type(model) == str:
+            stt_model = SubsAI.create_model(model, model_config)
+        else:
+            stt_model = model
+        subs = stt_model.transcribe(media_file)
+        if key is not None:
+            cache.put(key, subs)
+        return subs
+
+    @staticmethod
+    def transcribe_iter(media_file: str, model: Union[AbstractModel, str], model_config: dict = {}) -> Iterator[SSAEvent]:
+        """
+        Same as :func:`transcribe`, but yields the subtitles events as soon as they are decoded instead of building
+        the whole `SSAFile` in memory. Use :mod:`subsai.streaming` to write them incrementally to a file or a socket.
+
+        Example usage:
+        ```python
+        model = SubsAI.create_model('guillaumekln/faster-whisper', {'model_size_or_path': 'base'})
+        with open('test1.srt', 'w') as f:
+            write_events(SubsAI.transcribe_iter('./assets/test1.mp4', model), f, 'srt')
+        ```
+
+        :param media_file: path of the media file (video/audio)
+        :param model: model instance or model name
+        :param model_config: model configs' dict
+
+        :return: iterator of `SSAEvent`
+        """
         if type(model) == str:
             stt_model = SubsAI.create_model(model, model_config)
         else:
             stt_model = model
         media_file = str(pathlib.Path(media_file).resolve())
-        return stt_model.transcribe(media_file)
+        return stt_model.transcribe_iter(media_file)
+
+    @staticmethod
+    def transcribe_chunked(media_file: str,
+                           model: Union[AbstractModel, str],
+                           model_config: dict = {},
+                           chunk_length: float = 600.0,
+                           overlap: float = 5.0,
+                           workers: int = 2) -> SSAFile:
+        """
+        Transcribes long media files by splitting them at silence points into overlapping chunks that are
+        transcribed in parallel, then stitched back into one `SSAFile` (see :mod:`subsai.chunking`).
+        Works with any model.
 
+        Example usage:
+        ```python
+        subs = SubsAI.transcribe_chunked('./assets/long.mp3', 'guillaumekln/faster-whisper',
+                                         {'model_size_or_path': 'base'}, workers=4)
+        ```
+
+        :param media_file: path of the media file (video/audio)
+        :param model: model instance or model name. A model instance is shared by all the workers, while a model
+                      name creates one model per worker
+        :param model_config: model configs' dict
+        :param chunk_length: target chunk length in seconds
+        :param overlap: audio added on both sides of each chunk, in seconds
+        :param workers: number of chunks transcribed in parallel
+
+        :return: SSAFile: list of subtitles
+        """
+        if type(model) == str:
+            model_name = model
+            stt_model = lambda: SubsAI.create_model(model_name, model_config)
+        else:
+            stt_model = model
+        media_file = str(pathlib.Path(media_file).resolve())
+        return transcribe_chunked(media_file, stt_model, chunk_length=chunk_length, overlap=overlap,
+                                  workers=workers)
 
 class Tools:
     """
@@ -205,15 +290,17 @@ class Tools:
             translation_model = model
 
         translated_subs = SSAFile()
+        # one slot per subtitle: the live channels get the device back between two subtitles
         for sub in subs:
             translated_sub = sub.copy()
-            translated_sub.text = translation_model.translate(text=sub.text,
-                                                              source=source_language,
-                                                              target=target_language,
-                                                              batch_size=translation_configs[
-                                                                  'batch_size'] if 'batch_size' in translation_configs else 32,
-                                                              verbose=translation_configs[
-                                                                  'verbose'] if 'verbose' in translation_configs else False)
+            with compute(device_of(translation_model)):
+                translated_sub.text = translation_model.translate(text=sub.text,
+                                                                  source=source_language,
+                                                                  target=target_language,
+                                                                  batch_size=translation_configs[
+                                                                      'batch_size'] if 'batch_size' in translation_configs else 32,
+                                                                  verbose=translation_configs[
+                                                                      'verbose'] if 'verbose' in translation_configs else False)
             translated_subs.append(translated_sub)
         return translated_subs
 
@@ -251,7 +338,8 @@ class Tools:
                     cmd.append(f'--{config_name}')
                     cmd.append(f'{value}')
             parsed_args = parser.parse_args(cmd)
-            retval = run(parsed_args)["retval"]
+            with compute('cpu'):
+                retval = run(parsed_args)["retval"]
             synced_subs = pysubs2.load(srtout)
             return synced_subs
         finally:
@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Metrics of the live pipeline, in the Prometheus text exposition format
+
+Each process records into its own in-process :class:`Registry`. The channel processes push snapshots of their
+registry to the main process through a bounded queue (:class:`MetricsPusher`, :class:`MetricsCollector`), which
+serves all of them on `/metrics` (:func:`start_http_server`).
+
+Example usage:
+```python
+# main process
+metrics_queue = multiprocessing.Queue(1000)
+collector = MetricsCollector(metrics_queue)
+server = start_http_server(9464)
+# channel process
+pusher = MetricsPusher(metrics_queue, 'asr:cnn')
+AUDIO_INGESTED.inc(1.0, channel='cnn')
+pusher.maybe_push()
+```
+"""
+
+import bisect
+import collections
+import contextlib
+import http.server
+import os
+import queue
+import threading
+import time
+from typing import Dict, Tuple
+
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_PORT = int(os.environ.get('SUBSAI_METRICS_PORT', 9464))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Base class of the metrics, the values are kept per label set
+    """
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[Tuple[str, str], ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects the labels {self.labelnames}, got {tuple(labels)}')
+        return tuple((name, str(labels[name])) for name in self.labelnames)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: self._copy(value) for key, value in self._values.items()}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def samples(self, values: dict):
+        for key, value in values.items():
+            yield self.name, key, value
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value
+    """
+    type = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down
+    """
+    type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values in cumulative buckets
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per bucket counts (non cumulative, the last one is +Inf), sum, count]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @staticmethod
+    def _copy(value):
+        return [list(value[0]), value[1], value[2]]
+
+    @staticmethod
+    def merge(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+
+    def samples(self, values: dict):
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                yield self.name + '_bucket', key + (('le', _format_value(bound)),), cumulative
+            yield self.name + '_sum', key, total
+            yield self.name + '_count', key, count
+
+
+class Registry:
+    """
+    Set of metrics, plus the latest snapshots pushed by other processes
+    """
+
+    def __init__(self):
+        self._metrics = collections.OrderedDict()
+        self._remote = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f'Metric {metric.name} is already registered with another definition')
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def snapshot(self) -> Dict[str, dict]:
+        """
+        :return: the values of the metrics of this process, by metric name
+        """
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def clear(self) -> None:
+        """
+        Resets the values of the metrics of this process (e.g. the ones inherited by a forked process)
+        """
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def update_remote(self, source: str, snapshot: Dict[str, dict]) -> None:
+        """
+        Stores the latest snapshot of another process, it replaces the previous snapshot of `source`
+
+        :param source: identifier of the process, e.g. `asr:<channel>`
+        :param snapshot: :func:`snapshot` of the registry of that process
+        """
+        with self._lock:
+            self._remote[source] = snapshot
+
+    def remove_remote(self, source: str) -> None:
+        with self._lock:
+            self._remote.pop(source, None)
+
+    def render(self) -> str:
+        """
+        :return: the metrics of this process and of the remote snapshots in the text exposition format
+        """
+        with self._lock:
+            snapshots = [self.snapshot()] + list(self._remote.values())
+        lines = []
+        for name, metric in self._metrics.items():
+            values = {}
+            for snapshot in snapshots:
+                for key, value in snapshot.get(name, {}).items():
+                    values[key] = metric.merge(values[key], value) if key in values else metric._copy(value)
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for sample_name, key, value in metric.samples(values):
+                lines.append(f'{sample_name}{_format_labels(key)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# ingest
+AUDIO_INGESTED = REGISTRY.counter('subsai_audio_ingested_seconds_total',
+                                  'Seconds of audio read from the stream', ['channel'])
+FFMPEG_EXITS = REGISTRY.counter('subsai_ffmpeg_exits_total',
+                                'Number of times the ffmpeg stream ended or failed', ['channel'])
+FFMPEG_CPU_SECONDS = REGISTRY.gauge('subsai_ffmpeg_cpu_seconds',
+                                   'CPU seconds used by the running ffmpeg process', ['channel'])
+FFMPEG_READ_BYTES = REGISTRY.gauge('subsai_ffmpeg_read_bytes',
+                                   'Bytes read (stream downloads) by the running ffmpeg process', ['channel'])
+FFMPEG_RESTARTS = REGISTRY.counter('subsai_ffmpeg_restarts_total',
+                                   'ffmpeg restarts, after an exit or a stall of the stream', ['channel', 'reason'])
+STREAM_GAP_SECONDS = REGISTRY.counter('subsai_stream_gap_seconds_total',
+                                      'Seconds of the stream missed by the ingest', ['channel'])
+HLS_SEGMENT_SECONDS = REGISTRY.histogram('subsai_hls_segment_seconds',
+                                         'Download and decoding time of the HLS segments (native HLS client)',
+                                         ['channel'])
+# ASR
+QUEUE_DEPTH = REGISTRY.gauge('subsai_asr_queue_depth',
+                             'Audio chunks waiting for the ASR engine', ['channel'])
+DECODE_SECONDS = REGISTRY.histogram('subsai_asr_decode_seconds',
+                                    'Duration of one Whisper decoding of the audio buffer', ['channel'])
+RTF = REGISTRY.gauge('subsai_asr_rtf',
+                     'Real-time factor of the last iteration: decoding time / new audio duration', ['channel'])
+COMMITTED_WORDS = REGISTRY.counter('subsai_asr_committed_words_total',
+                                   'Words committed by the streaming policy', ['channel'])
+COMMITTED_WORDS_PER_MINUTE = REGISTRY.gauge('subsai_asr_committed_words_per_minute',
+                                            'Words committed during the last minute', ['channel'])
+REPEAT_SKIPPED_SECONDS = REGISTRY.counter('subsai_asr_repeat_skipped_seconds_total',
+                                          'Seconds of repeated audio given a cached transcript instead of Whisper',
+                                          ['channel'])
+REPEAT_SAVED_FRACTION = REGISTRY.gauge('subsai_asr_repeat_saved_fraction',
+                                       'Fraction of the audio seconds of the channel not passed to Whisper',
+                                       ['channel'])
+MODEL_SWAPS = REGISTRY.counter('subsai_asr_model_swaps_total', 'Live model hot-swaps', ['channel'])
+MODEL_SWAP_SECONDS = REGISTRY.histogram('subsai_asr_model_swap_seconds',
+                                        'Hot-swap latency: from the request to the handover to the new model',
+                                        ['channel'], buckets=(1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+MODEL_SWAP_GAP_SECONDS = REGISTRY.gauge('subsai_asr_model_swap_gap_seconds',
+                                        'Stream seconds between the last words of the old model and the first words '
+                                        'of the new one, at the last hot-swap', ['channel'])
+REPASS_AUDIO_SECONDS = REGISTRY.counter('subsai_repass_audio_seconds_total',
+                                       'Seconds of archived audio re-transcribed by the larger model', ['channel'])
+# compute scheduler (subsai.scheduler)
+SCHEDULER_WAIT_SECONDS = REGISTRY.histogram('subsai_scheduler_wait_seconds',
+                                            'Wait of the tasks for a slot of their device', ['priority', 'device'])
+SCHEDULER_REJECTED = REGISTRY.counter('subsai_scheduler_rejected_total',
+                                      'Tasks refused by the admission control or timed out', ['priority', 'device'])
+ALERTS = REGISTRY.counter('subsai_alerts_total', 'Watch-list alerts notified', ['channel'])
+# Elasticsearch
+ES_WRITE_SECONDS = REGISTRY.histogram('subsai_es_write_seconds',
+                                      'Duration of the Elasticsearch writes', ['index', 'operation'])
+ES_WRITE_FAILURES = REGISTRY.counter('subsai_es_write_failures_total',
+                                     'Failed Elasticsearch writes', ['index', 'operation'])
+ES_DOCUMENTS = REGISTRY.counter('subsai_es_documents_total',
+                                'Documents written to Elasticsearch', ['index'])
+
+
+@contextlib.contextmanager
+def es_write(index: str, operation: str, documents: int = 1):
+    """
+    Records the duration and the failure of the Elasticsearch write of the `with` block, the exception is re-raised
+
+    :param index: index name
+    :param operation: e.g. index, bulk
+    :param documents: number of documents written
+    """
+    t = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ES_WRITE_FAILURES.inc(index=index, operation=operation)
+        raise
+    else:
+        ES_DOCUMENTS.inc(documents, index=index)
+    finally:
+        ES_WRITE_SECONDS.observe(time.perf_counter() - t, index=index, operation=operation)
+
+
+class WordRate:
+    """
+    Number of events of the last `window` seconds, e.g. committed words per minute
+    """
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._events = collections.deque()
+        self._total = 0
+
+    def add(self, n: int, now: float = None) -> int:
+        """
+        :param n: number of new events
+        :param now: monotonic time, time.monotonic() by default
+        :return: number of events in the window
+        """
+        now = time.monotonic() if now is None else now
+        if n:
+            self._events.append((now, n))
+            self._total += n
+        while self._events and self._events[0][0] <= now - self.window:
+            self._total -= self._events.popleft()[1]
+        return self._total
+
+
+class MetricsPusher:
+    """
+    Pushes the snapshots of the registry of a channel process to the :class:`MetricsCollector` of the main process
+    """
+
+    def __init__(self, metrics_queue, source: str, registry: Registry = REGISTRY, interval: float = 1.0):
+        """
+        :param metrics_queue: bounded multiprocessing queue, snapshots are dropped when it is full
+        :param source: identifier of the process, e.g. `asr:<channel>`
+        :param registry: registry of the process, cleared so that the values inherited from the parent are not
+                         counted twice
+        :param interval: minimum number of seconds between two pushes
+        """
+        self.queue = metrics_queue
+        self.source = source
+        self.registry = registry
+        self.interval = interval
+        self._last = 0.0
+        registry.clear()
+
+    def maybe_push(self) -> None:
+        """
+        Pushes a snapshot if the last one is older than `interval`, call it from the process loop
+        """
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self.push()
+            self._last = now
+
+    def push(self) -> None:
+        try:
+            self.queue.put_nowait((self.source, self.registry.snapshot()))
+        except queue.Full:
+            pass
+
+
+class MetricsCollector:
+    """
+    Thread of the main process storing the snapshots pushed by the channel processes into its registry
+    """
+
+    def __init__(self, metrics_queue, registry: Registry = REGISTRY):
+        self.queue = metrics_queue
+        self.registry = registry
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            source, snapshot = item
+            self.registry.update_remote(source, snapshot)
+
+    def stop(self) -> None:
+        self.queue.put(None)
+        self._thread.join()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int = DEFAULT_PORT, addr: str = '0.0.0.0',
+                      registry: Registry = REGISTRY) -> http.server.ThreadingHTTPServer:
+    """
+    Serves the metrics of `registry` on `http://addr:port/metrics` from a daemon thread
+
+    :param port: port to listen on, 0 picks a free port (see `server.server_port`)
+    :param addr: address to listen on
+    :param registry: registry to expose
+    :return: the server, call `shutdown()` to stop it
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = http.server.ThreadingHTTPServer((addr, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
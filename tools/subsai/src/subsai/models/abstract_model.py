@@ -5,13 +5,24 @@
 API that the transcription models should follow
 """
 from abc import ABC, abstractmethod
-from pysubs2 import SSAFile
+from typing import Iterator
+
+from pysubs2 import SSAFile, SSAEvent
+
+from subsai.scheduler import schedule_methods, scheduled, scheduled_iter
 
 
 class AbstractModel(ABC):
     """
     Abstract Model class
+
+    The `transcribe` and `transcribe_iter` methods of the models run in a slot of their device, given by the compute
+    scheduler (see :mod:`subsai.scheduler`).
     """
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        schedule_methods(cls, transcribe=scheduled, transcribe_iter=scheduled_iter)
+
     def __init__(self, model_name=None, model_config={}):
         self.model_name = model_name
         self.model_config = model_config
@@ -36,3 +47,15 @@ class AbstractModel(ABC):
         :return: Collection of SSAEvent(s) (see :mod:`pysubs2.ssaevent`)
         """
         pass
+
+    def transcribe_iter(self, media_file) -> Iterator[SSAEvent]:
+        """
+        Transcribe the `media_file`, yielding the subtitles events as soon as they are decoded.
+
+        The default implementation yields the events of :func:`transcribe` once it returns, models that decode
+        incrementally should override it so the memory stays flat and the first events arrive early.
+
+        :param media_file: Path of the media file
+        :return: iterator of SSAEvent(s)
+        """
+        yield from self.transcribe(media_file)
@@ -7,7 +7,7 @@ Faster Whisper Model
 See [guillaumekln/faster-whisper](https://github.com/guillaumekln/faster-whisper)
 """
 
-from typing import Tuple
+from typing import Iterator, List, Tuple
 import pysubs2
 import whisper
 from pysubs2 import SSAFile, SSAEvent
@@ -257,24 +257,29 @@ class FasterWhisperModel(AbstractModel):
         total_duration = round(info.duration, 2)  # Same precision as the Whisper timestamps.
         timestamps = 0.0  # to get the current segments
         with tqdm(total=total_duration, unit=" audio seconds") as pbar:
-            if self.transcribe_configs['word_timestamps']:  # word level timestamps
-                for segment in segments:
-                    pbar.update(segment.end - timestamps)
-                    timestamps = segment.end
-                    if timestamps < info.duration:
-                        pbar.update(info.duration - timestamps)
-                    for word in segment.words:
-                        event = SSAEvent(start=pysubs2.make_time(s=word.start), end=pysubs2.make_time(s=word.end))
-                        event.plaintext = word.word.strip()
-                        subs.append(event)
-            else:
-                for segment in segments:
-                    pbar.update(segment.end - timestamps)
-                    timestamps = segment.end
-                    if timestamps < info.duration:
-                        pbar.update(info.duration - timestamps)
-                    event = SSAEvent(start=pysubs2.make_time(s=segment.start), end=pysubs2.make_time(s=segment.end))
-                    event.plaintext = segment.text.strip()
-                    subs.append(event)
+            for segment in segments:
+                pbar.update(segment.end - timestamps)
+                timestamps = segment.end
+                if timestamps < info.duration:
+                    pbar.update(info.duration - timestamps)
+                subs.extend(self._segment_events(segment))
 
         return subs
+
+    def transcribe_iter(self, media_file) -> Iterator[SSAEvent]:
+        # faster-whisper decodes lazily, segments are yielded as soon as they are decoded
+        segments, info = self.model.transcribe(media_file, **self.transcribe_configs)
+        for segment in segments:
+            yield from self._segment_events(segment)
+
+    def _segment_events(self, segment) -> List[SSAEvent]:
+        if self.transcribe_configs['word_timestamps']:  # word level timestamps
+            events = []
+            for word in segment.words:
+                event = SSAEvent(start=pysubs2.make_time(s=word.start), end=pysubs2.make_time(s=word.end))
+                event.plaintext = word.word.strip()
+                events.append(event)
+            return events
+        event = SSAEvent(start=pysubs2.make_time(s=segment.start), end=pysubs2.make_time(s=segment.end))
+        event.plaintext = segment.text.strip()
+        return [event]
@@ -16,6 +16,7 @@ import whisper
 import whisperx
 from subsai.utils import _load_config, get_available_devices
 import gc
+from collections import OrderedDict
 from pysubs2 import SSAFile, SSAEvent
 
 
@@ -99,6 +100,28 @@ class WhisperXModel(AbstractModel):
             'description': "max speakers",
             'options': None,
             'default': None
+        },
+        # resident models
+        'keep_models_loaded': {
+            'type': bool,
+            'description': "Keep the alignment and diarization models loaded between files, instead of reloading "
+                           "them for each file",
+            'options': None,
+            'default': True
+        },
+        'max_align_models': {
+            'type': int,
+            'description': "Maximum number of alignment models (one per language) kept loaded, the least recently "
+                           "used one is released first",
+            'options': None,
+            'default': 2
+        },
+        'min_free_gpu_memory': {
+            'type': float,
+            'description': "Memory pressure threshold: when the free fraction of the GPU memory drops below this "
+                           "value after a file, the resident models are released",
+            'options': None,
+            'default': 0.1
         }
     }
 
@@ -119,6 +142,12 @@ class WhisperXModel(AbstractModel):
         self.HF_TOKEN = _load_config('HF_TOKEN', model_config, self.config_schema)
         self.min_speakers = _load_config('min_speakers', model_config, self.config_schema)
         self.max_speakers = _load_config('max_speakers', model_config, self.config_schema)
+        # resident models
+        self.keep_models_loaded = _load_config('keep_models_loaded', model_config, self.config_schema)
+        self.max_align_models = _load_config('max_align_models', model_config, self.config_schema)
+        self.min_free_gpu_memory = _load_config('min_free_gpu_memory', model_config, self.config_schema)
+        self._align_models = OrderedDict()  # language -> (model, metadata), in LRU order
+        self._diarize_model = None
 
         self.model = whisperx.load_model(self.model_type,
                                          device=self.device,
@@ -129,17 +158,17 @@ class WhisperXModel(AbstractModel):
     def transcribe(self, media_file) -> str:
         audio = whisperx.load_audio(media_file)
         result = self.model.transcribe(audio, batch_size=self.batch_size)
-        model_a, metadata = whisperx.load_align_model(language_code=result["language"], device=self.device)
+        model_a, metadata = self._align_model(result["language"])
         result = whisperx.align(result["segments"], model_a, metadata, audio, self.device,
                                 return_char_alignments=self.return_char_alignments)
-        self._clear_gpu()
         del model_a
         if self.speaker_labels:
-            diarize_model = whisperx.DiarizationPipeline(use_auth_token=self.HF_TOKEN, device=self.device)
+            diarize_model = self._diarization_pipeline()
             diarize_segments = diarize_model(audio, min_speakers=self.min_speakers, max_speakers=self.max_speakers)
             result = whisperx.assign_word_speakers(diarize_segments, result)
-            self._clear_gpu()
             del diarize_model
+        if not self.keep_models_loaded or self._under_memory_pressure():
+            self.release_models()
 
         subs = SSAFile()
 
@@ -166,6 +195,43 @@ class WhisperXModel(AbstractModel):
                             f' {self.config_schema["segment_type"]["options"]}')
         return subs
 
+    def _align_model(self, language: str) -> Tuple:
+        """
+        Returns the alignment model and metadata of `language`, loading it if needed
+        """
+        if language in self._align_models:
+            self._align_models.move_to_end(language)
+            return self._align_models[language]
+        align_model = whisperx.load_align_model(language_code=language, device=self.device)
+        self._align_models[language] = align_model
+        while len(self._align_models) > max(self.max_align_models, 1):
+            old_language, _ = self._align_models.popitem(last=False)
+            logging.info(f"Releasing the {old_language} alignment model")
+            self._clear_gpu()
+        return align_model
+
+    def _diarization_pipeline(self):
+        """
+        Returns the diarization pipeline, loading it if needed
+        """
+        if self._diarize_model is None:
+            self._diarize_model = whisperx.DiarizationPipeline(use_auth_token=self.HF_TOKEN, device=self.device)
+        return self._diarize_model
+
+    def _under_memory_pressure(self) -> bool:
+        if not torch.cuda.is_available() or self.device == 'cpu':
+            return False
+        free, total = torch.cuda.mem_get_info(torch.device(self.device) if self.device else None)
+        return free / total < self.min_free_gpu_memory
+
+    def release_models(self) -> None:
+        """
+        Releases the resident alignment and diarization models, they are loaded again on the next call
+        """
+        self._align_models.clear()
+        self._diarize_model = None
+        self._clear_gpu()
+
     def _clear_gpu(self):
         gc.collect()
         torch.cuda.empty_cache()
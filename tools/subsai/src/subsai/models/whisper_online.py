@@ -1,24 +1,128 @@
 #!/usr/bin/env python3
 import sys
+import os
+import atexit
+import logging
+import re
+import bisect
+import subprocess
+import tempfile
+import threading
 import numpy as np
 import librosa  
-from functools import lru_cache
+from collections import OrderedDict
 import time
 import debugpy
 
 from datetime import datetime, timedelta
 
+from subsai.scheduler import schedule_methods, scheduled
+from subsai.tracing import NULL_TRACER
+
+logger = logging.getLogger(__name__)
+
+
+class AudioCache:
+    """LRU cache of decoded 16 kHz audio, bounded by a byte budget.
+
+    Files shorter than `mmap_min_seconds` are decoded in memory as float32. Longer files are decoded once by ffmpeg
+    to a 16-bit PCM scratch file that is memory-mapped, so reading chunks of hours-long files doesn't keep them on
+    the heap. The scratch files have their own disk budget, `max_scratch_bytes`, and are deleted on eviction and at
+    exit.
+    """
+
+    SAMPLING_RATE = 16000
+
+    def __init__(self, max_bytes=512*1024*1024, mmap_min_seconds=600, scratch_dir=None,
+                 max_scratch_bytes=4*1024*1024*1024):
+        self.max_bytes = max_bytes
+        self.max_scratch_bytes = max_scratch_bytes
+        self.mmap_min_seconds = mmap_min_seconds
+        self.scratch_dir = scratch_dir
+        self._entries = OrderedDict()  # fname -> (audio, heap bytes, scratch bytes, scratch file or None)
+        self._bytes = 0
+        self._scratch_bytes = 0
+        self._lock = threading.Lock()
+        atexit.register(self.clear)
+
+    def get(self, fname):
+        """returns the decoded audio of fname: a float32 array, or an int16 memmap for long files"""
+        with self._lock:
+            if fname in self._entries:
+                self._entries.move_to_end(fname)
+                return self._entries[fname][0]
+
+        if librosa.get_duration(path=fname) < self.mmap_min_seconds:
+            audio, _ = librosa.load(fname, sr=self.SAMPLING_RATE)
+            entry = (audio, audio.nbytes, 0, None)
+        else:
+            scratch = self._decode_to_scratch(fname)
+            audio = np.memmap(scratch, dtype=np.int16, mode="r")
+            entry = (audio, 0, audio.nbytes, scratch)
+
+        with self._lock:
+            if fname not in self._entries:
+                self._entries[fname] = entry
+                self._bytes += entry[1]
+                self._scratch_bytes += entry[2]
+                self._evict()
+            elif entry[3] is not None:
+                # decoded by another thread meanwhile
+                os.unlink(entry[3])
+            return self._entries[fname][0]
+
+    def _decode_to_scratch(self, fname):
+        fd, scratch = tempfile.mkstemp(suffix=".pcm", dir=self.scratch_dir)
+        os.close(fd)
+        cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", fname,
+               "-f", "s16le", "-acodec", "pcm_s16le", "-ac", "1", "-ar", str(self.SAMPLING_RATE), scratch]
+        try:
+            subprocess.run(cmd, check=True, capture_output=True)
+        except BaseException:
+            os.unlink(scratch)
+            raise
+        return scratch
+
+    def _evict(self):
+        # the most recent entry is kept even if it is over a budget by itself
+        while ((self._bytes > self.max_bytes or self._scratch_bytes > self.max_scratch_bytes)
+               and len(self._entries) > 1):
+            _, (_, nbytes, scratch_bytes, scratch) = self._entries.popitem(last=False)
+            self._bytes -= nbytes
+            self._scratch_bytes -= scratch_bytes
+            if scratch is not None:
+                # an open memmap keeps the data readable until it is released
+                os.unlink(scratch)
+
+    def clear(self):
+        with self._lock:
+            for _, _, _, scratch in self._entries.values():
+                if scratch is not None and os.path.exists(scratch):
+                    os.unlink(scratch)
+            self._entries.clear()
+            self._bytes = 0
+            self._scratch_bytes = 0
+
+
+audio_cache = AudioCache()
+
+
+def _to_float32(audio):
+    if audio.dtype == np.int16:
+        return audio.astype(np.float32) / 32768.0
+    return audio
 
-@lru_cache
 def load_audio(fname):
-    a, _ = librosa.load(fname, sr=16000)
-    return a
+    return _to_float32(audio_cache.get(fname))
+
+def audio_duration(fname):
+    return len(audio_cache.get(fname))/AudioCache.SAMPLING_RATE
 
 def load_audio_chunk(fname, beg, end):
-    audio = load_audio(fname)
+    audio = audio_cache.get(fname)
     beg_s = int(beg*16000)
     end_s = int(end*16000)
-    return audio[beg_s:end_s]
+    return _to_float32(audio[beg_s:end_s])
 
 
 # Whisper backend
@@ -28,6 +132,11 @@ class ASRBase:
     # join transcribe words with this character (" " for whisper_timestamped, "" for faster-whisper because it emits the spaces when neeeded)
     sep = " "
 
+    def __init_subclass__(cls, **kwargs):
+        # the transcribe() of the backends runs in a slot of their device (see subsai.scheduler)
+        super().__init_subclass__(**kwargs)
+        schedule_methods(cls, transcribe=scheduled)
+
     def __init__(self, lan, modelsize=None, cache_dir=None, model_dir=None):
         self.transcribe_kargs = {}
         self.original_language = lan 
@@ -91,6 +200,12 @@ class FasterWhisperASR(ASRBase):
 
     sep = ""
 
+    def __init__(self, lan, modelsize=None, cache_dir=None, model_dir=None, device="cuda", compute_type="float16"):
+        # device="cpu", compute_type="int8" runs the tiny models on CPU-only boxes
+        self.device = device
+        self.compute_type = compute_type
+        super().__init__(lan, modelsize=modelsize, cache_dir=cache_dir, model_dir=model_dir)
+
     def load_model(self, modelsize=None, cache_dir=None, model_dir=None):
         from faster_whisper import WhisperModel
 
@@ -105,7 +220,7 @@ class FasterWhisperASR(ASRBase):
 
 
         # this worked fast and reliably on NVIDIA L40
-        model = WhisperModel(model_size_or_path, device="cuda", compute_type="float16", download_root=cache_dir)
+        model = WhisperModel(model_size_or_path, device=self.device, compute_type=self.compute_type, download_root=cache_dir)
 
         # or run on GPU with INT8
         # tested: the transcripts were different, probably worse than with FP16, and it was slightly (appx 20%) slower
@@ -144,7 +259,8 @@ class FasterWhisperASR(ASRBase):
 
 class HypothesisBuffer:
 
-    def __init__(self):
+    def __init__(self, logger=logger):
+        self.logger = logger
         self.commited_in_buffer = []
         self.buffer = []
         self.new = []
@@ -170,10 +286,9 @@ class HypothesisBuffer:
                         c = " ".join([self.commited_in_buffer[-j][2] for j in range(1,i+1)][::-1])
                         tail = " ".join(self.new[j-1][2] for j in range(1,i+1))
                         if c == tail:
-                            print("removing last",i,"words:",file=sys.stderr)
-                            for j in range(i):
-                                print("\t",self.new.pop(0),file=sys.stderr)
-                                print()
+                            removed = self.new[:i]
+                            del self.new[:i]
+                            self.logger.debug("removing last %d words: %s", i, removed)
                             break
 
     def flush(self):
@@ -210,32 +325,63 @@ class OnlineASRProcessor:
 
     SAMPLING_RATE = 16000
 
-    def __init__(self, asr, tokenizer):
+    def __init__(self, asr, tokenizer, buffer_trimming="sentence", logger=logger, channel=None, tracer=None):
         """asr: WhisperASR object
         tokenizer: sentence tokenizer object for the target language. Must have a method *split* that behaves like the one of MosesTokenizer.
+        buffer_trimming: "sentence" trims the audio buffer after each completed sentence in process_iter, "segment" only trims on the last completed Whisper segment when the buffer is longer than 30 s.
+        logger: logger of the channel (see subsai.log), the debug records of every iteration are only built when its DEBUG level is enabled.
+        channel: channel name, the iterations are recorded in the subsai.metrics registry under this label when set.
+        tracer: optional subsai.tracing.IterationTracer recording the duration of each phase of the iterations.
         """
+        self.logger = logger
+        self.tracer = tracer if tracer is not None else NULL_TRACER
+        self.channel = channel
+        self.metrics = None
+        if channel is not None:
+            from subsai import metrics
+            self.metrics = metrics
+            self.word_rate = metrics.WordRate()
         self.asr = asr
         self.tokenizer = tokenizer
+        self.buffer_trimming = buffer_trimming
+        # the emitted segments are numbered by the position of their first word in the emitted words of the stream
+        # (the cached ones of subsai.fingerprint included), the stream id tells the processes apart: (stream_id, seq)
+        # is the identity of a segment
+        self.stream_id = f"{int(time.time()*1000):x}"
+        self.seq = 0
 
         self.init()
 
-    def init(self):
-        """run this when starting or restarting processing"""
+    def init(self, offset=0):
+        """run this when starting or restarting processing
+        offset: stream time of the next inserted audio, in seconds. The timestamps continue from there after a restart.
+        """
         self.audio_buffer = np.array([],dtype=np.float32)
-        self.buffer_time_offset = 0
+        self.buffer_time_offset = offset
 
-        self.transcript_buffer = HypothesisBuffer()
+        self.transcript_buffer = HypothesisBuffer(self.logger)
+        self.transcript_buffer.last_commited_time = offset
         self.commited = []
-        self.last_chunked_at = 0
+        # index of the first commited word not emitted by transcriptioChuncker
+        self.emitted_index = 0
+        self.last_chunked_at = offset
+        # index of the first commited word inside the audio buffer, the sentence splitting only runs from there
+        self.buffer_commited_index = 0
+
+        # commited words before the last stream gap, the beginning of the prompt (see insert_gap)
+        self.prompt_context = []
 
         self.silence_iters = 0
+        # audio inserted since the last iteration, for the real-time factor
+        self.new_audio_seconds = 0.0
 
     def insert_audio_chunk(self, audio):
         try:
             self.audio_buffer = np.append(self.audio_buffer, audio)
+            self.new_audio_seconds += len(audio)/self.SAMPLING_RATE
             return True  # or "Insertion successful!"
         except Exception as e:
-            print(f"Error during audio chunk insertion: {str(e)}")
+            self.logger.error("Error during audio chunk insertion: %s", e)
             return False  # or some error message
 
 
@@ -247,7 +393,7 @@ class OnlineASRProcessor:
         while k > 0 and self.commited[k-1][1] > self.last_chunked_at:
             k -= 1
 
-        p = self.commited[:k]
+        p = self.prompt_context + self.commited[:k]
         p = [t for _,_,t in p]
         prompt = []
         l = 0
@@ -260,29 +406,44 @@ class OnlineASRProcessor:
     
     def transcriptioChuncker(self):
         """Runs on the current audio buffer.
-        Returns: a tuple (beg_timestamp, end_timestamp, "text"), or (None, None, ""). 
-        The non-emty text is confirmed (commited) partial transcript.
+        Returns: None, or when the buffer is chunked a tuple (beg_timestamp, end_timestamp, "text", seq) of the commited
+        words not returned before, seq being the sequence number of the first one (see pop_unemitted).
         """
-        
-        prompt, context = self.prompt()
-        transcriptionResult = self.asr.transcribe(self.audio_buffer, init_prompt=prompt)
-        transcriptedWords = self.asr.ts_words(transcriptionResult)
-
-        self.transcript_buffer.insert(transcriptedWords, self.buffer_time_offset)
-        transcriptBufferFlush = self.transcript_buffer.flush()
+        with self.tracer.iteration("transcriptioChuncker", buffer_seconds=len(self.audio_buffer)/self.SAMPLING_RATE):
+            return self._transcriptioChuncker()
+
+    def _transcriptioChuncker(self):
+        tracer = self.tracer
+        with tracer.span("prompt"):
+            prompt, context = self.prompt()
+        t = time.perf_counter()
+        with tracer.span("decode"):
+            transcriptionResult = self.asr.transcribe(self.audio_buffer, init_prompt=prompt)
+        decode_seconds = time.perf_counter() - t
+        with tracer.span("ts_words"):
+            transcriptedWords = self.asr.ts_words(transcriptionResult)
+
+        with tracer.span("insert"):
+            self.transcript_buffer.insert(transcriptedWords, self.buffer_time_offset)
+        with tracer.span("flush"):
+            transcriptBufferFlush = self.transcript_buffer.flush()
         self.commited.extend(transcriptBufferFlush)
+        self.record_iteration(decode_seconds, len(transcriptBufferFlush))
 
         if transcriptBufferFlush:
-            print("chunk_completed_sentence")
+            self.logger.debug("commited %d words", len(transcriptBufferFlush))
 
         if len(self.audio_buffer)/self.SAMPLING_RATE > 30:
 
-            self.chunk_completed_segment(transcriptionResult)
+            with tracer.span("chunk_completed_segment"):
+                self.chunk_completed_segment(transcriptionResult)
             currentTime = datetime.now()
             time_difference = timedelta(seconds=len(self.audio_buffer)/self.SAMPLING_RATE)
             start_time = currentTime - time_difference
             end_time = currentTime
-            return (start_time, end_time, context)
+            # each commited word once: the context of the buffer can repeat the words of the previous output
+            seq, words = self.pop_unemitted()
+            return (start_time, end_time, self.asr.sep.join(t for _,_,t in words), seq)
             # print(f"chunking because of len",file=sys.stderr)
             # print("CONTEXT:", context, file=sys.stderr)
             # return context
@@ -296,27 +457,42 @@ class OnlineASRProcessor:
         Returns: a tuple (beg_timestamp, end_timestamp, "text"), or (None, None, ""). 
         The non-emty text is confirmed (commited) partial transcript.
         """
-
-        prompt, non_prompt = self.prompt()
-        print("PROMPT:", prompt, file=sys.stderr)
-        print("CONTEXT:", non_prompt, file=sys.stderr)
-        print(f"transcribing {len(self.audio_buffer)/self.SAMPLING_RATE:2.2f} seconds from {self.buffer_time_offset:2.2f}",file=sys.stderr)
-        res = self.asr.transcribe(self.audio_buffer, init_prompt=prompt)
+        with self.tracer.iteration("process_iter", buffer_seconds=len(self.audio_buffer)/self.SAMPLING_RATE):
+            return self._process_iter()
+
+    def _process_iter(self):
+        tracer = self.tracer
+        with tracer.span("prompt"):
+            prompt, non_prompt = self.prompt()
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.logger.debug("PROMPT: %s", prompt)
+            self.logger.debug("CONTEXT: %s", non_prompt)
+            self.logger.debug("transcribing %2.2f seconds from %2.2f", len(self.audio_buffer)/self.SAMPLING_RATE, self.buffer_time_offset)
+        t = time.perf_counter()
+        with tracer.span("decode"):
+            res = self.asr.transcribe(self.audio_buffer, init_prompt=prompt)
+        decode_seconds = time.perf_counter() - t
 
         # transform to [(beg,end,"word1"), ...]
-        tsw = self.asr.ts_words(res)
+        with tracer.span("ts_words"):
+            tsw = self.asr.ts_words(res)
 
-        self.transcript_buffer.insert(tsw, self.buffer_time_offset)
-        o = self.transcript_buffer.flush()
+        with tracer.span("insert"):
+            self.transcript_buffer.insert(tsw, self.buffer_time_offset)
+        with tracer.span("flush"):
+            o = self.transcript_buffer.flush()
         self.commited.extend(o)
-        print(">>>>COMPLETE NOW:",self.to_flush(o),file=sys.stderr,flush=True)
-        print("INCOMPLETE:",self.to_flush(self.transcript_buffer.complete()),file=sys.stderr,flush=True)
+        self.record_iteration(decode_seconds, len(o))
+        if debug:
+            self.logger.debug(">>>>COMPLETE NOW: %s", self.to_flush(o))
+            self.logger.debug("INCOMPLETE: %s", self.to_flush(self.transcript_buffer.complete()))
 
         # there is a newly confirmed text
-        if o:
+        if o and self.buffer_trimming == "sentence":
             # we trim all the completed sentences from the audio buffer
-            # self.chunk_completed_sentence()
-            print("chunk_completed_sentence")
+            with tracer.span("chunk_completed_sentence"):
+                self.chunk_completed_sentence()
             # ...segments could be considered
             #self.chunk_completed_segment(res)
 
@@ -343,7 +519,8 @@ class OnlineASRProcessor:
         # if the audio buffer is longer than 30s, trim it...
         if len(self.audio_buffer)/self.SAMPLING_RATE > 30:
             # ...on the last completed segment (labeled by Whisper)
-            self.chunk_completed_segment(res)
+            with tracer.span("chunk_completed_segment"):
+                self.chunk_completed_segment(res)
             
             # alternative: on any word
             #l = self.buffer_time_offset + len(self.audio_buffer)/self.SAMPLING_RATE - 10
@@ -352,18 +529,31 @@ class OnlineASRProcessor:
             #while k>0 and self.commited[k][1] > l:
             #    k -= 1
             #t = self.commited[k][1] 
-            print(f"chunking because of len",file=sys.stderr)
+            self.logger.debug("chunking because of len")
             #self.chunk_at(t)
 
-        print(f"len of buffer now: {len(self.audio_buffer)/self.SAMPLING_RATE:2.2f}",file=sys.stderr)
+        if debug:
+            self.logger.debug("len of buffer now: %2.2f", len(self.audio_buffer)/self.SAMPLING_RATE)
         return self.to_flush(o)
 
+    def record_iteration(self, decode_seconds, n_commited):
+        """records the decoding time, real-time factor and commited words of an iteration in the channel metrics"""
+        if self.metrics is not None:
+            m = self.metrics
+            m.DECODE_SECONDS.observe(decode_seconds, channel=self.channel)
+            if self.new_audio_seconds > 0:
+                m.RTF.set(decode_seconds/self.new_audio_seconds, channel=self.channel)
+            m.COMMITTED_WORDS.inc(n_commited, channel=self.channel)
+            m.COMMITTED_WORDS_PER_MINUTE.set(self.word_rate.add(n_commited), channel=self.channel)
+        self.new_audio_seconds = 0.0
+
     def chunk_completed_sentence(self):
         if self.commited == []: return
-        # print(self.commited,file=sys.stderr)
-        sents = self.words_to_sentences(self.commited)
-        for s in sents:
-            print("\t\tSENT:",s,file=sys.stderr)
+        # only the commited words that are still in the audio buffer, the older ones were already chunked
+        sents = self.words_to_sentences(self.commited[self.buffer_commited_index:])
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for s in sents:
+                self.logger.debug("\t\tSENT: %s", s)
         if len(sents) < 2:
             return
         while len(sents) > 2:
@@ -371,7 +561,7 @@ class OnlineASRProcessor:
         # we will continue with audio processing at this timestamp
         chunk_at = sents[-2][1]
 
-        print(f"--- sentence chunked at {chunk_at:2.2f}",file=sys.stderr)
+        self.logger.debug("--- sentence chunked at %2.2f", chunk_at)
         self.chunk_at(chunk_at)
 
     def chunk_completed_segment(self, res):
@@ -388,12 +578,12 @@ class OnlineASRProcessor:
                 ends.pop(-1)
                 e = ends[-2]+self.buffer_time_offset
             if e <= t:
-                print(f"--- segment chunked at {e:2.2f}",file=sys.stderr)
+                self.logger.debug("--- segment chunked at %2.2f", e)
                 self.chunk_at(e)
             else:
-                print(f"--- last segment not within commited area",file=sys.stderr)
+                self.logger.debug("--- last segment not within commited area")
         else:
-            print(f"--- not enough segments to chunk",file=sys.stderr)
+            self.logger.debug("--- not enough segments to chunk")
 
 
 
@@ -404,33 +594,51 @@ class OnlineASRProcessor:
         """
         self.transcript_buffer.pop_commited(time)
         cut_seconds = time - self.buffer_time_offset
-        self.audio_buffer = self.audio_buffer[int(cut_seconds)*self.SAMPLING_RATE:]
+        self.audio_buffer = self.audio_buffer[int(cut_seconds*self.SAMPLING_RATE):]
         self.buffer_time_offset = time
         self.last_chunked_at = time
+        while self.buffer_commited_index < len(self.commited) and self.commited[self.buffer_commited_index][1] <= time:
+            self.buffer_commited_index += 1
 
     def words_to_sentences(self, words):
         """Uses self.tokenizer for sentence segmentation of words.
         Returns: [(beg,end,"sentence 1"),...]
+
+        The words are joined once while recording their character offsets, then each sentence is located in the
+        joined text and mapped back to its first and last word by binary search over the offsets.
         """
-        
-        cwords = [w for w in words]
-        t = " ".join(o[2] for o in cwords)
-        s = self.tokenizer.split(t)
+        if not words:
+            return []
+        sep = self.asr.sep
+        starts = []
+        ends = []
+        pos = 0
+        for _,_,w in words:
+            starts.append(pos)
+            pos += len(w)
+            ends.append(pos)
+            pos += len(sep)
+        t = sep.join(o[2] for o in words)
+
         out = []
-        while s:
-            beg = None
-            end = None
-            sent = s.pop(0).strip()
-            fsent = sent
-            while cwords:
-                b,e,w = cwords.pop(0)
-                if beg is None and sent.startswith(w):
-                    beg = b
-                elif end is None and sent == w:
-                    end = e
-                    out.append((beg,end,fsent))
-                    break
-                sent = sent[len(w):].strip()
+        cursor = 0
+        for sent in self.tokenizer.split(t):
+            sent = sent.strip()
+            if not sent:
+                continue
+            b = t.find(sent, cursor)
+            if b < 0:
+                # the tokenizer changed the text (e.g. normalized spaces), assume it continues at the cursor
+                b = cursor
+                while b < len(t) and t[b] == " ":
+                    b += 1
+            e = min(b + len(sent), len(t))
+            cursor = e
+            i = bisect.bisect_right(ends, b)  # first word ending after the sentence start
+            j = bisect.bisect_left(starts, e) - 1  # last word starting before the sentence end
+            if i > j:
+                continue
+            out.append((words[i][0],words[j][1],sent))
         return out
 
     def finish(self):
@@ -439,7 +647,99 @@ class OnlineASRProcessor:
         """
         o = self.transcript_buffer.complete()
         f = self.to_flush(o)
-        print("last, noncommited:",f,file=sys.stderr)
+        self.logger.debug("last, noncommited: %s", f)
+        return f
+
+    def pop_unemitted(self):
+        """Returns: (seq, words), the commited words not emitted yet and the sequence number of the first one in the
+        stream. The next call returns the following ones.
+        """
+        seq = self.seq
+        words = self.commited[self.emitted_index:]
+        self.emitted_index = len(self.commited)
+        self.seq += len(words)
+        return seq, words
+
+    def swap_asr(self, asr, tokenizer=None):
+        """Hands the processing over to another backend between two iterations (see subsai.hotswap): the audio buffer,
+        the commited words and the stream offsets are kept, the next iteration transcribes the same buffer with `asr`.
+        tokenizer: sentence tokenizer of the language of `asr`, when it changes.
+        Returns: the previous backend
+        """
+        old = self.asr
+        if asr.original_language != old.original_language:
+            # the unconfirmed words of the old language can't agree with the new ones: they are dropped with the
+            # commited audio, the new model starts after the last commited word
+            self.transcript_buffer.buffer = []
+            if self.transcript_buffer.last_commited_time > self.buffer_time_offset:
+                self.chunk_at(self.transcript_buffer.last_commited_time)
+        self.asr = asr
+        if tokenizer is not None:
+            self.tokenizer = tokenizer
+        self.logger.debug("backend swapped at %.2f s, %.2f s of audio buffered", self.buffer_time_offset,
+                          len(self.audio_buffer)/self.SAMPLING_RATE)
+        return old
+
+    def checkpoint_state(self, prompt_words=50):
+        """The state of the processing between two iterations (see subsai.checkpoint): the offsets, the hypothesis
+        buffer and the commited words still in the audio buffer, with the `prompt_words` commited words before them
+        for the prompt.
+        Returns: (state, audio buffer), the state is JSON serializable
+        """
+        k = max(0, min(self.buffer_commited_index - prompt_words, self.emitted_index))
+        tb = self.transcript_buffer
+        state = {
+            'language': self.asr.original_language,
+            'stream_id': self.stream_id,
+            'seq': self.seq,
+            'emitted_index': self.emitted_index - k,
+            'buffer_time_offset': self.buffer_time_offset,
+            'last_chunked_at': self.last_chunked_at,
+            'commited': self.commited[k:],
+            'buffer_commited_index': self.buffer_commited_index - k,
+            'prompt_context': self.prompt_context[-prompt_words:],
+            'commited_in_buffer': tb.commited_in_buffer,
+            'hypothesis': tb.buffer,
+            'last_commited_time': tb.last_commited_time,
+            'last_commited_word': tb.last_commited_word,
+        }
+        return state, self.audio_buffer
+
+    def restore_state(self, state, audio):
+        """Continues the processing from a state of checkpoint_state(): the next iteration commits the words of the
+        restored audio that agree with the restored hypothesis.
+        """
+        self.init(offset=state['buffer_time_offset'])
+        self.audio_buffer = np.asarray(audio, dtype=np.float32)
+        self.last_chunked_at = state['last_chunked_at']
+        self.commited = [tuple(w) for w in state['commited']]
+        self.buffer_commited_index = state['buffer_commited_index']
+        self.prompt_context = [tuple(w) for w in state.get('prompt_context', [])]
+        # the segments emitted again after the restart get the numbers, and the ids, of their first emission
+        self.stream_id = state['stream_id']
+        self.seq = state['seq']
+        self.emitted_index = state['emitted_index']
+        tb = self.transcript_buffer
+        tb.commited_in_buffer = [tuple(w) for w in state['commited_in_buffer']]
+        tb.buffer = [tuple(w) for w in state['hypothesis']]
+        tb.last_commited_time = state['last_commited_time']
+        tb.last_commited_word = state['last_commited_word']
+
+    def insert_gap(self, seconds, prompt_words=50):
+        """Restarts the processing after an interruption of the stream: the next audio does not continue the audio
+        buffer, and comes `seconds` of stream time after its end. The last `prompt_words` words before the gap (the
+        incomplete ones included) stay the prompt of the next audio.
+        Returns: the incomplete text of the audio before the gap, in the same format as self.finish()
+        """
+        f = self.finish()
+        incomplete = self.transcript_buffer.complete()
+        # the incomplete words are emitted with the segment of the gap, the next segment is numbered after them
+        self.seq += len(incomplete)
+        context = (self.prompt_context + self.commited + incomplete)[-prompt_words:]
+        end = self.buffer_time_offset + len(self.audio_buffer)/self.SAMPLING_RATE
+        self.logger.debug("gap of %.1f s at %.1f s", seconds, end)
+        self.init(offset=end + seconds)
+        self.prompt_context = context
         return f
 
 
@@ -460,35 +760,140 @@ class OnlineASRProcessor:
 
 WHISPER_LANG_CODES = "af,am,ar,as,az,ba,be,bg,bn,bo,br,bs,ca,cs,cy,da,de,el,en,es,et,eu,fa,fi,fo,fr,gl,gu,ha,haw,he,hi,hr,ht,hu,hy,id,is,it,ja,jw,ka,kk,km,kn,ko,la,lb,ln,lo,lt,lv,mg,mi,mk,ml,mn,mr,ms,mt,my,ne,nl,nn,no,oc,pa,pl,ps,pt,ro,ru,sa,sd,si,sk,sl,sn,so,sq,sr,su,sv,sw,ta,te,tg,th,tk,tl,tr,tt,uk,ur,uz,vi,yi,yo,zh".split(",")
 
-def create_tokenizer(lan):
-    """returns an object that has split function that works like the one of MosesTokenizer"""
+MOSES_LANG_CODES = "as bn ca cs de el en es et fi fr ga gu hi hu is it kn lt lv ml mni mr nl or pa pl pt ro ru sk sl sv ta te yue zh".split()
 
-    assert lan in WHISPER_LANG_CODES, "language must be Whisper's supported lang code: " + " ".join(WHISPER_LANG_CODES)
+# the following languages are in Whisper, but not in wtpsplit:
+WTP_UNSUPPORTED_LANG_CODES = "as ba bo br bs fo haw hr ht jw lb ln lo mi nn oc sa sd sn so su sw tk tl tt".split()
 
-    if lan == "uk":
+WTP_MODEL = "wtp-canine-s-12l-no-adapters"
+
+
+class RegexSentenceSplitter:
+    """Zero-load sentence splitter: splits after sentence-final punctuation followed by whitespace, except after
+    common abbreviations and initials. Less accurate than Moses or WtP, but needs no model and no download.
+    """
+
+    _boundary = re.compile(r'(?<=[.!?\u2026\u3002\uff01\uff1f])(["\'\u201d\u2019)\]]*)\s+')
+    _no_split_before = re.compile(r'(?:\b(?:Mr|Mrs|Ms|Dr|Prof|Sr|Jr|St|vs|etc|e\.g|i\.e|No|Gen|Gov|Sen|Rep|U\.S|U\.K)|\b[A-Z])\.$')
+
+    def split(self, text):
+        sents = []
+        beg = 0
+        for m in self._boundary.finditer(text):
+            if self._no_split_before.search(text, beg, m.start()):
+                continue
+            sents.append(text[beg:m.end(1)].strip())
+            beg = m.end()
+        last = text[beg:].strip()
+        if last:
+            sents.append(last)
+        return [s for s in sents if s]
+
+
+class UkrainianTokenizer:
+    def __init__(self):
         import tokenize_uk
-        class UkrainianTokenizer:
-            def split(self, text):
-                return tokenize_uk.tokenize_sents(text)
+        self._tokenize_sents = tokenize_uk.tokenize_sents
+
+    def split(self, text):
+        return self._tokenize_sents(text)
+
+
+_wtp_lock = threading.Lock()
+_wtp = None
+
+def _wtp_model():
+    """one WtP model per process, shared by all the languages"""
+    global _wtp
+    with _wtp_lock:
+        if _wtp is None:
+            from wtpsplit import WtP
+            # downloads the model from huggingface on the first use
+            _wtp = WtP(WTP_MODEL)
+        return _wtp
+
+
+class WtPSplitter:
+    """WtP splitter for any language, this is the object hosted by the "wtp" service (see subsai.services)"""
+
+    def __init__(self):
+        self.wtp = _wtp_model()
+
+    def split(self, text, lang_code=None):
+        return self.wtp.split(text, lang_code=lang_code)
+
+
+def _wtp_lang(lan):
+    if lan in WTP_UNSUPPORTED_LANG_CODES:
+        logger.warning("%s code is not supported by wtpsplit. Going to use None lang_code option.", lan)
+        return None
+    return lan
+
+
+class WtPtok:
+    def __init__(self, splitter, lan):
+        self.splitter = splitter
+        self.lan = lan
+
+    def split(self, sent):
+        return self.splitter.split(sent, lang_code=self.lan)
+
+
+def _moses_tokenizer(lan):
+    if lan not in MOSES_LANG_CODES:
+        raise ValueError(f"{lan} is not supported by mosestokenizer")
+    from mosestokenizer import MosesTokenizer
+    return MosesTokenizer(lan)
+
+
+def _wtp_service_tokenizer(lan):
+    # one WtP model shared by all the channel processes, see `python -m subsai.services wtp` (same
+    # SUBSAI_SERVICE_AUTHKEY in both)
+    from subsai.services import connect_service, parse_address
+    address = parse_address(os.environ.get("SUBSAI_WTP_SERVICE", "127.0.0.1:50000"))
+    return WtPtok(connect_service("wtp", address), _wtp_lang(lan))
+
+
+def _auto_tokenizer(lan):
+    """the original selection: tokenize_uk for Ukrainian, Moses where supported, WtP otherwise"""
+    if lan == "uk":
         return UkrainianTokenizer()
+    if lan in MOSES_LANG_CODES:
+        return _moses_tokenizer(lan)
+    return WtPtok(WtPSplitter(), _wtp_lang(lan))
+
 
-    # supported by fast-mosestokenizer
-    if lan in "as bn ca cs de el en es et fi fr ga gu hi hu is it kn lt lv ml mni mr nl or pa pl pt ro ru sk sl sv ta te yue zh".split():
-        from mosestokenizer import MosesTokenizer
-        return MosesTokenizer(lan)
+# name -> factory(lan), extend it to plug in other sentence splitters
+TOKENIZER_BACKENDS = {
+    "regex": lambda lan: RegexSentenceSplitter(),
+    "moses": _moses_tokenizer,
+    "uk": lambda lan: UkrainianTokenizer(),
+    "wtp": lambda lan: WtPtok(WtPSplitter(), _wtp_lang(lan)),
+    "wtp-service": _wtp_service_tokenizer,
+    "auto": _auto_tokenizer,
+}
 
-    # the following languages are in Whisper, but not in wtpsplit:
-    if lan in "as ba bo br bs fo haw hr ht jw lb ln lo mi nn oc sa sd sn so su sw tk tl tt".split():
-        print(f"{lan} code is not supported by wtpsplit. Going to use None lang_code option.", file=sys.stderr)
-        lan = None
+DEFAULT_TOKENIZER_BACKEND = os.environ.get("SUBSAI_TOKENIZER", "regex")
 
-    from wtpsplit import WtP
-    # downloads the model from huggingface on the first use
-    wtp = WtP("wtp-canine-s-12l-no-adapters")
-    class WtPtok:
-        def split(self, sent):
-            return wtp.split(sent, lang_code=lan)
-    return WtPtok()
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+def create_tokenizer(lan, backend=None):
+    """returns an object that has split function that works like the one of MosesTokenizer.
+    Tokenizers are cached per (backend, language) for the whole process.
+
+    backend: one of TOKENIZER_BACKENDS, defaults to $SUBSAI_TOKENIZER or "regex" (no model to load)
+    """
+
+    assert lan in WHISPER_LANG_CODES, "language must be Whisper's supported lang code: " + " ".join(WHISPER_LANG_CODES)
+
+    if backend is None:
+        backend = DEFAULT_TOKENIZER_BACKEND
+    key = (backend, lan)
+    with _tokenizers_lock:
+        if key not in _tokenizers:
+            _tokenizers[key] = TOKENIZER_BACKENDS[backend](lan)
+        return _tokenizers[key]
 
 ## main:
 
@@ -510,8 +915,14 @@ if __name__ == "__main__":
     parser.add_argument('--offline', action="store_true", default=False, help='Offline mode.')
     parser.add_argument('--comp_unaware', action="store_true", default=False, help='Computationally unaware simulation.')
     parser.add_argument('--vad', action="store_true", default=False, help='Use VAD = voice activity detection, with the default parameters.')
+    parser.add_argument('--device', type=str, default="cuda", help='Device of the faster-whisper backend, e.g. cuda or cpu.')
+    parser.add_argument('--compute_type', type=str, default="float16", help='Compute type of the faster-whisper backend, e.g. float16, or int8 on CPU.')
+    parser.add_argument('--trace', type=str, default=None, help='Write the Chrome trace of the last iterations (spans of each phase) to this JSON file at the end.')
+    parser.add_argument('--log-level', type=str, default="DEBUG", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help='Level of the processing log written to stderr.')
     args = parser.parse_args()
 
+    logging.basicConfig(level=args.log_level, format="%(message)s", stream=sys.stderr)
+
     if args.offline and args.comp_unaware:
         print("No or one option from --offline and --comp_unaware are available, not both. Exiting.",file=sys.stderr)
         sys.exit(1)
@@ -519,7 +930,7 @@ if __name__ == "__main__":
     audio_path = args.audio_path
 
     SAMPLING_RATE = 16000
-    duration = len(load_audio(audio_path))/SAMPLING_RATE
+    duration = audio_duration(audio_path)
     print("Audio duration is: %2.2f seconds" % duration, file=sys.stderr)
 
     size = args.model
@@ -538,7 +949,10 @@ if __name__ == "__main__":
     #    from whisper_timestamped_model import WhisperTimestampedASR
         asr_cls = WhisperTimestampedASR
 
-    asr = asr_cls(modelsize=size, lan=language, cache_dir=args.model_cache_dir, model_dir=args.model_dir)
+    if asr_cls is FasterWhisperASR:
+        asr = asr_cls(modelsize=size, lan=language, cache_dir=args.model_cache_dir, model_dir=args.model_dir, device=args.device, compute_type=args.compute_type)
+    else:
+        asr = asr_cls(modelsize=size, lan=language, cache_dir=args.model_cache_dir, model_dir=args.model_dir)
 
     if args.task == "translate":
         asr.set_translate_task()
@@ -556,10 +970,14 @@ if __name__ == "__main__":
 
     
     min_chunk = args.min_chunk_size
-    online = OnlineASRProcessor(asr,create_tokenizer(tgt_language))
+    tracer = None
+    if args.trace:
+        from subsai.tracing import IterationTracer
+        tracer = IterationTracer(capacity=100000)
+    online = OnlineASRProcessor(asr,create_tokenizer(tgt_language),tracer=tracer)
 
 
-    # load the audio into the LRU cache before we start the timer
+    # load the audio into the audio cache before we start the timer
     a = load_audio_chunk(audio_path,0,1)
 
     # warm up the ASR, because the very first transcribe takes much more time than the other
@@ -644,3 +1062,7 @@ if __name__ == "__main__":
 
     o = online.finish()
     output_transcript(o, now=now)
+
+    if tracer is not None:
+        tracer.dump(args.trace)
+        print(f"Trace written to {args.trace}",file=sys.stderr)
@@ -7,14 +7,47 @@ whisper_timestamped
 See [linto-ai/whisper-timestamped](https://github.com/linto-ai/whisper-timestamped)
 """
 
-from typing import Tuple
+import subprocess
+from typing import Iterator, Tuple
+import numpy as np
 import pysubs2
 from pysubs2 import SSAFile, SSAEvent
 
+from subsai.ingest import PCM_SCALE, ffmpeg_command
 from subsai.models.abstract_model import AbstractModel
 import whisper_timestamped
 from subsai.utils import _load_config, get_available_devices
 
+SAMPLE_RATE = 16000
+# length of the audio windows decoded by `transcribe_iter`, in seconds
+STREAM_WINDOW = 60
+
+
+def _read_audio(media_file: str) -> Iterator[np.ndarray]:
+    """
+    Decodes the media file to 16 kHz mono float32 samples with one ffmpeg process, `STREAM_WINDOW` seconds at a time
+
+    :param media_file: path of the media file
+    :return: iterator of the samples, in the scale of `whisper_timestamped.load_audio`
+    """
+    process = subprocess.Popen(ffmpeg_command(media_file, reconnect=False), stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+    read = 0
+    try:
+        while True:
+            raw = process.stdout.read(STREAM_WINDOW * SAMPLE_RATE * 2)
+            if len(raw) < 2:
+                break
+            read += len(raw)
+            yield np.frombuffer(raw[:len(raw) // 2 * 2], np.int16).astype(np.float32) / PCM_SCALE
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            # the caller stopped before the end
+            process.kill()
+        if process.wait() != 0 and not read:
+            raise RuntimeError(f"Failed to load audio: ffmpeg exited with {process.returncode} on {media_file}")
+
 
 class WhisperTimeStamped(AbstractModel):
     model_name = 'linto-ai/whisper-timestamped'
@@ -254,28 +287,74 @@ class WhisperTimeStamped(AbstractModel):
 
     def transcribe(self, media_file) -> str:
         audio = whisper_timestamped.load_audio(media_file)
-        results = whisper_timestamped.transcribe(self.model, audio,
-                                                 verbose=self.verbose,
-                                                 temperature=self.temperature,
-                                                 compression_ratio_threshold=self.compression_ratio_threshold,
-                                                 logprob_threshold=self.logprob_threshold,
-                                                 no_speech_threshold=self.no_speech_threshold,
-                                                 condition_on_previous_text=self.condition_on_previous_text,
-                                                 **self.decode_options
-                                                 )
+        results = self._transcribe_audio(audio)
         subs = SSAFile()
+        subs.extend(self._segments_events(results['segments']))
+        return subs
+
+    def transcribe_iter(self, media_file) -> Iterator[SSAEvent]:
+        # whisper_timestamped only returns once the whole input is decoded, so the audio is fed in windows of
+        # `STREAM_WINDOW` seconds, decoded from the media as they are needed: at most two windows are in memory.
+        # The last segment of a window may be cut at the window edge, so it is dropped and the next window starts
+        # at the end of the previous segment (like whisper's own seek).
+        window = STREAM_WINDOW * SAMPLE_RATE
+        reader = _read_audio(media_file)
+        # the samples from `seek` on, read from the media and not transcribed yet
+        audio = np.zeros(0, dtype=np.float32)
+        seek = 0
+        prompt = None
+        more = True
+        try:
+            while True:
+                while more and len(audio) < window:
+                    chunk = next(reader, None)
+                    if chunk is None:
+                        more = False
+                    else:
+                        audio = np.concatenate((audio, chunk))
+                if not len(audio):
+                    break
+                end = min(len(audio), window)
+                results = self._transcribe_audio(audio[:end], initial_prompt=prompt)
+                segments = results['segments']
+                next_seek = end
+                if (more or end < len(audio)) and len(segments) > 1:
+                    segments = segments[:-1]
+                    next_seek = max(int(segments[-1]['end'] * SAMPLE_RATE), SAMPLE_RATE)
+                yield from self._segments_events(segments, offset=seek / SAMPLE_RATE)
+                if self.condition_on_previous_text and segments:
+                    prompt = ' '.join(segment['text'].strip() for segment in segments)[-200:]
+                audio = audio[next_seek:]
+                seek += next_seek
+        finally:
+            reader.close()
+
+    def _transcribe_audio(self, audio, **kwargs) -> dict:
+        return whisper_timestamped.transcribe(self.model, audio,
+                                              verbose=self.verbose,
+                                              temperature=self.temperature,
+                                              compression_ratio_threshold=self.compression_ratio_threshold,
+                                              logprob_threshold=self.logprob_threshold,
+                                              no_speech_threshold=self.no_speech_threshold,
+                                              condition_on_previous_text=self.condition_on_previous_text,
+                                              **self.decode_options,
+                                              **kwargs
+                                              )
+
+    def _segments_events(self, segments, offset=0.0) -> Iterator[SSAEvent]:
         if self.segment_type == 'word':  # word level timestamps
-            for segment in results['segments']:
+            for segment in segments:
                 for word in segment['words']:
-                    event = SSAEvent(start=pysubs2.make_time(s=word["start"]), end=pysubs2.make_time(s=word["end"]))
+                    event = SSAEvent(start=pysubs2.make_time(s=word["start"] + offset),
+                                     end=pysubs2.make_time(s=word["end"] + offset))
                     event.plaintext = word["text"].strip()
-                    subs.append(event)
+                    yield event
         elif self.segment_type == 'sentence':
-            for segment in results['segments']:
-                event = SSAEvent(start=pysubs2.make_time(s=segment["start"]), end=pysubs2.make_time(s=segment["end"]))
+            for segment in segments:
+                event = SSAEvent(start=pysubs2.make_time(s=segment["start"] + offset),
+                                 end=pysubs2.make_time(s=segment["end"] + offset))
                 event.plaintext = segment["text"].strip()
-                subs.append(event)
+                yield event
         else:
             raise Exception(f'Unknown `segment_type` value, it should be one of the following: '
                             f' {self.config_schema["segment_type"]["options"]}')
-        return subs
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Background re-transcription of the live channels
+
+The live channels run a small Whisper model for a low latency. The re-pass tier transcribes their audio archive
+(:mod:`subsai.archive`) again with a larger model through `SubsAI.transcribe`, one window at a time when the live
+channels leave the compute idle (:class:`subsai.scheduler.PriorityScheduler`), and replaces the live subtitles of
+each window in the subtitles index: the re-transcribed subtitles are indexed, then the live ones of the window are
+deleted. On Elasticsearch these are two requests, not atomic: the readers can see both versions of a window in
+between. A window whose subtitles are not written is written again after a back-off. The progress of each channel is
+kept in its archive directory once its window is written, so a restart continues where it stopped.
+
+Set `SUBSAI_REPASS_MODEL` (and its JSON configuration `SUBSAI_REPASS_MODEL_CONFIG`) with `SUBSAI_ARCHIVE` to run it
+next to the live channels.
+
+Example usage:
+```python
+model = SubsAI.create_model('guillaumekln/faster-whisper', {'model_size_or_path': 'medium.en'})
+repass = Retranscriber('/home/nexanews/archive', LocalSubtitleDatabase('/home/nexanews/subtitles.db'),
+                       lambda path: SubsAI.transcribe(path, model), device=device_of(model))
+repass.run(threading.Event())
+```
+"""
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Iterable, Optional, Tuple
+
+from subsai import metrics
+from subsai.archive import ARCHIVE_PATH, INDEX_FILE, AudioArchive
+from subsai.scheduler import BATCH, DEFAULT_DEVICE, SchedulerBusy, compute, device_of, set_scheduler
+
+logger = logging.getLogger(__name__)
+
+REPASS_MODEL = os.environ.get('SUBSAI_REPASS_MODEL')
+REPASS_MODEL_CONFIG = json.loads(os.environ.get('SUBSAI_REPASS_MODEL_CONFIG', '{}'))
+STATE_FILE = 'repass.json'
+# the write alias of the live subtitles (subsai.elasticsearch_class.SUBTITLES_ALIAS)
+SUBTITLES_INDEX = 'subtitles'
+
+
+class Retranscriber:
+    """
+    Re-transcribes the archived audio of the channels, and replaces their live subtitles
+    """
+
+    def __init__(self,
+                 archive_root: str,
+                 database,
+                 transcribe: Callable[[str], Iterable],
+                 scheduler=None,
+                 device: str = DEFAULT_DEVICE,
+                 index_name: str = SUBTITLES_INDEX,
+                 window_seconds: float = 60.0,
+                 delay: float = 120.0,
+                 lookback: float = 3600.0,
+                 admission_timeout: float = 5.0,
+                 retry_backoff: float = 5.0,
+                 max_backoff: float = 300.0,
+                 logger: logging.Logger = logger):
+        """
+        :param archive_root: directory of the audio archive
+        :param database: SubtitleDatabase or LocalSubtitleDatabase of the live subtitles
+        :param transcribe: audio file path -> subtitle events (`SubsAI.transcribe` of the larger model)
+        :param scheduler: PriorityScheduler (or its proxy) the windows wait for, the one of the process by default
+        :param device: device of the larger model, the one of its scheduler slots
+        :param index_name: index of the live subtitles
+        :param window_seconds: audio transcribed at once
+        :param delay: seconds after the air time before a window is transcribed, the live subtitles are written by then
+        :param lookback: a channel without progress starts this many seconds before now
+        :param admission_timeout: seconds a window waits for the scheduler before the next call of run_once()
+        :param retry_backoff: seconds before a window not written is written again, doubled at each failure
+        :param max_backoff: maximum seconds between two writes of a window
+        :param logger: logger
+        """
+        self.archive_root = archive_root
+        self.database = database
+        self.transcribe = transcribe
+        self.scheduler = scheduler
+        self.device = device
+        self.index_name = index_name
+        self.window_seconds = window_seconds
+        self.delay = delay
+        self.lookback = lookback
+        self.admission_timeout = admission_timeout
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.logger = logger
+        self._archives = {}
+        # (channel, start, end, subtitles or None) of the window transcribed and not written yet
+        self._pending = None
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def _archive(self, channel: str) -> AudioArchive:
+        if channel not in self._archives:
+            # a reader: it never writes nor prunes
+            self._archives[channel] = AudioArchive(self.archive_root, channel, retention=0)
+        return self._archives[channel]
+
+    def channels(self):
+        if not os.path.isdir(self.archive_root):
+            return []
+        return sorted(c for c in os.listdir(self.archive_root)
+                      if os.path.exists(os.path.join(self.archive_root, c, INDEX_FILE)))
+
+    def done_until(self, channel: str) -> Optional[float]:
+        """:return: air time the channel is re-transcribed until, None before its first window"""
+        try:
+            with open(os.path.join(self.archive_root, channel, STATE_FILE)) as f:
+                return json.load(f)['done_until']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save_progress(self, channel: str, done_until: float) -> None:
+        path = os.path.join(self.archive_root, channel, STATE_FILE)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'done_until': done_until}, f)
+        os.replace(path + '.tmp', path)
+
+    def next_window(self, now: Optional[float] = None) -> Optional[Tuple[str, float, float]]:
+        """
+        :return: (channel, start, end) of the oldest window of all the channels ready to be re-transcribed
+        """
+        now = time.time() if now is None else now
+        best = None
+        for channel in self.channels():
+            time_range = self._archive(channel).time_range()
+            if time_range is None:
+                continue
+            done = self.done_until(channel)
+            start = max(time_range[0], done if done is not None else now - self.lookback)
+            end = start + self.window_seconds
+            if end > min(time_range[1], now - self.delay):
+                continue
+            if best is None or start < best[1]:
+                best = (channel, start, end)
+        return best
+
+    def _documents(self, channel: str, start: float, events) -> list:
+        from subsai.utils import create_subtitle_entry, subtitle_id
+        docs = []
+        for i, event in enumerate(events):
+            if not event.text.strip():
+                continue
+            doc = create_subtitle_entry(datetime.datetime.fromtimestamp(start + event.start / 1000),
+                                        datetime.datetime.fromtimestamp(start + event.end / 1000),
+                                        event.text.strip(), channel)
+            doc['tier'] = 'repass'
+            # a window re-transcribed again (e.g. after a crash before its progress was saved) overwrites its subtitles
+            doc['segment_id'] = subtitle_id(channel, f'repass-{start:.3f}', i)
+            docs.append(doc)
+        return docs
+
+    def run_once(self, now: Optional[float] = None) -> bool:
+        """
+        Re-transcribes the next window, if the scheduler admits it
+
+        :return: True if a window was processed
+        """
+        if self._pending is None:
+            window = self.next_window(now)
+            if window is None:
+                return False
+            self._pending = self._transcribe_window(*window)
+            if self._pending is None:
+                return False
+        elif time.monotonic() < self._retry_at:
+            return False
+        return self._write()
+
+    def _transcribe_window(self, channel: str, start: float, end: float):
+        try:
+            with compute(self.device, BATCH, self.admission_timeout, self.scheduler):
+                path = self._archive(channel).extract(start, end)
+                try:
+                    events = list(self.transcribe(path))
+                finally:
+                    os.remove(path)
+        except SchedulerBusy:
+            return None
+        except Exception as e:
+            # the window keeps its live subtitles
+            self.logger.error("%s: window at %s not re-transcribed: %s", channel,
+                              datetime.datetime.fromtimestamp(start).isoformat(timespec='seconds'), e, exc_info=True)
+            return channel, start, end, None
+        return channel, start, end, self._documents(channel, start, events)
+
+    def _write(self) -> bool:
+        # replaces the subtitles of the pending window and saves the progress, the window is written again after a
+        # back-off if it fails (a restart transcribes it again)
+        channel, start, end, docs = self._pending
+        try:
+            if docs is not None:
+                replaced = self.database.replace_subtitles(self.index_name, channel,
+                                                           datetime.datetime.fromtimestamp(start).astimezone(),
+                                                           datetime.datetime.fromtimestamp(end).astimezone(), docs)
+            self._save_progress(channel, end)
+        except Exception as e:
+            self._failures += 1
+            backoff = min(self.max_backoff, self.retry_backoff * 2 ** (self._failures - 1))
+            self._retry_at = time.monotonic() + backoff
+            self.logger.error("%s: window at %s not written, written again in %.0f s: %s", channel,
+                              datetime.datetime.fromtimestamp(start).isoformat(timespec='seconds'), backoff, e,
+                              exc_info=True)
+            return False
+        self._pending = None
+        self._failures = 0
+        if docs is not None:
+            metrics.REPASS_AUDIO_SECONDS.inc(end - start, channel=channel)
+            self.logger.info("%s: %d live subtitles replaced by %d re-transcribed ones", channel, replaced, len(docs))
+        return True
+
+    def run(self, stop: threading.Event, idle_seconds: float = 5.0) -> None:
+        """re-transcribes the windows until `stop` is set"""
+        while not stop.is_set():
+            try:
+                done = self.run_once()
+            except Exception as e:
+                # e.g. the archive directory is not readable, the process keeps running
+                self.logger.error("Re-transcription failed: %s", e, exc_info=True)
+                done = False
+            if not done:
+                stop.wait(idle_seconds)
+
+
+def run_repass(scheduler_address=None, authkey=None) -> None:
+    """
+    Entry point of the re-pass process: transcribes the archive with `SUBSAI_REPASS_MODEL` into the subtitles index
+    of the live pipeline (the embedded index when `SUBSAI_LOCAL_INDEX` is set, Elasticsearch otherwise)
+
+    :param scheduler_address: (host, port) of the scheduler service of the webui
+    :param authkey: authkey of the scheduler service, defaults to `subsai.services.DEFAULT_AUTHKEY`
+    """
+    from subsai import SubsAI
+    from subsai.local_index import LOCAL_INDEX_PATH, LocalSubtitleDatabase
+    from subsai.services import DEFAULT_AUTHKEY, connect_service
+    if LOCAL_INDEX_PATH:
+        database = LocalSubtitleDatabase(LOCAL_INDEX_PATH)
+    else:
+        from subsai.elasticsearch_class import SubtitleDatabase
+        database = SubtitleDatabase()
+    if scheduler_address is not None:
+        set_scheduler(connect_service('scheduler', scheduler_address, authkey or DEFAULT_AUTHKEY))
+    model = SubsAI.create_model(REPASS_MODEL, REPASS_MODEL_CONFIG)
+    logger.info("Re-transcribing %s with %s", ARCHIVE_PATH, REPASS_MODEL)
+    Retranscriber(ARCHIVE_PATH, database, lambda path: SubsAI.transcribe(path, model),
+                  device=device_of(model)).run(threading.Event())
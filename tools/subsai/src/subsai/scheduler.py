@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Priority scheduling of the compute shared by the live channels, the webui and the background work
+
+Every transcription (`AbstractModel.transcribe`, `ASRBase.transcribe`), translation and ffsubsync run asks
+:class:`PriorityScheduler` for a slot of its device first, with one of three priorities:
+
+* `LIVE`: the live channels have to keep up with the air time, their short iterations are admitted at once
+* `INTERACTIVE`: the webui requests, admitted before any waiting background task
+* `BATCH`: the background work (e.g. the re-transcription of the archive), admitted when no live or interactive
+  task runs on the device and the live tasks were busy less than `max_live_load` of the last `window` seconds
+
+Each device ('cpu', 'cuda:0', ...) has its own slots and its own queue, a device busy with a batch job does not
+delay the tasks of another one. The tasks queued beyond `max_queued` are refused at once (admission control)
+rather than piling up behind a busy device. The slots are taken again at each chunk boundary (each event of
+`transcribe_iter`, each chunk of `SubsAI.transcribe_chunked`), so a long batch job gives its device to a task of a
+higher priority at its next chunk.
+
+One scheduler is hosted by the webui process and shared with the channel processes through subsai.services
+(`SUBSAI_SCHEDULER=host:port` for the other processes, e.g. the CLI); a process without one schedules its own tasks.
+The priority of the tasks follows the caller: `with priority(INTERACTIVE): ...`, `BATCH` by default.
+
+Example usage:
+```python
+with priority(INTERACTIVE):
+    subs = SubsAI.transcribe(path, model)
+
+with compute('cuda:0', BATCH, timeout=5):
+    model.transcribe(path)
+
+scheduler = PriorityScheduler(slots={'cpu': 4})
+token = scheduler.acquire(LIVE, device='cpu')
+try:
+    online.transcriptioChuncker()
+finally:
+    scheduler.release(token)
+```
+"""
+
+import collections
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+from subsai import metrics
+
+LIVE = 0
+INTERACTIVE = 1
+BATCH = 2
+PRIORITY_NAMES = {LIVE: 'live', INTERACTIVE: 'interactive', BATCH: 'batch'}
+
+SCHEDULER_ADDRESS = os.environ.get('SUBSAI_SCHEDULER')
+# device: concurrent tasks, e.g. {"cpu": 4, "cuda:0": 2}, 1 for the other devices
+DEVICE_SLOTS = json.loads(os.environ.get('SUBSAI_DEVICE_SLOTS', '{}'))
+# device of the models created without one, they run on the first GPU when there is one
+DEFAULT_DEVICE = os.environ.get('SUBSAI_DEFAULT_DEVICE', 'cuda:0')
+# tasks queued per device beyond which the new ones are refused, the live ones never wait
+MAX_QUEUED = {INTERACTIVE: 8, BATCH: 32}
+
+
+class SchedulerBusy(RuntimeError):
+    """The task was not admitted: the queue of its device is full, or the timeout expired"""
+
+
+class _Device:
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        # token: (priority, start)
+        self.running = {}
+        # (priority, arrival) of the waiting tasks
+        self.waiting = []
+        # (start, end) of the finished live tasks of the last window
+        self.live_busy = collections.deque()
+
+
+class PriorityScheduler:
+    """
+    Per-device slots, given to the live tasks at once and to the others by priority
+    """
+
+    def __init__(self,
+                 window: float = 10.0,
+                 max_live_load: float = 0.5,
+                 slots: Optional[dict] = None,
+                 max_queued: Optional[dict] = None):
+        """
+        :param window: seconds the live load is measured on
+        :param max_live_load: busy seconds of the live tasks per second, over `window`, above which no background
+                              task starts
+        :param slots: device: tasks running at once on it (`SUBSAI_DEVICE_SLOTS`), 1 for the devices not listed
+        :param max_queued: priority: tasks waiting per device beyond which the new ones are refused
+        """
+        self.window = window
+        self.max_live_load = max_live_load
+        self.slots = DEVICE_SLOTS if slots is None else slots
+        self.max_queued = MAX_QUEUED if max_queued is None else max_queued
+        self._condition = threading.Condition()
+        self._tokens = itertools.count(1)
+        self._arrivals = itertools.count()
+        self._devices = {}
+        # token: device
+        self._token_devices = {}
+
+    def _device(self, device: str) -> _Device:
+        if device not in self._devices:
+            self._devices[device] = _Device(self.slots.get(device, 1))
+        return self._devices[device]
+
+    def _live_load(self, state: _Device, now: float) -> float:
+        while state.live_busy and state.live_busy[0][1] < now - self.window:
+            state.live_busy.popleft()
+        busy = sum(end - max(start, now - self.window) for start, end in state.live_busy)
+        busy += sum(now - max(start, now - self.window) for priority, start in state.running.values()
+                    if priority == LIVE)
+        return busy / self.window
+
+    def _admitted(self, state: _Device, priority: int, arrival: int, now: float) -> bool:
+        if priority == LIVE:
+            return True
+        if len(state.running) >= state.slots:
+            return False
+        # by priority, then first come first served
+        if any(waiting < (priority, arrival) for waiting in state.waiting):
+            return False
+        if priority == BATCH:
+            if any(p < priority for p, _ in state.running.values()):
+                return False
+            return self._live_load(state, now) < self.max_live_load
+        return True
+
+    def live_load(self, device: str = DEFAULT_DEVICE) -> float:
+        """busy seconds of the live tasks of `device` per second, over the last `window` seconds"""
+        with self._condition:
+            return self._live_load(self._device(device), time.monotonic())
+
+    def queued(self, device: str = DEFAULT_DEVICE) -> dict:
+        """:return: priority name: tasks waiting for `device`"""
+        with self._condition:
+            counts = collections.Counter(p for p, _ in self._device(device).waiting)
+            return {PRIORITY_NAMES[p]: counts[p] for p in PRIORITY_NAMES}
+
+    def acquire(self, priority: int, timeout: Optional[float] = None,
+                device: str = DEFAULT_DEVICE) -> Optional[int]:
+        """
+        Waits until a task of `priority` can run on `device`
+
+        :param priority: LIVE, INTERACTIVE or BATCH
+        :param timeout: longest wait in seconds, None waits as long as needed
+        :param device: device of the task
+        :return: the token to release when the task ends, None if the task was refused or the timeout expired
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            state = self._device(device)
+            key = (priority, next(self._arrivals))
+            if not self._admitted(state, priority, key[1], time.monotonic()):
+                limit = self.max_queued.get(priority)
+                if limit is not None and sum(p == priority for p, _ in state.waiting) >= limit:
+                    return None
+                state.waiting.append(key)
+                try:
+                    while not self._admitted(state, priority, key[1], time.monotonic()):
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            return None
+                        # the live load decreases with time, not only at the releases
+                        self._condition.wait(1.0 if remaining is None else min(1.0, remaining))
+                finally:
+                    state.waiting.remove(key)
+                    # the tasks queued behind this one may be admitted now
+                    self._condition.notify_all()
+            token = next(self._tokens)
+            state.running[token] = (priority, time.monotonic())
+            self._token_devices[token] = device
+            return token
+
+    def release(self, token: int) -> None:
+        with self._condition:
+            state = self._devices[self._token_devices.pop(token)]
+            priority, start = state.running.pop(token)
+            if priority == LIVE:
+                state.live_busy.append((start, time.monotonic()))
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def slot(self, priority: int, device: str = DEFAULT_DEVICE):
+        """acquire() and release() around a block, in the process of the scheduler"""
+        token = self.acquire(priority, device=device)
+        try:
+            yield
+        finally:
+            self.release(token)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_priority = contextvars.ContextVar('subsai_priority', default=BATCH)
+# the slot of the running task: the nested calls (e.g. `transcribe_iter` calling `transcribe`) run in it
+_held = contextvars.ContextVar('subsai_slot', default=None)
+
+
+def set_scheduler(scheduler) -> None:
+    """Sets the scheduler of the process: a PriorityScheduler, or the proxy of a shared one"""
+    global _scheduler
+    _scheduler = scheduler
+
+
+def get_scheduler():
+    """:return: the scheduler of the process, `SUBSAI_SCHEDULER` or a scheduler of its own by default"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            if SCHEDULER_ADDRESS:
+                from subsai.services import connect_service, parse_address
+                _scheduler = connect_service('scheduler', parse_address(SCHEDULER_ADDRESS))
+            else:
+                _scheduler = PriorityScheduler()
+        return _scheduler
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def priority(value: int):
+    """runs the tasks of the block, in this thread, with the priority `value`"""
+    reset = _priority.set(value)
+    try:
+        yield
+    finally:
+        _priority.reset(reset)
+
+
+def device_of(model) -> str:
+    """
+    :return: the scheduler device of a model: its `device` (and `device_index`) attribute or configuration,
+             `DEFAULT_DEVICE` when it's not set
+    """
+    config = getattr(model, 'model_config', None) or {}
+    device = getattr(model, 'device', None) or getattr(model, '_device', None) or config.get('device')
+    index = getattr(model, '_device_index', None)
+    if index is None:
+        index = config.get('device_index')
+    if device in (None, 'auto'):
+        return DEFAULT_DEVICE
+    device = str(device)
+    if device == 'cuda':
+        return f'cuda:{index[0] if isinstance(index, (list, tuple)) else index or 0}'
+    return device
+
+
+@contextlib.contextmanager
+def compute(device: str, priority: Optional[int] = None, timeout: Optional[float] = None, scheduler=None):
+    """
+    Runs the block in a slot of `device`, or in the slot the caller already runs in
+
+    :param device: device of the task
+    :param priority: priority of the task, the one of the caller (:func:`priority`) by default
+    :param timeout: longest wait in seconds, None waits as long as needed
+    :param scheduler: scheduler to ask, the one of the process by default
+    :raises SchedulerBusy: the task was refused or the timeout expired
+    """
+    if _held.get() is not None:
+        yield
+        return
+    scheduler = get_scheduler() if scheduler is None else scheduler
+    priority = current_priority() if priority is None else priority
+    labels = {'priority': PRIORITY_NAMES[priority], 'device': device}
+    start = time.perf_counter()
+    token = scheduler.acquire(priority, timeout, device)
+    if token is None:
+        metrics.SCHEDULER_REJECTED.inc(**labels)
+        raise SchedulerBusy(f"No {PRIORITY_NAMES[priority]} slot of {device} available")
+    metrics.SCHEDULER_WAIT_SECONDS.observe(time.perf_counter() - start, **labels)
+    held = _held.set(token)
+    try:
+        yield
+    finally:
+        _held.reset(held)
+        scheduler.release(token)
+
+
+def scheduled(method):
+    """runs a `transcribe(self, ...)` method in a slot of the device of `self`"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with compute(device_of(self)):
+            return method(self, *args, **kwargs)
+    wrapper.__scheduled__ = True
+    return wrapper
+
+
+def scheduled_iter(method):
+    """
+    runs a `transcribe_iter(self, ...)` generator in a slot of the device of `self`, taken for each event: a task of
+    a higher priority gets the device between two events
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        iterator = method(self, *args, **kwargs)
+        end = object()
+        while True:
+            with compute(device_of(self)):
+                event = next(iterator, end)
+            if event is end:
+                return
+            yield event
+    wrapper.__scheduled__ = True
+    return wrapper
+
+
+def schedule_methods(cls, **wrappers) -> None:
+    """wraps the methods of `cls` itself (name=wrapper), for the `__init_subclass__` of the model base classes"""
+    for name, wrapper in wrappers.items():
+        method = cls.__dict__.get(name)
+        if method is not None and not getattr(method, '__scheduled__', False):
+            setattr(cls, name, wrapper(method))
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Small shared services
+
+Hosts one instance of an object in a server process (a :class:`multiprocessing.managers.BaseManager`), so that
+several channel processes share it through proxies instead of loading their own copy.
+
+The servers unpickle the requests of their clients, whoever knows the authkey can run code in them. Without
+`SUBSAI_SERVICE_AUTHKEY`, the authkey is random for each run and only the processes started by this one know it
+(pass `DEFAULT_AUTHKEY` to them with the address): the services then only listen on the loopback interface.
+
+Example usage:
+```python
+manager = start_service('wtp', WtPSplitter, address=('127.0.0.1', 50000), authkey=b'secret')
+# in any process
+wtp = connect_service('wtp', ('127.0.0.1', 50000), b'secret')
+wtp.split("Hello there. How are you?", "en")
+```
+"""
+
+import argparse
+import functools
+import ipaddress
+import os
+from multiprocessing.managers import BaseManager
+from typing import Callable, Tuple
+
+SERVICE_AUTHKEY = os.environ.get('SUBSAI_SERVICE_AUTHKEY', '').encode()
+DEFAULT_AUTHKEY = SERVICE_AUTHKEY or os.urandom(32)
+
+_instances = {}
+
+
+class ServiceManager(BaseManager):
+    pass
+
+
+def _singleton(name: str, factory: Callable):
+    # runs in the server process, every client gets a proxy to the same instance
+    if name not in _instances:
+        _instances[name] = factory()
+    return _instances[name]
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """
+    Parses a `host:port` string
+
+    :param address: `host:port`
+    :return: (host, port) tuple
+    """
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def is_loopback(host: str) -> bool:
+    """True if `host` is only reachable from this machine"""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _check_authkey(address: Tuple[str, int], authkey: bytes) -> None:
+    if not is_loopback(address[0]) and not SERVICE_AUTHKEY and authkey == DEFAULT_AUTHKEY:
+        raise ValueError(f"Set SUBSAI_SERVICE_AUTHKEY to listen on {address[0]}, the default authkey is only for the "
+                         f"loopback interface")
+
+
+def start_service(name: str,
+                  factory: Callable,
+                  address: Tuple[str, int] = ('127.0.0.1', 0),
+                  authkey: bytes = DEFAULT_AUTHKEY) -> ServiceManager:
+    """
+    Starts a server process hosting the instance created by `factory`
+
+    :param name: service name, used by :func:`connect_service`
+    :param factory: picklable callable (e.g. a class or a module level function) returning the instance
+    :param address: (host, port) to listen on, port 0 picks a free port (see `manager.address`)
+    :param authkey: shared secret of the clients, `SUBSAI_SERVICE_AUTHKEY` is required on other interfaces than
+                    the loopback
+    :return: the started manager, call `shutdown()` to stop it
+    """
+    _check_authkey(address, authkey)
+    ServiceManager.register(name, callable=functools.partial(_singleton, name, factory))
+    manager = ServiceManager(address=address, authkey=authkey)
+    manager.start()
+    return manager
+
+
+def connect_service(name: str, address: Tuple[str, int], authkey: bytes = DEFAULT_AUTHKEY):
+    """
+    Returns a proxy to the instance hosted by the service `name`
+
+    :param name: service name
+    :param address: (host, port) of the service
+    :param authkey: shared secret of the service
+    :return: proxy exposing the public methods of the instance
+    """
+    ServiceManager.register(name)
+    manager = ServiceManager(address=address, authkey=authkey)
+    manager.connect()
+    return getattr(manager, name)()
+
+
+def _services() -> dict:
+    from subsai.models.whisper_online import WtPSplitter
+    from subsai.stories import StoryClusterer
+    from subsai.scheduler import PriorityScheduler
+    return {'wtp': WtPSplitter, 'stories': StoryClusterer, 'scheduler': PriorityScheduler}
+
+
+def main():
+    services = _services()
+    parser = argparse.ArgumentParser(description="Runs a shared subsai service in the foreground")
+    parser.add_argument('service', choices=list(services.keys()), help="Service to run")
+    parser.add_argument('--address', default='127.0.0.1:50000', help="host:port to listen on")
+    args = parser.parse_args()
+    if not SERVICE_AUTHKEY:
+        # the clients are other processes, they need a key they know
+        parser.error("Set SUBSAI_SERVICE_AUTHKEY, the shared secret of the service and its clients")
+
+    name = args.service
+    ServiceManager.register(name, callable=functools.partial(_singleton, name, services[name]))
+    manager = ServiceManager(address=parse_address(args.address), authkey=DEFAULT_AUTHKEY)
+    server = manager.get_server()
+    # load it now rather than on the first client call
+    _singleton(name, services[name])
+    print(f"[+] Serving {name} on {args.address}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
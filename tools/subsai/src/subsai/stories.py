@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Cross-channel near-duplicate story detection
+
+The committed subtitles of each channel are sketched over a sliding window of their last words (MinHash of word
+3-grams) and looked up in an LSH index of the sketches of all the channels over the last hours. A window close
+enough to an indexed window of another channel, or to an older one of the same channel (a rerun), gets its story ID.
+Otherwise a window continuing the previous window of its channel (close enough to it, within `self_exclusion`) keeps
+the story ID of the channel, and any other window starts a new story. The first windows of a story on a channel are
+often too short to match the longer windows of the other channels: when a later window matches another story and
+the first window of the channel story is contained in the matched window, the two stories are merged (union-find),
+the ID of the channel story is then an alias of the other one (see `resolve`).
+Sketches older than `horizon` are evicted, so memory stays bounded.
+
+The channels run in separate processes, so the live pipeline hosts one :class:`StoryClusterer` in a shared service
+(see :mod:`subsai.services`) and each ASR process calls it through a proxy.
+
+Story detection of the live pipeline is disabled by setting `SUBSAI_STORIES=0`.
+
+Example usage:
+```python
+stories = StoryClusterer()
+stories.assign('cbs', "The senate passed the bill late on Tuesday ...", timestamp=1760900000)  # 'story-...'
+# in a channel process, with the proxy of the shared service
+subtitle = tag_subtitle(connect_service('stories', address), subtitle)
+```
+"""
+
+import collections
+import datetime
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from typing import Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STORIES_ENABLED = os.environ.get('SUBSAI_STORIES', '1') not in ('', '0')
+
+_WORD = re.compile(r"\w+(?:'\w+)*")
+# Mersenne prime of the MinHash permutations, the hashes are 32 bits so a * x + b fits in 64 bits
+_PRIME = (1 << 31) - 1
+
+
+def normalize_words(text: str):
+    text = unicodedata.normalize('NFKD', text.lower())
+    return [w for w in _WORD.findall(text) if not w.isdigit()]
+
+
+class MinHasher:
+    """
+    MinHash signatures of sets of word n-grams
+    """
+
+    def __init__(self, num_perm: int = 64, ngram: int = 3, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.ngram = ngram
+        self.a = rng.randint(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, words) -> np.ndarray:
+        n = self.ngram
+        grams = {' '.join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+        return np.fromiter((zlib.crc32(g.encode('utf-8')) for g in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, words) -> np.ndarray:
+        """
+        :param words: normalized words
+        :return: `num_perm` uint32 minimum hashes
+        """
+        hashes = self.shingles(words) % _PRIME
+        # (num_perm, n_shingles) permuted hashes, minimum over the shingles
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % _PRIME
+        return permuted.min(axis=1).astype(np.uint32)
+
+
+class _Entry:
+    __slots__ = ('channel', 'timestamp', 'signature', 'size', 'story_id')
+
+    def __init__(self, channel, timestamp, signature, size, story_id):
+        self.channel = channel
+        self.timestamp = timestamp
+        self.signature = signature
+        # number of n-grams of the window
+        self.size = size
+        self.story_id = story_id
+
+
+class _Run:
+    # the current story of a channel
+    __slots__ = ('story_id', 'last', 'first')
+
+    def __init__(self, entry):
+        self.story_id = entry.story_id
+        # the last window of the channel, and the first one of the story if the channel started it and none of its
+        # windows matched another story since
+        self.last = entry
+        self.first = entry
+
+
+class StoryClusterer:
+    """
+    Streaming MinHash LSH clustering of the subtitles windows of all the channels
+    """
+
+    def __init__(self,
+                 threshold: float = 0.3,
+                 num_perm: int = 96,
+                 bands: int = 32,
+                 window_words: int = 60,
+                 min_words: int = 12,
+                 horizon: float = 6 * 3600,
+                 self_exclusion: float = 600,
+                 max_entries: int = 200000):
+        """
+        :param threshold: minimum estimated Jaccard similarity of the 3-grams of two windows of the same story,
+                          the ASR errors and the different subtitle boundaries of the channels keep it low
+        :param num_perm: MinHash signature size
+        :param bands: LSH bands, of `num_perm / bands` rows; the detection probability is 50% at a similarity of
+                      about (1 / bands) ** (bands / num_perm)
+        :param window_words: number of last words of a channel sketched with each new subtitle
+        :param min_words: shorter windows are not assigned a story
+        :param horizon: seconds the sketches are kept
+        :param self_exclusion: the windows of the same channel closer than this are not compared (they overlap),
+                               only the previous one to continue its story
+        :param max_entries: maximum number of sketches kept, the oldest are evicted first
+        """
+        if num_perm % bands:
+            raise ValueError(f'num_perm ({num_perm}) should be a multiple of bands ({bands})')
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.window_words = window_words
+        self.min_words = min_words
+        self.horizon = horizon
+        self.self_exclusion = self_exclusion
+        self.max_entries = max_entries
+        # one dict per band, from the band of a signature to the entries
+        self._buckets = [{} for _ in range(bands)]
+        self._entries = collections.deque()
+        self._windows = {}
+        self._runs = {}
+        # union-find of the merged stories, from a story ID to the one it was merged into, and the merge times
+        self._parent = {}
+        self._merges = collections.deque()
+        self._stories = 0
+        self._lock = threading.Lock()
+
+    def _band_keys(self, signature: np.ndarray):
+        # recomputed on eviction rather than kept with the entries
+        rows = self.rows
+        return [signature[band * rows:(band + 1) * rows].tobytes() for band in range(self.bands)]
+
+    def _evict(self, now: float) -> None:
+        entries = self._entries
+        while entries and (entries[0].timestamp < now - self.horizon or len(entries) > self.max_entries):
+            entry = entries.popleft()
+            for buckets, key in zip(self._buckets, self._band_keys(entry.signature)):
+                bucket = buckets[key]
+                bucket.remove(entry)
+                if not bucket:
+                    del buckets[key]
+        # the sketches and the channel stories carry the IDs of their time, older aliases are not looked up anymore
+        merges = self._merges
+        while merges and merges[0][0] < now - self.horizon:
+            self._parent.pop(merges.popleft()[1], None)
+
+    def _new_story_id(self, channel: str, timestamp: float) -> str:
+        self._stories += 1
+        return f'story-{int(timestamp)}-{zlib.crc32(channel.encode("utf-8")):08x}-{self._stories}'
+
+    def _find(self, story_id: str) -> str:
+        parent = self._parent
+        root = story_id
+        while root in parent:
+            root = parent[root]
+        while story_id != root:
+            parent[story_id], story_id = root, parent[story_id]
+        return root
+
+    def _union(self, story_id: str, into: str, timestamp: float) -> str:
+        root = self._find(story_id)
+        if root != into:
+            self._parent[root] = into
+            self._merges.append((timestamp, root))
+        return into
+
+    @staticmethod
+    def _containment(entry: _Entry, other: _Entry) -> float:
+        # estimated fraction of the n-grams of `entry` in `other`, from their Jaccard similarity and sizes
+        similarity = (entry.signature == other.signature).mean()
+        return min(1.0, similarity * (entry.size + other.size) / ((1 + similarity) * entry.size))
+
+    def resolve(self, story_id: str) -> str:
+        """
+        :param story_id: story ID returned by `assign`
+        :return: the ID of the story it was merged into since, or the same ID
+        """
+        with self._lock:
+            return self._find(story_id)
+
+    def assign(self, channel: str, text: str, timestamp: Optional[float] = None) -> Optional[str]:
+        """
+        Appends `text` to the window of `channel` and returns the story ID of the window
+
+        :param channel: channel name
+        :param text: committed subtitle text
+        :param timestamp: air time in epoch seconds, now by default
+        :return: story ID, or None while the window is too short
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            window = self._windows.setdefault(channel, collections.deque(maxlen=self.window_words))
+            window.extend(normalize_words(text))
+            if len(window) < self.min_words:
+                return None
+            self._evict(timestamp)
+            signature = self.hasher.signature(list(window))
+            size = max(1, len(window) - self.hasher.ngram + 1)
+            keys = self._band_keys(signature)
+
+            candidates = {}
+            for buckets, key in zip(self._buckets, keys):
+                for entry in buckets.get(key, ()):
+                    if entry.channel != channel or timestamp - entry.timestamp >= self.self_exclusion:
+                        candidates[id(entry)] = entry
+            best = None
+            if candidates:
+                candidates = list(candidates.values())
+                similarities = (np.stack([e.signature for e in candidates]) == signature).mean(axis=1)
+                i = int(similarities.argmax())
+                if similarities[i] >= self.threshold:
+                    best = candidates[i]
+
+            entry = _Entry(channel, timestamp, signature, size, None)
+            run = self._runs.get(channel)
+            continues = (run is not None and timestamp - run.last.timestamp < self.self_exclusion
+                         and (run.last.signature == signature).mean() >= self.threshold)
+            if best is not None:
+                entry.story_id = self._find(best.story_id)
+                if continues and run.first is not None and self._containment(run.first, best) >= 0.5:
+                    # the story the channel started is the beginning of the matched one
+                    entry.story_id = self._union(run.story_id, entry.story_id, timestamp)
+            elif continues:
+                entry.story_id = self._find(run.story_id)
+            else:
+                entry.story_id = self._new_story_id(channel, timestamp)
+
+            if not (continues and entry.story_id == self._find(run.story_id)):
+                run = self._runs[channel] = _Run(entry)
+            run.story_id, run.last = entry.story_id, entry
+            if best is not None:
+                # the channel story is known to the other channels
+                run.first = None
+            self._entries.append(entry)
+            for buckets, key in zip(self._buckets, keys):
+                buckets.setdefault(key, []).append(entry)
+            self._evict(timestamp)
+            return entry.story_id
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'buckets': sum(len(b) for b in self._buckets), 'stories': self._stories,
+                    'merged': len(self._parent), 'channels': len(self._windows)}
+
+
+def tag_subtitle(stories, subtitle: Union[str, dict]) -> Union[str, dict]:
+    """
+    Adds the `story_id` of a subtitle entry, the entry is returned unchanged if the clusterer fails
+
+    :param stories: :class:`StoryClusterer` or a proxy of the `stories` service
+    :param subtitle: subtitle entry, a dict or the JSON string of `generate_subtitle`
+    :return: the entry, of the same type
+    """
+    entry = json.loads(subtitle) if isinstance(subtitle, str) else dict(subtitle)
+    start = entry.get('start')
+    timestamp = datetime.datetime.fromisoformat(start).timestamp() if start else None
+    try:
+        story_id = stories.assign(entry.get('channel') or '', entry.get('text', ''), timestamp)
+    except Exception as e:
+        # the story service is optional, the subtitle is indexed without it
+        logger.error("Story detection failed: %s", e)
+        return subtitle
+    if story_id is not None:
+        entry['story_id'] = story_id
+    return json.dumps(entry) if isinstance(subtitle, str) else entry
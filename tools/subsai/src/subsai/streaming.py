@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Incremental subtitles writers
+
+Writes SRT/VTT cues one by one as the events are decoded (see :func:`subsai.main.SubsAI.transcribe_iter`), to a file
+or any writable text stream such as `socket.makefile('w')`, without building an `SSAFile` in memory.
+"""
+
+from typing import Iterable, TextIO
+
+from pysubs2 import SSAEvent
+from pysubs2.time import ms_to_times
+
+STREAMING_FORMATS = ['srt', 'vtt']
+
+
+def _timestamp(ms: int, fractions_sep: str) -> str:
+    h, m, s, ms = ms_to_times(max(0, ms))
+    return f"{h:02d}:{m:02d}:{s:02d}{fractions_sep}{ms:03d}"
+
+
+class SubtitleStreamWriter:
+    """
+    Writes subtitles events incrementally in SRT or VTT format.
+
+    Example usage:
+    ```python
+    with open('test1.srt', 'w') as f:
+        writer = SubtitleStreamWriter(f, 'srt')
+        for event in SubsAI.transcribe_iter('./assets/test1.mp4', model):
+            writer.write(event)
+    ```
+    """
+
+    def __init__(self, fp: TextIO, format_: str = 'srt', flush: bool = True):
+        """
+        :param fp: writable text stream
+        :param format_: one of :attr:`STREAMING_FORMATS`
+        :param flush: flush the stream after each cue, so readers get the cues as soon as they are decoded
+        """
+        if format_ not in STREAMING_FORMATS:
+            raise ValueError(f'Unsupported streaming format `{format_}`, it should be one of the following: '
+                             f'{STREAMING_FORMATS}')
+        self.fp = fp
+        self.format = format_
+        self.flush = flush
+        self.count = 0
+        if self.format == 'vtt':
+            self.fp.write('WEBVTT\n\n')
+
+    def write(self, event: SSAEvent) -> None:
+        """
+        Writes one cue
+
+        :param event: subtitles event
+        """
+        text = event.plaintext.strip()
+        if not text or event.is_comment:
+            return
+        self.count += 1
+        if self.format == 'srt':
+            self.fp.write(f"{self.count}\n"
+                          f"{_timestamp(event.start, ',')} --> {_timestamp(event.end, ',')}\n"
+                          f"{text}\n\n")
+        else:
+            self.fp.write(f"{_timestamp(event.start, '.')} --> {_timestamp(event.end, '.')}\n"
+                          f"{text}\n\n")
+        if self.flush:
+            self.fp.flush()
+
+
+def write_events(events: Iterable[SSAEvent], fp: TextIO, format_: str = 'srt') -> int:
+    """
+    Writes all the events to `fp` as they come
+
+    :param events: iterable of subtitles events
+    :param fp: writable text stream
+    :param format_: one of :attr:`STREAMING_FORMATS`
+    :return: number of written cues
+    """
+    writer = SubtitleStreamWriter(fp, format_)
+    for event in events:
+        writer.write(event)
+    return writer.count
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Tracing of the phases of the streaming ASR iterations
+
+An :class:`IterationTracer` keeps the timings of the spans (decode, ts_words, insert, ...) of the last N iterations of
+a channel in a ring buffer, and exports them as Chrome trace-event JSON (chrome://tracing, https://ui.perfetto.dev).
+Without a tracer, :data:`NULL_TRACER` is used and a span costs an attribute lookup and a call.
+
+Tracing of the live channel processes is enabled by setting `SUBSAI_TRACE=1` (`SUBSAI_TRACE_ITERATIONS` sets the
+ring buffer size). Dumping the traces of running channel processes (they write their trace when they receive SIGUSR1):
+
+    python -m subsai.tracing dump <pid> [<pid> ...] --output trace.json
+"""
+
+import argparse
+import collections
+import contextlib
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+DEFAULT_CAPACITY = 256
+TRACE_DIR = os.environ.get('SUBSAI_TRACE_DIR', tempfile.gettempdir())
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'start')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        spans = self.tracer._spans
+        if spans is not None:
+            spans.append((self.name, self.start, time.perf_counter_ns() - self.start))
+
+
+class _Iteration:
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.tracer._spans = []
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        tracer = self.tracer
+        tracer.iterations.append((self.name, self.start, time.perf_counter_ns() - self.start,
+                                  tracer._spans, self.args))
+        tracer._spans = None
+
+
+class IterationTracer:
+    """
+    Ring buffer of the span timings of the last `capacity` iterations of a channel
+    """
+
+    def __init__(self, channel: str = 'main', capacity: int = DEFAULT_CAPACITY):
+        """
+        :param channel: channel name, the thread name of the Chrome trace
+        :param capacity: number of iterations kept
+        """
+        self.channel = channel
+        # the trace format expects a numeric thread id, the thread creating the tracer runs the iterations
+        self.tid = threading.get_native_id()
+        self.iterations = collections.deque(maxlen=capacity)
+        self._spans = None
+
+    def iteration(self, name: str, **args) -> _Iteration:
+        """
+        Context manager of one iteration, spans are only recorded inside an iteration
+
+        :param name: e.g. process_iter
+        :param args: values shown with the event, e.g. the buffer length
+        """
+        return _Iteration(self, name, args)
+
+    def span(self, name: str) -> _Span:
+        """
+        Context manager of one phase of the current iteration
+
+        :param name: e.g. decode
+        """
+        return _Span(self, name)
+
+    def chrome_trace_events(self, pid: int = None) -> List[dict]:
+        """
+        :param pid: process id of the events, the current process by default
+        :return: Chrome trace events ("X" complete events, timestamps in microseconds)
+        """
+        pid = os.getpid() if pid is None else pid
+        tid = self.tid
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': self.channel}}]
+        for name, start, duration, spans, args in list(self.iterations):
+            events.append({'name': name, 'cat': 'iteration', 'ph': 'X', 'pid': pid, 'tid': tid,
+                           'ts': start / 1000, 'dur': duration / 1000, 'args': args})
+            for span_name, span_start, span_duration in spans:
+                events.append({'name': span_name, 'cat': 'span', 'ph': 'X', 'pid': pid, 'tid': tid,
+                               'ts': span_start / 1000, 'dur': span_duration / 1000})
+        return events
+
+    def dump(self, path: str) -> str:
+        """
+        Writes the Chrome trace JSON of the buffered iterations
+
+        :param path: output file
+        :return: path
+        """
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.chrome_trace_events(), 'displayTimeUnit': 'ms'}, f)
+        return path
+
+    def summary(self) -> dict:
+        """
+        :return: total and maximum duration in seconds of each span name over the buffered iterations
+        """
+        out = {}
+        for _, _, _, spans, _ in list(self.iterations):
+            for name, _, duration in spans:
+                total, maximum = out.get(name, (0.0, 0.0))
+                out[name] = (total + duration / 1e9, max(maximum, duration / 1e9))
+        return {name: {'total': total, 'max': maximum} for name, (total, maximum) in out.items()}
+
+
+class _NullTracer:
+    _context = contextlib.nullcontext()
+
+    def iteration(self, name, **args):
+        return self._context
+
+    def span(self, name):
+        return self._context
+
+
+NULL_TRACER = _NullTracer()
+
+
+def trace_path(pid: int = None, trace_dir: str = TRACE_DIR) -> str:
+    """
+    :return: the file written by the process `pid` when it receives SIGUSR1
+    """
+    return os.path.join(trace_dir, f'subsai-trace-{os.getpid() if pid is None else pid}.json')
+
+
+def install_dump_signal(tracer: IterationTracer, trace_dir: str = TRACE_DIR) -> None:
+    """
+    Makes the current process write the trace of `tracer` to :func:`trace_path` when it receives SIGUSR1.
+    The signal is handled by the main thread, so a process blocked in a C call (e.g. decoding) writes it afterwards.
+
+    :param tracer: tracer of the process
+    :param trace_dir: output directory
+    """
+    def _handler(signum, frame):
+        path = trace_path(trace_dir=trace_dir)
+        # renamed once complete, the dump command waits for the file to exist
+        os.replace(tracer.dump(path + '.tmp'), path)
+
+    signal.signal(signal.SIGUSR1, _handler)
+
+
+def tracer_from_env(channel: str) -> Optional[IterationTracer]:
+    """
+    Returns a tracer of `channel` dumped on SIGUSR1 if `SUBSAI_TRACE` is set, None otherwise
+
+    :param channel: channel name
+    :return: tracer or None
+    """
+    if os.environ.get('SUBSAI_TRACE', '') in ('', '0'):
+        return None
+    tracer = IterationTracer(channel, int(os.environ.get('SUBSAI_TRACE_ITERATIONS', DEFAULT_CAPACITY)))
+    install_dump_signal(tracer)
+    return tracer
+
+
+def dump(pids: List[int], output: str, trace_dir: str = TRACE_DIR, timeout: float = 10.0) -> str:
+    """
+    Asks the processes `pids` to write their trace and merges them into one Chrome trace JSON file
+
+    :param pids: process ids of the traced channel processes
+    :param output: output file
+    :param trace_dir: directory the processes write to
+    :param timeout: seconds to wait for the processes
+    :return: output
+    """
+    paths = {}
+    for pid in pids:
+        path = trace_path(pid, trace_dir)
+        if os.path.exists(path):
+            os.remove(path)
+        os.kill(pid, signal.SIGUSR1)
+        paths[pid] = path
+
+    events = []
+    deadline = time.monotonic() + timeout
+    for pid, path in paths.items():
+        while not os.path.exists(path) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        if not os.path.exists(path):
+            raise TimeoutError(f'Process {pid} did not write its trace to {path}')
+        with open(path) as f:
+            events.extend(json.load(f)['traceEvents'])
+    with open(output, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tracing of the streaming ASR iterations")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    dump_parser = subparsers.add_parser('dump', help="Writes the Chrome trace of running channel processes")
+    dump_parser.add_argument('pids', type=int, nargs='+', help="Process ids of the ASR processes")
+    dump_parser.add_argument('--output', default='trace.json', help="Output Chrome trace JSON file")
+    dump_parser.add_argument('--trace-dir', default=TRACE_DIR, help="Directory the processes write their traces to")
+    dump_parser.add_argument('--timeout', type=float, default=10.0, help="Seconds to wait for each process")
+    args = parser.parse_args()
+
+    if args.command == 'dump':
+        print(f"[+] Trace written to {dump(args.pids, args.output, args.trace_dir, args.timeout)}")
+
+
+if __name__ == '__main__':
+    main()
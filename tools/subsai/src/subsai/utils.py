@@ -5,6 +5,7 @@
 Utility functions
 """
 
+import hashlib
 import os
 import torch
 from pysubs2.formats import FILE_EXTENSION_TO_FORMAT_IDENTIFIER
@@ -33,8 +34,8 @@ def create_subtitle_entry(start, end, text , channel_name):
     Converts timestamps and text into a subtitle entry.
 
     Parameters:
-        start (float): The start time in seconds.
-        end (float): The end time in seconds.
+        start (datetime): The air time of the start of the subtitle.
+        end (datetime): The air time of the end of the subtitle.
         text (str): The transcribed text.
 
     Returns:
@@ -47,23 +48,47 @@ def create_subtitle_entry(start, end, text , channel_name):
     end_time = end.strftime('%H:%M:%S')
     
     return {
+        # ISO 8601 with the UTC offset, the date fields of the subtitles index
+        "start": start.astimezone().isoformat(),
+        "end": end.astimezone().isoformat(),
         "start_time": start_time,
         "end_time": end_time,
         "text": text,
         "channel": channel_name
     }
 
-def generate_subtitle(complete_now_output, channel_name):
+def subtitle_id(channel_name, stream_id, seq):
+    """
+    Deterministic document id of a subtitle: the same segment of a stream always gets the same id.
+
+    The id is only stable within a stream: a channel process restarted without a checkpoint starts a new stream
+    (see `subsai.checkpoint`). Elasticsearch only overwrites a document of the same id in the same index, a segment
+    sent again after a rollover of the write alias is indexed twice.
+
+    Parameters:
+        channel_name (str): The channel of the subtitle.
+        stream_id (str): The id of the stream.
+        seq (int): The sequence number of the segment in the stream.
+
+    Returns:
+        str: A hex digest of the segment.
+    """
+    # a segment emitted again after a restart can have more words, it replaces the first emission
+    return hashlib.sha1(f"{channel_name}|{stream_id}|{seq}".encode()).hexdigest()[:32]
+
+def generate_subtitle(complete_now_output, channel_name, stream_id=None):
     """
     Generates a subtitle entry from the "COMPLETE NOW" output.
 
     Parameters:
-        complete_now_output (tuple): A tuple (start, end, text).
+        complete_now_output (tuple): A tuple (start, end, text) or (start, end, text, seq).
+        stream_id (str): The id of the ASR stream of the segment, part of its segment_id.
 
     Returns:
-        str: A JSON-formatted string of the subtitle entry.
+        str: A JSON-formatted string of the subtitle entry, with a segment_id when the output has a seq.
     """
-    start, end, text = complete_now_output
+    start, end, text, *rest = complete_now_output
+    seq = rest[0] if rest else None
     
     # If no valid data, return None
     if start is None or end is None or text.strip() == "":
@@ -71,6 +96,10 @@ def generate_subtitle(complete_now_output, channel_name):
         return None
     
     subtitle_entry = create_subtitle_entry(start, end, text , channel_name)
+    if seq is not None:
+        subtitle_entry["seq"] = seq
+        # the document id of the subtitle in the indices: a re-sent segment overwrites itself
+        subtitle_entry["segment_id"] = subtitle_id(channel_name, stream_id, seq)
     return json.dumps(subtitle_entry)
 
 def get_available_devices() -> list:
@@ -5,7 +5,9 @@
 Subs AI Web User Interface (webui)
 """
 
+import datetime
 import importlib
+import json
 import mimetypes
 import os.path
 import shutil
@@ -23,6 +25,7 @@ from streamlit_player import st_player
 from st_aggrid import AgGrid, GridUpdateMode, GridOptionsBuilder, DataReturnMode
 
 from subsai import SubsAI, Tools
+from subsai.cache import ModelCache, TranscriptionCache
 from subsai.configs import ADVANCED_TOOLS_CONFIGS
 from subsai.utils import (
     available_subs_formats,
@@ -44,8 +47,23 @@ import debugpy
 import multiprocessing
 from elasticsearch import Elasticsearch, helpers
 import logging
-import logging.handlers
 import interpreter
+from subsai.log import DebugSwitch, worker_logger, start_listener
+from subsai import metrics
+from subsai.tracing import tracer_from_env
+from subsai.elasticsearch_class import SUBTITLES_ALIAS, setup_subtitles_index
+from subsai.local_index import LOCAL_INDEX_PATH, LocalSubtitleDatabase
+from subsai.alerts import alert_stage_from_env
+from subsai.stories import STORIES_ENABLED, StoryClusterer, tag_subtitle
+from subsai.services import DEFAULT_AUTHKEY, start_service, connect_service
+from subsai.fingerprint import REPEAT_CACHE_ENABLED, RepeatSkipper
+from subsai.ingest import Gap, IngestManager
+from subsai.hls import NATIVE_HLS_ENABLED, HLSIngest
+from subsai.archive import ARCHIVE_PATH, AudioArchive
+from subsai.checkpoint import CHECKPOINT_PATH, ProcessorCheckpoint
+from subsai.hotswap import LIVE_MODEL_SIZES, HotSwapper, ModelSwap
+from subsai.scheduler import INTERACTIVE, LIVE, PriorityScheduler, SchedulerBusy, priority, set_scheduler
+from subsai.repass import REPASS_MODEL, run_repass
 
 
 
@@ -61,17 +79,9 @@ tools = Tools()
 es = Elasticsearch([{"host": "elasticsearch", "port": 9200, "scheme": "http"}])
 
 
-class ContextAdapter(logging.LoggerAdapter):
-    def process(self, msg, kwargs):
-        return '[%s] %s' % (self.extra['context'], msg), kwargs
-
-
-def worker_setup(log_queue, context):
-    logger = logging.getLogger(__name__)
-    logger.addHandler(logging.handlers.QueueHandler(log_queue))
-    logger.setLevel(logging.INFO)
-    logger.propagate = False
-    return ContextAdapter(logger, {'context': context})
+# bounded, the channel processes drop their log records rather than blocking when the listener lags behind
+LOG_QUEUE_SIZE = 10000
+METRICS_QUEUE_SIZE = 1000
 
 
 def setup_logger():
@@ -91,14 +101,31 @@ def ensure_index_exists(index_name):
         es.indices.create(index=index_name)
 
 
-def insert_subtitle_to_es(subtitle, index_name):
-    
+@st.cache_resource
+def _setup_subtitles_index():
+    # template, lifecycle policy and first index of the `subtitles` alias, once per server
     try:
-        es.index(index=index_name, document=subtitle)
+        return setup_subtitles_index(es, SUBTITLES_ALIAS)
     except Exception as e:
-        logger.error(e, exc_info=True)
-    finally:
-        logger.info("Subtitle Inserted !")
+        logger.error("Could not set up the subtitles index: %s", e)
+        return False
+
+
+def insert_subtitle_to_es(subtitle, index_name, retries=2):
+    # the segment id of generate_subtitle makes the write an upsert: a retry never indexes the subtitle twice
+    doc = json.loads(subtitle) if isinstance(subtitle, str) else subtitle
+    for attempt in range(retries + 1):
+        try:
+            with metrics.es_write(index_name, 'index'):
+                es.index(index=index_name, id=doc.get('segment_id'), document=doc)
+        except Exception as e:
+            if attempt == retries:
+                logger.error(e, exc_info=True)
+            else:
+                time.sleep(0.5 * 2 ** attempt)
+        else:
+            logger.debug("Subtitle Inserted !")
+            return
 
 
 def _get_key(model_name: str, config_name: str) -> str:
@@ -263,10 +290,44 @@ def _create_translation_model(model_name: str):
     translation_model = tools.create_translation_model(model_name)
     return translation_model
 
-@st.cache_data
+@st.cache_resource
+def _model_cache():
+    """
+    Returns the loaded transcription models of the server, bounded by `SUBSAI_MAX_MODELS`
+
+    :return: :class:`subsai.cache.ModelCache`
+    """
+    return ModelCache(lambda model_name, model_config: subs_ai.create_model(model_name, model_config=model_config))
+
+
+def _create_model(model_name: str, model_config: dict):
+    """
+    Returns a transcription model and caches it, so the weights (and the models it keeps resident, like the
+    whisperX alignment models) are loaded once per configuration. The least recently used configuration is released
+    when another one is needed.
+
+    :param model_name: name of the model
+    :param model_config: configs dict
+
+    :return: model instance
+    """
+    return _model_cache().get(model_name, model_config)
+
+
+@st.cache_resource
+def _transcription_cache():
+    """
+    Returns the transcription results cache, shared with the CLI
+
+    :return: :class:`subsai.cache.TranscriptionCache`
+    """
+    return TranscriptionCache()
+
+
 def _transcribe(file_path, model_name, model_config):
     """
-    Returns and caches the generated subtitles
+    Returns and caches the generated subtitles.
+    Results are cached by media content, so renamed or re-uploaded files are not transcribed again
 
     :param file_path: path of the media file
     :param model_name: name of the model
@@ -274,8 +335,10 @@ def _transcribe(file_path, model_name, model_config):
 
     :return: `SSAFile` subs
     """
-    model = subs_ai.create_model(model_name, model_config=model_config)
-    subs = subs_ai.transcribe(media_file=file_path, model=model)
+    model = _create_model(model_name, model_config)
+    # before the background work, after the live channels
+    with priority(INTERACTIVE):
+        subs = subs_ai.transcribe(media_file=file_path, model=model, cache=_transcription_cache())
     return subs
 
 
@@ -332,91 +395,193 @@ footer = """
 """
 
 
-def handle_ffmpeg_stream(data_queue, channel_name, logger_ffmpeg):
+def handle_ffmpeg_stream(data_queue, channel_name, logger_ffmpeg, metrics_queue=None):
     logger = logging.getLogger(__name__)
     # Define FFmpeg command. Replace [...] with your actual FFmpeg command
     m3u8_stream_path = subs_ai.get_channel_info(channel_name)["url"]
     # logger.info("Channel URL : " + m3u8_stream_path)
+    # ffmpeg runs on the audio-only or lowest bandwidth rendition, and is restarted when the stream exits or stalls
+    if NATIVE_HLS_ENABLED:
+        manager = HLSIngest(m3u8_stream_path, channel=channel_name, logger=logger_ffmpeg)
+    else:
+        manager = IngestManager(m3u8_stream_path, channel=channel_name, logger=logger_ffmpeg)
 
-    cmd = [
-        "ffmpeg",
-        "-loglevel",
-        "quiet",
-        "-i",
-        m3u8_stream_path,  # Input stream URL
-        "-f",
-        "wav",  # Format
-        "-acodec",
-        "pcm_s16le",  # Audio codec
-        "-ar",
-        "16000",  # Sample rate
-        "-ac",
-        "1",  # Audio channels
-        "-",  # Output to stdout
-    ]
+    # the raw audio is kept for replay and re-transcription
+    archive = AudioArchive(ARCHIVE_PATH, channel_name) if ARCHIVE_PATH else None
 
+    pusher = metrics.MetricsPusher(metrics_queue, f"ffmpeg:{channel_name}") if metrics_queue is not None else None
     try:
-        # Start FFmpeg process
-        process = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=10**8
-        )
-
-        while True:
-            # Read a chunk of raw audio data
-            raw_audio = process.stdout.read(16000 * 2)  # 1 second of audio data
-
-            # Check if we got any data
-            if not raw_audio:
-                break  # Exit the loop if no more data
-
-            # Convert raw audio to numpy array and normalize
-            audio_chunk = np.frombuffer(raw_audio, dtype=np.int16).astype(np.float32)
-            audio_chunk /= np.iinfo(np.int16).max
-
-            # Place audio_chunk on the queue for the ASR process
+        for audio_chunk in manager.chunks():
+            # Place audio_chunk, or the Gap marker, on the queue for the ASR process
             data_queue.put(audio_chunk)
+            if isinstance(audio_chunk, Gap):
+                if archive is not None:
+                    archive.gap(audio_chunk.seconds)
+            else:
+                metrics.AUDIO_INGESTED.inc(len(audio_chunk) / 16000, channel=channel_name)
+                if archive is not None:
+                    try:
+                        archive.write(audio_chunk)
+                    except (OSError, RuntimeError) as e:
+                        # soundfile raises RuntimeError, the ingest goes on without the archive
+                        logger_ffmpeg.error("Audio archive disabled: %s", e)
+                        archive = None
+            if pusher is not None:
+                pusher.maybe_push()
     except Exception as e:
-        logger_ffmpeg.error(f"Error in FFmpeg stream: {str(e)}", exc_info=True)
+        logger_ffmpeg.error("Error in FFmpeg stream: %s", e, exc_info=True)
     finally:
-        process.terminate()  # Ensure FFmpeg is terminated cleanly
+        manager.stop()  # Ensure FFmpeg is terminated cleanly
+        if archive is not None:
+            archive.close()
+        if pusher is not None:
+            pusher.push()
 
 
-def handle_asr_engine(data_queue, channel_name , logger_asr):
+def handle_asr_engine(data_queue, channel_name , logger_asr, debug_switch=None, metrics_queue=None,
+                      stories_address=None, scheduler_address=None, service_authkey=DEFAULT_AUTHKEY):
     src_lan = "en"  # source language
     # Initialize ASR engine. Replace [...] with your actual initialization code.
     asr_engine = FasterWhisperASR(lan=src_lan, modelsize="tiny.en")
     tokenizer = create_tokenizer(src_lan)
-    online = OnlineASRProcessor(asr_engine, tokenizer)
+    online = OnlineASRProcessor(asr_engine, tokenizer, logger=logger_asr, channel=channel_name,
+                                tracer=tracer_from_env(channel_name))
+    # restored below, once the subtitles can be published
+    checkpoint = ProcessorCheckpoint(CHECKPOINT_PATH, channel_name, logger=logger_asr) if CHECKPOINT_PATH else None
+    pusher = metrics.MetricsPusher(metrics_queue, f"asr:{channel_name}") if metrics_queue is not None else None
+    # without Elasticsearch, the subtitles go to the embedded index
+    local_index = LocalSubtitleDatabase(LOCAL_INDEX_PATH) if LOCAL_INDEX_PATH else None
+    # watch-list alerts, as soon as the subtitles are committed
+    alert_stage = alert_stage_from_env(logger_asr)
+    # story IDs of the near-duplicate segments of all the channels, shared by the channel processes
+    stories = connect_service('stories', stories_address, service_authkey) if stories_address is not None else None
+    # the live iterations run before the background re-transcription
+    if scheduler_address is not None:
+        set_scheduler(connect_service('scheduler', scheduler_address, service_authkey))
+    # the repeated commercials and jingles get the transcript of their previous airing instead of Whisper
+    skipper = RepeatSkipper(online, channel=channel_name) if REPEAT_CACHE_ENABLED else None
+    # the model requested from the webui is loaded in the background and takes over at a commit boundary
+    swapper = HotSwapper(online, lambda modelsize, lan: FasterWhisperASR(lan=lan, modelsize=modelsize),
+                         create_tokenizer, channel=channel_name, logger=logger_asr)
+
+    def publish(transcription_full_output):
+        subtitle_completed = generate_subtitle(
+            transcription_full_output, channel_name, stream_id=online.stream_id
+        )
+        if subtitle_completed is not None and stories is not None:
+            subtitle_completed = tag_subtitle(stories, subtitle_completed)
+        logger_asr.info("Subtitle: %s", subtitle_completed)
+        if subtitle_completed is not None and alert_stage is not None:
+            alerts = alert_stage.process(subtitle_completed)
+            if alerts:
+                metrics.ALERTS.inc(len(alerts), channel=channel_name)
+        if subtitle_completed is None:
+            pass
+        elif local_index is not None:
+            local_index.insert_subtitle(SUBTITLES_ALIAS, subtitle_completed)
+        else:
+            insert_subtitle_to_es(subtitle_completed, SUBTITLES_ALIAS)
+        st.session_state["asr_process"] = subtitle_completed
+        saveSubsToFile(transcription_full_output)
+        # add interpreter code
+
+    def end_at_gap(seconds):
+        # the buffered audio is not continued: its text is published now, and the stream goes on `seconds` later
+        try:
+            seq, words = online.pop_unemitted()
+            context = online.asr.sep.join(t for _, _, t in words)
+            buffer_seconds = len(online.audio_buffer) / online.SAMPLING_RATE
+            incomplete_words = len(online.transcript_buffer.complete())
+            if skipper is None:
+                _, _, incomplete = online.insert_gap(seconds)
+            else:
+                _, _, incomplete = skipper.insert_gap(seconds)
+            if not words:
+                # numbered after the cached words the skipper emitted at the gap
+                seq = online.seq - incomplete_words
+            text = online.asr.sep.join(t for t in (context, incomplete) if t)
+            if text:
+                # wall clock times, like the outputs of transcriptioChuncker
+                end_time = datetime.datetime.now() - datetime.timedelta(seconds=seconds)
+                publish((end_time - datetime.timedelta(seconds=buffer_seconds), end_time, text, seq))
+        except Exception as e:
+            logger_asr.error("Error at a stream gap: %s", e, exc_info=True)
+
+    # a restarted process continues from the buffers of the last checkpoint instead of an empty buffer; the audio
+    # since the checkpoint is missing, a longer interruption than the splice tolerance ends the restored buffer
+    resume_gap = (checkpoint is not None and checkpoint.restore(online)
+                  and checkpoint.restored_age > checkpoint.max_splice)
 
     try:
         while True:
             # Get a chunk of audio data from the queue
             audio_chunk = data_queue.get()
+            if debug_switch is not None:
+                debug_switch.apply(logger_asr)
+            if pusher is not None:
+                try:
+                    metrics.QUEUE_DEPTH.set(data_queue.qsize(), channel=channel_name)
+                except NotImplementedError:
+                    # qsize() is not available on macOS
+                    pass
+                pusher.maybe_push()
 
             # Break if a special "stop" signal is received (you might send a None, for example)
             if audio_chunk is None:
                 break
 
+            if resume_gap:
+                # the first iteration transcribes the restored buffer once more: its words waiting for confirmation
+                # are committed, then it ends where the audio is missing
+                resume_gap = False
+                try:
+                    with priority(LIVE):
+                        transcription_full_output = online.transcriptioChuncker()
+                    if transcription_full_output:
+                        publish(transcription_full_output)
+                except Exception as e:
+                    logger_asr.error("Error during processing: %s", e, exc_info=True)
+                end_at_gap(checkpoint.age())
+
+            if isinstance(audio_chunk, ModelSwap):
+                # sent by the "Swap model" button of the webui
+                swapper.request(audio_chunk)
+                continue
+
+            if isinstance(audio_chunk, Gap):
+                # ffmpeg was restarted: the buffered audio is not continued, its text is published now
+                logger_asr.warning("Stream gap of %.1f s after %.1f s of stream", audio_chunk.seconds,
+                                   audio_chunk.stream_time)
+                end_at_gap(audio_chunk.seconds)
+                continue
+
             # Insert audio chunk to Whisper
-            online.insert_audio_chunk(audio_chunk)
+            if skipper is None:
+                online.insert_audio_chunk(audio_chunk)
+                new_audio = True
+            else:
+                new_audio = skipper.insert_audio_chunk(audio_chunk)
             # Process and retrieve transcription
             try:
-                transcription_full_output = online.transcriptioChuncker()
-                if transcription_full_output:
-                    subtitle_completed = generate_subtitle(
-                        transcription_full_output, channel_name
-                    )
-                    logger_asr.info("Subtitle: " + subtitle_completed)
-                    insert_subtitle_to_es(subtitle_completed, "subtitles")
-                    st.session_state["asr_process"] = subtitle_completed  
-                    saveSubsToFile(transcription_full_output)
-                    # add interpreter code
+                if skipper is not None:
+                    for cached_output in skipper.pop_cached():
+                        publish(cached_output)
+                        logger_asr.info("Repeated audio skipped, %.1f%% of the audio not transcribed",
+                                        100 * skipper.saved_fraction)
+                if new_audio:
+                    with priority(LIVE):
+                        transcription_full_output = online.transcriptioChuncker()
+                    if transcription_full_output:
+                        publish(transcription_full_output)
+                    swapper.maybe_swap()
+                    if checkpoint is not None:
+                        checkpoint.maybe_save(online)
                 # transcription_full_output = online.process_iter()
             except Exception as e:
-                logger_asr.error(f"Error during processing: {str(e)}", exc_info=True)
+                logger_asr.error("Error during processing: %s", e, exc_info=True)
             # Update UI with transcription. Note: you'll need to determine a safe way to do this in your Streamlit app.
     except Exception as e:
-        logger_asr.error(f"Error in ASR engine: {str(e)}", exc_info=True)
+        logger_asr.error("Error in ASR engine: %s", e, exc_info=True)
 
 
 
@@ -433,60 +598,107 @@ def saveSubsToFile(data):
     # Define o nome do arquivo com base no número do arquivo
     file_path = f"/home/nexanews/mysubs_{file_number}.txt"
     
-    print(f"Saving to file: {file_path}")
+    logger.debug("Saving to file: %s", file_path)
     
     # Abre o arquivo em modo de anexação (append) e escreve os dados
     with open(file_path, 'a') as file:
         file.write(str(data[subtitleTupleIndex]))
 
 
-def listener_process(log_queue):
+@st.cache_resource
+def _metrics_endpoint():
+    # one endpoint for all the channels, the channel processes push their metrics to this process
+    metrics_queue = multiprocessing.Queue(METRICS_QUEUE_SIZE)
+    collector = metrics.MetricsCollector(metrics_queue)
     try:
-        logger = setup_logger()
-        logger.info("[Listener Process] Started.")
-        while True:
-            print("[Listener Process] Waiting for log record...")
-            record = log_queue.get()
-            print("[Listener Process] Log record received.")
-            if record is None:
-                logger.info("[Listener Process] Termination signal received.")
-                break
-            logger.handle(record)
-        logger.info("[Listener Process] Terminating.")
-    except Exception as e:
-        print(f"[Listener Process] Error: {str(e)}")
-    finally:
-        print("[Listener Process] Ended.")
+        server = metrics.start_http_server(metrics.DEFAULT_PORT)
+        logger.info("Serving the metrics on port %d", server.server_port)
+    except OSError as e:
+        server = None
+        logger.error("Metrics endpoint not started: %s", e)
+    return metrics_queue, collector, server
 
-def start_processes(channel_name):
-    data_queue = multiprocessing.Queue()
-    log_queue = multiprocessing.Queue()
 
-    print("[Main] Starting listener...")
-    listener = multiprocessing.Process(target=listener_process, args=(log_queue,))
-    listener.start()
+@st.cache_resource
+def _story_service():
+    # one clusterer for all the channels, it compares their subtitles
+    if not STORIES_ENABLED:
+        return None
+    try:
+        manager = start_service('stories', StoryClusterer)
+    except OSError as e:
+        logger.error("Story service not started: %s", e)
+        return None
+    logger.info("Story service listening on %s:%d", *manager.address)
+    return manager
 
-    print("[Main] Starting ffmpeg_process...")
-    ffmpeg_process = multiprocessing.Process(target=handle_ffmpeg_stream, args=(data_queue, channel_name, worker_setup(log_queue, 'ffmpeg_process')))
+
+@st.cache_resource
+def _scheduler_service():
+    # one compute scheduler for the live channels, the webui requests and the re-pass process
+    try:
+        manager = start_service('scheduler', PriorityScheduler)
+    except OSError as e:
+        logger.error("Scheduler service not started: %s", e)
+        return None
+    set_scheduler(connect_service('scheduler', manager.address))
+    logger.info("Scheduler service listening on %s:%d", *manager.address)
+    return manager
+
+
+@st.cache_resource
+def _repass_service():
+    # the re-pass process transcribes the archive again, when the live channels leave the compute idle
+    if not (REPASS_MODEL and ARCHIVE_PATH):
+        return None
+    scheduler_service = _scheduler_service()
+    repass_process = multiprocessing.Process(
+        target=run_repass, args=(scheduler_service.address if scheduler_service is not None else None, DEFAULT_AUTHKEY),
+        daemon=True)
+    repass_process.start()
+    logger.info("Re-pass process started with pid %d", repass_process.pid)
+    return repass_process
+
+
+def start_processes(channel_name, debug=False):
+    data_queue = multiprocessing.Queue()
+    log_queue = multiprocessing.Queue(LOG_QUEUE_SIZE)
+    debug_switch = DebugSwitch(debug)
+    metrics_queue, _, _ = _metrics_endpoint()
+    story_service = _story_service()
+    scheduler_service = _scheduler_service()
+    _repass_service()
+    if not LOCAL_INDEX_PATH:
+        _setup_subtitles_index()
+
+    # the records of the channel processes are written by a thread of this process
+    listener = start_listener(log_queue, *logger.handlers)
+
+    logger.info("Starting ffmpeg_process for %s", channel_name)
+    ffmpeg_process = multiprocessing.Process(target=handle_ffmpeg_stream, args=(data_queue, channel_name, worker_logger(log_queue, 'ffmpeg', channel_name), metrics_queue))
     ffmpeg_process.start()
 
-    print("[Main] Starting asr_process...")
+    logger.info("Starting asr_process for %s", channel_name)
     asr_process = multiprocessing.Process(
-        target=handle_asr_engine, args=(data_queue, channel_name, worker_setup(log_queue, 'asr_process'))
+        target=handle_asr_engine, args=(data_queue, channel_name, worker_logger(log_queue, 'asr', channel_name), debug_switch, metrics_queue,
+                                         story_service.address if story_service is not None else None,
+                                         scheduler_service.address if scheduler_service is not None else None,
+                                         DEFAULT_AUTHKEY)
     )
     asr_process.start()
+    logger.info("asr_process of %s started with pid %d", channel_name, asr_process.pid)
 
-    return ffmpeg_process, asr_process, data_queue, listener, log_queue
+    return ffmpeg_process, asr_process, data_queue, listener, debug_switch
 
 
 
-def stop_processes(ffmpeg_process, asr_process, data_queue, log_queue):
+def stop_processes(ffmpeg_process, asr_process, data_queue, listener):
     data_queue.put(None)
-    log_queue.put(None)
     ffmpeg_process.terminate()
     asr_process.terminate()
     ffmpeg_process.join()
     asr_process.join()
+    listener.stop()
 
 #     return stt_model_name
 def webui() -> None:
@@ -509,6 +721,8 @@ def webui() -> None:
     )
 
     st.sidebar.title("Settings")
+    # the requests of the page share the compute with the live channels
+    _scheduler_service()
 
     if "transcribed_subs" in st.session_state:
         subs = st.session_state["transcribed_subs"]
@@ -519,6 +733,7 @@ def webui() -> None:
 
     with st.sidebar:
         channel_name = ""
+        debug_logging = False
         file_path = ""
         transcribe_button = False
         with st.expander("Media Source", expanded=True):
@@ -557,6 +772,45 @@ def webui() -> None:
                     index=1,
                     help="Select a channel to use ",
                 )
+                debug_logging = st.checkbox(
+                    "Debug logging",
+                    value=False,
+                    help="Log every iteration of the ASR engine, can be switched while the job is running",
+                )
+                if st.session_state.get("debug_switch") is not None:
+                    st.session_state.debug_switch.set(debug_logging)
+                with st.expander("Live model", expanded=False):
+                    live_model_size = st.selectbox("Model size", LIVE_MODEL_SIZES, index=0)
+                    live_language = st.text_input("Language", value="en", help="Whisper language code")
+                    if st.button("Swap model", help="Replaces the model of the running job without stopping it"):
+                        if st.session_state.get("asr_process") is None:
+                            st.error("No running job")
+                        elif live_model_size.endswith(".en") and live_language != "en":
+                            st.error(f"{live_model_size} only transcribes English")
+                        else:
+                            st.session_state.data_queue.put(ModelSwap(live_model_size, live_language))
+                            st.info(f"Loading {live_model_size}, the job keeps its model until it's loaded")
+                if ARCHIVE_PATH:
+                    with st.expander("Audio archive", expanded=False):
+                        archive = AudioArchive(ARCHIVE_PATH, channel_name)
+                        archived = archive.time_range()
+                        if archived is None:
+                            st.info("Nothing archived for this channel yet")
+                        else:
+                            default = datetime.datetime.fromtimestamp(archived[1]) - datetime.timedelta(minutes=1)
+                            replay_start = st.text_input(
+                                "Air time", value=default.isoformat(timespec="seconds"),
+                                help="ISO 8601 air time, local time without offset",
+                            )
+                            replay_seconds = st.number_input("Seconds", min_value=1, max_value=600, value=30)
+                            if st.button("Play"):
+                                try:
+                                    start = datetime.datetime.fromisoformat(replay_start)
+                                except ValueError:
+                                    st.error(f"Invalid air time: {replay_start}")
+                                else:
+                                    end = start + datetime.timedelta(seconds=replay_seconds)
+                                    st.audio(archive.read_wav(start, end), format="audio/wav")
 
         if file_mode == "Upload" or file_mode == "Local path":
             stt_model_name = st.selectbox(
@@ -582,9 +836,13 @@ def webui() -> None:
         model_config = _get_config_from_session_state(
             stt_model_name, config_schema, notification_placeholder
         )
-        subs = _transcribe(file_path, stt_model_name, model_config)
-        st.session_state["transcribed_subs"] = subs
-        transcribe_loading_placeholder.success("Done!", icon="✅")
+        try:
+            subs = _transcribe(file_path, stt_model_name, model_config)
+        except SchedulerBusy as e:
+            transcribe_loading_placeholder.error(f"{e}, please try again later")
+        else:
+            st.session_state["transcribed_subs"] = subs
+            transcribe_loading_placeholder.success("Done!", icon="✅")
 
     # Persistent state to keep track of processes
     if "ffmpeg_process" not in st.session_state:
@@ -602,8 +860,8 @@ def webui() -> None:
             st.session_state.asr_process,
             st.session_state.data_queue,
             st.session_state.listener,
-            st.session_state.log_queue,
-        ) = start_processes(channel_name)
+            st.session_state.debug_switch,
+        ) = start_processes(channel_name, debug=debug_logging)
         st.write("Processes started!")
     # Stop processes
     elif (
@@ -615,9 +873,10 @@ def webui() -> None:
             st.session_state.ffmpeg_process,
             st.session_state.asr_process,
             st.session_state.data_queue,
-            st.session_state.log_queue,
+            st.session_state.listener,
         )
         st.session_state.ffmpeg_process, st.session_state.asr_process = None, None
+        st.session_state.debug_switch = None
         st.write("Processes stopped!")
 
     with st.expander("Post Processing Tools", expanded=False):
@@ -715,19 +974,23 @@ def webui() -> None:
                         if "transcribed_subs" not in st.session_state:
                             st.error("No subtitles to translate")
                         else:
-                            with st.spinner("Processing (This may take a while) ..."):
-                                translated_subs = tools.translate(
-                                    subs=subs,
-                                    source_language=source_language,
-                                    target_language=target_language,
-                                    model=translation_model,
-                                    translation_configs=translation_config,
-                                )
-                                st.session_state["original_subs"] = st.session_state[
-                                    "transcribed_subs"
-                                ]
-                                st.session_state["transcribed_subs"] = translated_subs
-                            notification_placeholder.success("Success!", icon="✅")
+                            try:
+                                with st.spinner("Processing (This may take a while) ..."), priority(INTERACTIVE):
+                                    translated_subs = tools.translate(
+                                        subs=subs,
+                                        source_language=source_language,
+                                        target_language=target_language,
+                                        model=translation_model,
+                                        translation_configs=translation_config,
+                                    )
+                                    st.session_state["original_subs"] = st.session_state[
+                                        "transcribed_subs"
+                                    ]
+                                    st.session_state["transcribed_subs"] = translated_subs
+                            except SchedulerBusy as e:
+                                notification_placeholder.error(f"{e}, please try again later")
+                            else:
+                                notification_placeholder.success("Success!", icon="✅")
                 with b2:
                     reload_transcribed_subs = st.button("Reload Original subtitles")
                     if reload_transcribed_subs:
@@ -749,13 +1012,17 @@ def webui() -> None:
             )
             submitted = st.button("ffsubsync")
             if submitted:
-                with st.spinner("Processing (This may take a while) ..."):
-                    synced_subs = tools.auto_sync(subs, file_path, **ffsubsync_config)
-                    st.session_state["original_subs"] = st.session_state[
-                        "transcribed_subs"
-                    ]
-                    st.session_state["transcribed_subs"] = synced_subs
-                notification_placeholder.success("Success!", icon="✅")
+                try:
+                    with st.spinner("Processing (This may take a while) ..."), priority(INTERACTIVE):
+                        synced_subs = tools.auto_sync(subs, file_path, **ffsubsync_config)
+                        st.session_state["original_subs"] = st.session_state[
+                            "transcribed_subs"
+                        ]
+                        st.session_state["transcribed_subs"] = synced_subs
+                except SchedulerBusy as e:
+                    notification_placeholder.error(f"{e}, please try again later")
+                else:
+                    notification_placeholder.success("Success!", icon="✅")
 
     subs_column, video_column = st.columns([4, 3])
 
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the watch-list alerts
+
+"""
+import json
+from unittest import TestCase
+
+from subsai.alerts import AlertStage, CallbackNotifier, KeywordMatcher, create_notifiers, LogNotifier
+
+
+class TestKeywordMatcher(TestCase):
+
+    def setUp(self):
+        self.matcher = KeywordMatcher(['Volodymyr Zelensky', ('European Central Bank', 'ECB'), 'central bank',
+                                       'Olaf Scholz'])
+
+    def _labels(self, text):
+        return [(m.label, m.text) for m in self.matcher.match(text)]
+
+    def test_overlapping_terms(self):
+        self.assertEqual(self._labels('The European Central Bank raised rates'),
+                         [('ECB', 'European Central Bank'), ('central bank', 'Central Bank')])
+
+    def test_word_boundaries(self):
+        self.assertEqual(self._labels('The centralbank of Olafs'), [])
+
+    def test_plural_possessive_accents(self):
+        self.assertEqual(self._labels("central banks and Olaf Schölz's speech"),
+                         [('central bank', 'central banks'), ('Olaf Scholz', "Olaf Schölz's")])
+
+    def test_fuzzy(self):
+        # one insertion, one substitution
+        self.assertEqual(self._labels('Volodymyr Zelenskyy and Volodymyr Zelenska'),
+                         [('Volodymyr Zelensky', 'Volodymyr Zelenskyy'), ('Volodymyr Zelensky', 'Volodymyr Zelenska')])
+        exact = KeywordMatcher(['Volodymyr Zelensky'], fuzzy=False)
+        self.assertEqual(exact.match('Volodymyr Zelenskyy'), [])
+
+    def test_restart_after_partial_match(self):
+        self.assertEqual(self._labels('European European Central Bank'),
+                         [('ECB', 'European Central Bank'), ('central bank', 'Central Bank')])
+
+
+class TestAlertStage(TestCase):
+
+    def test_notify_with_cooldown(self):
+        received = []
+        stage = AlertStage(KeywordMatcher(['central bank']), [CallbackNotifier(received.append)], cooldown=60)
+        subtitle = json.dumps({'text': 'The central bank said', 'channel': 'cnn', 'start': '2026-10-19T20:00:00'})
+        self.assertEqual(len(stage.process(subtitle)), 1)
+        self.assertEqual(stage.process(subtitle), [])
+        self.assertEqual(len(stage.process(subtitle, channel='bbc')), 1)
+        self.assertEqual([(a.channel, a.label, a.air_start) for a in received],
+                         [('cnn', 'central bank', '2026-10-19T20:00:00'), ('bbc', 'central bank', '2026-10-19T20:00:00')])
+
+    def test_create_notifiers(self):
+        self.assertIsInstance(create_notifiers('log')[0], LogNotifier)
+        with self.assertRaises(ValueError):
+            create_notifiers('pager')
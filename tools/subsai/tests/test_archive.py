@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the raw audio archive
+
+"""
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import soundfile
+
+from subsai.archive import INDEX_FILE, SAMPLING_RATE, AudioArchive
+
+T0 = 1_800_000_000.0
+
+
+def _ramp(seconds, start=0):
+    # the value of each sample tells its position in the stream
+    return ((np.arange(int(seconds * SAMPLING_RATE)) + start) % 30000 / 30000 - 0.5).astype(np.float32)
+
+
+class TestAudioArchive(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _archive(self, **kwargs):
+        kwargs.setdefault('chunk_seconds', 2)
+        kwargs.setdefault('retention', 0)
+        return AudioArchive(self.root, 'cnn', **kwargs)
+
+    def test_write_and_read(self):
+        archive = self._archive()
+        audio = _ramp(5)
+        for start in range(0, len(audio), SAMPLING_RATE):
+            archive.write(audio[start:start + SAMPLING_RATE], air_time=T0)
+        # the chunk being written is not readable yet
+        self.assertEqual(len(archive), 2)
+        archive.close()
+        self.assertEqual(len(archive), 3)
+        self.assertEqual(archive.time_range(), (T0, T0 + 5))
+        # across the chunks
+        np.testing.assert_allclose(archive.read(T0 + 1.5, T0 + 4.25), audio[24000:68000], atol=1e-4)
+        path, offset = archive.seek(T0 + 3.5)
+        self.assertEqual((os.path.basename(path), offset), (f'{int((T0 + 2) * 1000)}.flac', 24000))
+        self.assertIsNone(archive.seek(T0 - 1))
+        self.assertIsNone(archive.seek(T0 + 5))
+
+    def test_gap_is_silence(self):
+        archive = self._archive()
+        archive.write(_ramp(1), air_time='2027-01-15T08:00:00+00:00')
+        archive.gap(3)
+        archive.write(_ramp(1, start=SAMPLING_RATE))
+        archive.close()
+        start, end = archive.time_range()
+        self.assertEqual(end - start, 5)
+        audio = archive.read(start, end)
+        self.assertEqual(len(audio), 5 * SAMPLING_RATE)
+        self.assertFalse(audio[SAMPLING_RATE:4 * SAMPLING_RATE].any())
+        np.testing.assert_allclose(audio[4 * SAMPLING_RATE:], _ramp(1, start=SAMPLING_RATE), atol=1e-4)
+        self.assertIsNone(archive.seek(start + 2))
+
+    def test_reader_follows_the_writer(self):
+        writer = self._archive()
+        reader = self._archive()
+        writer.write(_ramp(2), air_time=T0)
+        self.assertEqual(reader.time_range(), (T0, T0 + 2))
+        writer.write(_ramp(2), air_time=T0)
+        self.assertEqual(reader.time_range(), (T0, T0 + 4))
+        # the index is only 13 bytes per chunk
+        self.assertEqual(os.path.getsize(os.path.join(writer.directory, INDEX_FILE)), 26)
+
+    def test_retention(self):
+        archive = self._archive(retention=10)
+        reader = self._archive()
+        archive.write(_ramp(20), air_time=T0)
+        self.assertEqual(archive.prune(now=T0 + 20), 5)
+        self.assertEqual(archive.time_range(), (T0 + 10, T0 + 20))
+        self.assertEqual(len(os.listdir(archive.directory)), 6)
+        # the readers reload the rewritten index
+        self.assertEqual(reader.time_range(), (T0 + 10, T0 + 20))
+        self.assertFalse(reader.read(T0, T0 + 10).any())
+
+    def test_opus(self):
+        archive = self._archive(format='opus')
+        t = np.arange(4 * SAMPLING_RATE) / SAMPLING_RATE
+        tone = (0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+        archive.write(tone, air_time=T0)
+        audio = archive.read(T0 + 1, T0 + 3)
+        self.assertEqual(len(audio), 2 * SAMPLING_RATE)
+        self.assertAlmostEqual(np.argmax(np.abs(np.fft.rfft(audio))) / 2, 440, delta=2)
+        self.assertAlmostEqual(float(np.sqrt(np.mean(audio ** 2))), 0.3 / np.sqrt(2), delta=0.03)
+
+    def test_extract(self):
+        archive = self._archive()
+        archive.write(_ramp(3), air_time=T0)
+        archive.close()
+        path = archive.extract(T0 + 1, T0 + 2)
+        try:
+            audio, rate = soundfile.read(path, dtype='float32')
+        finally:
+            os.remove(path)
+        self.assertEqual(rate, SAMPLING_RATE)
+        np.testing.assert_allclose(audio, _ramp(1, start=SAMPLING_RATE), atol=1e-4)
+        self.assertTrue(archive.read_wav(T0, T0 + 1).startswith(b'RIFF'))
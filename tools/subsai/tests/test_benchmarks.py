@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the helpers shared by the benchmarks
+
+"""
+import json
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+
+from subsai.benchmarks import streaming_latency
+from subsai.benchmarks.common import dump_results, normalize_words, percentiles, word_error_rate
+
+
+class TestPercentiles(TestCase):
+
+    def test_fixed_list(self):
+        stats = percentiles(list(range(1, 101)), qs=(50, 90, 99))
+        self.assertEqual(stats['count'], 100)
+        self.assertEqual(stats['mean'], 50.5)
+        self.assertEqual(stats['max'], 100)
+        # linear interpolation between the closest ranks
+        self.assertAlmostEqual(stats['p50'], 50.5)
+        self.assertAlmostEqual(stats['p90'], 90.1)
+        self.assertAlmostEqual(stats['p99'], 99.01)
+
+    def test_empty(self):
+        self.assertEqual(percentiles([], qs=(50,)), {'count': 0, 'mean': None, 'max': None, 'p50': None})
+
+
+class TestWordErrorRate(TestCase):
+
+    def test_identical(self):
+        self.assertEqual(word_error_rate("Breaking news tonight.", "breaking NEWS, tonight"), 0.0)
+
+    def test_fully_substituted(self):
+        self.assertEqual(word_error_rate("breaking news tonight", "weather report today"), 1.0)
+
+    def test_edits(self):
+        # one deletion, one substitution
+        self.assertEqual(word_error_rate("the news is breaking tonight", "the news breaking today"), 0.4)
+        # insertions can take it above 1
+        self.assertEqual(word_error_rate("news", "the late news tonight"), 3.0)
+
+    def test_empty_reference(self):
+        self.assertEqual(word_error_rate("", ""), 0.0)
+        self.assertEqual(word_error_rate("", "news"), 1.0)
+
+    def test_normalize_words(self):
+        self.assertEqual(normalize_words("It's 9 o'clock: Breaking-news!"), ["it's", '9', "o'clock", 'breaking', 'news'])
+
+
+class TestDumpResults(TestCase):
+
+    def test_json_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            dump_results({'wer': 0.25}, path)
+            with open(path) as f:
+                self.assertEqual(json.load(f), {'wer': 0.25})
+
+
+class _Processor:
+    # records the inserted audio, commits nothing
+    SAMPLING_RATE = 16000
+
+    def __init__(self):
+        self.audio_buffer = np.zeros(0, dtype=np.float32)
+        self.commited = []
+
+    def insert_audio_chunk(self, audio):
+        self.audio_buffer = np.append(self.audio_buffer, audio)
+
+    def process_iter(self):
+        return None, None, ""
+
+    def finish(self):
+        return None, None, ""
+
+
+class TestReplay(TestCase):
+
+    def setUp(self):
+        self.chunks = []
+
+        def load_audio_chunk(path, beg, end):
+            self.chunks.append((beg, end))
+            return np.zeros(int(round((end - beg) * _Processor.SAMPLING_RATE)), dtype=np.float32)
+
+        for name, value in [('audio_duration', lambda path: 2.5), ('load_audio_chunk', load_audio_chunk)]:
+            patcher = mock.patch.object(streaming_latency, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_comp_unaware_inserts_all_the_audio(self):
+        online = _Processor()
+        recorder = streaming_latency.replay(online, 'test.wav', 'comp_unaware', min_chunk=1.0)
+        # the last chunk is shorter than min_chunk, it ends at the end of the file
+        self.assertEqual(self.chunks, [(0.0, 1.0), (1.0, 2.0), (2.0, 2.5)])
+        self.assertEqual(len(online.audio_buffer), 2.5 * _Processor.SAMPLING_RATE)
+        self.assertEqual(recorder.iteration_ends, [1.0, 2.0, 2.5])
+
+    def test_comp_unaware_short_file(self):
+        online = _Processor()
+        streaming_latency.replay(online, 'test.wav', 'comp_unaware', min_chunk=5.0)
+        self.assertEqual(self.chunks, [(0.0, 2.5)])
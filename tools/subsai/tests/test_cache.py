@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the transcription results cache
+
+"""
+import os
+import pathlib
+import tempfile
+from unittest import TestCase
+
+from pysubs2 import SSAFile, SSAEvent
+
+from subsai.cache import ModelCache, TranscriptionCache
+
+
+def _subs(text):
+    subs = SSAFile()
+    event = SSAEvent(start=0, end=1000)
+    event.plaintext = text
+    subs.append(event)
+    return subs
+
+
+class TestTranscriptionCache(TestCase):
+    model_name = 'openai/whisper'
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = TranscriptionCache(pathlib.Path(self.tmp_dir.name) / 'cache')
+        self.media_file = pathlib.Path(self.tmp_dir.name) / 'media.mp3'
+        self.media_file.write_bytes(b'some media content')
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        key = self.cache.key(self.media_file, self.model_name, {})
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, _subs('hello world'))
+        subs = self.cache.get(key)
+        self.assertIsInstance(subs, SSAFile)
+        self.assertEqual(subs[0].text, 'hello world')
+
+    def test_key_follows_content(self):
+        key = self.cache.key(self.media_file, self.model_name, {})
+        renamed = self.media_file.with_name('renamed.mp3')
+        renamed.write_bytes(self.media_file.read_bytes())
+        self.assertEqual(key, self.cache.key(renamed, self.model_name, {}))
+        renamed.write_bytes(b'other media content')
+        self.assertNotEqual(key, self.cache.key(renamed, self.model_name, {}))
+
+    def test_key_normalizes_config(self):
+        default = self.cache.key(self.media_file, self.model_name, {})
+        explicit = self.cache.key(self.media_file, self.model_name, {'model_type': 'base'})
+        other = self.cache.key(self.media_file, self.model_name, {'model_type': 'tiny'})
+        self.assertEqual(default, explicit)
+        self.assertNotEqual(default, other)
+
+    def test_eviction(self):
+        self.cache.put('a' * 64, _subs('first'))
+        entry_size = os.path.getsize(self.cache.cache_dir / ('a' * 64 + self.cache.suffix))
+        self.cache.max_size = entry_size * 2 + 16
+        os.utime(self.cache.cache_dir / ('a' * 64 + self.cache.suffix), (0, 0))
+        self.cache.put('b' * 64, _subs('second'))
+        self.cache.put('c' * 64, _subs('third'))
+        self.assertIsNone(self.cache.get('a' * 64))
+        self.assertIsNotNone(self.cache.get('c' * 64))
+
+
+class _Model:
+
+    def __init__(self, model_name, model_config):
+        self.model_config = model_config
+        self.released = False
+
+    def release_models(self):
+        self.released = True
+
+
+class TestModelCache(TestCase):
+
+    def test_one_model_per_config(self):
+        models = ModelCache(_Model, max_entries=2)
+        model = models.get('openai/whisper', {'model_type': 'base'})
+        self.assertIs(models.get('openai/whisper', {'model_type': 'base'}), model)
+        self.assertIsNot(models.get('openai/whisper', {'model_type': 'tiny'}), model)
+        self.assertEqual(len(models), 2)
+
+    def test_least_recently_used_released(self):
+        models = ModelCache(_Model, max_entries=2)
+        base = models.get('openai/whisper', {'model_type': 'base'})
+        tiny = models.get('openai/whisper', {'model_type': 'tiny'})
+        models.get('openai/whisper', {'model_type': 'base'})
+        models.get('openai/whisper', {'model_type': 'small'})
+        self.assertTrue(tiny.released)
+        self.assertFalse(base.released)
+        self.assertEqual(len(models), 2)
+        models.clear()
+        self.assertTrue(base.released)
+        self.assertEqual(len(models), 0)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the checkpoints of the online ASR processing, with a scripted backend instead of a Whisper model
+
+"""
+import math
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from subsai.checkpoint import ProcessorCheckpoint
+from subsai.models.whisper_online import OnlineASRProcessor, RegexSentenceSplitter
+
+SAMPLING_RATE = OnlineASRProcessor.SAMPLING_RATE
+
+
+class _ScriptedASR:
+    # one word per second of stream; the last second is not stable yet
+    sep = " "
+
+    def __init__(self, online, lan='en'):
+        self.online = online
+        self.original_language = lan
+
+    def transcribe(self, audio, init_prompt=""):
+        offset = self.online.buffer_time_offset
+        end = offset + len(audio) / SAMPLING_RATE - 1
+        return [(t - offset, t - offset + 0.5, f'w{t}') for t in range(math.ceil(offset), int(end))]
+
+    def ts_words(self, words):
+        return words
+
+    def segments_end_ts(self, words):
+        return []
+
+
+def _processor(lan='en'):
+    online = OnlineASRProcessor(None, RegexSentenceSplitter())
+    online.asr = _ScriptedASR(online, lan)
+    return online
+
+
+def _iterate(online, seconds=1):
+    n = len(online.commited)
+    audio = np.full(seconds * SAMPLING_RATE, 0.25, dtype=np.float32)
+    online.insert_audio_chunk(audio)
+    online.transcriptioChuncker()
+    return online.commited[n:]
+
+
+class TestProcessorCheckpoint(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.online = _processor()
+        for _ in range(8):
+            _iterate(self.online)
+        self.checkpoint = ProcessorCheckpoint(self.directory, 'cnn')
+        self.checkpoint.save(self.online, now=1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_resumes_committing_in_one_iteration(self):
+        restored = _processor()
+        self.assertTrue(ProcessorCheckpoint(self.directory, 'cnn').restore(restored, now=1005))
+        self.assertEqual(restored.commited, self.online.commited)
+        self.assertEqual(restored.buffer_time_offset, self.online.buffer_time_offset)
+        self.assertEqual(restored.transcript_buffer.complete(), self.online.transcript_buffer.complete())
+        # the same PCM scale both ways
+        np.testing.assert_array_equal(restored.audio_buffer, self.online.audio_buffer)
+        self.assertEqual(restored.prompt(), self.online.prompt())
+        # the segments emitted again keep their numbers in the stream
+        self.assertEqual((restored.stream_id, restored.seq), (self.online.stream_id, self.online.seq))
+        self.assertEqual(restored.pop_unemitted(), self.online.pop_unemitted())
+        # the words waiting for confirmation are committed by the first iteration
+        self.assertEqual(_iterate(restored), [(6, 6.5, 'w6')])
+        # without the checkpoint, nothing for the first iterations
+        self.assertEqual(_iterate(_processor()), [])
+
+    def test_missing_audio_ends_the_buffer(self):
+        # the sequence of subsai.webui.handle_asr_engine: restore, then at the first live audio one iteration on the
+        # restored buffer and the gap
+        checkpoint = ProcessorCheckpoint(self.directory, 'cnn')
+        restored = _processor()
+        self.assertTrue(checkpoint.restore(restored, now=1005))
+        self.assertEqual(checkpoint.restored_age, 5)
+        self.assertGreater(checkpoint.restored_age, checkpoint.max_splice)
+        end = restored.buffer_time_offset + len(restored.audio_buffer) / SAMPLING_RATE
+        self.assertIsNone(restored.transcriptioChuncker())
+        # the words waiting for confirmation are committed by this first iteration, not published unconfirmed
+        self.assertEqual(restored.commited[-1], (6, 6.5, 'w6'))
+        seq, words = restored.pop_unemitted()
+        self.assertEqual(words[-1][2], 'w6')
+        self.assertEqual(checkpoint.age(now=1006), 6)
+        _, _, incomplete = restored.insert_gap(checkpoint.age(now=1006))
+        self.assertEqual(incomplete, '')
+        # the live audio comes 6 s of stream after the restored one, the restored words stay the prompt
+        self.assertEqual(restored.buffer_time_offset, end + 6)
+        self.assertEqual(restored.prompt()[0], ' '.join(f'w{t}' for t in range(7)))
+        self.assertEqual(restored.seq, seq + len(words))
+        # and the processing goes on from the live audio
+        _iterate(restored, 3)
+        self.assertEqual(_iterate(restored)[0], (end + 6, end + 6.5, f'w{end + 6:g}'))
+
+    def test_stale_or_other_language(self):
+        self.assertFalse(ProcessorCheckpoint(self.directory, 'cnn').restore(_processor(), now=1000 + 61))
+        self.assertFalse(ProcessorCheckpoint(self.directory, 'cnn').restore(_processor('de'), now=1001))
+        self.assertFalse(ProcessorCheckpoint(self.directory, 'bbc').restore(_processor(), now=1001))
+
+    def test_periodic_and_compact(self):
+        self.assertFalse(self.checkpoint.maybe_save(self.online, now=1004))
+        self.assertTrue(self.checkpoint.maybe_save(self.online, now=1005))
+        # 16-bit PCM of the audio buffer, and the state
+        self.assertLess(os.path.getsize(self.checkpoint.path), 8 * SAMPLING_RATE * 2 + 4096)
+        self.assertEqual(os.listdir(self.directory), ['cnn.npz'])
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the chunked transcription helpers
+
+"""
+from unittest import TestCase, mock
+
+import numpy as np
+from pysubs2 import SSAFile, SSAEvent
+
+from subsai import chunking, cli
+from subsai.chunking import find_split_points, stitch, transcribe_chunked, SAMPLING_RATE
+
+
+def _subs(events):
+    subs = SSAFile()
+    for start, end, text in events:
+        event = SSAEvent(start=start * 1000, end=end * 1000)
+        event.plaintext = text
+        subs.append(event)
+    return subs
+
+
+class TestChunking(TestCase):
+
+    def test_split_points_at_silence(self):
+        rng = np.random.default_rng(0)
+        audio = (rng.standard_normal(SAMPLING_RATE * 100) * 3000).astype(np.int16)
+        audio[SAMPLING_RATE * 35:SAMPLING_RATE * 37] = 0
+        points = find_split_points(audio, chunk_length=40, search_window=10)
+        self.assertEqual(points[0], 0.0)
+        self.assertEqual(points[-1], 100.0)
+        self.assertTrue(35 <= points[1] <= 37, points)
+
+    def test_short_audio_is_not_split(self):
+        audio = np.zeros(SAMPLING_RATE * 10, dtype=np.int16)
+        self.assertEqual(find_split_points(audio, chunk_length=40), [0.0, 10.0])
+
+    def test_stitch_keeps_centered_events(self):
+        first = _subs([(0, 2, 'hello there'), (2, 4, 'this is'), (4, 6, 'the end')])
+        second = _subs([(0.5, 2.5, 'the end'), (2.5, 4.5, 'of it')])
+        subs = stitch([(0, first), (3.5, second)], [0, 5, 10])
+        self.assertEqual([e.text for e in subs], ['hello there', 'this is', 'the end', 'of it'])
+
+    def test_stitch_drops_repeated_words(self):
+        first = _subs([(0, 4.9, 'this is the end')])
+        second = _subs([(1.5, 3.5, 'the end of it')])
+        subs = stitch([(0, first), (3.5, second)], [0, 5, 10])
+        self.assertEqual([e.text for e in subs], ['this is the end', 'of it'])
+
+    def test_stitch_keeps_repeated_words_far_apart(self):
+        # a real "the ... the" on both sides of the split point
+        first = _subs([(0, 2, 'this is'), (2, 3, 'the')])
+        second = _subs([(1.5, 2, 'the'), (2, 3.5, 'end of it')])
+        subs = stitch([(0, first), (3.5, second)], [0, 5, 10])
+        self.assertEqual([e.text for e in subs], ['this is', 'the', 'the', 'end of it'])
+
+    def test_non_positive_chunk_length(self):
+        audio = np.zeros(SAMPLING_RATE * 10, dtype=np.int16)
+        for chunk_length in (0, -5):
+            with self.assertRaises(ValueError):
+                find_split_points(audio, chunk_length=chunk_length)
+        with mock.patch.object(chunking, 'load_audio') as load_audio:
+            with self.assertRaises(ValueError):
+                transcribe_chunked('long.mp3', mock.Mock(), chunk_length=0)
+            with self.assertRaises(ValueError):
+                transcribe_chunked('long.mp3', mock.Mock(), overlap=-1)
+            load_audio.assert_not_called()
+        # nor from the command line
+        with self.assertRaises(ValueError):
+            cli.run([], 'openai/whisper', '{}', None, 'srt', None, '{}', None, None, None, cache_dir=None,
+                    chunk_length=-600)
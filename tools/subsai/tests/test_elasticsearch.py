@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the subtitles search queries, against a recording stand-in of the Elasticsearch client
+
+"""
+import datetime
+from unittest import TestCase, mock
+
+from subsai import elasticsearch_class
+from subsai.elasticsearch_class import SubtitleDatabase
+
+
+class _Client:
+
+    def __init__(self):
+        self.calls = []
+
+    def search(self, **kwargs):
+        self.calls.append(kwargs)
+        return {
+            'hits': {
+                'total': {'value': 1},
+                'hits': [{'_id': '1', '_index': 'subtitles-2026.10.19-000001', '_score': 2.0,
+                          '_source': {'text': 'breaking news'}, 'highlight': {'text': ['<em>breaking</em> news']},
+                          'sort': [2.0, 1760832000000]}],
+            },
+        }
+
+
+class TestReplaceSubtitles(TestCase):
+
+    def setUp(self):
+        self.db = SubtitleDatabase.__new__(SubtitleDatabase)
+        self.db.es = mock.Mock()
+        self.db.es.delete_by_query.return_value = {'deleted': 12000}
+
+    def test_indexed_then_the_others_deleted(self):
+        docs = [{'text': 'better one', 'channel': 'cnn', 'segment_id': 'a'}, {'text': 'two', 'channel': 'cnn'}]
+        with mock.patch.object(elasticsearch_class.helpers, 'bulk') as bulk:
+            replaced = self.db.replace_subtitles('subtitles', 'cnn', '2026-10-19T20:00:00Z', '2026-10-19T20:10:00Z',
+                                                 docs)
+        # any number of documents, not the first page of a search
+        self.assertEqual(replaced, 12000)
+        actions = bulk.call_args[0][1]
+        self.assertEqual([action.get('_id') for action in actions], ['a', None])
+        # every document gets a unique doc_id, the segment_id when there is one
+        doc_ids = [action['_source']['doc_id'] for action in actions]
+        self.assertEqual(doc_ids[0], 'a')
+        self.assertEqual(len(doc_ids[1]), 32)
+        self.assertNotIn('doc_id', docs[1])
+        query = self.db.es.delete_by_query.call_args[1]['query']['bool']
+        self.assertEqual(query['must_not'], [{'ids': {'values': ['a']}}])
+        self.assertEqual(query['filter'][0], {'term': {'channel': 'cnn'}})
+
+
+class TestSubtitleSearch(TestCase):
+
+    def setUp(self):
+        self.db = SubtitleDatabase.__new__(SubtitleDatabase)
+        self.db.es = _Client()
+
+    def test_filters(self):
+        start = datetime.datetime(2026, 10, 19, tzinfo=datetime.timezone.utc)
+        result = self.db.search('breaking', channels=['cnn'], start=start, end='2026-10-20T00:00:00Z')
+        query = self.db.es.calls[0]['query']['bool']
+        self.assertEqual(query['filter'], [
+            {'terms': {'channel': ['cnn']}},
+            {'range': {'start': {'gte': '2026-10-19T00:00:00+00:00', 'lt': '2026-10-20T00:00:00Z'}}},
+        ])
+        self.assertEqual(self.db.es.calls[0]['index'], 'subtitles')
+        self.assertEqual(result['hits'][0]['highlight'], ['<em>breaking</em> news'])
+        self.assertEqual(result['search_after'], [2.0, 1760832000000])
+
+    def test_latest_without_query(self):
+        self.db.search(channels=['cnn'])
+        call = self.db.es.calls[0]
+        # the ties across a page boundary are ordered by a unique field
+        self.assertEqual(call['sort'], [{'start': 'desc'}, {'doc_id': {'order': 'asc', 'unmapped_type': 'keyword'}}])
+        self.assertNotIn('highlight', call)
+
+    def test_point_in_time_pagination(self):
+        self.db.search('breaking', pit_id='pit', search_after=[1.0, 2])
+        call = self.db.es.calls[0]
+        self.assertEqual(call['pit'], {'id': 'pit', 'keep_alive': '1m'})
+        self.assertNotIn('index', call)
+        self.assertEqual(call['search_after'], [1.0, 2])
+        # the point in time adds its own tiebreaker
+        self.assertEqual(call['sort'], ['_score', {'start': 'desc'}])
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the repeated audio cache
+
+"""
+from unittest import TestCase
+
+import numpy as np
+
+from subsai.fingerprint import SAMPLING_RATE, FingerprintIndex, RepeatSkipper, peak_hashes
+
+
+def _clip(seconds, seed):
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLING_RATE)
+    clip = np.zeros(n, dtype=np.float32)
+    for pos in range(0, n, SAMPLING_RATE // 4):
+        t = np.arange(min(SAMPLING_RATE // 4, n - pos)) / SAMPLING_RATE
+        for _ in range(3):
+            clip[pos:pos + len(t)] += 0.2 * np.sin(2 * np.pi * rng.uniform(100, 4000) * t) * np.exp(-t / 0.08)
+    return clip + 0.003 * rng.standard_normal(n).astype(np.float32)
+
+
+class _Asr:
+    sep = ' '
+
+
+class _Processor:
+    """commits the word 'w<n>' for the n-th second of audio it receives"""
+
+    def __init__(self):
+        self.asr = _Asr()
+        self.commited = []
+        self.seq = 0
+        self.buffer_time_offset = 0.0
+        self.received = 0
+
+    def insert_audio_chunk(self, audio):
+        self.received += len(audio)
+        while len(self.commited) < self.received // SAMPLING_RATE:
+            n = len(self.commited)
+            self.commited.append((n, n + 1, f'w{n}'))
+        self.buffer_time_offset = self.received / SAMPLING_RATE
+        return True
+
+
+class TestFingerprintIndex(TestCase):
+
+    def test_alignment(self):
+        clip = _clip(12, 1)
+        index = FingerprintIndex()
+        hashes, frames = peak_hashes(clip)
+        index.add(hashes, frames + 1000)
+        # 4 s from the 4th second of another encoding
+        query = clip[4 * SAMPLING_RATE:8 * SAMPLING_RATE] * 0.8
+        match, votes = index.query(*peak_hashes(query))
+        self.assertAlmostEqual(match, 1000 + 4 * SAMPLING_RATE / 256, delta=1)
+        self.assertGreater(votes, 50)
+        self.assertLess(index.query(*peak_hashes(_clip(4, 2)))[1], 5)
+
+    def test_eviction(self):
+        index = FingerprintIndex()
+        for i, seed in enumerate((1, 2)):
+            hashes, frames = peak_hashes(_clip(4, seed))
+            index.add(hashes, frames + i * 250)
+        size = index.size
+        index.evict_before(250)
+        self.assertLess(index.size, size)
+        self.assertIsNone(index.query(*peak_hashes(_clip(4, 1)))[0])
+        self.assertIsNotNone(index.query(*peak_hashes(_clip(4, 2)))[0])
+
+
+class TestRepeatSkipper(TestCase):
+
+    def _stream(self, skipper, audio):
+        fed = []
+        for start in range(0, len(audio), SAMPLING_RATE):
+            fed.append(skipper.insert_audio_chunk(audio[start:start + SAMPLING_RATE]))
+        return fed
+
+    def test_repeat_skipped(self):
+        ad = _clip(16, 3)
+        # the second airing is shifted by a fraction of a frame, with another gain
+        second_airing = np.concatenate([np.zeros(100, dtype=np.float32), ad[:-100] * 1.2])
+        audio = np.concatenate([_clip(20, 4), ad, _clip(20, 5), second_airing, _clip(8, 6)])
+        online = _Processor()
+        skipper = RepeatSkipper(online, block_seconds=4)
+        fed = self._stream(skipper, audio)
+
+        self.assertFalse(all(fed))
+        self.assertGreaterEqual(skipper.skipped_seconds, 8)
+        self.assertLessEqual(skipper.skipped_seconds, 16)
+        self.assertAlmostEqual(skipper.saved_fraction, skipper.skipped_seconds / 80)
+        self.assertEqual(online.received / SAMPLING_RATE + skipper.skipped_seconds, 80)
+        # the transcript of the first airing (seconds 20 to 36)
+        [(start, end, text, seq)] = skipper.pop_cached()
+        words = text.split()
+        # numbered in the stream, the processor numbers its next words after them
+        self.assertEqual(seq, 0)
+        self.assertEqual(online.seq, len(words))
+        self.assertTrue(set(words) <= {f'w{n}' for n in range(20, 36)})
+        self.assertEqual(len(words), skipper.skipped_seconds)
+        self.assertEqual(skipper.pop_cached(), [])
+        # the words committed after the skip are still in stream time
+        self.assertEqual(skipper._stream_time(online.received / SAMPLING_RATE), 80)
+
+    def test_silence_not_skipped(self):
+        skipper = RepeatSkipper(_Processor(), block_seconds=4)
+        fed = self._stream(skipper, np.zeros(20 * SAMPLING_RATE, dtype=np.float32))
+        # one iteration per block
+        self.assertEqual(fed, [False, False, False, True] * 5)
+        self.assertEqual(skipper.saved_fraction, 0)
+
+    def test_untranscribed_audio_not_skipped(self):
+        class Lagging(_Processor):
+            def insert_audio_chunk(self, audio):
+                self.received += len(audio)
+                return True
+
+        ad = _clip(8, 7)
+        skipper = RepeatSkipper(Lagging(), block_seconds=4)
+        self._stream(skipper, np.concatenate([ad, ad, ad]))
+        self.assertEqual(skipper.skipped_seconds, 0)
+
+    def test_gap(self):
+        class Restarting(_Processor):
+            def insert_gap(self, seconds):
+                self.received += int(seconds * SAMPLING_RATE)
+                self.commited = []
+                return None, None, ''
+
+        online = Restarting()
+        skipper = RepeatSkipper(online, block_seconds=4)
+        self._stream(skipper, _clip(6, 8))
+        self.assertEqual(skipper.insert_gap(10), (None, None, ''))
+        # the incomplete block reached the processor before the gap
+        self.assertEqual(online.received, 16 * SAMPLING_RATE)
+        self.assertEqual(skipper.stream_seconds, 16)
+        self._stream(skipper, _clip(4, 9))
+        self.assertEqual(skipper.stream_seconds, 20)
+        self.assertEqual(skipper._stream_time(online.received / SAMPLING_RATE), 20)
+        self.assertEqual(skipper.saved_fraction, 0)
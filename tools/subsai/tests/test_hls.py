@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the native HLS client, against a local HLS server
+
+"""
+import functools
+import http.server
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from subsai.hls import HLSClient, HLSIngest, parse_media_playlist
+from subsai.ingest import Gap
+
+HAS_CLIENT_DEPENDENCIES = all(importlib.util.find_spec(m) is not None for m in ('aiohttp', 'av'))
+
+PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:41
+#EXT-X-MAP:URI="init.mp4"
+#EXTINF:6.006,
+seg41.m4s
+#EXT-X-DISCONTINUITY
+#EXTINF:5.5,title
+https://cdn.example.com/seg42.m4s
+#EXT-X-ENDLIST
+"""
+
+
+def _segment(seconds, frequency, rate=44100):
+    # an MPEG-TS segment of an AAC tone
+    import av
+    t = np.arange(int(seconds * rate)) / rate
+    samples = (0.3 * np.sin(2 * np.pi * frequency * t)).astype(np.float32).reshape(1, -1)
+    out = io.BytesIO()
+    with av.open(out, 'w', format='mpegts') as container:
+        stream = container.add_stream('aac', rate=rate, layout='mono')
+        frame = av.AudioFrame.from_ndarray(samples, format='fltp', layout='mono')
+        frame.sample_rate = rate
+        for packet in stream.encode(frame):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return out.getvalue()
+
+
+def _playlist(first, count, ended=False, missing=()):
+    lines = ['#EXTM3U', '#EXT-X-TARGETDURATION:1', f'#EXT-X-MEDIA-SEQUENCE:{first}']
+    for sequence in range(first, first + count):
+        lines += ['#EXTINF:1.0,', f'missing{sequence}.ts' if sequence in missing else f'seg{sequence % 4}.ts']
+    if ended:
+        lines.append('#EXT-X-ENDLIST')
+    return '\n'.join(lines) + '\n'
+
+
+class _LiveHandler(http.server.SimpleHTTPRequestHandler):
+    """serves the successive `live.m3u8` of the server, then the last one"""
+
+    def do_GET(self):
+        if self.path.endswith('live.m3u8'):
+            playlists = self.server.live_playlists
+            body = (playlists.pop(0) if len(playlists) > 1 else playlists[0]).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestMediaPlaylist(TestCase):
+
+    def test_parse(self):
+        playlist = parse_media_playlist(PLAYLIST, 'http://host/live/audio.m3u8')
+        self.assertEqual(playlist.target_duration, 6)
+        self.assertTrue(playlist.ended)
+        first, second = playlist.segments
+        self.assertEqual(first, (41, 'http://host/live/seg41.m4s', 6.006, False, 'http://host/live/init.mp4'))
+        self.assertEqual(second.sequence, 42)
+        self.assertEqual(second.url, 'https://cdn.example.com/seg42.m4s')
+        self.assertTrue(second.discontinuity)
+
+    def test_master_playlist(self):
+        master = '#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=96000\naudio.m3u8\n'
+        self.assertEqual(parse_media_playlist(master).segments, [])
+
+
+@unittest.skipUnless(HAS_CLIENT_DEPENDENCIES, 'aiohttp and av are not installed')
+class TestHLSClient(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        for i in range(4):
+            with open(os.path.join(cls.root, f'seg{i}.ts'), 'wb') as f:
+                f.write(_segment(1.0, 300 + 200 * i))
+        with open(os.path.join(cls.root, 'vod.m3u8'), 'w') as f:
+            f.write(_playlist(0, 8, ended=True))
+        with open(os.path.join(cls.root, 'broken.m3u8'), 'w') as f:
+            f.write(_playlist(0, 4, ended=True, missing=(2,)))
+        handler = functools.partial(_LiveHandler, directory=cls.root)
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.root)
+
+    def _serve(self, urls, **kwargs):
+        client = HLSClient(retries=0, timeout=5, **kwargs)
+        outputs = {}
+        for i, url in enumerate(urls):
+            outputs[i] = []
+            client.add_channel(f'channel{i}', url, outputs[i].append)
+        timer = threading.Timer(20, client.stop)
+        timer.start()
+        client.run()
+        timer.cancel()
+        return [outputs[i] for i in range(len(urls))]
+
+    def test_channels_from_one_loop(self):
+        outputs = self._serve([f'{self.base}/vod.m3u8'] * 3)
+        for chunks in outputs:
+            self.assertFalse(any(isinstance(c, Gap) for c in chunks))
+            self.assertTrue(all(len(c) == 16000 for c in chunks[:-1]))
+            audio = np.concatenate(chunks)
+            # 8 segments of about 1 s, the encoder pads each of them
+            self.assertAlmostEqual(len(audio) / 16000, 8, delta=0.5)
+            # in order: the tone of each second is the one of its segment
+            for second, frequency in ((0, 300), (1, 500), (2, 700), (5, 500), (7, 900)):
+                window = audio[second * 16000 + 4000:second * 16000 + 12000]
+                spectrum = np.abs(np.fft.rfft(window))
+                self.assertAlmostEqual(np.argmax(spectrum) * 2, frequency, delta=20)
+
+    def test_failed_segment_is_a_gap(self):
+        [chunks] = self._serve([f'{self.base}/broken.m3u8'])
+        gaps = [c for c in chunks if isinstance(c, Gap)]
+        self.assertEqual(len(gaps), 1)
+        self.assertEqual(gaps[0].seconds, 1)
+        self.assertAlmostEqual(gaps[0].stream_time, 2, delta=0.1)
+
+    def test_live_sequence_jump_is_a_gap(self):
+        # the rendition selection reads the first playlist too
+        self.server.live_playlists = [_playlist(0, 3)] * 2 + [_playlist(6, 3), _playlist(6, 3, ended=True)]
+        [chunks] = self._serve([f'{self.base}/live.m3u8'], live_edge_segments=2)
+        gaps = [c for c in chunks if isinstance(c, Gap)]
+        # segments 1 and 2 at the live edge of the first poll, then 6 to 8: 3 to 5 are missed
+        self.assertEqual([g.seconds for g in gaps], [3])
+        audio = np.concatenate([c for c in chunks if not isinstance(c, Gap)])
+        self.assertAlmostEqual(len(audio) / 16000, 5, delta=0.5)
+
+    def test_ingest_interface(self):
+        ingest = HLSIngest(f'{self.base}/vod.m3u8', channel='vod', retries=0)
+        chunks = list(ingest.chunks())
+        self.assertAlmostEqual(sum(len(c) for c in chunks) / 16000, 8, delta=0.5)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the live model hot-swap, with scripted backends instead of Whisper models
+
+"""
+import math
+import threading
+import time
+from unittest import TestCase
+
+import numpy as np
+
+from subsai import metrics
+from subsai.hotswap import HotSwapper, ModelSwap
+from subsai.models.whisper_online import OnlineASRProcessor, RegexSentenceSplitter
+
+SAMPLING_RATE = OnlineASRProcessor.SAMPLING_RATE
+CHANNEL = 'hotswap-test'
+
+
+class _ScriptedASR:
+    # one word per second of stream, its text tells the model that transcribed it; the last second is not stable yet
+    sep = " "
+
+    def __init__(self, online, lan='en', prefix='w'):
+        self.online = online
+        self.original_language = lan
+        self.prefix = prefix
+
+    def transcribe(self, audio, init_prompt=""):
+        offset = self.online.buffer_time_offset
+        end = offset + len(audio) / SAMPLING_RATE - 1
+        return [(t - offset, t - offset + 0.5, f'{self.prefix}{t}') for t in range(math.ceil(offset), int(end))]
+
+    def ts_words(self, words):
+        return words
+
+    def segments_end_ts(self, words):
+        return []
+
+
+class TestHotSwapper(TestCase):
+
+    def setUp(self):
+        self.online = OnlineASRProcessor(None, RegexSentenceSplitter())
+        self.online.asr = _ScriptedASR(self.online)
+        self.loading = threading.Event()
+        self.loading.set()
+        self.inserted = 0
+
+    def _factory(self, modelsize, lan):
+        self.loading.wait()
+        if modelsize == 'missing':
+            raise OSError("model not found")
+        return _ScriptedASR(self.online, lan, prefix='n' if lan == 'en' else 'd')
+
+    def _iterate(self, swapper, seconds=1):
+        self.online.insert_audio_chunk(np.zeros(seconds * SAMPLING_RATE, dtype=np.float32))
+        self.inserted += seconds
+        self.online.transcriptioChuncker()
+        return swapper.maybe_swap()
+
+    def _swap(self, swapper, max_iterations=50):
+        for _ in range(max_iterations):
+            if self._iterate(swapper):
+                return
+            time.sleep(0.01)
+        self.fail("not swapped")
+
+    def test_swap_at_a_commit_boundary(self):
+        swapper = HotSwapper(self.online, self._factory, channel=CHANNEL)
+        for _ in range(5):
+            self._iterate(swapper)
+        self.loading.clear()
+        swapper.request(ModelSwap('small.en', 'en'))
+        # the old model keeps committing while the new one loads
+        for _ in range(3):
+            self.assertFalse(self._iterate(swapper))
+        self.assertTrue(swapper.pending)
+        commited = list(self.online.commited)
+        self.assertEqual(commited[-1][2], 'w5')
+        self.loading.set()
+        self._swap(swapper)
+        self.assertFalse(swapper.pending)
+        self.assertEqual(self.online.asr.prefix, 'n')
+        # the committed words and the audio buffer are handed over
+        self.assertEqual(self.online.commited[:len(commited)], commited)
+        self.assertEqual(len(self.online.audio_buffer), self.inserted * SAMPLING_RATE)
+        for _ in range(3):
+            self._iterate(swapper)
+        # no word of the stream is lost: the new model continues after the last word of the old one
+        starts = [a for a, _, _ in self.online.commited]
+        self.assertEqual(starts, list(range(len(starts))))
+        self.assertTrue(self.online.commited[-1][2].startswith('n'))
+        gap = metrics.MODEL_SWAP_GAP_SECONDS.snapshot()[(('channel', CHANNEL),)]
+        self.assertEqual(gap, 0.5)
+        self.assertEqual(metrics.MODEL_SWAPS.snapshot()[(('channel', CHANNEL),)], 1)
+
+    def test_language_change(self):
+        tokenizers = []
+        swapper = HotSwapper(self.online, self._factory, tokenizer_factory=tokenizers.append, max_wait=0)
+        for _ in range(6):
+            self._iterate(swapper)
+        swapper.request(ModelSwap('small', 'de'))
+        self._swap(swapper)
+        self.assertEqual(tokenizers, ['de'])
+        # the new language starts after the last committed word
+        self.assertEqual(self.online.buffer_time_offset, self.online.transcript_buffer.last_commited_time)
+        self.assertEqual(self.online.transcript_buffer.complete(), [])
+        for _ in range(3):
+            self._iterate(swapper)
+        self.assertTrue(self.online.commited[-1][2].startswith('d'))
+
+    def test_stream_gap_before_the_first_words(self):
+        swapper = HotSwapper(self.online, self._factory, max_wait=0)
+        for _ in range(6):
+            self._iterate(swapper)
+        swapper.request(ModelSwap('small.en', 'en'))
+        self._swap(swapper)
+        # ffmpeg restarted: the processor is reset before the new model commits
+        self.online.pop_unemitted()
+        self.online.insert_gap(2)
+        for _ in range(4):
+            self._iterate(swapper)
+        self.assertTrue(self.online.commited)
+        self.assertTrue(all(t.startswith('n') for _, _, t in self.online.commited))
+
+    def test_failed_load_keeps_the_model(self):
+        swapper = HotSwapper(self.online, self._factory)
+        swapper.request(ModelSwap('missing', 'en'))
+        with self.assertLogs('subsai.hotswap', 'ERROR'):
+            for _ in range(50):
+                self._iterate(swapper)
+                if not swapper.pending:
+                    break
+                time.sleep(0.01)
+        self.assertEqual(self.online.asr.prefix, 'w')
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the channel stream ingest, against a local HLS server
+
+"""
+import functools
+import http.server
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import TestCase
+
+import numpy as np
+
+from subsai.ingest import (PCM_SCALE, Gap, IngestManager, choose_rendition, ffmpeg_command, parse_master_playlist,
+                           process_stats, select_rendition)
+
+MASTER_WITH_AUDIO = """#EXTM3U
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aac-hi",LANGUAGE="en",NAME="English",DEFAULT=YES,URI="audio/hi_en.m3u8"
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aac-lo",LANGUAGE="es",NAME="Espanol",DEFAULT=NO,URI="audio/lo_es.m3u8"
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aac-lo",LANGUAGE="en",NAME="English",DEFAULT=YES,URI="audio/lo_en.m3u8"
+#EXT-X-STREAM-INF:BANDWIDTH=3564000,CODECS="avc1.64001f,mp4a.40.2",RESOLUTION=1280x720,AUDIO="aac-hi"
+video/720p.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=564000,CODECS="avc1.4d401e,mp4a.40.2",RESOLUTION=640x360,AUDIO="aac-lo"
+video/360p.m3u8
+"""
+
+MASTER_MUXED = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=3564000,CODECS="avc1.64001f,mp4a.40.2",RESOLUTION=1280x720
+VIDEO_0_3564000.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=96000,CODECS="mp4a.40.2"
+AUDIO_96000.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=864000,CODECS="avc1.4d401e,mp4a.40.2",RESOLUTION=640x360
+VIDEO_1_864000.m3u8
+"""
+
+MASTER_VIDEO_ONLY = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=3564000,RESOLUTION=1280x720
+high.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=864000,RESOLUTION=640x360
+low.m3u8
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-TARGETDURATION:6
+#EXT-X-MEDIA-SEQUENCE:1
+#EXTINF:6.0,
+segment1.ts
+"""
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class TestIngest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        files = {
+            'audio/master.m3u8': MASTER_WITH_AUDIO,
+            'muxed/master.m3u8': MASTER_MUXED,
+            'muxed/VIDEO_0_3564000.m3u8': MEDIA,
+            'video/master.m3u8': MASTER_VIDEO_ONLY,
+            'orphan/stream.m3u8': MEDIA,
+        }
+        for path, text in files.items():
+            os.makedirs(os.path.dirname(os.path.join(cls.root, path)), exist_ok=True)
+            with open(os.path.join(cls.root, path), 'w') as f:
+                f.write(text)
+        handler = functools.partial(_QuietHandler, directory=cls.root)
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        shutil.rmtree(cls.root)
+
+    def test_parse(self):
+        variants, audio = parse_master_playlist(MASTER_WITH_AUDIO, 'http://host/live/master.m3u8')
+        self.assertEqual([v.bandwidth for v in variants], [3564000, 564000])
+        self.assertEqual(variants[1].url, 'http://host/live/video/360p.m3u8')
+        self.assertEqual(variants[1].audio_group, 'aac-lo')
+        self.assertEqual([(a.group, a.language, a.default) for a in audio],
+                         [('aac-hi', 'en', True), ('aac-lo', 'es', False), ('aac-lo', 'en', True)])
+        self.assertEqual(parse_master_playlist(MEDIA), ([], []))
+
+    def test_choose(self):
+        self.assertIsNone(choose_rendition([], []))
+        rendition = choose_rendition(*parse_master_playlist(MASTER_WITH_AUDIO), language='es')
+        self.assertEqual(rendition, ('audio/lo_es.m3u8', 'audio', None))
+
+    def test_audio_rendition(self):
+        rendition = select_rendition(f'{self.base}/audio/master.m3u8')
+        # the English rendition of the group of the lowest variant
+        self.assertEqual(rendition.url, f'{self.base}/audio/audio/lo_en.m3u8')
+        self.assertTrue(rendition.audio_only)
+
+    def test_audio_variant_from_media_playlist(self):
+        # the configured URL is a video variant, its master playlist is next to it
+        rendition = select_rendition(f'{self.base}/muxed/VIDEO_0_3564000.m3u8')
+        self.assertEqual(rendition, (f'{self.base}/muxed/AUDIO_96000.m3u8', 'audio_variant', 96000))
+
+    def test_lowest_variant(self):
+        rendition = select_rendition(f'{self.base}/video/master.m3u8')
+        self.assertEqual(rendition, (f'{self.base}/video/low.m3u8', 'lowest_variant', 864000))
+        self.assertFalse(rendition.audio_only)
+
+    def test_original(self):
+        for url in (f'{self.base}/orphan/stream.m3u8', f'{self.base}/missing/master.m3u8'):
+            self.assertEqual(select_rendition(url, timeout=2), (url, 'original', None))
+
+    def test_ffmpeg_command(self):
+        cmd = ffmpeg_command('http://host/a.m3u8')
+        self.assertLess(cmd.index('-i'), cmd.index('-vn'))
+        # the reconnect options are input options
+        self.assertLess(cmd.index('-reconnect'), cmd.index('-i'))
+        self.assertEqual(cmd[cmd.index('-map') + 1], '0:a:0')
+        self.assertEqual(cmd[-9:], ['-f', 's16le', '-acodec', 'pcm_s16le', '-ar', '16000', '-ac', '1', '-'])
+        self.assertNotIn('-vn', ffmpeg_command('http://host/a.m3u8', audio_only=False))
+        self.assertNotIn('-reconnect', ffmpeg_command('http://host/a.m3u8', reconnect=False))
+
+    @unittest.skipUnless(os.path.exists('/proc/self/io'), '/proc is not available')
+    def test_process_stats(self):
+        cpu_seconds, read_bytes = process_stats(os.getpid())
+        self.assertGreater(cpu_seconds, 0)
+        self.assertGreater(read_bytes, 0)
+        self.assertIsNone(process_stats(-1))
+
+    def test_pcm_scale(self):
+        pcm = np.array([-32768, 16384, 32767], dtype=np.int16)
+        audio = IngestManager._to_float(pcm.tobytes())
+        self.assertEqual(audio.dtype, np.float32)
+        self.assertEqual(audio.tolist(), [-1.0, 0.5, 32767 / PCM_SCALE])
+
+    @unittest.skipUnless(shutil.which('ffmpeg'), 'ffmpeg is not installed')
+    def test_ffmpeg_ingest(self):
+        # a muxed HLS stream of 4 s of video and audio, with an audio-only variant
+        out = os.path.join(self.root, 'live')
+        os.makedirs(out, exist_ok=True)
+        sine = ['-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100']
+        hls = ['-t', '4', '-c:a', 'aac', '-f', 'hls', '-hls_time', '2', '-hls_list_size', '0']
+        subprocess.run(['ffmpeg', '-loglevel', 'quiet', '-f', 'lavfi', '-i', 'testsrc=size=320x240:rate=25', *sine,
+                        '-map', '0:v', '-map', '1:a', '-c:v', 'mpeg2video', *hls, os.path.join(out, 'video.m3u8')],
+                       check=True)
+        subprocess.run(['ffmpeg', '-loglevel', 'quiet', *sine, *hls, os.path.join(out, 'audio.m3u8')], check=True)
+        with open(os.path.join(out, 'master.m3u8'), 'w') as f:
+            f.write('#EXTM3U\n#EXT-X-STREAM-INF:BANDWIDTH=900000,CODECS="mp4v.20.9,mp4a.40.2",RESOLUTION=320x240\n'
+                    'video.m3u8\n#EXT-X-STREAM-INF:BANDWIDTH=64000,CODECS="mp4a.40.2"\naudio.m3u8\n')
+        rendition = select_rendition(f'{self.base}/live/master.m3u8')
+        self.assertEqual(rendition.kind, 'audio_variant')
+        for url in (rendition.url, f'{self.base}/live/video.m3u8'):
+            pcm = subprocess.run(ffmpeg_command(url), capture_output=True, check=True).stdout
+            # 4 s of 16 kHz 16 bits mono
+            self.assertAlmostEqual(len(pcm) / 32000, 4, delta=0.2)
+
+
+def _fake_ffmpeg(script):
+    """command of a python process standing in for ffmpeg, `script` writes to `out`"""
+    return lambda url: [sys.executable, '-c', 'import sys, time\nout = sys.stdout.buffer\n' + script]
+
+
+class TestIngestManager(TestCase):
+
+    def _collect(self, manager, n):
+        out = []
+        for chunk in manager.chunks():
+            out.append(chunk)
+            if len(out) == n:
+                break
+        manager.stop()
+        return out
+
+    def test_restart_after_exit(self):
+        # 2 s of audio, then the stream ends
+        command = _fake_ffmpeg('out.write(bytes(64000)); out.flush()')
+        manager = IngestManager('x', command=command, backoff=0.01, min_gap=10)
+        chunks = self._collect(manager, 5)
+        self.assertEqual([len(c) for c in chunks], [16000] * 5)
+        self.assertGreaterEqual(manager.restarts, 2)
+        self.assertEqual(manager.stream_seconds, 5)
+
+    def test_gap_after_stall(self):
+        # 1 s of audio, then nothing: the watchdog restarts the process, the stream time keeps the silence
+        command = _fake_ffmpeg('out.write(bytes(32000)); out.flush(); time.sleep(30)')
+        manager = IngestManager('x', command=command, stall_seconds=0.5, backoff=0.2, min_gap=0.3)
+        t = time.monotonic()
+        chunks = self._collect(manager, 3)
+        self.assertLess(time.monotonic() - t, 10)
+        self.assertEqual(len(chunks[0]), 16000)
+        gap = chunks[1]
+        self.assertIsInstance(gap, Gap)
+        self.assertEqual(gap.stream_time, 1)
+        # the stall detection, the backoff and the start of the next process
+        self.assertGreater(gap.seconds, 0.7)
+        self.assertEqual(manager.stream_seconds, 2 + gap.seconds)
+        self.assertEqual(len(chunks[2]), 16000)
+
+    def test_slow_stream_is_a_stall(self):
+        # a tenth of the real-time rate
+        command = _fake_ffmpeg('while True:\n    out.write(bytes(320)); out.flush(); time.sleep(0.1)')
+        manager = IngestManager('x', command=command, rate_window=0.5, backoff=0.01, min_gap=10)
+        # no chunk is complete before the watchdog, the manager runs in a thread
+        thread = threading.Thread(target=lambda: list(manager.chunks()), daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 5
+        while not manager.restarts and time.monotonic() < deadline:
+            time.sleep(0.05)
+        manager.stop()
+        thread.join(5)
+        self.assertGreaterEqual(manager.restarts, 1)
+        self.assertFalse(thread.is_alive())
+
+    def test_backoff(self):
+        manager = IngestManager('x', backoff=1, max_backoff=5)
+        self.assertEqual([manager.next_backoff() for _ in range(5)], [1, 2, 4, 5, 5])
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the embedded subtitles full-text index
+
+"""
+import datetime
+import json
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from subsai.local_index import LocalSubtitleDatabase, fts_query
+from subsai.utils import generate_subtitle
+
+
+def _doc(start, text, channel='cnn'):
+    return {'start': f'2026-10-19T20:{start:02d}:00+00:00', 'end': f'2026-10-19T20:{start:02d}:05+00:00',
+            'text': text, 'channel': channel}
+
+
+class TestLocalSubtitleDatabase(TestCase):
+
+    def setUp(self):
+        self.db = LocalSubtitleDatabase()
+        self.db.bulk_insert('subtitles', [
+            _doc(0, 'Breaking news from the capital tonight'),
+            _doc(1, 'The news is breaking all records', channel='bbc'),
+            _doc(2, 'Weather news: storms are expected'),
+        ])
+        # the JSON string of generate_subtitle
+        self.db.insert_subtitle('subtitles', json.dumps(_doc(3, 'More breaking news after the break')))
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_fts_query(self):
+        self.assertEqual(fts_query('"breaking news" tonight*'), '"breaking news" OR "tonight"')
+
+    def test_phrase(self):
+        result = self.db.search('"breaking news"')
+        self.assertEqual(result['total'], 2)
+        self.assertEqual({hit['source']['start'][11:16] for hit in result['hits']}, {'20:00', '20:03'})
+        self.assertIn('<em>Breaking news</em>', result['hits'][0]['highlight'][0] + result['hits'][1]['highlight'][0])
+
+    def test_channel_and_time_range(self):
+        self.assertEqual(self.db.search('news', channels=['bbc'])['total'], 1)
+        result = self.db.search('news', start='2026-10-19T20:01:00Z', end='2026-10-19T20:03:00Z')
+        self.assertEqual({hit['source']['text'] for hit in result['hits']},
+                         {'The news is breaking all records', 'Weather news: storms are expected'})
+
+    def test_latest_first_pagination(self):
+        seen = []
+        search_after = None
+        while True:
+            result = self.db.search(size=3, search_after=search_after)
+            if not result['hits']:
+                break
+            self.assertEqual(result['total'], 4)
+            seen.extend(hit['source']['start'][11:16] for hit in result['hits'])
+            search_after = result['search_after']
+        self.assertEqual(seen, ['20:03', '20:02', '20:01', '20:00'])
+
+    def test_relevance_pagination(self):
+        all_ids = [hit['id'] for hit in self.db.search('news breaking', size=10)['hits']]
+        page1 = self.db.search('news breaking', size=2)
+        page2 = self.db.search('news breaking', size=2, search_after=page1['search_after'])
+        self.assertEqual([hit['id'] for hit in page1['hits'] + page2['hits']], all_ids)
+
+    def test_replace_subtitles(self):
+        replaced = self.db.replace_subtitles('subtitles', 'cnn', '2026-10-19T20:00:00Z', '2026-10-19T20:03:00Z',
+                                             [_doc(0, 'Breaking news from the capital tonight, again')])
+        self.assertEqual(replaced, 2)
+        self.assertEqual({hit['source']['text'] for hit in self.db.search(channels=['cnn'])['hits']},
+                         {'Breaking news from the capital tonight, again', 'More breaking news after the break'})
+        # the other channels are kept
+        self.assertEqual(self.db.search(channels=['bbc'])['total'], 1)
+
+    def test_segment_sent_twice(self):
+        start = datetime.datetime(2026, 10, 19, 20, 4, tzinfo=datetime.timezone.utc)
+        end = start + datetime.timedelta(seconds=5)
+        subtitle = generate_subtitle((start, end, 'Election results tonight', 7), 'cnn', stream_id='s1')
+        self.assertEqual(subtitle, generate_subtitle((start, end, 'Election results tonight', 7), 'cnn',
+                                                     stream_id='s1'))
+        self.db.insert_subtitle('subtitles', subtitle)
+        # a retry, then the segment emitted again with more words after a restart
+        self.db.insert_subtitle('subtitles', subtitle)
+        self.db.insert_subtitle('subtitles', generate_subtitle((start, end, 'Election results tonight in Ohio', 7),
+                                                               'cnn', stream_id='s1'))
+        self.assertEqual(self.db.count('subtitles'), 5)
+        self.assertEqual([hit['source']['text'] for hit in self.db.search('election')['hits']],
+                         ['Election results tonight in Ohio'])
+        # without a sequence number, no id
+        self.assertNotIn('segment_id', json.loads(generate_subtitle((start, end, 'Election results'), 'cnn')))
+        # another stream of the channel
+        self.db.insert_subtitle('subtitles', generate_subtitle((start, end, 'Election results tonight', 7), 'cnn',
+                                                               stream_id='s2'))
+        self.assertEqual(self.db.search('election')['total'], 2)
+
+    def test_segment_id_column_added(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'subtitles.db')
+            db = sqlite3.connect(path)
+            db.execute('CREATE TABLE subtitles (id INTEGER PRIMARY KEY, idx TEXT NOT NULL, channel TEXT, start REAL, '
+                       '"end" REAL, text TEXT NOT NULL, source TEXT NOT NULL)')
+            db.close()
+            local = LocalSubtitleDatabase(path)
+            local.insert_subtitle('subtitles', dict(_doc(0, 'Breaking news'), segment_id='a'))
+            local.insert_subtitle('subtitles', dict(_doc(0, 'Breaking news'), segment_id='a'))
+            self.assertEqual(local.count(), 1)
+            local.close()
+
+    def test_ingest_archive(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'mysubs_2827900.txt')
+            with open(path, 'w') as f:
+                f.write('First sentence here.Second one follows. Third?')
+            db = LocalSubtitleDatabase(os.path.join(tmp_dir, 'subtitles.db'))
+            self.assertEqual(db.ingest_archive(os.path.join(tmp_dir, 'mysubs_*.txt'), channel='cnn'), 3)
+            hit = db.search('"second one"')['hits'][0]
+            self.assertEqual(hit['source']['start'], '2023-10-08T04:40:00+00:00')
+            db.close()
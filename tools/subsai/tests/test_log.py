@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the logging of the live pipeline
+
+"""
+import logging
+import queue
+from unittest import TestCase
+
+from subsai.log import DebugSwitch, NonBlockingQueueHandler, worker_logger
+
+
+class TestLog(TestCase):
+
+    def setUp(self):
+        self.queue = queue.Queue(2)
+        self.logger = worker_logger(self.queue, 'asr', 'test-channel')
+
+    def tearDown(self):
+        self.logger.handlers.clear()
+
+    def test_debug_disabled_by_default(self):
+        self.logger.debug("dropped %s", 'early')
+        self.assertTrue(self.queue.empty())
+
+    def test_full_queue_does_not_block(self):
+        for i in range(5):
+            self.logger.info("record %d", i)
+        handler = next(h for h in self.logger.handlers if isinstance(h, NonBlockingQueueHandler))
+        self.assertEqual(self.queue.qsize(), 2)
+        self.assertEqual(handler.dropped, 3)
+
+    def test_debug_switch(self):
+        switch = DebugSwitch()
+        switch.apply(self.logger)
+        self.assertFalse(self.logger.isEnabledFor(logging.DEBUG))
+        switch.set(True)
+        switch.apply(self.logger)
+        self.assertTrue(self.logger.isEnabledFor(logging.DEBUG))
+        self.logger.debug("x=%s", 1)
+        self.assertEqual(self.queue.get_nowait().getMessage(), "x=1")
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the metrics registry and its exposition endpoint
+
+"""
+import queue
+import urllib.request
+from unittest import TestCase
+
+from subsai.metrics import Registry, MetricsPusher, WordRate, start_http_server
+
+
+class TestRegistry(TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.counter = self.registry.counter('test_total', 'A counter', ['channel'])
+        self.histogram = self.registry.histogram('test_seconds', 'A histogram', ['channel'], buckets=(0.1, 1.0))
+
+    def test_render(self):
+        self.counter.inc(2, channel='a')
+        self.histogram.observe(0.5, channel='a')
+        text = self.registry.render()
+        self.assertIn('# TYPE test_total counter', text)
+        self.assertIn('test_total{channel="a"} 2.0', text)
+        self.assertIn('test_seconds_bucket{channel="a",le="0.1"} 0.0', text)
+        self.assertIn('test_seconds_bucket{channel="a",le="1.0"} 1.0', text)
+        self.assertIn('test_seconds_bucket{channel="a",le="+Inf"} 1.0', text)
+        self.assertIn('test_seconds_count{channel="a"} 1.0', text)
+
+    def test_wrong_labels(self):
+        with self.assertRaises(ValueError):
+            self.counter.inc(1, stream='a')
+
+    def test_remote_snapshots_are_merged(self):
+        self.counter.inc(1, channel='a')
+        q = queue.Queue()
+        MetricsPusher(q, 'asr:a', registry=self.registry).push()
+        self.registry.update_remote(*q.get_nowait())
+        # the pusher cleared the local values, as in a forked process
+        self.counter.inc(3, channel='a')
+        self.assertIn('test_total{channel="a"} 3.0', self.registry.render())
+        self.registry.update_remote('asr:b', {'test_total': {(('channel', 'a'),): 4.0}})
+        self.assertIn('test_total{channel="a"} 7.0', self.registry.render())
+
+    def test_http_endpoint(self):
+        self.counter.inc(1, channel='a')
+        server = start_http_server(0, '127.0.0.1', registry=self.registry)
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{server.server_port}/metrics') as response:
+                self.assertIn('test_total{channel="a"} 1.0', response.read().decode())
+        finally:
+            server.shutdown()
+
+
+class TestWordRate(TestCase):
+
+    def test_window(self):
+        rate = WordRate(window=60)
+        self.assertEqual(rate.add(5, now=0), 5)
+        self.assertEqual(rate.add(3, now=30), 8)
+        self.assertEqual(rate.add(0, now=61), 3)
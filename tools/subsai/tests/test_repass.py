@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the background re-transcription of the archived audio
+
+"""
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+import numpy as np
+import pysubs2
+import soundfile
+
+from subsai.archive import SAMPLING_RATE, AudioArchive
+from subsai.local_index import LocalSubtitleDatabase
+from subsai.repass import STATE_FILE, Retranscriber
+from subsai.scheduler import LIVE, PriorityScheduler
+from subsai.utils import create_subtitle_entry
+
+T0 = 1_800_000_000.0
+
+
+def _live_doc(seconds, text):
+    return create_subtitle_entry(datetime.datetime.fromtimestamp(T0 + seconds),
+                                 datetime.datetime.fromtimestamp(T0 + seconds + 2), text, 'cnn')
+
+
+class TestRetranscriber(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        archive = AudioArchive(self.root, 'cnn', chunk_seconds=10, retention=0)
+        archive.write(np.zeros(30 * SAMPLING_RATE, dtype=np.float32), air_time=T0)
+        self.db = LocalSubtitleDatabase()
+        self.db.bulk_insert('subtitles', [_live_doc(1, 'live one'), _live_doc(5, 'live two'),
+                                          _live_doc(12, 'live three')])
+        self.durations = []
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.root)
+
+    def _transcribe(self, path):
+        self.durations.append(soundfile.info(path).duration)
+        return [pysubs2.SSAEvent(start=500, end=2500, text=' better one '),
+                pysubs2.SSAEvent(start=3000, end=3500, text=' ')]
+
+    def _repass(self, **kwargs):
+        kwargs.setdefault('window_seconds', 10)
+        kwargs.setdefault('delay', 5)
+        return Retranscriber(self.root, self.db, self._transcribe, **kwargs)
+
+    def _texts(self):
+        return sorted(hit['source']['text'] for hit in self.db.search(channels=['cnn'], size=10)['hits'])
+
+    def test_windows_replace_the_live_subtitles(self):
+        repass = self._repass(lookback=3600)
+        self.assertEqual(repass.next_window(now=T0 + 30), ('cnn', T0, T0 + 10))
+        self.assertTrue(repass.run_once(now=T0 + 30))
+        self.assertEqual(self.durations, [10])
+        self.assertEqual(self._texts(), ['better one', 'live three'])
+        hit = self.db.search('better', channels=['cnn'])['hits'][0]
+        self.assertEqual(hit['source']['tier'], 'repass')
+        self.assertEqual(hit['source']['start'], _live_doc(0.5, '')['start'])
+        # the progress is persisted: a new instance continues after it
+        with open(os.path.join(self.root, 'cnn', STATE_FILE)) as f:
+            self.assertEqual(json.load(f), {'done_until': T0 + 10})
+        self.assertEqual(self._repass().next_window(now=T0 + 30), ('cnn', T0 + 10, T0 + 20))
+        # the last window is not `delay` seconds old yet
+        self.assertTrue(repass.run_once(now=T0 + 30))
+        self.assertFalse(repass.run_once(now=T0 + 30))
+        self.assertEqual(repass.next_window(now=T0 + 35), ('cnn', T0 + 20, T0 + 30))
+
+    def test_window_done_again(self):
+        repass = self._repass(lookback=3600)
+        self.assertTrue(repass.run_once(now=T0 + 30))
+        ids = [hit['source']['segment_id'] for hit in self.db.search('better', channels=['cnn'])['hits']]
+        # stopped before the progress was saved: the window is re-transcribed
+        os.remove(os.path.join(self.root, 'cnn', STATE_FILE))
+        self.assertTrue(repass.run_once(now=T0 + 30))
+        self.assertEqual(self._texts(), ['better one', 'live three'])
+        self.assertEqual([hit['source']['segment_id'] for hit in self.db.search('better', channels=['cnn'])['hits']],
+                         ids)
+
+    def test_lookback(self):
+        repass = self._repass(lookback=15)
+        self.assertEqual(repass.next_window(now=T0 + 30), ('cnn', T0 + 15, T0 + 25))
+        # the archive starts after the lookback
+        self.assertEqual(repass.next_window(now=T0 + 15), ('cnn', T0, T0 + 10))
+        self.assertIsNone(repass.next_window(now=T0 + 14))
+
+    def test_waits_for_the_live_channels(self):
+        scheduler = PriorityScheduler(window=0.2)
+        repass = self._repass(scheduler=scheduler, device='cuda:0', admission_timeout=0.05)
+        token = scheduler.acquire(LIVE, device='cuda:0')
+        self.assertFalse(repass.run_once(now=T0 + 30))
+        self.assertEqual(self.durations, [])
+        self.assertIsNone(repass.done_until('cnn'))
+        scheduler.release(token)
+        # admitted once the live load of the device decreased
+        repass.admission_timeout = 2
+        self.assertTrue(repass.run_once(now=T0 + 30))
+        self.assertLess(scheduler.live_load('cuda:0'), 0.5)
+
+    def test_failed_window_keeps_the_live_subtitles(self):
+        def transcribe(path):
+            raise RuntimeError("out of memory")
+
+        repass = Retranscriber(self.root, self.db, transcribe, window_seconds=10, delay=5, lookback=3600)
+        with self.assertLogs('subsai.repass', 'ERROR'):
+            self.assertTrue(repass.run_once(now=T0 + 30))
+        self.assertEqual(self._texts(), ['live one', 'live three', 'live two'])
+        self.assertEqual(repass.done_until('cnn'), T0 + 10)
+
+    def test_failed_write_is_retried(self):
+        class Flaky:
+            def __init__(self, db, failures):
+                self.db = db
+                self.failures = failures
+
+            def replace_subtitles(self, *args):
+                if self.failures:
+                    self.failures -= 1
+                    raise ConnectionError("connection refused")
+                return self.db.replace_subtitles(*args)
+
+        repass = Retranscriber(self.root, Flaky(self.db, 2), self._transcribe, window_seconds=10, delay=5,
+                               lookback=3600, retry_backoff=60)
+        with self.assertLogs('subsai.repass', 'ERROR'):
+            self.assertFalse(repass.run_once(now=T0 + 30))
+        # the progress is not saved, the window keeps its live subtitles and waits for the back-off
+        self.assertIsNone(repass.done_until('cnn'))
+        self.assertEqual(self._texts(), ['live one', 'live three', 'live two'])
+        self.assertFalse(repass.run_once(now=T0 + 30))
+        repass._retry_at = 0
+        with self.assertLogs('subsai.repass', 'ERROR') as logs:
+            self.assertFalse(repass.run_once(now=T0 + 30))
+        self.assertIn('written again in 120 s', logs.output[0])
+        repass._retry_at = 0
+        self.assertTrue(repass.run_once(now=T0 + 30))
+        # written without transcribing the window again
+        self.assertEqual(self.durations, [10])
+        self.assertEqual(self._texts(), ['better one', 'live three'])
+        self.assertEqual(repass.done_until('cnn'), T0 + 10)
+
+    def test_run_survives_the_errors(self):
+        repass = self._repass()
+        stop = threading.Event()
+        calls = []
+
+        def run_once():
+            calls.append(1)
+            if len(calls) == 2:
+                stop.set()
+            raise OSError("archive not readable")
+
+        repass.run_once = run_once
+        with self.assertLogs('subsai.repass', 'ERROR'):
+            repass.run(stop, idle_seconds=0)
+        self.assertEqual(len(calls), 2)
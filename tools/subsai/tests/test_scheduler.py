@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the priority scheduling of the live and background tasks
+
+"""
+import threading
+import time
+from unittest import TestCase
+
+from subsai.models.abstract_model import AbstractModel
+from subsai.scheduler import (BATCH, DEFAULT_DEVICE, INTERACTIVE, LIVE, PriorityScheduler, SchedulerBusy, compute,
+                              device_of, priority, set_scheduler)
+
+
+class TestPriorityScheduler(TestCase):
+
+    def test_live_is_always_admitted(self):
+        scheduler = PriorityScheduler()
+        tokens = [scheduler.acquire(LIVE, timeout=0) for _ in range(3)]
+        self.assertNotIn(None, tokens)
+        for token in tokens:
+            scheduler.release(token)
+
+    def test_batch_waits_for_live(self):
+        scheduler = PriorityScheduler(window=0.5, max_live_load=1.0)
+        token = scheduler.acquire(LIVE)
+        self.assertIsNone(scheduler.acquire(BATCH, timeout=0.05))
+        released = []
+
+        def release():
+            time.sleep(0.1)
+            released.append(time.monotonic())
+            scheduler.release(token)
+
+        threading.Thread(target=release).start()
+        batch = scheduler.acquire(BATCH, timeout=2)
+        self.assertIsNotNone(batch)
+        self.assertTrue(released)
+        scheduler.release(batch)
+
+    def test_live_load(self):
+        scheduler = PriorityScheduler(window=0.4, max_live_load=0.5)
+        with scheduler.slot(LIVE):
+            time.sleep(0.3)
+        self.assertGreater(scheduler.live_load(), 0.5)
+        # the busy live tasks keep the background ones out until their load decreases
+        self.assertIsNone(scheduler.acquire(BATCH, timeout=0))
+        token = scheduler.acquire(BATCH, timeout=2)
+        self.assertIsNotNone(token)
+        self.assertLess(scheduler.live_load(), 0.5)
+        # a background task never delays a live one
+        self.assertIsNotNone(scheduler.acquire(LIVE, timeout=0))
+
+    def test_interactive_before_batch(self):
+        scheduler = PriorityScheduler(max_live_load=1.0)
+        running = scheduler.acquire(BATCH, device='cuda:0')
+        order = []
+
+        def task(priority):
+            token = scheduler.acquire(priority, device='cuda:0')
+            order.append(priority)
+            scheduler.release(token)
+
+        batch = threading.Thread(target=task, args=(BATCH,))
+        batch.start()
+        while not scheduler.queued('cuda:0')['batch']:
+            time.sleep(0.01)
+        interactive = threading.Thread(target=task, args=(INTERACTIVE,))
+        interactive.start()
+        while not scheduler.queued('cuda:0')['interactive']:
+            time.sleep(0.01)
+        scheduler.release(running)
+        batch.join()
+        interactive.join()
+        self.assertEqual(order, [INTERACTIVE, BATCH])
+
+    def test_per_device_queues(self):
+        scheduler = PriorityScheduler(slots={'cpu': 2})
+        gpu = scheduler.acquire(INTERACTIVE, device='cuda:0')
+        # a busy device does not delay the others
+        self.assertIsNone(scheduler.acquire(INTERACTIVE, timeout=0, device='cuda:0'))
+        cpu = [scheduler.acquire(INTERACTIVE, timeout=0, device='cpu') for _ in range(3)]
+        self.assertIsNotNone(cpu[0])
+        self.assertIsNotNone(cpu[1])
+        self.assertIsNone(cpu[2])
+        for token in [gpu] + cpu[:2]:
+            scheduler.release(token)
+
+    def test_admission_control(self):
+        scheduler = PriorityScheduler(max_queued={BATCH: 1})
+        running = scheduler.acquire(BATCH, device='cpu')
+        waiting = threading.Thread(target=scheduler.acquire, args=(BATCH, 1.0, 'cpu'))
+        waiting.start()
+        while not scheduler.queued('cpu')['batch']:
+            time.sleep(0.01)
+        # refused at once rather than queued
+        start = time.monotonic()
+        self.assertIsNone(scheduler.acquire(BATCH, timeout=5, device='cpu'))
+        self.assertLess(time.monotonic() - start, 1)
+        with self.assertRaises(SchedulerBusy):
+            with compute('cpu', BATCH, timeout=5, scheduler=scheduler):
+                pass
+        scheduler.release(running)
+        waiting.join()
+
+    def test_preemption_at_chunk_boundaries(self):
+        scheduler = PriorityScheduler(max_live_load=1.0)
+        set_scheduler(scheduler)
+        self.addCleanup(set_scheduler, None)
+        interactive_done = threading.Event()
+        events = []
+
+        def interactive():
+            with priority(INTERACTIVE), compute('cpu'):
+                interactive_done.set()
+
+        class _Model(AbstractModel):
+            def transcribe(self, media_file):
+                return list(self.transcribe_iter(media_file))
+
+            def transcribe_iter(self, media_file):
+                for i in range(3):
+                    events.append(interactive_done.is_set())
+                    if i == 0:
+                        # queued while the batch job decodes its first event
+                        threading.Thread(target=interactive).start()
+                        while not scheduler.queued('cpu')['interactive']:
+                            time.sleep(0.01)
+                    yield i
+
+        model = _Model(model_config={'device': 'cpu'})
+        self.assertEqual(list(model.transcribe_iter('media')), [0, 1, 2])
+        # the interactive task ran between the first two events of the batch job
+        self.assertEqual(events, [False, True, True])
+        # the nested transcribe_iter() runs in the slot of transcribe()
+        self.assertEqual(model.transcribe('media'), [0, 1, 2])
+
+    def test_device_of(self):
+        class _Model:
+            pass
+
+        model = _Model()
+        model.model_config = {'device': 'cuda', 'device_index': 1}
+        self.assertEqual(device_of(model), 'cuda:1')
+        model.device = 'cpu'
+        self.assertEqual(device_of(model), 'cpu')
+        self.assertEqual(device_of(object()), DEFAULT_DEVICE)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the shared services
+
+"""
+from multiprocessing import AuthenticationError
+from unittest import TestCase
+
+from subsai import services
+from subsai.services import connect_service, is_loopback, start_service
+
+
+class TestServices(TestCase):
+
+    def test_shared_instance(self):
+        manager = start_service('test-list', list)
+        self.addCleanup(manager.shutdown)
+        connect_service('test-list', manager.address).append('cnn')
+        self.assertEqual(connect_service('test-list', manager.address).count('cnn'), 1)
+        with self.assertRaises(AuthenticationError):
+            connect_service('test-list', manager.address, b'guess')
+
+    def test_random_authkey_only_on_loopback(self):
+        self.assertTrue(is_loopback('127.0.0.1'))
+        self.assertTrue(is_loopback('localhost'))
+        self.assertFalse(is_loopback('0.0.0.0'))
+        self.assertFalse(is_loopback('elasticsearch'))
+        if not services.SERVICE_AUTHKEY:
+            with self.assertRaises(ValueError):
+                start_service('test-exposed', list, address=('0.0.0.0', 0))
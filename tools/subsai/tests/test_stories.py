@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the cross-channel story detection
+
+"""
+import json
+from unittest import TestCase
+
+from subsai.stories import MinHasher, StoryClusterer, normalize_words, tag_subtitle
+
+STORY = ("The senate passed the infrastructure bill late on Tuesday after a long debate over the cost of the new "
+         "bridges and the funding of the rail network, and the house is expected to vote on it next week")
+# a story of many subtitles
+LONG_STORY = ("The senate passed the infrastructure bill late on Tuesday after a long debate over the cost of the new "
+              "bridges and the funding of the rail network. Supporters said the plan would repair thousands of "
+              "miles of highways that have been neglected for decades, while critics warned that the spending "
+              "would add to the deficit without a clear way to pay for it. The vote came after weeks of "
+              "negotiations between the leaders of both parties, who met behind closed doors to settle the last "
+              "details of the package. Governors from several states welcomed the decision and asked for the "
+              "money to reach local projects quickly, especially the repair of aging water pipes and the "
+              "expansion of broadband access in rural areas. The house is expected to take up the bill next week, "
+              "where a group of moderate members has already promised to support it, although the final margin "
+              "remains uncertain and some progressive members want a larger climate program attached to it.")
+OTHER = ("Heavy rain flooded the streets of the old town this morning and the firefighters evacuated dozens of "
+         "families from the houses along the river while the schools stayed closed")
+
+
+class TestMinHasher(TestCase):
+
+    def test_similarity_estimate(self):
+        hasher = MinHasher(128)
+        story = normalize_words(STORY)
+        same = hasher.signature(story)
+        self.assertTrue((same == hasher.signature(list(story))).all())
+        # one substituted word out of 35
+        edited = list(story)
+        edited[10] = 'vote'
+        self.assertGreater((same == hasher.signature(edited)).mean(), 0.7)
+        self.assertLess((same == hasher.signature(normalize_words(OTHER))).mean(), 0.1)
+
+
+class TestStoryClusterer(TestCase):
+
+    def setUp(self):
+        self.stories = StoryClusterer(window_words=30, min_words=10, horizon=3600, self_exclusion=600)
+
+    def test_short_window(self):
+        self.assertIsNone(self.stories.assign('cbs', 'Good evening', 0))
+
+    def test_cross_channel_duplicate(self):
+        first = self.stories.assign('cbs', STORY, 0)
+        self.assertIsNotNone(first)
+        # another channel, other case and punctuation
+        self.assertEqual(self.stories.assign('nbc', STORY.upper() + '!', 120), first)
+        self.assertNotEqual(self.stories.assign('abc', OTHER, 180), first)
+
+    def test_same_channel_continuation_and_rerun(self):
+        first = self.stories.assign('cbs', STORY, 0)
+        # the consecutive windows of a channel overlap, they continue its story
+        self.assertEqual(self.stories.assign('cbs', 'and more on that story later', 10), first)
+        # a window not continuing the previous one starts another story
+        self.assertNotEqual(self.stories.assign('cbs', OTHER, 20), first)
+        # a rerun is the same story
+        self.assertEqual(self.stories.assign('cbs', STORY, 1200), first)
+
+    def _air(self, channel, text, words_per_subtitle, start):
+        words = text.split()
+        ids = []
+        for i in range(0, len(words), words_per_subtitle):
+            ids.append(self.stories.assign(channel, ' '.join(words[i:i + words_per_subtitle]), start + i))
+        return ids
+
+    def test_one_story_over_many_subtitles(self):
+        stories = StoryClusterer()
+        self.stories = stories
+        first = self._air('cbs', LONG_STORY, 6, 0)
+        # the window of the first subtitle is too short
+        self.assertIsNone(first[0])
+        self.assertGreater(len(first), 20)
+        self.assertEqual(set(first[1:]), {first[1]})
+        # the rerun of another channel, with other subtitle boundaries
+        rerun = self._air('abc', LONG_STORY, 9, 200)
+        self.assertEqual(set(rerun[1:]), {first[1]})
+        # after a story of its own: the windows of the first subtitles are mostly the previous story
+        other = self._air('nbc', OTHER, 7, 300)[-1]
+        rerun = self._air('nbc', LONG_STORY, 9, 400)
+        self.assertEqual(rerun[:2], [other, other])
+        self.assertEqual(set(rerun[2:]), {first[1]})
+        # and it is not merged into the rerun
+        self.assertNotEqual(stories.resolve(other), first[1])
+        self.assertEqual(stories.stats()['merged'], 0)
+
+    def test_channels_starting_a_story_together(self):
+        stories = StoryClusterer()
+        self.stories = stories
+        words = LONG_STORY.split()
+        # the first windows of nbc are shorter than the one of cbs: they are assigned a story of their own first
+        cbs = self._air('cbs', ' '.join(words[:60]), 60, 0)
+        nbc = self._air('nbc', ' '.join(words[30:]), 4, 10)
+        self.assertNotEqual(nbc[2], cbs[0])
+        self.assertEqual(nbc[-1], cbs[0])
+        # and merged into the cbs story once a window matches it
+        self.assertEqual({stories.resolve(story_id) for story_id in nbc if story_id is not None}, {cbs[0]})
+        self.assertEqual(stories.stats()['merged'], 1)
+
+    def test_horizon_eviction(self):
+        first = self.stories.assign('cbs', STORY, 0)
+        self.assertNotEqual(self.stories.assign('nbc', STORY, 4000), first)
+        self.assertEqual(self.stories.stats()['entries'], 1)
+
+    def test_max_entries(self):
+        stories = StoryClusterer(window_words=30, min_words=10, max_entries=5)
+        for i in range(20):
+            stories.assign(f'channel-{i}', f'{OTHER} {i}', i)
+        stats = stories.stats()
+        self.assertEqual(stats['entries'], 5)
+        self.assertLessEqual(stats['buckets'], 5 * stories.bands)
+
+
+class TestTagSubtitle(TestCase):
+
+    def test_tag(self):
+        stories = StoryClusterer(min_words=10)
+        subtitle = json.dumps({'start': '2026-10-19T20:00:00+00:00', 'text': STORY, 'channel': 'cbs'})
+        tagged = json.loads(tag_subtitle(stories, subtitle))
+        self.assertTrue(tagged['story_id'].startswith('story-'))
+        self.assertEqual(tag_subtitle(stories, {'text': STORY, 'channel': 'nbc'})['story_id'], tagged['story_id'])
+
+    def test_failure(self):
+        class Broken:
+            def assign(self, *args):
+                raise ConnectionError('service down')
+
+        subtitle = json.dumps({'text': STORY, 'channel': 'cbs'})
+        with self.assertLogs('subsai.stories', 'ERROR'):
+            self.assertEqual(tag_subtitle(Broken(), subtitle), subtitle)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the streaming transcription and the incremental subtitles writers
+
+"""
+import io
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+from pysubs2 import SSAFile, SSAEvent
+
+from subsai import cli
+from subsai.models import whisper_timestamped_model
+from subsai.models.abstract_model import AbstractModel
+from subsai.models.whisper_timestamped_model import SAMPLE_RATE, STREAM_WINDOW, WhisperTimeStamped
+from subsai.streaming import SubtitleStreamWriter, write_events
+
+
+def _event(start, end, text):
+    event = SSAEvent(start=start, end=end)
+    event.plaintext = text
+    return event
+
+
+class _Model(AbstractModel):
+
+    def transcribe(self, media_file):
+        subs = SSAFile()
+        subs.extend([_event(0, 1500, 'Hello'), _event(1500, 3000, 'there')])
+        return subs
+
+
+class TestSubtitleStreamWriter(TestCase):
+
+    def test_srt(self):
+        fp = io.StringIO()
+        comment = _event(0, 500, 'comment')
+        comment.type = 'Comment'
+        events = [_event(0, 1500, 'Hello'), _event(1500, 1600, ' '), comment, _event(3661001, 3662000, 'there')]
+        self.assertEqual(write_events(events, fp, 'srt'), 2)
+        self.assertEqual(fp.getvalue(), "1\n00:00:00,000 --> 00:00:01,500\nHello\n\n"
+                                        "2\n01:01:01,001 --> 01:01:02,000\nthere\n\n")
+
+    def test_vtt(self):
+        fp = io.StringIO()
+        writer = SubtitleStreamWriter(fp, 'vtt')
+        self.assertEqual(fp.getvalue(), "WEBVTT\n\n")
+        writer.write(_event(0, 1500, 'Hello'))
+        self.assertEqual(fp.getvalue(), "WEBVTT\n\n00:00:00.000 --> 00:00:01.500\nHello\n\n")
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            SubtitleStreamWriter(io.StringIO(), 'ass')
+
+
+class TestTranscribeIter(TestCase):
+
+    def test_default_yields_the_transcription(self):
+        self.assertEqual([e.plaintext for e in _Model().transcribe_iter('test.mp4')], ['Hello', 'there'])
+
+    def test_whisper_timestamped_windows(self):
+        model = WhisperTimeStamped.__new__(WhisperTimeStamped)
+        model.segment_type = 'sentence'
+        model.condition_on_previous_text = True
+        calls = []
+
+        def transcribe_audio(audio, initial_prompt=None):
+            # a 10 s segment every 10 s of the window, the last one cut at the window edge
+            calls.append((len(audio) / SAMPLE_RATE, initial_prompt))
+            seconds = len(audio) / SAMPLE_RATE
+            return {'segments': [{'start': s, 'end': min(s + 10, seconds), 'text': f' segment {s}'}
+                                 for s in range(0, int(seconds), 10)]}
+
+        model._transcribe_audio = transcribe_audio
+        read = []
+
+        def read_audio(media_file):
+            # 150 s of audio, decoded 7 s at a time
+            for start in range(0, int(2.5 * STREAM_WINDOW), 7):
+                read.append(start)
+                yield np.zeros(min(7, int(2.5 * STREAM_WINDOW) - start) * SAMPLE_RATE, dtype=np.float32)
+
+        with mock.patch.object(whisper_timestamped_model, '_read_audio', read_audio):
+            events = model.transcribe_iter('test.mp4')
+            first = next(events)
+            # the media is decoded as the windows need it
+            self.assertEqual(read[-1], 56)
+            events = [first] + list(events)
+        # the dropped last segment of a window is decoded again at the start of the next one
+        self.assertEqual([e.start for e in events], list(range(0, 150000, 10000)))
+        self.assertEqual(events[-1].end, 150000)
+        self.assertEqual([seconds for seconds, _ in calls], [60, 60, 50])
+        self.assertIsNone(calls[0][1])
+        self.assertTrue(calls[1][1].endswith('segment 40'))
+
+
+    def test_read_audio(self):
+        pcm = np.array([0, 16384, -32768, 32767] * (STREAM_WINDOW * SAMPLE_RATE // 2) + [1], dtype=np.int16)
+        process = mock.Mock(stdout=io.BytesIO(pcm.tobytes()))
+        process.poll.return_value = 0
+        process.wait.return_value = 0
+        with mock.patch.object(whisper_timestamped_model.subprocess, 'Popen', return_value=process) as popen:
+            chunks = list(whisper_timestamped_model._read_audio('test.mp4'))
+        self.assertIn('test.mp4', popen.call_args[0][0])
+        # one window of samples per read, in the scale of whisper's load_audio
+        self.assertEqual([len(chunk) for chunk in chunks], [STREAM_WINDOW * SAMPLE_RATE, STREAM_WINDOW * SAMPLE_RATE, 1])
+        self.assertEqual(chunks[0].dtype, np.float32)
+        self.assertEqual(list(chunks[0][:3]), [0.0, 0.5, -1.0])
+
+    def test_read_audio_failure(self):
+        process = mock.Mock(stdout=io.BytesIO(b''))
+        process.poll.return_value = 1
+        process.wait.return_value = 1
+        with mock.patch.object(whisper_timestamped_model.subprocess, 'Popen', return_value=process):
+            with self.assertRaises(RuntimeError):
+                list(whisper_timestamped_model._read_audio('missing.mp4'))
+
+
+class TestStreamCommandLine(TestCase):
+
+    def test_unsupported_format_keeps_the_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            media = os.path.join(directory, 'test.mp4')
+            output = os.path.join(directory, 'test.ass')
+            for path in (media, output):
+                with open(path, 'w') as f:
+                    f.write('kept')
+            with self.assertRaises(ValueError):
+                cli.run([media], 'linto-ai/whisper-timestamped', '{}', None, 'ass', None, '{}', None, None, None,
+                        stream=True)
+            with open(output) as f:
+                self.assertEqual(f.read(), 'kept')
+
+    def test_no_chunking(self):
+        with self.assertRaises(ValueError):
+            cli.run([], 'linto-ai/whisper-timestamped', '{}', None, 'srt', None, '{}', None, None, None,
+                    chunk_length=600, stream=True)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the tracing of the streaming ASR iterations
+
+"""
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from subsai.tracing import IterationTracer, NULL_TRACER
+
+
+class TestIterationTracer(TestCase):
+
+    def setUp(self):
+        self.tracer = IterationTracer('test-channel', capacity=2)
+
+    def _iterate(self, n):
+        for i in range(n):
+            with self.tracer.iteration('process_iter', i=i):
+                with self.tracer.span('decode'):
+                    pass
+                with self.tracer.span('flush'):
+                    pass
+
+    def test_ring_buffer(self):
+        self._iterate(3)
+        self.assertEqual(len(self.tracer.iterations), 2)
+        self.assertEqual([it[4]['i'] for it in self.tracer.iterations], [1, 2])
+        self.assertEqual([span[0] for span in self.tracer.iterations[0][3]], ['decode', 'flush'])
+
+    def test_spans_outside_iterations_are_ignored(self):
+        with self.tracer.span('decode'):
+            pass
+        self.assertEqual(len(self.tracer.iterations), 0)
+
+    def test_chrome_trace(self):
+        self._iterate(1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = self.tracer.dump(os.path.join(tmp_dir, 'trace.json'))
+            with open(path) as f:
+                events = json.load(f)['traceEvents']
+        self.assertTrue(all(isinstance(e['tid'], int) for e in events))
+        self.assertEqual(events[0]['args']['name'], 'test-channel')
+        complete = [e for e in events if e['ph'] == 'X']
+        self.assertEqual([e['name'] for e in complete], ['process_iter', 'decode', 'flush'])
+        iteration = complete[0]
+        for span in complete[1:]:
+            self.assertGreaterEqual(span['ts'], iteration['ts'])
+            self.assertLessEqual(span['ts'] + span['dur'], iteration['ts'] + iteration['dur'])
+
+    def test_null_tracer(self):
+        with NULL_TRACER.iteration('process_iter', i=0):
+            with NULL_TRACER.span('decode'):
+                pass
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the queue loop of the ASR process of a channel, with a scripted backend instead of a Whisper model
+
+"""
+import json
+import logging
+import math
+import shutil
+import tempfile
+import time
+from unittest import TestCase, mock
+
+import numpy as np
+
+from subsai import webui
+from subsai.checkpoint import ProcessorCheckpoint
+from subsai.hotswap import HotSwapper, ModelSwap
+from subsai.models.whisper_online import OnlineASRProcessor, RegexSentenceSplitter
+
+SAMPLING_RATE = 16000
+
+
+class _ScriptedASR:
+    # no speech: the iterations commit nothing
+    sep = ""
+
+    def __init__(self, lan, modelsize=None):
+        self.original_language = lan
+        self.modelsize = modelsize
+
+    def transcribe(self, audio, init_prompt=""):
+        return []
+
+    def ts_words(self, words):
+        return words
+
+    def segments_end_ts(self, words):
+        return []
+
+
+class _WordsASR(_ScriptedASR):
+    # one word per second of stream; the last second is not stable yet
+    sep = " "
+    online = None
+
+    def transcribe(self, audio, init_prompt=""):
+        offset = self.online.buffer_time_offset
+        end = offset + len(audio) / SAMPLING_RATE - 1
+        return [(t - offset, t - offset + 0.5, f'w{t}') for t in range(math.ceil(offset), int(end))]
+
+
+class _Queue:
+
+    def __init__(self, items):
+        self.items = iter(items)
+
+    def get(self):
+        return next(self.items)
+
+    def qsize(self):
+        return 0
+
+
+class TestASREngineLoop(TestCase):
+
+    def setUp(self):
+        self.swappers = []
+
+        def swapper(*args, **kwargs):
+            # a channel without speech has no commit boundary, the loaded model takes over at once
+            self.swappers.append(HotSwapper(*args, max_wait=0, **kwargs))
+            return self.swappers[-1]
+
+        for name, value in [('FasterWhisperASR', _ScriptedASR),
+                            ('create_tokenizer', lambda lan: RegexSentenceSplitter()),
+                            ('HotSwapper', swapper),
+                            ('REPEAT_CACHE_ENABLED', False),
+                            ('CHECKPOINT_PATH', None),
+                            ('LOCAL_INDEX_PATH', None)]:
+            patcher = mock.patch.object(webui, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _items(self, max_iterations=200):
+        yield ModelSwap('small.en', 'en')
+        for _ in range(max_iterations):
+            if self.swappers[0].online.asr.modelsize == 'small.en':
+                break
+            yield np.zeros(SAMPLING_RATE, dtype=np.float32)
+            time.sleep(0.01)
+        yield None
+
+    def test_model_swap_from_the_queue(self):
+        logger = logging.getLogger('test_webui.asr')
+        with self.assertNoLogs(logger, 'ERROR'):
+            webui.handle_asr_engine(_Queue(self._items()), 'webui-test', logger)
+        online = self.swappers[0].online
+        self.assertEqual(online.asr.modelsize, 'small.en')
+        # the request is not audio: the buffer holds the audio chunks only
+        self.assertEqual(online.audio_buffer.dtype, np.float32)
+        self.assertFalse(self.swappers[0].pending)
+
+
+class TestCheckpointRestore(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.processors = []
+        self.published = []
+        # the words still waiting for confirmation at each gap
+        self.unconfirmed = []
+
+        def processor(asr, *args, **kwargs):
+            online = OnlineASRProcessor(asr, *args, **kwargs)
+            asr.online = online
+            insert_gap = online.insert_gap
+
+            def gap(seconds):
+                self.unconfirmed.append(list(online.transcript_buffer.complete()))
+                return insert_gap(seconds)
+
+            online.insert_gap = gap
+            self.processors.append(online)
+            return online
+
+        for name, value in [('FasterWhisperASR', _WordsASR),
+                            ('OnlineASRProcessor', processor),
+                            ('create_tokenizer', lambda lan: RegexSentenceSplitter()),
+                            ('REPEAT_CACHE_ENABLED', False),
+                            ('CHECKPOINT_PATH', self.directory),
+                            ('LOCAL_INDEX_PATH', None),
+                            ('insert_subtitle_to_es', lambda doc, index: self.published.append(json.loads(doc))),
+                            ('saveSubsToFile', lambda output: None)]:
+            patcher = mock.patch.object(webui, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_restarted_channel_commits_in_its_first_iteration(self):
+        # the checkpoint of a channel 8 s into its stream, written 5 s before the restart
+        asr = _WordsASR('en')
+        online = OnlineASRProcessor(asr, RegexSentenceSplitter())
+        asr.online = online
+        for _ in range(8):
+            online.insert_audio_chunk(np.zeros(SAMPLING_RATE, dtype=np.float32))
+            online.transcriptioChuncker()
+        waiting = online.transcript_buffer.complete()
+        self.assertEqual(waiting, [(6, 6.5, 'w6')])
+        ProcessorCheckpoint(self.directory, 'webui-test').save(online, now=time.time() - 5)
+
+        logger = logging.getLogger('test_webui.asr')
+        with self.assertNoLogs(logger, 'ERROR'):
+            webui.handle_asr_engine(_Queue([np.zeros(SAMPLING_RATE, dtype=np.float32), None]), 'webui-test',
+                                    logger)
+        restored = self.processors[0]
+        # the first iteration confirmed the restored words waiting for it: they are published as commited words,
+        # and the restored buffer ended where the audio is missing
+        self.assertEqual(self.unconfirmed, [[]])
+        self.assertEqual(len(self.published), 1)
+        self.assertEqual(self.published[0]['text'], ' '.join(f'w{t}' for t in range(7)))
+        self.assertEqual(restored.seq, 7)
+        self.assertGreaterEqual(restored.buffer_time_offset, 8 + 5)
+        # the live audio is transcribed with the restored words as prompt
+        self.assertEqual(len(restored.audio_buffer), SAMPLING_RATE)
+        self.assertTrue(restored.prompt()[0].endswith('w5 w6'))
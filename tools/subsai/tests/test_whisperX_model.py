@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the resident models of whisperX, with the whisperx loaders replaced by stand-ins
+
+"""
+from unittest import TestCase, mock
+
+from subsai.models import whisperX_model
+from subsai.models.whisperX_model import WhisperXModel
+
+
+class TestResidentModels(TestCase):
+
+    def setUp(self):
+        self.loaded = []
+        whisperx = whisperX_model.whisperx
+        for name, value in [('load_model', mock.Mock()),
+                            ('load_align_model', self._load_align_model),
+                            ('load_audio', mock.Mock()),
+                            ('align', lambda segments, *args, **kwargs: {'segments': segments})]:
+            patcher = mock.patch.object(whisperx, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _load_align_model(self, language_code, device):
+        self.loaded.append(language_code)
+        return object(), {'language': language_code}
+
+    def _model(self, **config):
+        model = WhisperXModel({'device': 'cpu', **config})
+        model.model.transcribe.return_value = {
+            'language': 'en', 'segments': [{'start': 0.0, 'end': 1.5, 'text': ' Hello there'}]}
+        return model
+
+    def test_align_models_lru(self):
+        model = self._model(max_align_models=2)
+        for language in ['en', 'fr', 'en', 'de', 'en']:
+            model._align_model(language)
+        self.assertEqual(self.loaded, ['en', 'fr', 'de'])
+        self.assertEqual(list(model._align_models), ['de', 'en'])
+
+    def test_kept_between_files(self):
+        model = self._model()
+        self.assertEqual([e.plaintext for e in model.transcribe('test.mp4')], ['Hello there'])
+        model.transcribe('test.mp4')
+        self.assertEqual(self.loaded, ['en'])
+
+    def test_released_after_a_file(self):
+        model = self._model(keep_models_loaded=False)
+        model.transcribe('test.mp4')
+        self.assertEqual(len(model._align_models), 0)
+        model.transcribe('test.mp4')
+        self.assertEqual(self.loaded, ['en', 'en'])
+
+    def test_released_under_memory_pressure(self):
+        model = self._model()
+        with mock.patch.object(WhisperXModel, '_under_memory_pressure', return_value=True):
+            model.transcribe('test.mp4')
+        self.assertEqual(len(model._align_models), 0)
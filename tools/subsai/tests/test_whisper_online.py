@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Test file for the online (streaming) ASR processing, without loading any Whisper model
+
+"""
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+
+from subsai.models import whisper_online
+from subsai.models.whisper_online import (
+    AudioCache,
+    TOKENIZER_BACKENDS,
+    OnlineASRProcessor,
+    RegexSentenceSplitter,
+    create_tokenizer,
+)
+
+
+class _FakeASR:
+    # same separator as faster-whisper: the words carry their leading space
+    sep = ""
+
+
+class TestRegexSentenceSplitter(TestCase):
+    tokenizer = RegexSentenceSplitter()
+
+    def test_split(self):
+        text = 'Hello there Mr. Smith. How are you? "Fine." The U.S. Army moved'
+        self.assertEqual(self.tokenizer.split(text),
+                         ['Hello there Mr. Smith.', 'How are you?', '"Fine."', 'The U.S. Army moved'])
+
+
+class TestCreateTokenizer(TestCase):
+
+    def test_cached_per_backend_and_language(self):
+        tokenizer = create_tokenizer('en', backend='regex')
+        self.assertIsInstance(tokenizer, RegexSentenceSplitter)
+        self.assertIs(create_tokenizer('en', backend='regex'), tokenizer)
+        self.assertIsNot(create_tokenizer('fr', backend='regex'), tokenizer)
+
+    def test_registered_backend(self):
+        created = []
+        TOKENIZER_BACKENDS['test-words'] = lambda lan: created.append(lan) or RegexSentenceSplitter()
+        self.addCleanup(TOKENIZER_BACKENDS.pop, 'test-words')
+        create_tokenizer('de', backend='test-words')
+        create_tokenizer('de', backend='test-words')
+        self.assertEqual(created, ['de'])
+        with self.assertRaises(KeyError):
+            create_tokenizer('en', backend='missing')
+        with self.assertRaises(AssertionError):
+            create_tokenizer('xx', backend='regex')
+
+
+class TestWordsToSentences(TestCase):
+
+    def setUp(self):
+        self.online = OnlineASRProcessor(_FakeASR(), RegexSentenceSplitter())
+
+    def test_sentences_timestamps(self):
+        words = [(0, 1, ' Hello'), (1, 2, ' there.'), (2, 3, ' How'), (3, 4, ' are'), (4, 5, ' you?'),
+                 (5, 6, ' Fine')]
+        self.assertEqual(self.online.words_to_sentences(words),
+                         [(0, 2, 'Hello there.'), (2, 5, 'How are you?'), (5, 6, 'Fine')])
+
+    def test_empty(self):
+        self.assertEqual(self.online.words_to_sentences([]), [])
+
+    def test_chunk_completed_sentence_only_scans_the_buffer(self):
+        self.online.commited = [(0, 1, ' One.'), (1, 2, ' Two.'), (2, 3, ' Three.'), (3, 4, ' Four')]
+        self.online.chunk_completed_sentence()
+        # chunked at the end of the second last sentence
+        self.assertEqual(self.online.buffer_time_offset, 3)
+        self.assertEqual(self.online.buffer_commited_index, 3)
+        self.online.chunk_completed_sentence()
+        self.assertEqual(self.online.buffer_time_offset, 3)
+
+
+class TestGap(TestCase):
+
+    def test_timestamps_continue_after_a_gap(self):
+        online = OnlineASRProcessor(_FakeASR(), RegexSentenceSplitter())
+        online.buffer_time_offset = 30
+        online.insert_audio_chunk(np.zeros(5 * OnlineASRProcessor.SAMPLING_RATE, dtype=np.float32))
+        online.transcript_buffer.buffer = [(33, 34, ' Hello')]
+        self.assertEqual(online.insert_gap(12), (33, 34, ' Hello'))
+        # 30 s, 5 s of audio and the gap
+        self.assertEqual(online.buffer_time_offset, 47)
+        self.assertEqual(online.last_chunked_at, 47)
+        self.assertEqual(len(online.audio_buffer), 0)
+        self.assertEqual(online.commited, [])
+        # the text before the gap is the prompt of the next audio
+        self.assertEqual(online.prompt(), (' Hello', ''))
+        online.transcript_buffer.insert([(0, 1, ' again')], online.buffer_time_offset)
+        self.assertEqual(online.transcript_buffer.new, [(47, 48, ' again')])
+
+
+class TestPopUnemitted(TestCase):
+
+    def test_each_commited_word_once(self):
+        online = OnlineASRProcessor(_FakeASR(), RegexSentenceSplitter())
+        online.commited = [(0, 1, ' One'), (1, 2, ' two')]
+        self.assertEqual(online.pop_unemitted(), (0, [(0, 1, ' One'), (1, 2, ' two')]))
+        self.assertEqual(online.pop_unemitted(), (2, []))
+        online.commited.append((2, 3, ' three'))
+        self.assertEqual(online.pop_unemitted(), (2, [(2, 3, ' three')]))
+        # the incomplete words published at a gap take their numbers too
+        online.transcript_buffer.buffer = [(3, 4, ' four')]
+        online.insert_gap(1)
+        online.commited.append((5, 6, ' five'))
+        self.assertEqual(online.pop_unemitted(), (4, [(5, 6, ' five')]))
+
+
+class TestAudioCache(TestCase):
+
+    def setUp(self):
+        self.scratch_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.scratch_dir.cleanup)
+        # 10 s files are decoded in memory, 20 s files to a memory-mapped scratch file
+        self.cache = AudioCache(max_bytes=15 * 16000 * 4, mmap_min_seconds=15, scratch_dir=self.scratch_dir.name,
+                                max_scratch_bytes=30 * 16000 * 2)
+        librosa = mock.patch.object(whisper_online, 'librosa')
+        self.librosa = librosa.start()
+        self.addCleanup(librosa.stop)
+        self.librosa.get_duration.side_effect = lambda path: int(os.path.basename(path).split('-')[0])
+        self.librosa.load.side_effect = lambda path, sr: (np.zeros(self.librosa.get_duration(path) * sr,
+                                                                   dtype=np.float32), sr)
+        decode = mock.patch.object(AudioCache, '_decode_to_scratch', self._decode_to_scratch)
+        decode.start()
+        self.addCleanup(decode.stop)
+
+    def _decode_to_scratch(self, fname):
+        fd, scratch = tempfile.mkstemp(suffix=".pcm", dir=self.scratch_dir.name)
+        os.write(fd, np.full(self.librosa.get_duration(fname) * 16000, 16384, dtype=np.int16).tobytes())
+        os.close(fd)
+        return scratch
+
+    def test_memory_budget(self):
+        self.assertEqual(self.cache.get('10-a.wav').dtype, np.float32)
+        self.cache.get('10-b.wav')
+        self.cache.get('10-b.wav')
+        self.assertEqual(self.librosa.load.call_count, 2)
+        # the least recently used one is evicted
+        self.assertEqual(list(self.cache._entries), ['10-b.wav'])
+
+    def test_scratch_files_budget(self):
+        self.assertEqual(whisper_online._to_float32(self.cache.get('20-a.wav')[:2]).tolist(), [0.5, 0.5])
+        self.cache.get('20-b.wav')
+        # 40 s of scratch files for 30 s of budget: the first one is deleted
+        self.assertEqual(list(self.cache._entries), ['20-b.wav'])
+        self.assertEqual(len(os.listdir(self.scratch_dir.name)), 1)
+        self.cache.clear()
+        self.assertEqual(os.listdir(self.scratch_dir.name), [])